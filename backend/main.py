@@ -3,11 +3,18 @@ FastAPI Backend for LangGraph AI Agent
 Provides REST API endpoints for the React frontend
 """
 
-from fastapi import FastAPI, HTTPException
+import time
+
+# Startup timing starts before any heavy imports
+APP_IMPORT_STARTED = time.time()
+
+from fastapi import FastAPI, HTTPException, Header, Request, Response, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
-from pydantic import BaseModel
+from fastapi.responses import StreamingResponse, PlainTextResponse
+from starlette.requests import HTTPConnection
+from pydantic import BaseModel, ValidationError
 from typing import Optional, Dict, Any, List, AsyncGenerator
+import hmac
 import uuid
 from datetime import datetime
 import os
@@ -25,8 +32,29 @@ src_dir = os.path.join(parent_dir, 'src')
 sys.path.insert(0, parent_dir)
 sys.path.insert(0, src_dir)
 
-from src.agents.langgraph_agent import LangGraphAgent
 from src.utils.config import AppConfig
+from src.utils.startup import StartupTimer
+from src.utils.streaming import (
+    DeltaStreamEncoder,
+    StreamReplayBuffer,
+    gzip_stream,
+    parse_last_event_id
+)
+# Imported under the same module name the agent uses so both see one process-wide pool
+from utils.http_pool import get_pool_manager
+from utils.adaptive_sizing import get_result_policy
+from utils.speculation import get_prefetcher, get_early_dispatcher
+from utils.model_cascade import get_cascade_metrics
+from utils.scheduler import get_scheduler, tenant_id, QueueFullError
+from utils.flight_recorder import get_flight_recorder
+from utils.profiling import get_request_profiler, folded_text
+from utils.hot_queries import get_hot_queries
+from utils.shared_state import get_shared_state, get_session_store, sum_counters
+from utils.affinity import affinity_token, STREAM_TOKEN_SEPARATOR
+from utils.multiplex import MultiplexedConnection, MuxStream
+from utils.run_control import RunControl
+from utils.usage import get_usage_ledger
+from utils.revision import apply_patches
 
 # Load environment variables
 load_dotenv()
@@ -55,6 +83,14 @@ app.add_middleware(
 # Initialize agent
 config = AppConfig()
 agent = None
+startup_timer = StartupTimer(origin=APP_IMPORT_STARTED)
+agent_warming = False
+
+
+def load_agent_class():
+    """Import the agent lazily so the server accepts connections before LangChain loads"""
+    from src.agents.langgraph_agent import LangGraphAgent
+    return LangGraphAgent
 
 # Request/Response models
 class ChatMessage(BaseModel):
@@ -69,6 +105,11 @@ class ChatRequest(BaseModel):
     conversation_history: Optional[List[ChatMessage]] = []
     openai_api_key: Optional[str] = None
     tavily_api_key: Optional[str] = None
+    force_full_depth: Optional[bool] = False
+    stream_protocol: Optional[str] = None
+    compress: Optional[bool] = False
+    progressive: Optional[bool] = None
+    priority: Optional[str] = None
 
 class ChatResponse(BaseModel):
     response: str
@@ -81,15 +122,42 @@ class HealthResponse(BaseModel):
     timestamp: datetime
     agent_ready: bool
     api_keys_configured: bool
+    startup_seconds: Optional[float] = None
+    worker_id: Optional[str] = None
+
+# Session history; shared by all workers when SHARED_STATE_PATH is set (see backend/prefork.py)
+sessions = get_session_store(config)
+
+# Recent v2 streams kept for Last-Event-ID resume
+replay_buffer = StreamReplayBuffer(ttl_seconds=config.stream_replay_ttl)
 
-# In-memory session storage (use Redis in production)
-sessions = {}
+# The event loop only keeps weak references to tasks; these hold background ones until they finish
+background_tasks = set()
+
+def spawn(coro) -> asyncio.Task:
+    """Start a background task that stays referenced until it is done"""
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    "Content-Type": "text/event-stream",
+}
+
+async def store_message(session_id: str, message: ChatMessage):
+    """Append a message to the session's history; the shared store writes to SQLite, so off the event loop"""
+    await asyncio.to_thread(sessions.append, session_id, message.model_dump(mode="json"))
 
 def get_agent_with_keys(openai_key: Optional[str] = None, tavily_key: Optional[str] = None):
     """Get agent instance with provided API keys"""
+    if not (openai_key and tavily_key) and agent is None and agent_warming:
+        raise HTTPException(status_code=503, detail="Agent is still starting up, please retry shortly")
     try:
         if openai_key and tavily_key:
-            return LangGraphAgent(config, openai_key, tavily_key)
+            return load_agent_class()(config, openai_key, tavily_key)
         elif agent is not None:
             return agent
         else:
@@ -97,52 +165,272 @@ def get_agent_with_keys(openai_key: Optional[str] = None, tavily_key: Optional[s
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Failed to initialize agent: {str(e)}")
 
-@app.on_event("startup")
-async def startup_event():
-    """Initialize the agent on startup"""
-    global agent
+def build_default_agent():
+    """Import, build and warm the default agent (runs in a worker thread)"""
+    openai_key = os.getenv("OPENAI_API_KEY")
+    tavily_key = os.getenv("TAVILY_API_KEY")
+    with startup_timer.stage("import_agent"):
+        agent_class = load_agent_class()
+    with startup_timer.stage("build_agent"):
+        default_agent = agent_class(config, openai_key, tavily_key)
+    with startup_timer.stage("warm_up"):
+        default_agent.warm_up(startup_timer)
+    return default_agent
+
+async def initialize_agent():
+    """Build the default agent in the background and publish it once warm"""
+    global agent, agent_warming
     try:
-        # Initialize with environment variables as fallback
-        openai_key = os.getenv("OPENAI_API_KEY")
-        tavily_key = os.getenv("TAVILY_API_KEY")
-        if openai_key and tavily_key:
-            agent = LangGraphAgent(config, openai_key, tavily_key)
-            print("Agent initialized successfully with environment keys")
-        else:
-            print("No API keys in environment - will require user-provided keys")
+        agent = await asyncio.to_thread(build_default_agent)
+        print("Agent initialized successfully with environment keys")
+        if config.hot_query_precompute:
+            scheduler = get_scheduler(config)
+            get_hot_queries(config).start(agent.precompute, is_idle=lambda: scheduler.running < config.hot_query_idle_below)
     except Exception as e:
         print(f"Failed to initialize agent: {e}")
+    finally:
+        agent_warming = False
+        startup_timer.mark_ready()
+        print(f"Startup complete in {startup_timer.report()['time_to_ready']}s")
+
+@app.on_event("startup")
+async def startup_event():
+    """Start agent initialization without blocking the server from accepting connections"""
+    global agent_warming
+    startup_timer.record("import_app", APP_IMPORT_STARTED, time.time())
+    
+    if get_shared_state(config) is not None:
+        spawn(publish_worker_metrics())
+    
+    # Initialize with environment variables as fallback
+    if os.getenv("OPENAI_API_KEY") and os.getenv("TAVILY_API_KEY"):
+        agent_warming = True
+        spawn(initialize_agent())
+    else:
+        print("No API keys in environment - will require user-provided keys")
+        startup_timer.mark_ready()
 
 @app.get("/health", response_model=HealthResponse)
-async def health_check():
-    """Health check endpoint"""
+async def health_check(response: Response):
+    """Readiness check; 503 until warm-up has finished, like /chat"""
+    startup_report = startup_timer.report()
+    if not startup_report["ready"]:
+        response.status_code = 503
     return HealthResponse(
-        status="healthy",
+        status="healthy" if startup_report["ready"] else "starting",
         timestamp=datetime.now(),
         agent_ready=agent is not None,
-        api_keys_configured=bool(os.getenv("OPENAI_API_KEY") and os.getenv("TAVILY_API_KEY"))
+        api_keys_configured=bool(os.getenv("OPENAI_API_KEY") and os.getenv("TAVILY_API_KEY")),
+        startup_seconds=startup_report["time_to_ready"],
+        worker_id=config.worker_id
     )
 
+@app.get("/health/live")
+async def liveness_check():
+    """Liveness check; answers as soon as the process serves requests, including during warm-up"""
+    return {"status": "alive", "worker_id": config.worker_id}
+
+@app.get("/health/startup")
+async def startup_breakdown():
+    """Startup-time breakdown by stage"""
+    return startup_timer.report()
+
+@app.get("/metrics/http")
+async def http_pool_metrics():
+    """Connection reuse metrics for the shared upstream HTTP pools"""
+    return get_pool_manager(config).stats()
+
+@app.get("/metrics/adaptive")
+async def adaptive_sizing_metrics():
+    """Per-query-class fetch sizing and estimated latency saved"""
+    return get_result_policy(config).stats()
+
+@app.get("/metrics/speculation")
+async def speculation_metrics():
+    """Speculative tool prefetch hit rate, wasted calls and hidden latency"""
+    return get_prefetcher().stats()
+
+@app.get("/metrics/early_dispatch")
+async def early_dispatch_metrics():
+    """Tool calls started while the analyzer was still streaming, on their own pool"""
+    return get_early_dispatcher(config).stats()
+
+@app.get("/metrics/cascade")
+async def cascade_metrics():
+    """Responder escalation rate and latency/cost saved by answering with cheaper models"""
+    return get_cascade_metrics().stats()
+
+@app.get("/metrics/scheduler")
+async def scheduler_metrics():
+    """Per-tenant queue depth, concurrency and queue-wait percentiles"""
+    return get_scheduler(config).stats()
+
+@app.get("/metrics/usage")
+async def usage_metrics(session_id: Optional[str] = None, x_debug_token: Optional[str] = Header(default=None)):
+    """
+    Token, search and cost totals per node
+    
+    The per-tenant breakdown with budget state, and one session's totals,
+    identify callers and need the debug token.
+    """
+    ledger = get_usage_ledger(config)
+    if session_id is None:
+        return ledger.stats(include_tenants=debug_token_matches(x_debug_token))
+    require_debug_token(x_debug_token)
+    usage = ledger.session(session_id)
+    if usage is None:
+        raise HTTPException(status_code=404, detail="No usage recorded for this session")
+    return usage
+
+async def worker_snapshot() -> Dict[str, Any]:
+    """This worker's metrics, in the layout of the /metrics endpoints"""
+    return {
+        "http": get_pool_manager(config).stats(),
+        "speculation": get_prefetcher().stats(),
+        "early_dispatch": get_early_dispatcher(config).stats(),
+        "cascade": get_cascade_metrics().stats(),
+        "scheduler": get_scheduler(config).stats(),
+        # Merged hot-query counts are read from the shared store; /metrics/workers is public, so no query text
+        "hot_queries": await asyncio.to_thread(get_hot_queries(config).stats, False),
+        "usage": get_usage_ledger(config).stats(include_tenants=False)
+    }
+
+async def publish_worker_metrics():
+    """Periodically publish this worker's metrics for /metrics/workers"""
+    shared = get_shared_state(config)
+    worker = config.worker_id or str(os.getpid())
+    while True:
+        try:
+            await asyncio.to_thread(shared.publish_metrics, worker, await worker_snapshot())
+        except Exception as e:
+            print(f"Worker metrics publish error: {e}")
+        await asyncio.sleep(config.metrics_publish_interval)
+
+@app.get("/metrics/workers")
+async def worker_metrics():
+    """Latest metrics of every worker process, with integer counters summed across workers"""
+    shared = get_shared_state(config)
+    if shared is None:
+        workers = {config.worker_id or "0": {"pid": os.getpid(), "age_s": 0.0, "metrics": await worker_snapshot()}}
+    else:
+        workers = await asyncio.to_thread(shared.worker_metrics, max(60.0, 3 * config.metrics_publish_interval))
+    return {
+        "workers": workers,
+        "totals": sum_counters([worker["metrics"] for worker in workers.values()])
+    }
+
+@app.get("/metrics/hot_queries")
+async def hot_query_metrics(x_debug_token: Optional[str] = Header(default=None)):
+    """Heavy-hitter counts, precomputed answer ages, hit rate and refresh budget use; query text needs the debug token"""
+    return await asyncio.to_thread(get_hot_queries(config).stats, debug_token_matches(x_debug_token))
+
+def debug_token_matches(token: Optional[str]) -> bool:
+    """True only when DEBUG_TOKEN is set and the request carries it"""
+    return bool(config.debug_token) and hmac.compare_digest((token or "").encode("utf-8"), config.debug_token.encode("utf-8"))
+
+def require_debug_token(token: Optional[str]):
+    """Debug endpoints expose user queries; they are off unless DEBUG_TOKEN is set, and then require it"""
+    if not config.debug_token:
+        raise HTTPException(status_code=404, detail="Debug endpoints are disabled; set DEBUG_TOKEN to enable them")
+    if not debug_token_matches(token):
+        raise HTTPException(status_code=403, detail="Invalid debug token")
+
+@app.get("/debug/slow")
+async def debug_slow_requests(
+    limit: int = 20,
+    kind: str = "slow",
+    x_debug_token: Optional[str] = Header(default=None)
+):
+    """Full traces of the slowest (kind=slow) or most recent failed (kind=failed) requests"""
+    require_debug_token(x_debug_token)
+    recorder = get_flight_recorder(config)
+    traces = recorder.failed(limit) if kind == "failed" else recorder.slowest(limit)
+    return {"stats": recorder.stats(), "traces": traces}
+
+@app.get("/debug/slow/{trace_id}")
+async def debug_trace(trace_id: str, x_debug_token: Optional[str] = Header(default=None)):
+    """One retained trace, by the trace_id returned in response metadata"""
+    require_debug_token(x_debug_token)
+    trace = get_flight_recorder(config).get(trace_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="Trace not retained")
+    return trace
+
+@app.get("/debug/profile")
+async def debug_profiles(x_debug_token: Optional[str] = Header(default=None)):
+    """Stored request profiles and allocation growth by call site"""
+    require_debug_token(x_debug_token)
+    return get_request_profiler(config).summary()
+
+@app.get("/debug/profile/{profile_id}")
+async def debug_profile(profile_id: str, format: str = "json", x_debug_token: Optional[str] = Header(default=None)):
+    """Download one profile as JSON, or its CPU samples as folded stacks (format=folded) for flamegraph tools"""
+    require_debug_token(x_debug_token)
+    profile = get_request_profiler(config).get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    if format == "folded":
+        return PlainTextResponse(folded_text(profile), headers={
+            "Content-Disposition": f'attachment; filename="profile-{profile_id}.folded"'
+        })
+    return profile
+
+async def start_profile(x_profile: Optional[str], x_debug_token: Optional[str], label: str):
+    """Profile this request if X-Profile asks for it with the debug token, or sampling picks it"""
+    # Tracing slows every request in the process, so clients can only ask for it with DEBUG_TOKEN
+    requested = (x_profile or "").lower() in ("1", "true") and debug_token_matches(x_debug_token)
+    profiler = get_request_profiler(config)
+    if not profiler.wants(requested):
+        return None
+    # Heap snapshots take far too long to run on the event loop
+    return await asyncio.to_thread(profiler.begin, label)
+
+async def finish_profile(profile):
+    """Store a request's profile; its closing snapshot runs in a worker thread"""
+    if profile is not None:
+        await asyncio.to_thread(get_request_profiler(config).finish, profile)
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop background precomputation and close pooled upstream connections"""
+    get_hot_queries(config).stop()
+    get_pool_manager(config).close()
+
 @app.post("/chat/stream")
-async def chat_stream(request: ChatRequest):
+async def chat_stream(
+    request: ChatRequest,
+    http_request: Request,
+    x_profile: Optional[str] = Header(default=None),
+    x_debug_token: Optional[str] = Header(default=None)
+):
     """Streaming chat endpoint"""
     # Get agent with provided API keys (same as regular chat endpoint)
     current_agent = get_agent_with_keys(request.openai_api_key, request.tavily_api_key)
     
+    # Refuse a full queue with 429 now; once the stream starts the status is already 200
+    tenant = request_tenant(request, http_request)
+    try:
+        get_scheduler(config).admit(tenant)
+    except QueueFullError as e:
+        raise too_many_requests(e)
+    
     # Generate session ID if not provided
     session_id = request.session_id or str(uuid.uuid4())
     
-    # Store conversation history
-    if session_id not in sessions:
-        sessions[session_id] = []
-    
     # Add user message to history
-    user_message = ChatMessage(
+    await store_message(session_id, ChatMessage(
         role="user",
         content=request.message,
         timestamp=datetime.now()
-    )
-    sessions[session_id].append(user_message)
+    ))
+    
+    profile = await start_profile(x_profile, x_debug_token, "/chat/stream")
+    
+    if (request.stream_protocol or config.stream_protocol) != "v1":
+        response = start_delta_stream(current_agent, request, session_id, tenant, profile)
+        if profile is not None:
+            response.headers["X-Profile-Id"] = profile.profile_id
+        return response
     
     async def generate_response():
         try:
@@ -150,7 +438,16 @@ async def chat_stream(request: ChatRequest):
             yield f"data: {json.dumps({'type': 'start', 'session_id': session_id})}\n\n"
             
             # Process query with agent (current_agent already initialized above)
-            response_data = current_agent.process_query(request.message, session_id)
+            response_data = await run_scheduled(
+                request,
+                tenant,
+                "interactive",
+                current_agent.process_query,
+                request.message,
+                session_id,
+                force_full_depth=bool(request.force_full_depth),
+                profile=profile
+            )
             
             # Stream the response in chunks
             full_response = response_data.get("response", "No response generated")
@@ -179,13 +476,12 @@ async def chat_stream(request: ChatRequest):
             yield f"data: {json.dumps(final_data)}\n\n"
             
             # Add assistant message to history
-            assistant_message = ChatMessage(
+            await store_message(session_id, ChatMessage(
                 role="assistant",
                 content=full_response,
                 timestamp=datetime.now(),
                 metadata=metadata
-            )
-            sessions[session_id].append(assistant_message)
+            ))
             
         except Exception as e:
             error_data = {
@@ -193,6 +489,8 @@ async def chat_stream(request: ChatRequest):
                 'error': str(e)
             }
             yield f"data: {json.dumps(error_data)}\n\n"
+        finally:
+            await finish_profile(profile)
     
     return StreamingResponse(
         generate_response(),
@@ -204,8 +502,200 @@ async def chat_stream(request: ChatRequest):
         }
     )
 
+def client_address(connection: HTTPConnection) -> Optional[str]:
+    """Client IP; workers behind the prefork proxy listen on a Unix socket and get it from the proxy's X-Forwarded-For"""
+    if connection.client is not None and connection.client.host:
+        return connection.client.host
+    return connection.headers.get("x-forwarded-for") or None
+
+def request_tenant(request: ChatRequest, connection: HTTPConnection) -> str:
+    """Fairness and usage tenant: the caller's own API key, else the client's address"""
+    return tenant_id(request.openai_api_key, client_address(connection))
+
+def too_many_requests(error: QueueFullError) -> HTTPException:
+    return HTTPException(status_code=429, detail=str(error), headers={"Retry-After": str(error.retry_after)})
+
+async def run_scheduled(request: ChatRequest, tenant: str, default_lane: str, func, *args, profile=None, **kwargs):
+    """Run a blocking agent call in a worker thread once the fair scheduler grants this tenant a slot"""
+    lane = request.priority if request.priority in ("interactive", "batch") else default_lane
+    # The same tenant is charged for the call's token and search usage
+    kwargs["tenant"] = tenant
+    if request.openai_api_key or request.tavily_api_key:
+        # Hot answers are computed on the server's keys; callers bringing their own get their own run
+        kwargs["use_precomputed"] = False
+    async with get_scheduler(config).slot(tenant, lane):
+        if profile is not None:
+            # Sample the worker thread that runs the graph
+            return await asyncio.to_thread(profile.run, func, *args, **kwargs)
+        return await asyncio.to_thread(func, *args, **kwargs)
+
+def start_delta_stream(current_agent, request: ChatRequest, session_id: str, tenant: str, profile=None) -> StreamingResponse:
+    """Run the query in the background and stream v2 delta frames from its replay buffer"""
+    # The session's affinity token lets the prefork proxy route resumes to the worker holding the buffer
+    stream_id = f"{affinity_token(session_id)}{STREAM_TOKEN_SEPARATOR}{uuid.uuid4()}"
+    stream = replay_buffer.create(stream_id)
+    encoder = DeltaStreamEncoder(stream_id, checkpoint_every=config.stream_checkpoint_every)
+    
+    async def produce():
+        try:
+            await run_delta_frames(current_agent, request, session_id, tenant, encoder, stream.append, profile=profile)
+        finally:
+            # Finished after the answer is stored in the session, so retained memory shows up
+            await finish_profile(profile)
+            await stream.finish()
+    
+    spawn(produce())
+    return stream_response(stream, 0, bool(request.compress))
+
+async def run_delta_frames(current_agent, request: ChatRequest, session_id: str, tenant: str, encoder: DeltaStreamEncoder, emit,
+                           control: Optional[RunControl] = None, profile=None):
+    """Run the query and pass its v2 frames to emit(frames), storing the answer in the session"""
+    try:
+        await emit([encoder.start(session_id)])
+        
+        async def emit_words(text: str) -> bool:
+            """Stream word deltas; concatenating them reproduces the text exactly. False once cancelled"""
+            for i, word in enumerate(text.split(' ')):
+                if control is not None and control.cancelled:
+                    return False
+                await emit(encoder.delta(word if i == 0 else " " + word))
+                await asyncio.sleep(0.05)  # Small delay for streaming effect
+            return True
+        
+        on_draft, on_answer = None, None
+        answer_streamed = None
+        progressive = request.progressive if request.progressive is not None else config.progressive_answers
+        if progressive:
+            loop = asyncio.get_running_loop()
+            
+            async def emit_draft(draft):
+                await emit([encoder.draft(draft)])
+            
+            # Called from the agent's worker thread as soon as web search returns
+            on_draft = lambda draft: asyncio.run_coroutine_threadsafe(emit_draft(draft), loop)
+            
+            def on_answer(text):
+                # Called from the worker thread as each helpfulness check starts; the first answer
+                # streams while the check runs and later changes arrive as patches
+                nonlocal answer_streamed
+                if answer_streamed is None:
+                    answer_streamed = asyncio.run_coroutine_threadsafe(emit_words(text), loop)
+        
+        # Only multiplexed streams can be steered while they run
+        controls = {"control": control} if control is not None else {}
+        response_data = await run_scheduled(
+            request,
+            tenant,
+            "interactive",
+            current_agent.process_query,
+            request.message,
+            session_id,
+            force_full_depth=bool(request.force_full_depth),
+            on_draft=on_draft,
+            on_answer=on_answer,
+            profile=profile,
+            **controls
+        )
+        full_response = response_data.get("response", "No response generated")
+        metadata = response_data.get("metadata", {})
+        if metadata.get("cancelled"):
+            return
+        
+        if answer_streamed is None:
+            if not await emit_words(full_response):
+                return
+        else:
+            if not await asyncio.wrap_future(answer_streamed):
+                return
+            # Revisions patch the streamed answer; a rewritten one replaces it whole
+            patches = response_data.get("revisions", [])
+            if apply_patches(encoder.text, patches) != full_response:
+                patches = [{"start": 0, "end": len(encoder.text), "text": full_response}]
+            for patch in patches:
+                await emit(encoder.patch(patch["start"], patch["end"], patch["text"]))
+        
+        await emit(encoder.done(metadata, datetime.now().isoformat()))
+        
+        await store_message(session_id, ChatMessage(
+            role="assistant",
+            content=full_response,
+            timestamp=datetime.now(),
+            metadata=metadata
+        ))
+    except Exception as e:
+        await emit([encoder.error(str(e))])
+
+def stream_response(stream, after_seq: int, compress: bool) -> StreamingResponse:
+    """Serve a replay stream from a sequence number, optionally gzip-compressed"""
+    headers = dict(SSE_HEADERS, **{"X-Stream-Id": stream.stream_id})
+    frames = stream.read(after_seq)
+    if compress:
+        headers["Content-Encoding"] = "gzip"
+        return StreamingResponse(gzip_stream(frames), media_type="text/event-stream", headers=headers)
+    return StreamingResponse(frames, media_type="text/event-stream", headers=headers)
+
+@app.get("/chat/stream/{stream_id}")
+async def resume_chat_stream(
+    stream_id: str,
+    last_event_id: Optional[str] = Header(default=None),
+    compress: bool = False
+):
+    """Resume a v2 stream after the given Last-Event-ID from the server-side replay buffer"""
+    stream = replay_buffer.get(stream_id)
+    if stream is None:
+        raise HTTPException(status_code=404, detail="Stream not found or expired")
+    return stream_response(stream, parse_last_event_id(last_event_id), compress)
+
+@app.websocket("/chat/ws")
+async def chat_websocket(websocket: WebSocket):
+    """Several concurrent conversations over one connection, with cancel, skip-check and follow-up controls"""
+    await websocket.accept()
+    
+    async def receive() -> Optional[str]:
+        try:
+            return await websocket.receive_text()
+        except WebSocketDisconnect:
+            return None
+    
+    connection = MultiplexedConnection(
+        receive,
+        websocket.send_text,
+        lambda code: websocket.close(code=code),
+        lambda stream, message: run_socket_stream(stream, message, websocket),
+        max_streams=config.ws_max_streams,
+        window=config.ws_stream_window,
+        checkpoint_every=config.stream_checkpoint_every,
+        heartbeat_interval=config.ws_heartbeat_interval,
+        heartbeat_timeout=config.ws_heartbeat_timeout
+    )
+    await connection.serve()
+
+async def run_socket_stream(stream: MuxStream, message: Dict[str, Any], connection: HTTPConnection):
+    """Run one conversation started on a multiplexed connection"""
+    try:
+        request = ChatRequest(**message)
+        current_agent = get_agent_with_keys(request.openai_api_key, request.tavily_api_key)
+    except ValidationError as e:
+        return await stream.emit([stream.encoder.error(f"Invalid start message: {e.errors()[0]['msg']}")])
+    except HTTPException as e:
+        return await stream.emit([stream.encoder.error(e.detail)])
+    
+    session_id = request.session_id or str(uuid.uuid4())
+    await store_message(session_id, ChatMessage(
+        role="user",
+        content=request.message,
+        timestamp=datetime.now()
+    ))
+    tenant = request_tenant(request, connection)
+    await run_delta_frames(current_agent, request, session_id, tenant, stream.encoder, stream.emit, control=stream.control)
+
 @app.post("/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest):
+async def chat(
+    request: ChatRequest,
+    http_request: Request,
+    x_profile: Optional[str] = Header(default=None),
+    x_debug_token: Optional[str] = Header(default=None)
+):
     """Main chat endpoint (non-streaming fallback)"""
     # Get agent with provided API keys
     current_agent = get_agent_with_keys(request.openai_api_key, request.tavily_api_key)
@@ -213,64 +703,73 @@ async def chat(request: ChatRequest):
     # Generate session ID if not provided
     session_id = request.session_id or str(uuid.uuid4())
     
-    # Store conversation history
-    if session_id not in sessions:
-        sessions[session_id] = []
-    
     # Add user message to history
-    user_message = ChatMessage(
+    await store_message(session_id, ChatMessage(
         role="user",
         content=request.message,
         timestamp=datetime.now()
-    )
-    sessions[session_id].append(user_message)
+    ))
     
+    profile = await start_profile(x_profile, x_debug_token, "/chat")
     try:
-        # Process query with agent
-        response_data = current_agent.process_query(request.message, session_id)
+        # Process query with agent; non-streaming calls default to the batch lane
+        response_data = await run_scheduled(
+            request,
+            request_tenant(request, http_request),
+            "batch",
+            current_agent.process_query,
+            request.message,
+            session_id,
+            force_full_depth=bool(request.force_full_depth),
+            profile=profile
+        )
+        metadata = response_data.get("metadata", {})
+        if profile is not None:
+            metadata = dict(metadata, profile_id=profile.profile_id)
         
         # Create response
         response = ChatResponse(
             response=response_data.get("response", "No response generated"),
             session_id=session_id,
-            metadata=response_data.get("metadata", {}),
+            metadata=metadata,
             timestamp=datetime.now()
         )
         
         # Add assistant message to history
-        assistant_message = ChatMessage(
+        await store_message(session_id, ChatMessage(
             role="assistant",
             content=response.response,
             timestamp=response.timestamp,
             metadata=response.metadata
-        )
-        sessions[session_id].append(assistant_message)
+        ))
         
         return response
         
+    except QueueFullError as e:
+        raise too_many_requests(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing request: {str(e)}")
+    finally:
+        await finish_profile(profile)
 
 @app.get("/chat/{session_id}/history", response_model=List[ChatMessage])
 async def get_chat_history(session_id: str):
     """Get chat history for a session"""
-    if session_id not in sessions:
-        return []
-    return sessions[session_id]
+    return await asyncio.to_thread(sessions.history, session_id)
 
 @app.delete("/chat/{session_id}")
 async def clear_chat_history(session_id: str):
     """Clear chat history for a session"""
-    if session_id in sessions:
-        del sessions[session_id]
+    await asyncio.to_thread(sessions.delete, session_id)
     return {"message": "Chat history cleared"}
 
 @app.get("/sessions")
 async def get_sessions():
     """Get all active sessions"""
+    session_ids = await asyncio.to_thread(sessions.session_ids)
     return {
-        "sessions": list(sessions.keys()),
-        "total_sessions": len(sessions)
+        "sessions": session_ids,
+        "total_sessions": len(session_ids)
     }
 
 if __name__ == "__main__":
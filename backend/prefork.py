@@ -0,0 +1,296 @@
+"""
+Prefork Runner
+Starts one uvicorn worker process per core behind an affinity proxy that pins each session to a worker
+"""
+
+import argparse
+import asyncio
+import hmac
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, parent_dir)
+sys.path.insert(0, os.path.join(parent_dir, 'src'))
+
+from utils.config import AppConfig
+from utils.affinity import HashRing, routing_key
+
+
+MAX_HEAD_BYTES = 64 * 1024
+MAX_BODY_BYTES = 8 * 1024 * 1024
+RELAY_CHUNK = 64 * 1024
+FORWARDED_HEADER = "x-affinity-forwarded"
+CLIENT_ADDRESS_HEADER = "x-forwarded-for"
+
+# Headers rewritten by the proxy on the way to the worker
+_HOP_HEADERS = {"connection", "keep-alive", "proxy-connection", FORWARDED_HEADER}
+
+
+class Worker:
+    """One uvicorn process listening on its own Unix socket"""
+    
+    def __init__(self, index: int, socket_path: str, env: Dict[str, str]):
+        self.index = index
+        self.socket_path = socket_path
+        self.env = env
+        self.process: Optional[subprocess.Popen] = None
+        self.restarts = 0
+    
+    def start(self):
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "backend.main:app", "--uds", self.socket_path, "--log-level", "warning"],
+            cwd=parent_dir,
+            env=dict(self.env, WORKER_ID=str(self.index))
+        )
+    
+    def alive(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+    
+    def stop(self):
+        if self.alive():
+            self.process.terminate()
+
+
+class AffinityProxy:
+    """
+    HTTP front end that routes each request to the worker owning its session
+    
+    Sessions are placed on two consistent-hash rings: across nodes (when a
+    multi-replica deployment lists them) and then across this node's
+    workers. Requests for another node's sessions are forwarded once, marked
+    so the receiving node serves them locally; the mark is only honoured
+    when it carries the shared secret or, without one, when the connection
+    comes from a listed node. Requests with no session go round-robin. Each client connection carries one request; upgrade
+    requests (WebSockets) are relayed in both directions.
+    """
+    
+    def __init__(self, workers: List[Worker], nodes: Optional[List[str]] = None, self_node: Optional[str] = None,
+                 secret: Optional[str] = None):
+        self.workers = workers
+        self.worker_ring = HashRing([str(worker.index) for worker in workers])
+        self.node_ring = HashRing(nodes) if nodes and len(nodes) > 1 else None
+        self.self_node = self_node
+        self.secret = secret
+        self.node_addresses = node_addresses(nodes or [])
+        self._next = 0
+    
+    def is_relayed(self, headers: Dict[str, str], peer: Optional[str]) -> bool:
+        """Whether another replica's proxy forwarded this request, rather than a client claiming so"""
+        mark = headers.get(FORWARDED_HEADER)
+        if mark is None:
+            return False
+        if self.secret:
+            return hmac.compare_digest(mark.encode("utf-8"), self.secret.encode("utf-8"))
+        return peer is not None and peer in self.node_addresses
+    
+    def choose(self, key: Optional[str], relayed: bool = False) -> Tuple[str, object]:
+        """("node", (host, port)) for another replica, else ("worker", Worker)"""
+        if key is not None and self.node_ring is not None and not relayed:
+            node = self.node_ring.node_for(key)
+            if node != self.self_node:
+                address = urlsplit(node)
+                return "node", (address.hostname, address.port or 80)
+        if key is None:
+            self._next = (self._next + 1) % len(self.workers)
+            return "worker", self.workers[self._next]
+        return "worker", self.workers[int(self.worker_ring.node_for(key))]
+    
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+            if len(head) > MAX_HEAD_BYTES:
+                return await self._reply(writer, 431, "Request Header Fields Too Large")
+            request_line, *header_lines = head[:-4].decode("latin-1").split("\r\n")
+            method, target, _ = request_line.split(" ", 2)
+            headers_list = [line.split(":", 1) for line in header_lines if ":" in line]
+            headers = {name.strip().lower(): value.strip() for name, value in headers_list}
+            
+            # Routing needs the whole body, so a chunked one is decoded and forwarded with a Content-Length
+            if "transfer-encoding" in headers:
+                if headers["transfer-encoding"].lower() != "chunked":
+                    return await self._reply(writer, 501, "Not Implemented")
+                body = await read_chunked(reader, MAX_BODY_BYTES)
+                if body is None:
+                    return await self._reply(writer, 413, "Payload Too Large")
+                headers_list = [
+                    (name, value) for name, value in headers_list
+                    if name.strip().lower() not in ("transfer-encoding", "content-length")
+                ] + [("Content-Length", str(len(body)))]
+            else:
+                length = int(headers.get("content-length", 0) or 0)
+                if length > MAX_BODY_BYTES:
+                    return await self._reply(writer, 413, "Payload Too Large")
+                body = await reader.readexactly(length) if length else b""
+            
+            url = urlsplit(target)
+            key = routing_key(method, url.path, headers, body, query=url.query)
+            peer = writer.get_extra_info("peername")
+            peer = peer[0] if peer else None
+            relayed = self.is_relayed(headers, peer)
+            kind, destination = self.choose(key, relayed)
+            # Browsers may list other tokens next to it, e.g. "keep-alive, Upgrade"
+            upgrade = "upgrade" in {token.strip() for token in headers.get("connection", "").lower().split(",")}
+            try:
+                upstream_reader, upstream_writer = await self._open(kind, destination)
+            except OSError:
+                if kind == "node":
+                    # Another replica being down costs locality, not availability
+                    kind, destination = "worker", self.workers[int(self.worker_ring.node_for(key))]
+                    upstream_reader, upstream_writer = await self._open(kind, destination)
+                else:
+                    return await self._reply(writer, 503, "Worker Unavailable")
+            
+            # Workers see no client address over their Unix sockets, so the proxy passes it on; a client's
+            # own header is dropped, and only one relayed by another replica's proxy is kept
+            lines = [request_line] + [
+                f"{name.strip()}: {value.strip()}" for name, value in headers_list
+                if (name.strip().lower() not in _HOP_HEADERS or (upgrade and name.strip().lower() == "connection"))
+                and (relayed or name.strip().lower() != CLIENT_ADDRESS_HEADER)
+            ]
+            if not relayed and peer:
+                lines.append(f"X-Forwarded-For: {peer}")
+            if not upgrade:
+                lines.append("Connection: close")
+            if kind == "node":
+                lines.append(f"X-Affinity-Forwarded: {self.secret or 1}")
+            upstream_writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+            await upstream_writer.drain()
+            
+            relays = [self._relay(upstream_reader, writer)]
+            if upgrade:
+                relays.append(self._relay(reader, upstream_writer))
+            done, pending = await asyncio.wait([asyncio.ensure_future(relay) for relay in relays], return_when=asyncio.FIRST_COMPLETED)
+            for task in pending:
+                task.cancel()
+            upstream_writer.close()
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, OSError, ValueError):
+            pass
+        finally:
+            writer.close()
+    
+    async def _open(self, kind: str, destination):
+        if kind == "node":
+            host, port = destination
+            return await asyncio.open_connection(host, port)
+        return await asyncio.open_unix_connection(destination.socket_path)
+    
+    async def _relay(self, source: asyncio.StreamReader, sink: asyncio.StreamWriter):
+        while True:
+            chunk = await source.read(RELAY_CHUNK)
+            if not chunk:
+                return
+            sink.write(chunk)
+            await sink.drain()
+    
+    async def _reply(self, writer: asyncio.StreamWriter, status: int, reason: str):
+        body = reason.encode("utf-8")
+        writer.write(
+            f"HTTP/1.1 {status} {reason}\r\nContent-Type: text/plain\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("latin-1") + body
+        )
+        await writer.drain()
+
+
+def node_addresses(nodes: List[str]) -> set:
+    """IP addresses the listed node URLs resolve to; unresolvable nodes are skipped"""
+    addresses = set()
+    for node in nodes:
+        host = urlsplit(node).hostname
+        if not host:
+            continue
+        try:
+            addresses.update(info[4][0] for info in socket.getaddrinfo(host, None))
+        except OSError as e:
+            print(f"Could not resolve affinity node {node}: {e}")
+    return addresses
+
+
+async def read_chunked(reader: asyncio.StreamReader, limit: int) -> Optional[bytes]:
+    """Decode a chunked request body; None once it grows past limit"""
+    body = bytearray()
+    while True:
+        size = int((await reader.readuntil(b"\r\n")).split(b";", 1)[0].strip(), 16)
+        if size == 0:
+            # Trailer fields, if any, end with an empty line; routing does not need them
+            while await reader.readuntil(b"\r\n") != b"\r\n":
+                pass
+            return bytes(body)
+        if len(body) + size > limit:
+            return None
+        body += await reader.readexactly(size)
+        await reader.readexactly(2)
+
+
+async def supervise(workers: List[Worker], stop: asyncio.Event, interval: float = 1.0):
+    """Restart workers that exit, backing off while one keeps crashing"""
+    last_start = {worker.index: time.monotonic() for worker in workers}
+    while not stop.is_set():
+        for worker in workers:
+            if not worker.alive() and time.monotonic() - last_start[worker.index] >= min(30.0, 2 ** worker.restarts):
+                print(f"Worker {worker.index} exited with {worker.process.returncode}; restarting")
+                worker.restarts += 1
+                last_start[worker.index] = time.monotonic()
+                worker.start()
+        try:
+            await asyncio.wait_for(stop.wait(), interval)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def serve(config: AppConfig, host: str, port: int, workers: int):
+    runtime_dir = tempfile.mkdtemp(prefix="langgraph-agent-")
+    env = dict(os.environ)
+    # Workers must share one coordination database for sessions, caches and metrics
+    env.setdefault("SHARED_STATE_PATH", os.path.join(runtime_dir, "shared.db"))
+    env["WEB_CONCURRENCY"] = str(workers)
+    pool = [Worker(index, os.path.join(runtime_dir, f"worker-{index}.sock"), env) for index in range(workers)]
+    for worker in pool:
+        worker.start()
+    
+    nodes = [node.strip() for node in config.affinity_nodes.split(",") if node.strip()]
+    proxy = AffinityProxy(pool, nodes=nodes, self_node=config.affinity_self, secret=config.affinity_secret)
+    server = await asyncio.start_server(proxy.handle, host, port, limit=MAX_HEAD_BYTES)
+    print(f"Serving on http://{host}:{port} with {workers} workers (shared state: {env['SHARED_STATE_PATH']})")
+    
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+    
+    async with server:
+        await supervise(pool, stop)
+    for worker in pool:
+        worker.stop()
+    for worker in pool:
+        if worker.process is not None:
+            worker.process.wait()
+
+
+def main():
+    """Run the backend with one worker per core (WEB_CONCURRENCY), or a single uvicorn process"""
+    config = AppConfig()
+    parser = argparse.ArgumentParser(description="Run the backend with multiple worker processes")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1)))
+    parser.add_argument("--host", default=config.fastapi_host)
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", config.fastapi_port)))
+    args = parser.parse_args()
+    
+    if args.workers <= 1 and not config.affinity_nodes:
+        # Single worker: no proxy hop
+        os.chdir(parent_dir)
+        os.execv(sys.executable, [sys.executable, "-m", "uvicorn", "backend.main:app", "--host", args.host, "--port", str(args.port)])
+    
+    asyncio.run(serve(config, args.host, args.port, max(1, args.workers)))
+
+
+if __name__ == "__main__":
+    main()
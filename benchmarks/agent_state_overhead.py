@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Agent state overhead benchmark
+Compares search results held as tool dicts with SearchResult records, and full-state node returns with delta returns
+"""
+
+import operator
+import os
+import sys
+import time
+import tracemalloc
+from typing import Annotated, Any, Dict, List
+from typing_extensions import TypedDict
+
+from langgraph.graph import StateGraph, END
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(__file__)), 'src'))
+
+from utils.search_results import SearchResult
+
+
+def tool_dicts():
+    """One request's worth of raw results in the shapes the three tools return"""
+    web = [{
+        "title": f"Web result {i}",
+        "url": f"https://example.com/{i}",
+        "content": "w" * 600,
+        "snippet": "w" * 300 + "...",
+        "source": "web"
+    } for i in range(8)]
+    arxiv = [{
+        "title": f"Paper {i}",
+        "authors": ["A. Author", "B. Author"],
+        "summary": "s" * 1200,
+        "url": f"http://arxiv.org/abs/{i}",
+        "published": "2024-01-01",
+        "content": f"Paper {i}\n\nAuthors: A. Author, B. Author\n\nSummary: " + "s" * 500 + "...",
+        "snippet": "s" * 300 + "...",
+        "source": "arxiv"
+    } for i in range(5)]
+    youtube = [{
+        "title": f"Video {i}",
+        "url": f"https://www.youtube.com/watch?v={i}",
+        "description": "d" * 200,
+        "duration": "10:00",
+        "channel": "Channel",
+        "published_date": "1 year ago",
+        "thumbnail": f"https://i.ytimg.com/vi/{i}/hqdefault.jpg",
+        "views": "1M views",
+        "type": "youtube",
+        "score": 0.8
+    } for i in range(5)]
+    return web, arxiv, youtube
+
+
+def retained_bytes(build):
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    kept = build()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    size = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    del kept
+    return size
+
+
+def state_as_dicts():
+    web, arxiv, youtube = tool_dicts()
+    # Old tool caller: YouTube entries were kept in search_results and again in youtube_videos
+    return {"search_results": web + arxiv + youtube, "youtube_videos": youtube}
+
+
+def state_as_records():
+    web, arxiv, youtube = tool_dicts()
+    # Raw dicts are dropped once converted, as in the tool caller
+    return {"search_results": [SearchResult.from_tool_result(result) for result in web + arxiv + youtube]}
+
+
+class FullState(TypedDict):
+    query: str
+    response: str
+    search_results: List[Any]
+    tools_used: List[str]
+    tool_latencies: Dict[str, float]
+    escalations: List[str]
+    tier_usage: List[Dict[str, Any]]
+    padding: Dict[str, Any]
+
+
+class DeltaState(TypedDict):
+    query: str
+    response: str
+    search_results: List[Any]
+    tools_used: List[str]
+    tool_latencies: Dict[str, float]
+    escalations: Annotated[List[str], operator.add]
+    tier_usage: Annotated[List[Dict[str, Any]], operator.add]
+    padding: Dict[str, Any]
+
+
+def build_graph(state_type, delta):
+    results = state_as_records()["search_results"]
+    
+    def analyzer(state):
+        if delta:
+            return {"tools_used": []}
+        state["tools_used"] = []
+        return state
+    
+    def tools(state):
+        update = {"search_results": results, "tools_used": ["web_search"], "tool_latencies": {"web_search": 0.1}}
+        if delta:
+            return update
+        state.update(update)
+        return state
+    
+    def responder(state):
+        usage = {"model": "m", "latency": 0.1}
+        if delta:
+            return {"response": "answer", "tier_usage": [usage]}
+        state["response"] = "answer"
+        state["tier_usage"] = state["tier_usage"] + [usage]
+        return state
+    
+    def checker(state):
+        if delta:
+            return {"escalations": []}
+        return state
+    
+    workflow = StateGraph(state_type)
+    for name, node in (("analyzer", analyzer), ("tools", tools), ("responder", responder), ("checker", checker)):
+        workflow.add_node(name, node)
+    workflow.set_entry_point("analyzer")
+    workflow.add_edge("analyzer", "tools")
+    workflow.add_edge("tools", "responder")
+    workflow.add_edge("responder", "checker")
+    workflow.add_edge("checker", END)
+    return workflow.compile()
+
+
+def per_run(graph, iterations):
+    initial = {
+        "query": "q", "response": "", "search_results": [], "tools_used": [], "tool_latencies": {},
+        "escalations": [], "tier_usage": [], "padding": {f"key{i}": i for i in range(20)}
+    }
+    graph.invoke(dict(initial))
+    start = time.perf_counter()
+    for _ in range(iterations):
+        graph.invoke(dict(initial))
+    return (time.perf_counter() - start) / iterations
+
+
+def main():
+    dict_bytes = retained_bytes(state_as_dicts)
+    record_bytes = retained_bytes(state_as_records)
+    full = per_run(build_graph(FullState, delta=False), 300)
+    delta = per_run(build_graph(DeltaState, delta=True), 300)
+    
+    print(f"search results as tool dicts: {dict_bytes / 1024:8.1f} KiB per request")
+    print(f"search results as records:    {record_bytes / 1024:8.1f} KiB per request")
+    print(f"graph run, full-state nodes:  {full * 1e6:8.0f} us")
+    print(f"graph run, delta nodes:       {delta * 1e6:8.0f} us")
+
+
+if __name__ == "__main__":
+    main()
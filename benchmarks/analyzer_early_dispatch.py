@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Analyzer early dispatch benchmark
+Time until the web search starts, and total time, with and without dispatching tools as the analyzer's flags decode
+"""
+
+import os
+import statistics
+import sys
+import time
+from unittest.mock import Mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(__file__)), 'src'))
+
+from agents.langgraph_agent import LangGraphAgent
+from utils.config import AppConfig
+
+# Model and tool latencies in seconds, scaled down 10x
+SECONDS_PER_CHUNK = 0.02
+WEB_SECONDS = 0.3
+RESPONDER_SECONDS = 0.1
+RUNS = 5
+
+ROUTING_CHUNKS = ['{"needs_web_search": true, ', '"needs_arxiv_search": false, ', '"needs_youtube_search": false, ', '"reasoning": "']
+ROUTING_CHUNKS += ["the query asks about recent events " for _ in range(20)] + ['"}']
+
+
+def build_agent(early: bool) -> LangGraphAgent:
+    config = AppConfig()
+    config.adaptive_result_sizing = False
+    config.speculative_tools = False
+    config.early_tool_dispatch = early
+    agent = LangGraphAgent(config, openai_api_key="bench-key", tavily_api_key="bench-key")
+    agent.helpfulness_checker = Mock()
+    agent.helpfulness_checker.evaluate.return_value = 0.9
+    agent._tavily_tool = Mock()
+    agent._arxiv_tool = Mock()
+    agent._youtube_tool = Mock()
+    return agent
+
+
+def measure(early: bool):
+    agent = build_agent(early)
+    starts, totals = [], []
+    for _ in range(RUNS):
+        began = time.perf_counter()
+        search_started = []
+        
+        def web(query, **kwargs):
+            search_started.append(time.perf_counter() - began)
+            time.sleep(WEB_SECONDS)
+            return {"results": [{"title": f"Web {i}", "url": f"https://example.com/{i}", "content": "w" * 400} for i in range(5)], "answer": None}
+        
+        def stream(messages):
+            for chunk in ROUTING_CHUNKS:
+                time.sleep(SECONDS_PER_CHUNK)
+                yield Mock(content=chunk)
+        
+        def invoke(messages):
+            time.sleep(RESPONDER_SECONDS)
+            return Mock(content="An answer.")
+        
+        agent._tavily_tool.search_with_answer.side_effect = web
+        agent.llm = Mock()
+        agent.llm.invoke.side_effect = invoke
+        agent.llm.stream.side_effect = stream
+        agent.process_query("latest news on the election")
+        totals.append(time.perf_counter() - began)
+        starts.append(search_started[0])
+    return statistics.median(starts), statistics.median(totals)
+
+
+def main():
+    print(f"analyzer {len(ROUTING_CHUNKS) * SECONDS_PER_CHUNK * 1000:.0f} ms, web {WEB_SECONDS * 1000:.0f} ms, responder {RESPONDER_SECONDS * 1000:.0f} ms, median of {RUNS}")
+    for label, early in (("after parse", False), ("early", True)):
+        start, total = measure(early)
+        print(f"{label:<12} search starts {start * 1000:7.1f} ms   answer complete {total * 1000:7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
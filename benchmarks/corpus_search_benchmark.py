@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Corpus search benchmark
+Builds synthetic corpora and times brute-force float32, int8 and IVF queries, with IVF recall against the exact scan
+"""
+
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(__file__)), 'src'))
+
+from tools.corpus_index import CorpusIndex
+
+QUERIES = 200
+TOP_K = 10
+
+
+def write_corpus(root, chunks, rng):
+    """One file per 200 paragraphs of topic words plus noise; each paragraph becomes one chunk"""
+    vocabulary = np.array([f"term{i}" for i in range(20000)])
+    topics = [rng.choice(vocabulary, 12, replace=False) for _ in range(500)]
+    for start in range(0, chunks, 200):
+        paragraphs = []
+        for _ in range(min(200, chunks - start)):
+            topic = topics[rng.integers(len(topics))]
+            words = list(rng.choice(topic, 8)) + list(rng.choice(vocabulary, 30))
+            paragraphs.append(" ".join(words))
+        with open(os.path.join(root, f"doc{start // 200:05d}.txt"), "w") as f:
+            f.write("\n\n".join(paragraphs))
+    return [" ".join(rng.choice(topic, 4, replace=False)) for topic in topics]
+
+
+def time_queries(index, queries, **kwargs):
+    latencies, results = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results.append({result["url"] for result in index.search(query, max_results=TOP_K, **kwargs)})
+        latencies.append(time.perf_counter() - start)
+    return statistics.median(latencies) * 1000, sorted(latencies)[int(len(latencies) * 0.99) - 1] * 1000, results
+
+
+def main():
+    chunks = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as root:
+        docs = os.path.join(root, "docs")
+        os.makedirs(docs)
+        queries = write_corpus(docs, chunks, rng)[:QUERIES]
+        
+        variants = (
+            ("float32 brute", dict(quantize=False, nlist=0), {}),
+            ("int8 brute", dict(quantize=True, nlist=0), {}),
+            ("int8 ivf", dict(quantize=True, nlist=None), {"nprobe": 8}),
+            ("int8 ivf", None, {"nprobe": 32})
+        )
+        exact = None
+        print(f"{chunks} chunks, {len(queries)} queries, top {TOP_K}")
+        index = None
+        for label, build, search in variants:
+            build_seconds = 0.0
+            if build is not None:
+                # None reuses the previous build with other search settings
+                if index is not None:
+                    index.close()
+                index = CorpusIndex(os.path.join(root, label.replace(" ", "_")))
+                start = time.perf_counter()
+                index.build([docs], chunk_chars=400, **build)
+                build_seconds = time.perf_counter() - start
+            size = os.path.getsize(os.path.join(index.build_path, "vectors.npy")) / 2 ** 20
+            median, p99, results = time_queries(index, queries, **search)
+            if exact is None:
+                exact = results
+            recall = np.mean([len(found & expected) / max(1, len(expected)) for found, expected in zip(results, exact)])
+            label = f"{label} nprobe={search['nprobe']}" if search else label
+            print(f"{label:<20} build {build_seconds:6.1f} s  vectors {size:7.1f} MiB  p50 {median:6.2f} ms  p99 {p99:6.2f} ms  recall@{TOP_K} {recall:.3f}")
+        index.close()
+
+
+if __name__ == "__main__":
+    main()
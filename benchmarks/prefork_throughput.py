@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Prefork throughput benchmark
+Runs the backend through backend/prefork.py with increasing worker counts and measures requests per second
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+from multiprocessing import Pool
+from pathlib import Path
+
+
+def wait_ready(port: int, workers: int, timeout: float = 60.0):
+    """Wait until every worker has answered /health"""
+    seen = set()
+    deadline = time.time() + timeout
+    while time.time() < deadline and len(seen) < workers:
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=2) as response:
+                seen.add(json.loads(response.read()).get("worker_id"))
+        except OSError:
+            time.sleep(0.1)
+    return len(seen) >= workers
+
+
+def client(args):
+    """Issue requests for a fixed time; each uses a different session so load spreads over workers"""
+    port, duration, client_index = args
+    done = 0
+    deadline = time.time() + duration
+    while time.time() < deadline:
+        request = urllib.request.Request(
+            f"http://127.0.0.1:{port}/metrics/workers",
+            headers={"X-Session-Id": f"bench-{client_index}-{done}"}
+        )
+        with urllib.request.urlopen(request, timeout=10) as response:
+            response.read()
+        done += 1
+    return done
+
+
+def run(workers: int, port: int, clients: int, duration: float) -> float:
+    root = Path(__file__).resolve().parent.parent
+    env = dict(os.environ, WEB_CONCURRENCY=str(workers))
+    env.pop("OPENAI_API_KEY", None)
+    env.pop("TAVILY_API_KEY", None)
+    process = subprocess.Popen(
+        [sys.executable, "backend/prefork.py", "--port", str(port), "--host", "127.0.0.1"],
+        cwd=root, env=env, stdout=subprocess.DEVNULL
+    )
+    try:
+        if not wait_ready(port, workers):
+            raise RuntimeError(f"{workers} workers did not become ready")
+        with Pool(clients) as pool:
+            counts = pool.map(client, [(port, duration, i) for i in range(clients)])
+        return sum(counts) / duration
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workers", default=f"1,{os.cpu_count() or 1}", help="Comma-separated worker counts")
+    parser.add_argument("--clients", type=int, default=2 * (os.cpu_count() or 1))
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--port", type=int, default=8790)
+    args = parser.parse_args()
+    
+    for workers in sorted({int(count) for count in args.workers.split(",")}):
+        rate = run(workers, args.port, args.clients, args.duration)
+        print(f"{workers:3d} workers: {rate:8.0f} requests/s ({args.clients} clients)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Progressive generation benchmark
+Time until the responder starts, until the client gets the answer text, and total time, with the tool barrier and with progressive generation
+"""
+
+import os
+import statistics
+import sys
+import time
+from unittest.mock import Mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(__file__)), 'src'))
+
+from agents.langgraph_agent import LangGraphAgent
+from utils.config import AppConfig
+
+# Tool and model latencies in seconds, scaled down 10x from a fast Tavily call and a slow ArXiv one
+WEB_SECONDS = 0.08
+ARXIV_SECONDS = 0.6
+RESPONDER_SECONDS = 0.3
+RUNS = 5
+
+ROUTING = '{"needs_web_search": true, "needs_arxiv_search": true, "needs_youtube_search": false, "reasoning": "research"}'
+
+
+def build_agent(progressive: bool) -> LangGraphAgent:
+    config = AppConfig()
+    config.adaptive_result_sizing = False
+    config.progressive_generation = progressive
+    agent = LangGraphAgent(config, openai_api_key="bench-key", tavily_api_key="bench-key")
+    agent.helpfulness_checker = Mock()
+    agent.helpfulness_checker.evaluate.return_value = 0.9
+    agent._tavily_tool = Mock()
+    agent._arxiv_tool = Mock()
+    agent._youtube_tool = Mock()
+    
+    def web(query, **kwargs):
+        time.sleep(WEB_SECONDS)
+        return {"results": [{"title": f"Web {i}", "url": f"https://example.com/{i}", "content": "w" * 400} for i in range(5)], "answer": None}
+    
+    def arxiv(query, **kwargs):
+        time.sleep(ARXIV_SECONDS)
+        return [{"title": f"Paper {i}", "url": f"http://arxiv.org/abs/{i}", "summary": "s" * 400, "source": "arxiv"} for i in range(3)]
+    
+    agent._tavily_tool.search_with_answer.side_effect = web
+    agent._arxiv_tool.search.side_effect = arxiv
+    return agent
+
+
+def measure(progressive: bool):
+    agent = build_agent(progressive)
+    starts, answers, totals = [], [], []
+    for _ in range(RUNS):
+        began = time.perf_counter()
+        responder_started, answered = [], []
+        
+        def invoke(messages):
+            if "Analyze this user query" in messages[0].content:
+                return Mock(content=ROUTING)
+            responder_started.append(time.perf_counter() - began)
+            time.sleep(RESPONDER_SECONDS)
+            return Mock(content="An answer.")
+        
+        agent.llm = Mock()
+        agent.llm.invoke.side_effect = invoke
+        agent.llm.stream.side_effect = lambda messages: iter([invoke(messages)])
+        # on_answer is when a streaming endpoint starts sending the answer text
+        agent.process_query("research on transformer attention", on_answer=lambda text: answered.append(time.perf_counter() - began))
+        totals.append(time.perf_counter() - began)
+        starts.append(responder_started[0])
+        answers.append(answered[0])
+    return statistics.median(starts), statistics.median(answers), statistics.median(totals)
+
+
+def main():
+    print(f"web {WEB_SECONDS * 1000:.0f} ms, arxiv {ARXIV_SECONDS * 1000:.0f} ms, responder {RESPONDER_SECONDS * 1000:.0f} ms, median of {RUNS}")
+    for label, progressive in (("barrier", False), ("progressive", True)):
+        start, answer, total = measure(progressive)
+        print(f"{label:<12} responder starts {start * 1000:7.1f} ms   first answer text {answer * 1000:7.1f} ms   "
+              f"answer complete {total * 1000:7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Query log scan benchmark
+Writes synthetic request records and times percentile and routing queries over the memory-mapped log
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(__file__)), 'src'))
+
+from utils.query_log import RECORD_DTYPE, QueryLogReader, QueryLogWriter, record_from_trace
+
+
+def synthetic_rows(count, rng):
+    """Rows written directly in the segment format, so the benchmark measures reads"""
+    rows = np.zeros(count, dtype=RECORD_DTYPE)
+    rows["ts"] = time.time()
+    rows["routing"] = rng.integers(0, 8, count)
+    rows["tools_used"] = rows["routing"]
+    rows["helpfulness"] = rng.uniform(0, 1, count)
+    rows["total_ms"] = rng.lognormal(7, 0.5, count)
+    rows["responder_ms"] = rows["total_ms"] * 0.7
+    rows["model"] = rng.choice([b"gpt-4o-mini", b"gpt-o3"], count)
+    return rows
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2_000_000
+    rng = np.random.default_rng(0)
+    
+    with tempfile.TemporaryDirectory() as log_dir:
+        # Logging cost as seen by the request thread
+        writer = QueryLogWriter(log_dir)
+        record = record_from_trace({"query": "what is attention", "duration_ms": 1200.0, "spans": []}, "gpt-o3")
+        start = time.perf_counter()
+        for _ in range(100000):
+            writer.log(record)
+        enqueue = (time.perf_counter() - start) / 100000
+        writer.close()
+        
+        synthetic_rows(count, rng).tofile(os.path.join(log_dir, "segment-000001.rec"))
+        open(os.path.join(log_dir, "segment-000001.txt"), "wb").close()
+        
+        start = time.perf_counter()
+        reader = QueryLogReader(log_dir)
+        percentiles = reader.latency_percentiles()
+        scan = time.perf_counter() - start
+        start = time.perf_counter()
+        reader.routing_stats()
+        routing = time.perf_counter() - start
+        
+        print(f"log() on request path:  {enqueue * 1e9:8.0f} ns/record")
+        print(f"records:                {len(reader):8d} ({RECORD_DTYPE.itemsize} bytes each)")
+        print(f"latency percentiles:    {scan * 1000:8.1f} ms (total p99 {percentiles['total_ms']['p99']} ms)")
+        print(f"routing stats:          {routing * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
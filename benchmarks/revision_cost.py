@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Revision cost benchmark
+Output tokens, cost, latency and streamed bytes of one low-scoring answer fixed by a full rewrite versus a targeted revision
+"""
+
+import json
+import os
+import statistics
+import sys
+import time
+from unittest.mock import Mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(__file__)), 'src'))
+
+from agents.langgraph_agent import LangGraphAgent
+from tools.helpfulness_checker import Critique
+from utils.config import AppConfig
+from utils.revision import REVISION_SYSTEM_MESSAGE
+from utils.streaming import DeltaStreamEncoder
+
+# Simulated model speed, scaled up 20x from about 50 output tokens per second
+FIRST_TOKEN_SECONDS = 0.05
+TOKENS_PER_SECOND = 1000
+RUNS = 5
+
+ROUTING = '{"needs_web_search": false, "needs_arxiv_search": false, "needs_youtube_search": false, "reasoning": "explanation"}'
+PARAGRAPHS = [
+    f"Paragraph {i} explains one aspect of retrieval-augmented generation in detail, "
+    "covering how documents are chunked, embedded, indexed and retrieved before generation. " * 3
+    for i in range(8)
+]
+WEAK = "Evaluation is hard."
+ANSWER = "\n\n".join(PARAGRAPHS[:4] + [WEAK] + PARAGRAPHS[4:])
+REWRITE = ANSWER.replace(WEAK, "Evaluation compares retrieved passages with labelled relevant ones, using recall@k and answer faithfulness.")
+CRITIQUE = Critique(score=0.2, weak_parts=[{"quote": WEAK, "problem": "says nothing about how to evaluate"}], missing=["a worked example"])
+REVISION = json.dumps({
+    "edits": [{"find": WEAK, "replace": "Evaluation compares retrieved passages with labelled relevant ones, using recall@k and answer faithfulness."}],
+    "addendum": "For example, a support bot retrieving three manual pages per question can be scored on whether the right page is among them."
+})
+
+
+def generate(text: str) -> Mock:
+    """A chat result after the time a model would take to write text"""
+    time.sleep(FIRST_TOKEN_SECONDS + len(text) / 4 / TOKENS_PER_SECOND)
+    return Mock(content=text)
+
+
+def build_agent(mode: str) -> LangGraphAgent:
+    config = AppConfig()
+    config.adaptive_result_sizing = False
+    config.speculative_tools = False
+    config.revision_mode = mode
+    agent = LangGraphAgent(config, openai_api_key="bench-key", tavily_api_key="bench-key")
+    agent.helpfulness_checker = Mock()
+    # The analyzer defaults longer queries to web search; an empty result keeps the context identical in both modes
+    agent._tavily_tool = Mock()
+    agent._tavily_tool.search_with_answer.return_value = {"results": [], "answer": None}
+    return agent
+
+
+def measure(mode: str):
+    latencies = []
+    for _ in range(RUNS):
+        agent = build_agent(mode)
+        checks = iter([CRITIQUE, Critique(score=0.9)])
+        responder_calls = []
+        
+        def critique(query, response, on_usage=None):
+            result = next(checks)
+            # The checker's own output is charged too: the critique JSON, or a bare score in full mode
+            content = json.dumps(result.to_dict()) if mode == "targeted" else str(result.score)
+            if on_usage is not None:
+                on_usage("gpt-3.5-turbo", [], generate(content))
+            return result
+        
+        def invoke(messages):
+            prompt = messages[0].content
+            if "Analyze this user query" in prompt:
+                return generate(ROUTING)
+            if prompt == REVISION_SYSTEM_MESSAGE:
+                return generate(REVISION)
+            responder_calls.append(messages)
+            return generate(ANSWER if len(responder_calls) == 1 else REWRITE)
+        
+        agent.helpfulness_checker.critique.side_effect = critique
+        agent.helpfulness_checker.evaluate.side_effect = lambda query, response, on_usage=None: critique(query, response, on_usage).score
+        agent.llm = Mock()
+        agent.llm.invoke.side_effect = invoke
+        agent.llm.stream.side_effect = lambda messages: iter([invoke(messages)])
+        
+        streamed = []
+        began = time.perf_counter()
+        result = agent.process_query("how does retrieval-augmented generation work", on_answer=streamed.append)
+        latencies.append(time.perf_counter() - began)
+    return statistics.median(latencies), result, streamed[0]
+
+
+def stream_bytes(first: str, result) -> int:
+    """Bytes of v2 frames after the first answer streamed: its patches, or the whole new answer again"""
+    encoder = DeltaStreamEncoder("bench")
+    encoder.delta(first)
+    patches = result["revisions"] or [{"start": 0, "end": len(first), "text": result["response"]}]
+    return sum(len(frame) for patch in patches for frame in encoder.patch(patch["start"], patch["end"], patch["text"]))
+
+
+def main():
+    print(f"answer {len(ANSWER)} chars with one weak passage, median of {RUNS}; output tokens per node")
+    for mode in ("full", "targeted"):
+        latency, result, first = measure(mode)
+        usage = result["metadata"]["usage"]
+        output = {node: usage["by_node"].get(node, {}).get("output_tokens", 0) for node in ("responder", "reviser", "helpfulness_checker")}
+        print(
+            f"{mode:<9} responder {output['responder']:5d}  reviser {output['reviser']:4d}  checker {output['helpfulness_checker']:3d}  "
+            f"total {usage['output_tokens']:5d}  cost ${usage['cost_usd']:.4f}  latency {latency * 1000:6.1f} ms  "
+            f"after first answer {stream_bytes(first, result):5d} B streamed"
+        )
+
+
+if __name__ == "__main__":
+    main()
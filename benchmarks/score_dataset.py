@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Helpfulness regression harness
+Scores a recorded JSONL dataset of {"query", "response"} records in batches
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(__file__)), 'src'))
+
+from tools.helpfulness_checker import HelpfulnessChecker
+
+
+def main():
+    """Score every record in the dataset and print aggregate statistics"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("dataset", help="JSONL file with query/response records")
+    parser.add_argument("--pack-size", type=int, default=4)
+    parser.add_argument("--max-concurrency", type=int, default=8)
+    parser.add_argument("--output", help="Optional .npy file to save the raw scores")
+    args = parser.parse_args()
+
+    load_dotenv()
+
+    queries, responses = [], []
+    with open(args.dataset, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                queries.append(record["query"])
+                responses.append(record["response"])
+
+    checker = HelpfulnessChecker()
+    start_time = time.time()
+    scores = checker.evaluate_many(
+        queries,
+        responses,
+        pack_size=args.pack_size,
+        max_concurrency=args.max_concurrency
+    )
+    elapsed = time.time() - start_time
+
+    print(f"Scored {len(scores)} answers in {elapsed:.2f}s ({len(scores) / max(elapsed, 1e-9) * 60:.0f}/min)")
+    if len(scores):
+        print(f"mean={scores.mean():.3f} p10={np.percentile(scores, 10):.3f} "
+              f"p50={np.percentile(scores, 50):.3f} below_0.3={(scores < 0.3).mean():.1%}")
+
+    if args.output:
+        np.save(args.output, scores)
+
+
+if __name__ == "__main__":
+    main()
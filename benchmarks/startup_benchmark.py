@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Startup benchmark
+Launches the backend with uvicorn and measures time to first served request and time to ready
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+from pathlib import Path
+
+
+def fetch_json(url: str):
+    with urllib.request.urlopen(url, timeout=2) as response:
+        return json.loads(response.read())
+
+
+def run_once(port: int, timeout: float) -> dict:
+    """Start one server process and time it until it reports ready"""
+    root = Path(__file__).resolve().parent.parent
+    env = os.environ.copy()
+    env["PYTHONPATH"] = os.pathsep.join([str(root / "src"), str(root / "backend"), str(root)])
+    
+    launched = time.time()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=root,
+        env=env
+    )
+    first_response = None
+    ready = None
+    report = None
+    try:
+        while time.time() - launched < timeout:
+            if first_response is None:
+                try:
+                    fetch_json(f"http://127.0.0.1:{port}/health/live")
+                except OSError:
+                    time.sleep(0.02)
+                    continue
+                first_response = time.time() - launched
+            try:
+                # 503 (an HTTPError, so an OSError) until ready
+                health = fetch_json(f"http://127.0.0.1:{port}/health")
+            except OSError:
+                time.sleep(0.05)
+                continue
+            if health["status"] == "healthy":
+                ready = time.time() - launched
+                report = fetch_json(f"http://127.0.0.1:{port}/health/startup")
+                break
+            time.sleep(0.05)
+    finally:
+        process.terminate()
+        process.wait()
+    
+    return {"first_response": first_response, "ready": ready, "report": report}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    args = parser.parse_args()
+    
+    runs = [run_once(args.port, args.timeout) for _ in range(args.runs)]
+    
+    for name in ("first_response", "ready"):
+        values = [r[name] for r in runs if r[name] is not None]
+        if values:
+            print(f"{name:>15}: median {statistics.median(values):.3f}s  min {min(values):.3f}s  max {max(values):.3f}s")
+        else:
+            print(f"{name:>15}: not reached within {args.timeout}s")
+    
+    last_report = next((r["report"] for r in reversed(runs) if r["report"]), None)
+    if last_report:
+        print("\nStage breakdown (last run):")
+        for stage in last_report["stages"]:
+            print(f"  {stage['stage']:<22} start {stage['start']:>7.3f}s  took {stage['duration']:>7.3f}s")
+
+
+if __name__ == "__main__":
+    main()
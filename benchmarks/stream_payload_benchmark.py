@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Stream payload benchmark
+Compares bytes sent and encoding time of the legacy v1 and delta v2 SSE protocols
+"""
+
+import json
+import os
+import sys
+import time
+import zlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(__file__)), 'src'))
+
+from utils.streaming import DeltaStreamEncoder
+
+
+def legacy_frames(words):
+    current_text = ""
+    for word in words:
+        current_text += word + " "
+        chunk_data = {'type': 'chunk', 'content': word + " ", 'full_content': current_text.strip()}
+        yield f"data: {json.dumps(chunk_data)}\n\n"
+
+
+def delta_frames(words):
+    encoder = DeltaStreamEncoder("benchmark")
+    for i, word in enumerate(words):
+        yield from encoder.delta(word if i == 0 else " " + word)
+
+
+def measure(frames):
+    start = time.perf_counter()
+    payload = "".join(frames).encode("utf-8")
+    elapsed = time.perf_counter() - start
+    return len(payload), len(zlib.compress(payload)), elapsed
+
+
+def main():
+    print(f"{'words':>7} {'v1 bytes':>12} {'v2 bytes':>10} {'v2 gzip':>9} {'v1 ms':>8} {'v2 ms':>7}")
+    for n in (100, 1000, 5000, 20000):
+        words = [f"word{i % 97}" for i in range(n)]
+        v1_bytes, _, v1_time = measure(legacy_frames(words))
+        v2_bytes, v2_gzip, v2_time = measure(delta_frames(words))
+        print(f"{n:>7} {v1_bytes:>12} {v2_bytes:>10} {v2_gzip:>9} {v1_time * 1000:>8.1f} {v2_time * 1000:>7.1f}")
+
+
+if __name__ == "__main__":
+    main()
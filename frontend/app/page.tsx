@@ -77,7 +77,15 @@ export default function Home() {
       const stream = chatService.current.sendMessageStream(message, sessionId)
       
       for await (const chunk of stream) {
-        if (chunk.type === 'chunk' && chunk.full_content) {
+        if (chunk.type === 'draft' && chunk.text && !fullContent) {
+          // Provisional answer from web search; replaced by the first streamed chunk
+          const draftText = `*Draft (refining...)*\n\n${chunk.text}`
+          setMessages(prev => prev.map((msg, index) => 
+            index === prev.length - 1 && msg.role === 'assistant' 
+              ? { ...msg, content: draftText }
+              : msg
+          ))
+        } else if ((chunk.type === 'chunk' || chunk.type === 'patch') && chunk.full_content !== undefined) {
           fullContent = chunk.full_content
           
           // Update the message in real-time
@@ -2,7 +2,7 @@ export interface Source {
   title: string
   url: string
   snippet: string
-  type: 'web' | 'arxiv' | 'youtube'
+  type: 'web' | 'arxiv' | 'youtube' | 'corpus'
   published_date?: string
   score: number
   // YouTube-specific fields
@@ -114,14 +114,15 @@ export class ChatService {
   }
 
   async *sendMessageStream(message: string, sessionId: string): AsyncGenerator<{
-    type: 'start' | 'chunk' | 'done' | 'error'
+    type: 'start' | 'draft' | 'chunk' | 'patch' | 'done' | 'error'
     content?: string
+    text?: string
     full_content?: string
     metadata?: any
     session_id?: string
     error?: string
   }> {
-    const response = await fetch(`${this.baseUrl}/chat/stream`, {
+    let response = await fetch(`${this.baseUrl}/chat/stream`, {
       method: 'POST',
       headers: {
         'Content-Type': 'application/json',
@@ -131,6 +132,7 @@ export class ChatService {
         session_id: sessionId,
         openai_api_key: this.openaiApiKey,
         tavily_api_key: this.tavilyApiKey,
+        stream_protocol: 'v2',
       }),
     })
 
@@ -138,6 +140,49 @@ export class ChatService {
       throw new Error('Failed to start streaming')
     }
 
+    // v2 frames carry only deltas; rebuild the full text client-side
+    const streamId = response.headers.get('X-Stream-Id')
+    let fullContent = ''
+    let lastSeq = 0
+    let resumeAttempts = 0
+
+    while (true) {
+      try {
+        for await (const data of this.readEvents(response)) {
+          if (data.seq) {
+            if (data.seq <= lastSeq) continue
+            lastSeq = data.seq
+          }
+          if (data.type === 'delta') {
+            fullContent += data.delta
+            yield { type: 'chunk', content: data.delta, full_content: fullContent }
+          } else if (data.type === 'patch') {
+            // Revisions replace a span of the answer; offsets are UTF-16 code units, like JS string indexes
+            fullContent = fullContent.slice(0, data.start) + data.text + fullContent.slice(data.end)
+            yield { type: 'patch', text: data.text, full_content: fullContent }
+          } else if (data.type === 'checkpoint') {
+            if (data.length !== fullContent.length) {
+              console.warn('Stream checkpoint mismatch', data.length, fullContent.length)
+            }
+          } else {
+            yield data
+            if (data.type === 'done' || data.type === 'error') return
+          }
+        }
+        return
+      } catch (e) {
+        // Resume from the server-side replay buffer after a dropped connection
+        if (!streamId || resumeAttempts >= 3) throw e
+        resumeAttempts += 1
+        response = await fetch(`${this.baseUrl}/chat/stream/${streamId}`, {
+          headers: { 'Last-Event-ID': String(lastSeq) },
+        })
+        if (!response.ok) throw e
+      }
+    }
+  }
+
+  private async *readEvents(response: Response): AsyncGenerator<any> {
     const reader = response.body?.getReader()
     const decoder = new TextDecoder()
 
@@ -145,19 +190,20 @@ export class ChatService {
       throw new Error('No response body')
     }
 
+    let buffer = ''
     try {
       while (true) {
         const { done, value } = await reader.read()
         if (done) break
 
-        const chunk = decoder.decode(value)
-        const lines = chunk.split('\n')
+        buffer += decoder.decode(value, { stream: true })
+        const lines = buffer.split('\n')
+        buffer = lines.pop() || ''
 
         for (const line of lines) {
           if (line.startsWith('data: ')) {
             try {
-              const data = JSON.parse(line.slice(6))
-              yield data
+              yield JSON.parse(line.slice(6))
             } catch (e) {
               console.error('Failed to parse SSE data:', e)
             }
@@ -3,37 +3,97 @@ LangGraph Agent Implementation
 Core agent logic with tool integration and state management
 """
 
+import operator
 import time
-from typing import Dict, List, Any, Optional
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from functools import partial
+from typing import Annotated, Callable, Dict, List, Any, Optional
 from typing_extensions import TypedDict
 from langchain_openai import ChatOpenAI
-from pydantic import SecretStr
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
 from langgraph.graph import StateGraph, END
 import uuid
 
-from tools.tavily_search import TavilySearchTool
-from tools.arxiv_search import ArxivSearchTool
-from tools.youtube_search import YouTubeSearchTool
-from tools.helpfulness_checker import HelpfulnessChecker
+from tools.helpfulness_checker import HelpfulnessChecker, Critique
 from utils.config import AppConfig
+from utils.http_pool import get_pool_manager
+from utils.adaptive_sizing import get_result_policy
+from utils.speculation import get_prefetcher, get_early_dispatcher
+from utils.model_cascade import ModelTier, parse_cascade, looks_unconfident, estimate_tokens, get_cascade_metrics
+from utils.draft_answer import build_draft, DraftPolicy
+from utils.subqueries import normalize_sub_queries, plan_calls, fuse_results
+from utils.flight_recorder import RequestTrace, get_flight_recorder
+from utils.query_log import record_from_trace, get_query_log
+from utils.hot_queries import PRECOMPUTE_TENANT, get_hot_queries
+from utils.search_results import SearchResult
+from utils.run_control import RunControl, RunCancelled
+from utils.progressive import ToolResultStream, Arrival, additional_sources_section
+from utils.json_stream import IncrementalJSONParser, JSONStreamError
+from utils.usage import UsageMeter, parse_prices, count_tokens, provider_usage, get_usage_ledger
+from utils.revision import REVISION_MODES, REVISION_SYSTEM_MESSAGE, build_revision_prompt, parse_revision, apply_revision
+from utils.scheduler import tenant_id
+
+
+# Analyzer model, and the responder's when no cascade is configured
+DEFAULT_MODEL = "gpt-o3"
+
+# Number of search results packed into the responder's context
+CONTEXT_RESULTS = 5
+
+# Tool name -> analyzer decision flag; the local corpus comes first so its results lead the context
+TOOL_FLAGS = {
+    "corpus_search": "needs_corpus_search",
+    "web_search": "needs_web_search",
+    "arxiv_search": "needs_arxiv_search",
+    "youtube_search": "needs_youtube_search"
+}
 
 
 class AgentState(TypedDict):
-    """State definition for the agent"""
+    """
+    State definition for the agent
+    
+    Nodes return only the keys they change; list keys annotated with a
+    reducer accumulate across responder passes instead of being replaced.
+    """
     messages: List[Any]
     query: str
     response: str
     tools_used: List[str]
-    search_results: List[Dict]
-    youtube_videos: List[Dict]
+    search_results: List[SearchResult]
     helpfulness_score: Optional[float]
     session_id: str
     iteration_count: int
     needs_web_search: bool
     needs_arxiv_search: bool
     needs_youtube_search: bool
+    needs_corpus_search: bool
     analysis_reasoning: Optional[str]
+    force_full_depth: bool
+    fetch_plan: Optional[Dict[str, Any]]
+    tool_latencies: Dict[str, float]
+    prefetch: Optional[Any]
+    model_tier: int
+    escalate_to: Optional[int]
+    escalations: Annotated[List[str], operator.add]
+    tier_usage: Annotated[List[Dict[str, Any]], operator.add]
+    draft: Optional[Dict[str, Any]]
+    draft_accepted: bool
+    on_draft: Optional[Any]
+    sub_queries: List[Dict[str, Any]]
+    control: Optional[RunControl]
+    follow_ups: Annotated[List[str], operator.add]
+    follow_up_passes: int
+    pending_tools: Optional[ToolResultStream]
+    early_dispatch: Dict[str, float]
+    late_results: int
+    usage: Optional[UsageMeter]
+    budget_mode: Optional[str]
+    critique: Optional[Dict[str, Any]]
+    revisions: Annotated[List[Dict[str, Any]], operator.add]
+    on_answer: Optional[Any]
+    trace: Optional[Any]
 
 
 class LangGraphAgent:
@@ -51,38 +111,181 @@ class LangGraphAgent:
         if not self.tavily_api_key:
             raise ValueError("Tavily API key is required. Set TAVILY_API_KEY environment variable or pass tavily_api_key parameter.")
         
+        # Every client draws connections from the process-wide pools
+        self.http_pool = get_pool_manager(config)
+        
         self.llm = ChatOpenAI(
-            model="gpt-o3",
+            model=DEFAULT_MODEL,
             temperature=0.1,
             streaming=True,
-            api_key=SecretStr(self.openai_api_key)
+            stream_usage=True,
+            api_key=self.openai_api_key,
+            http_client=self.http_pool.httpx_client,
+            http_async_client=self.http_pool.httpx_async_client
         )
         
-        # Initialize tools with dynamic API keys
-        self.tavily_tool = TavilySearchTool(api_key=self.tavily_api_key)
-        self.arxiv_tool = ArxivSearchTool()
-        self.youtube_tool = YouTubeSearchTool()
-        self.helpfulness_checker = HelpfulnessChecker(api_key=self.openai_api_key)
+        # Responder cascade, cheapest first; without one the responder is the analyzer model
+        self.responder_tiers = parse_cascade(config.responder_cascade, default_model=DEFAULT_MODEL)
+        self.responder_llms = [self._build_responder(tier) for tier in self.responder_tiers] if len(self.responder_tiers) > 1 else None
+        
+        # Tenants over their budget are answered by a cheaper model, built on first use
+        self.token_prices = parse_prices(config.token_prices)
+        self._fallback_llm = None
+        
+        # Decides when the web search's own answer is good enough to skip the responder
+        self.draft_policy = DraftPolicy(mode=config.draft_skip_llm)
         
-        # Available tools
-        self.tools = [
+        if config.revision_mode not in REVISION_MODES:
+            raise ValueError(f"Unknown revision mode '{config.revision_mode}', expected one of {REVISION_MODES}")
+        
+        # Search tools are imported and built on first use, so a request only
+        # pays for the tool modules it actually needs
+        self._tavily_tool = None
+        self._arxiv_tool = None
+        self._youtube_tool = None
+        self._corpus_tool = None
+        self.helpfulness_checker = HelpfulnessChecker(
+            api_key=self.openai_api_key,
+            http_client=self.http_pool.httpx_client,
+            http_async_client=self.http_pool.httpx_async_client
+        )
+        
+        # Fetch sizes adapt to which results actually get used, across all agents in the process
+        self.result_policy = get_result_policy(config)
+        
+        # The graph is compiled on first use or during warm_up()
+        self._graph = None
+    
+    def _build_responder(self, tier):
+        """Chat model for one cascade tier, bounded by the tier's timeout"""
+        return ChatOpenAI(
+            model=tier.model,
+            temperature=0.1,
+            streaming=True,
+            stream_usage=True,
+            api_key=self.openai_api_key,
+            timeout=tier.timeout,
+            max_retries=1,
+            http_client=self.http_pool.httpx_client,
+            http_async_client=self.http_pool.httpx_async_client
+        )
+    
+    @property
+    def fallback_llm(self):
+        """Cheaper model for tenants past their budget"""
+        if self._fallback_llm is None:
+            self._fallback_llm = self._build_responder(ModelTier(self.config.budget_fallback_model))
+        return self._fallback_llm
+    
+    @property
+    def tavily_tool(self):
+        """Web search tool"""
+        if self._tavily_tool is None:
+            from tools.tavily_search import TavilySearchTool
+            self._tavily_tool = TavilySearchTool(
+                api_key=self.tavily_api_key,
+                session=self.http_pool.requests_session
+            )
+        return self._tavily_tool
+    
+    @property
+    def arxiv_tool(self):
+        """Academic paper search tool"""
+        if self._arxiv_tool is None:
+            from tools.arxiv_search import ArxivSearchTool
+            self._arxiv_tool = ArxivSearchTool(
+                index_dir=self.config.arxiv_index_dir if self.config.arxiv_backend == "local" else None,
+                session=self.http_pool.requests_session
+            )
+        return self._arxiv_tool
+    
+    @property
+    def youtube_tool(self):
+        """Educational video search tool"""
+        if self._youtube_tool is None:
+            from tools.youtube_search import YouTubeSearchTool
+            self._youtube_tool = YouTubeSearchTool(session=self.http_pool.requests_session)
+        return self._youtube_tool
+    
+    @property
+    def corpus_tool(self):
+        """Private document search tool over the local corpus index"""
+        if self._corpus_tool is None:
+            from tools.corpus_search import CorpusSearchTool
+            self._corpus_tool = CorpusSearchTool(self.config.corpus_index_dir, nprobe=self.config.corpus_nprobe)
+        return self._corpus_tool
+    
+    def _tool_enabled(self, tool: str) -> bool:
+        """Corpus search is only offered when a corpus index is configured"""
+        return tool != "corpus_search" or bool(self.config.corpus_index_dir)
+    
+    @property
+    def tools(self) -> List[Any]:
+        """Available tools as LangChain tool interfaces"""
+        tools = [
             self.tavily_tool.get_tool(),
             self.arxiv_tool.get_tool(),
             self.youtube_tool.get_tool()
         ]
+        if self._tool_enabled("corpus_search"):
+            tools.append(self.corpus_tool.get_tool())
+        return tools
+    
+    @property
+    def graph(self):
+        """Compiled LangGraph workflow"""
+        if self._graph is None:
+            self._graph = self._build_graph()
+        return self._graph
+    
+    def warm_up(self, timer=None):
+        """
+        Prepare everything the first request would otherwise pay for
+        
+        Compiles the graph, builds the search tools and opens connections
+        in the shared pools to upstream APIs concurrently. Each step is recorded
+        as a stage on the optional StartupTimer.
+        """
+        def stage(name):
+            return timer.stage(name) if timer is not None else nullcontext()
         
-        # Build the graph
-        self.graph = self._build_graph()
+        def run(name, step):
+            try:
+                with stage(name):
+                    step()
+            except Exception as e:
+                print(f"Warm-up step {name} failed: {e}")
         
+        steps = {
+            "compile_graph": lambda: self.graph,
+            "load_tokenizer": lambda: count_tokens("", DEFAULT_MODEL),
+            "load_web_search": lambda: self.tavily_tool,
+            "load_youtube_search": lambda: self.youtube_tool,
+            "warm_openai": lambda: self.llm.root_client.models.list(),
+            "warm_tavily": lambda: self.http_pool.requests_session.head("https://api.tavily.com", timeout=10),
+            "warm_arxiv": self._warm_arxiv
+        }
+        if self._tool_enabled("corpus_search"):
+            steps["load_corpus_search"] = lambda: self.corpus_tool
+        with ThreadPoolExecutor(max_workers=len(steps)) as executor:
+            for name, step in steps.items():
+                executor.submit(run, name, step)
+    
+    def _warm_arxiv(self):
+        """Open the arXiv client's pooled connection unless a local index is used"""
+        if self.arxiv_tool.local_index is None:
+            self.http_pool.requests_session.head("https://export.arxiv.org/api/query", timeout=10)
+    
     def _build_graph(self):
         """Build the LangGraph workflow"""
         workflow = StateGraph(AgentState)
         
         # Add nodes
-        workflow.add_node("analyzer", self._analyze_query)
-        workflow.add_node("tool_caller", self._call_tools)
-        workflow.add_node("responder", self._generate_response)
-        workflow.add_node("helpfulness_checker", self._check_helpfulness)
+        workflow.add_node("analyzer", traced("analyzer", self._analyze_query))
+        workflow.add_node("tool_caller", traced("tool_caller", self._call_tools))
+        workflow.add_node("responder", traced("responder", self._generate_response))
+        workflow.add_node("helpfulness_checker", traced("helpfulness_checker", self._check_helpfulness))
+        workflow.add_node("reviser", traced("reviser", self._revise_response))
         
         # Add edges
         workflow.set_entry_point("analyzer")
@@ -94,32 +297,50 @@ class LangGraphAgent:
                 "direct_response": "responder"
             }
         )
-        workflow.add_edge("tool_caller", "responder")
-        workflow.add_edge("responder", "helpfulness_checker")
+        workflow.add_conditional_edges(
+            "tool_caller",
+            self._should_generate,
+            {
+                "generate": "responder",
+                "draft_accepted": END
+            }
+        )
+        if self.config.progressive_generation:
+            # The responder may start before every tool returned; stragglers are merged after it
+            workflow.add_node("late_merger", traced("late_merger", self._merge_late_results))
+            workflow.add_edge("responder", "late_merger")
+            workflow.add_edge("late_merger", "helpfulness_checker")
+        else:
+            workflow.add_edge("responder", "helpfulness_checker")
         workflow.add_conditional_edges(
             "helpfulness_checker",
             self._should_regenerate,
             {
                 "regenerate": "responder",
+                "revise": "reviser",
                 "finish": END
             }
         )
+        workflow.add_edge("reviser", "helpfulness_checker")
         
         return workflow.compile()
     
-    def _analyze_query(self, state: AgentState) -> AgentState:
+    def _analyze_query(self, state: AgentState) -> Dict[str, Any]:
         """Use LLM to intelligently analyze query intent"""
         query = state["query"]
+        corpus = self._tool_enabled("corpus_search")
+        corpus_key = '    "needs_corpus_search": true/false,\n' if corpus else ""
+        corpus_guideline = f"- **Corpus search**: Our own {self.config.corpus_description}; questions about our organization, systems and processes\n" if corpus else ""
         
         analysis_prompt = f"""
 Analyze this user query and determine what type of information sources would be most helpful.
 
 Query: "{query}"
 
-Consider the intent and information needs. Return your analysis as valid JSON with boolean values:
+Consider the intent and information needs. Return your analysis as valid JSON with boolean values, keys in this order:
 
 {{
-    "needs_web_search": true/false,
+{corpus_key}    "needs_web_search": true/false,
     "needs_arxiv_search": true/false, 
     "needs_youtube_search": true/false,
     "reasoning": "Brief explanation of your analysis"
@@ -129,109 +350,378 @@ Guidelines:
 - **Web search**: Current events, news, real-time data, company information, stock prices, weather, recent developments, general knowledge that changes frequently
 - **ArXiv search**: Academic research papers, scientific studies, peer-reviewed publications, theoretical concepts, research methodology, scholarly work
 - **YouTube search**: Tutorials, how-to guides, step-by-step instructions, learning content, demonstrations, educational videos, beginner explanations
-
+{corpus_guideline}
 Multiple sources can be selected if the query would benefit from different types of information.
+"""
+        if self.config.subquery_decomposition:
+            analysis_prompt += f"""
+If the query contains independent parts that need different searches (for example "compare X and Y and show me a tutorial for Z"),
+also include "sub_queries": a list of at most {self.config.max_subqueries} objects, each with a self-contained "query" string
+and its own {'"needs_corpus_search", ' if corpus else ""}"needs_web_search", "needs_arxiv_search" and "needs_youtube_search" booleans. Omit "sub_queries" for single-part queries.
 """
         
+        update = {}
+        dispatched = {}
         try:
-            messages = [HumanMessage(content=analysis_prompt)]
-            response = self.llm.invoke(messages)
-            
-            # Parse JSON response
-            import json
-            response_text = str(response.content).strip()
+            analysis = self._stream_analysis(state, analysis_prompt, update, dispatched)
             
-            # Extract JSON if it's wrapped in code blocks
-            if "```json" in response_text:
-                response_text = response_text.split("```json")[1].split("```")[0].strip()
-            elif "```" in response_text:
-                response_text = response_text.split("```")[1].split("```")[0].strip()
+            for tool, flag in TOOL_FLAGS.items():
+                update[flag] = bool(analysis.get(flag, False)) and self._tool_enabled(tool)
+            update["analysis_reasoning"] = analysis.get("reasoning", "")
             
-            analysis = json.loads(response_text)
-            
-            state["needs_web_search"] = analysis.get("needs_web_search", False)
-            state["needs_arxiv_search"] = analysis.get("needs_arxiv_search", False)  
-            state["needs_youtube_search"] = analysis.get("needs_youtube_search", False)
-            state["analysis_reasoning"] = analysis.get("reasoning", "")
+            if self.config.subquery_decomposition:
+                update["sub_queries"] = normalize_sub_queries(analysis.get("sub_queries"), self.config.max_subqueries)
+                for sub_query in update["sub_queries"]:
+                    for tool, flag in TOOL_FLAGS.items():
+                        sub_query[flag] = sub_query[flag] and self._tool_enabled(tool)
+                        update[flag] = update[flag] or sub_query[flag]
             
             # Ensure at least one tool is selected for non-trivial queries
-            if not any([state["needs_web_search"], state["needs_arxiv_search"], state["needs_youtube_search"]]):
+            if not any(update[flag] for flag in TOOL_FLAGS.values()):
                 if len(query.split()) > 2:  # For substantial queries, default to web search
-                    state["needs_web_search"] = True
-                    state["analysis_reasoning"] += " (Defaulted to web search for substantial query)"
+                    update["needs_web_search"] = True
+                    update["analysis_reasoning"] += " (Defaulted to web search for substantial query)"
                     
         except Exception as e:
-            print(f"LLM Analysis error: {e}")
-            # Intelligent fallback based on query characteristics
-            query_lower = query.lower()
-            
-            # Simple heuristics as fallback
-            state["needs_web_search"] = len(query.split()) > 2
-            state["needs_arxiv_search"] = any(word in query_lower for word in ["research", "study", "paper", "academic"])
-            state["needs_youtube_search"] = any(word in query_lower for word in ["how to", "tutorial", "learn", "guide"])
-            state["analysis_reasoning"] = f"Fallback analysis due to error: {str(e)}"
+            log_error(state, "analyzer", "Analyzer output error" if isinstance(e, JSONStreamError) else "LLM Analysis error", e)
+            # Intelligent fallback based on query characteristics; tools already dispatched stay claimable
+            update.update(heuristic_tool_selection(query, corpus=corpus))
+            update["analysis_reasoning"] = f"Fallback analysis due to error: {str(e)}"
+        
+        # How long before the end of the analyzer each early tool was started
+        finished = time.time()
+        update["early_dispatch"] = {tool: round(finished - dispatched_at, 4) for tool, dispatched_at in dispatched.items()}
             
-        return state
+        return update
+    
+    def _stream_analysis(self, state: AgentState, prompt: str, update: Dict[str, Any], dispatched: Dict[str, float]) -> Dict[str, Any]:
+        """
+        Stream the analyzer's JSON, starting each selected tool as soon as its flag is decoded
+        
+        Early tools run on the early-dispatch pool but are attached to the
+        request's prefetch handle, so the tool caller claims them like
+        prefetched results. The handle and the fetch plan
+        they used are written to update. Malformed output raises
+        JSONStreamError at the first bad character instead of after the
+        whole response.
+        """
+        early = self.config.early_tool_dispatch and not self.config.subquery_decomposition
+        tool_for_flag = {flag: tool for tool, flag in TOOL_FLAGS.items()}
+        parser = IncrementalJSONParser()
+        llm, model = self._llm_for(state, self.llm, DEFAULT_MODEL)
+        messages = [HumanMessage(content=prompt)]
+        text, reported = [], None
+        stream = llm.stream(messages)
+        try:
+            for chunk in stream:
+                text.append(str(chunk.content))
+                if provider_usage(chunk) is not None:
+                    reported = chunk
+                for key, value in parser.feed(text[-1]):
+                    if key not in tool_for_flag:
+                        continue
+                    if not isinstance(value, bool):
+                        raise JSONStreamError(f"{key} must be true or false", parser.position)
+                    if value and early and self._tool_enabled(tool_for_flag[key]):
+                        self._dispatch_early(state, tool_for_flag[key], update, dispatched)
+                if parser.done:
+                    # Anything after the object (a closing code fence) is not needed
+                    break
+        finally:
+            if hasattr(stream, "close"):
+                stream.close()
+            # Usage arrives on the last chunk; a stream stopped at the closing brace is counted locally
+            if state.get("usage") is not None:
+                state["usage"].record_llm("analyzer", model, messages, reported, output_text="".join(text))
+        return parser.result()
+    
+    def _llm_for(self, state: AgentState, llm, model: str):
+        """The given model, or the budget fallback model once the tenant is past its budget"""
+        if state.get("budget_mode") == "fallback_model":
+            return self.fallback_llm, self.config.budget_fallback_model
+        return llm, model
+    
+    def _dispatch_early(self, state: AgentState, tool: str, update: Dict[str, Any], dispatched: Dict[str, float]):
+        """Start a tool the analyzer has just selected on the request's prefetch handle, on the early-dispatch pool"""
+        query = state["query"]
+        plan = update.get("fetch_plan") or state.get("fetch_plan")
+        if plan is None:
+            plan = update["fetch_plan"] = self.result_policy.plan(query, force_full_depth=state.get("force_full_depth", False))
+        search = self._search_fn(tool, state.get("usage"))
+        call = lambda: search(query, **plan[tool])
+        
+        prefetch = update.get("prefetch") or state.get("prefetch")
+        dispatcher = get_early_dispatcher(self.config)
+        if prefetch is None:
+            update["prefetch"] = dispatcher.start({tool: call})
+            dispatched[tool] = time.time()
+        elif prefetch.add(tool, call, prefetcher=dispatcher):
+            dispatched[tool] = time.time()
     
     def _should_use_tools(self, state: AgentState) -> str:
         """Decide whether to use tools or respond directly"""
-        if state.get("needs_web_search") or state.get("needs_arxiv_search") or state.get("needs_youtube_search"):
+        if any(state.get(flag) for flag in TOOL_FLAGS.values()):
             return "use_tools"
         return "direct_response"
     
-    def _call_tools(self, state: AgentState) -> AgentState:
+    def _call_tools(self, state: AgentState) -> Dict[str, Any]:
         """Execute relevant tools based on analysis"""
         query = state["query"]
         search_results = []
         tools_used = []
+        tool_latencies = {}
+        draft = None
+        plan = state.get("fetch_plan") or self.result_policy.plan(query, force_full_depth=state.get("force_full_depth", False))
+        
+        if state.get("sub_queries"):
+            return self._call_sub_queries(state, plan)
+        
+        selected = [tool for tool, flag in TOOL_FLAGS.items() if state.get(flag)]
+        if self.config.progressive_generation and len(selected) > 1:
+            return self._call_tools_progressive(state, plan, selected)
+        
+        # Internal documents first: a local lookup takes milliseconds
+        if state.get("needs_corpus_search"):
+            try:
+                corpus_results, tool_latencies["corpus_search"] = self._run_tool(state, "corpus_search", plan)
+                search_results.extend(SearchResult.from_tool_result(result) for result in corpus_results)
+                tools_used.append("corpus_search")
+            except Exception as e:
+                log_error(state, "corpus_search", "Corpus search error", e)
         
         # Web search if needed
         if state.get("needs_web_search"):
             try:
-                web_results = self.tavily_tool.search(query)
-                search_results.extend(web_results)
+                web_response, tool_latencies["web_search"] = self._run_tool(state, "web_search", plan)
+                web_results = web_response["results"]
+                search_results.extend(SearchResult.from_tool_result(result) for result in web_results)
                 tools_used.append("web_search")
+                
+                # Surface the search's own answer immediately, before the other tools and the responder
+                draft = build_draft(web_response.get("answer"), web_results)
+                if draft is not None and state.get("on_draft") is not None:
+                    state["on_draft"](draft)
             except Exception as e:
-                print(f"Web search error: {e}")
+                log_error(state, "web_search", "Web search error", e)
         
         # ArXiv search if needed
         if state.get("needs_arxiv_search"):
             try:
-                arxiv_results = self.arxiv_tool.search(query)
-                search_results.extend(arxiv_results)
+                arxiv_results, tool_latencies["arxiv_search"] = self._run_tool(state, "arxiv_search", plan)
+                search_results.extend(SearchResult.from_tool_result(result) for result in arxiv_results)
                 tools_used.append("arxiv_search")
             except Exception as e:
-                print(f"ArXiv search error: {e}")
+                log_error(state, "arxiv_search", "ArXiv search error", e)
         
         # YouTube search if needed
-        youtube_videos = []
         if state.get("needs_youtube_search"):
             try:
-                youtube_results = self.youtube_tool.search(query, max_results=3)
-                youtube_videos = youtube_results
-                # Also add to search_results for unified processing
-                search_results.extend(youtube_results)
+                youtube_results, tool_latencies["youtube_search"] = self._run_tool(state, "youtube_search", plan)
+                search_results.extend(SearchResult.from_tool_result(result) for result in youtube_results)
                 tools_used.append("youtube_search")
             except Exception as e:
-                print(f"YouTube search error: {e}")
+                log_error(state, "youtube_search", "YouTube search error", e)
+        
+        if state.get("prefetch") is not None:
+            state["prefetch"].close(needed=[tool for tool in TOOL_FLAGS if state.get(TOOL_FLAGS[tool])])
+        
+        update = {
+            "search_results": search_results,
+            "tools_used": tools_used,
+            "fetch_plan": plan,
+            "tool_latencies": tool_latencies,
+            "draft": draft
+        }
+        
+        other_tools = bool(state.get("needs_arxiv_search") or state.get("needs_youtube_search") or state.get("needs_corpus_search"))
+        update["draft_accepted"] = self.draft_policy.accept(query, draft, other_tools=other_tools)
+        if update["draft_accepted"]:
+            update["response"] = draft["text"]
+        
+        return update
+    
+    def _call_sub_queries(self, state: AgentState, plan: Dict[str, Any]) -> Dict[str, Any]:
+        """Run each sub-query's tools concurrently and fuse the results into one ranking"""
+        sub_queries = state["sub_queries"]
+        calls = plan_calls(sub_queries, TOOL_FLAGS, self.config.max_upstream_calls)
+        
+        def run(call):
+            index, tool = call
+            start = time.time()
+            try:
+                results = self._search_fn(tool, state.get("usage"))(sub_queries[index]["query"], **plan[tool])
+                if tool == "web_search":
+                    results = results["results"]
+            except Exception as e:
+                log_error(state, tool, f"Sub-query {tool} error", e)
+                results = []
+            return results, time.time() - start
+        
+        with ThreadPoolExecutor(max_workers=max(1, min(self.config.subquery_concurrency, len(calls)))) as executor:
+            outcomes = list(executor.map(run, calls))
+        
+        # Speculation targeted the raw query, so none of it is reusable here
+        if state.get("prefetch") is not None:
+            state["prefetch"].close()
+        
+        tools_used, tool_latencies = [], {}
+        for (index, tool), (results, latency) in zip(calls, outcomes):
+            if tool not in tools_used:
+                tools_used.append(tool)
+            # Calls overlap, so a tool's latency is its slowest call
+            tool_latencies[tool] = max(tool_latencies.get(tool, 0.0), latency)
+        
+        return {
+            "search_results": [SearchResult.from_tool_result(result) for result in fuse_results([results for results, _ in outcomes])],
+            "tools_used": tools_used,
+            "fetch_plan": plan,
+            "tool_latencies": tool_latencies,
+            "draft_accepted": False
+        }
+    
+    def _call_tools_progressive(self, state: AgentState, plan: Dict[str, Any], tools: List[str]) -> Dict[str, Any]:
+        """Start every selected tool at once and hand the responder whatever has arrived by the evidence threshold"""
+        stream = ToolResultStream({tool: (lambda tool=tool: self._run_tool(state, tool, plan)) for tool in tools})
+        arrivals = stream.wait_for_evidence(
+            self.config.progressive_min_results,
+            self.config.progressive_grace_seconds,
+            evidence=lambda arrival: len(arrival_results(arrival))
+        )
+        
+        search_results, tools_used, tool_latencies = self._collect_arrivals(state, arrivals)
+        draft = None
+        web = next((arrival for arrival in arrivals if arrival.tool == "web_search" and arrival.error is None), None)
+        if web is not None:
+            draft = build_draft(web.value.get("answer"), web.value["results"])
+            if draft is not None and state.get("on_draft") is not None:
+                state["on_draft"](draft)
+        
+        update = {
+            "search_results": search_results,
+            "tools_used": tools_used,
+            "fetch_plan": plan,
+            "tool_latencies": tool_latencies,
+            "draft": draft,
+            "pending_tools": stream if stream.pending else None
+        }
+        # Progressive mode only runs with several tools selected, so others always contribute
+        update["draft_accepted"] = self.draft_policy.accept(state["query"], draft, other_tools=True)
+        if update["draft_accepted"]:
+            update["response"] = draft["text"]
+        if state.get("prefetch") is not None and not stream.pending:
+            state["prefetch"].close(needed=tools)
+        return update
+    
+    def _merge_late_results(self, state: AgentState) -> Dict[str, Any]:
+        """
+        Wait for tools still running after the responder, then fold their results into the answer or sources
+        
+        The answer is announced before the wait, so a streaming caller is
+        not held up by slow tools; an "Additional sources" section is
+        appended as a patch to it.
+        """
+        stream = state.get("pending_tools")
+        if stream is None:
+            return {"pending_tools": None}
+        if not self._escalates_unconfident(state):
+            self._announce_answer(state)
+        arrivals = stream.wait_for_rest(self.config.progressive_late_timeout)
+        stream.close()
+        if state.get("prefetch") is not None:
+            state["prefetch"].close(needed=[tool for tool, flag in TOOL_FLAGS.items() if state.get(flag)])
+        
+        late, tools_used, tool_latencies = self._collect_arrivals(state, arrivals)
+        update = {"pending_tools": None}
+        if not late:
+            return update
+        update["search_results"] = state.get("search_results", []) + late
+        update["tools_used"] = state.get("tools_used", []) + tools_used
+        update["tool_latencies"] = dict(state.get("tool_latencies", {}), **tool_latencies)
+        update["late_results"] = state.get("late_results", 0) + len(late)
+        if self.config.progressive_late_results == "section":
+            section = additional_sources_section(late)
+            end = len(state["response"])
+            update["response"] = state["response"] + section
+            update["revisions"] = [{"start": end, "end": end, "text": section}]
+        return update
+    
+    def _collect_arrivals(self, state: AgentState, arrivals: List[Arrival]):
+        """Search results, tools used and latencies from tool outcomes, in the usual tool order"""
+        search_results, tools_used, tool_latencies = [], [], {}
+        for arrival in sorted(arrivals, key=lambda arrival: list(TOOL_FLAGS).index(arrival.tool)):
+            if arrival.error is not None:
+                log_error(state, arrival.tool, f"{arrival.tool} error", arrival.error)
+                continue
+            search_results.extend(SearchResult.from_tool_result(result) for result in arrival_results(arrival))
+            tools_used.append(arrival.tool)
+            tool_latencies[arrival.tool] = arrival.latency
+        return search_results, tools_used, tool_latencies
+    
+    def _should_generate(self, state: AgentState) -> str:
+        """Skip the responder when the draft answer was accepted"""
+        return "draft_accepted" if state.get("draft_accepted") else "generate"
+    
+    def _search_fn(self, tool: str, usage: Optional[UsageMeter] = None):
+        """Search callable for a tool name, counting each call on the request's usage meter"""
+        if tool == "web_search":
+            search = self.tavily_tool.search_with_answer
+        elif tool == "arxiv_search":
+            search = self.arxiv_tool.search
+        elif tool == "corpus_search":
+            search = self.corpus_tool.search
+        else:
+            search = self.youtube_tool.search
+        if usage is None:
+            return search
         
-        state["search_results"] = search_results
-        state["youtube_videos"] = youtube_videos
-        state["tools_used"] = tools_used
+        def counted(query, **kwargs):
+            usage.record_search(tool, kwargs.get("search_depth"))
+            return search(query, **kwargs)
+        return counted
+    
+    def _run_tool(self, state: AgentState, tool: str, plan: Dict[str, Any]):
+        """Run one tool, using its speculative result when one was prefetched"""
+        prefetch = state.get("prefetch")
+        if prefetch is not None:
+            claimed = prefetch.claim(tool)
+            if claimed is not None:
+                return claimed
         
-        return state
+        start = time.time()
+        results = self._search_fn(tool, state.get("usage"))(state["query"], **plan[tool])
+        return results, time.time() - start
     
-    def _generate_response(self, state: AgentState) -> AgentState:
+    def _start_prefetch(self, query: str, plan: Dict[str, Any], usage: Optional[UsageMeter] = None):
+        """Speculatively start the tools the keyword heuristic predicts, alongside the analyzer"""
+        predicted = heuristic_tool_selection(query, corpus=self._tool_enabled("corpus_search"))
+        calls = {}
+        for tool, flag in TOOL_FLAGS.items():
+            if predicted[flag]:
+                search = self._search_fn(tool, usage)
+                calls[tool] = lambda search=search, kwargs=plan[tool]: search(query, **kwargs)
+        return get_prefetcher().start(calls) if calls else None
+    
+    def _generate_response(self, state: AgentState) -> Dict[str, Any]:
         """Generate the final response"""
         query = state["query"]
-        search_results = state.get("search_results", [])
         
-        # Create context from search results
-        context = ""
-        if search_results:
-            context = "\n\nRelevant information:\n"
-            for i, result in enumerate(search_results[:5], 1):
-                context += f"{i}. {result.get('title', 'N/A')}: {result.get('content', result.get('snippet', 'No content'))}\n"
+        update = {}
+        tier = state.get("model_tier", 0)
+        if state.get("escalate_to") is not None:
+            tier = update["model_tier"] = state["escalate_to"]
+            update["escalate_to"] = None
+        
+        # Follow-ups sent while the graph was running steer this and every later pass
+        follow_ups = list(state.get("follow_ups", []))
+        if state.get("control") is not None:
+            new_follow_ups = state["control"].take_follow_ups()
+            if new_follow_ups:
+                update["follow_ups"] = new_follow_ups
+                follow_ups += new_follow_ups
+                if state["response"]:
+                    # An extra pass over an answer already written; bounded by MAX_REVISIONS
+                    update["follow_up_passes"] = state.get("follow_up_passes", 0) + 1
+        context = self._build_context(state, follow_ups)
         
         # Generate response
         system_message = """You are a helpful AI assistant. Provide comprehensive, accurate, and helpful responses. 
@@ -243,47 +733,274 @@ Multiple sources can be selected if the query would benefit from different types
             HumanMessage(content=f"Query: {query}{context}")
         ]
         
+        llm, model = self._llm_for(state, self.responder_llms[tier] if self.responder_llms else self.llm, self.responder_tiers[tier].model)
+        tokens = None
+        start = time.time()
         try:
-            response = self.llm.invoke(messages)
-            state["response"] = str(response.content) if hasattr(response.content, '__str__') else str(response.content)
+            response = llm.invoke(messages)
+            response_text = str(response.content)
+            if state.get("usage") is not None:
+                tokens = state["usage"].record_llm("responder", model, messages, response)
         except Exception as e:
-            state["response"] = f"I apologize, but I encountered an error while generating a response: {str(e)}"
+            response_text = f"I apologize, but I encountered an error while generating a response: {str(e)}"
+            if state.get("trace") is not None:
+                state["trace"].error("responder", e)
+            if tier < len(self.responder_tiers) - 1 and state.get("budget_mode") != "fallback_model":
+                # Timeouts and errors on a cheaper tier go straight to the next one
+                update["escalate_to"] = tier + 1
+                update["escalations"] = ["error"]
+        
+        update["response"] = response_text
+        # A rewrite answers any pending critique
+        update["critique"] = None
+        update["tier_usage"] = [{
+            "model": model,
+            "latency": time.time() - start,
+            "tokens": tokens if tokens is not None else estimate_tokens(system_message, messages[1].content, response_text),
+            "prompt_chars": len(system_message) + len(messages[1].content),
+            "response_chars": len(response_text)
+        }]
         
-        return state
+        return update
     
-    def _check_helpfulness(self, state: AgentState) -> AgentState:
-        """Check if the response is helpful"""
+    def _revise_response(self, state: AgentState) -> Dict[str, Any]:
+        """Patch the parts of the answer the helpfulness critique named instead of rewriting all of it"""
+        critique = state["critique"]
+        if not critique.get("weak_parts") and not critique.get("missing"):
+            # Nothing specific to fix: only a rewrite can improve the answer
+            return self._generate_response(state)
+        
+        tier = state.get("model_tier", 0)
+        context = self._build_context(state, list(state.get("follow_ups", [])))
+        messages = [
+            SystemMessage(content=REVISION_SYSTEM_MESSAGE),
+            HumanMessage(content=build_revision_prompt(state["query"], context, state["response"], critique))
+        ]
+        
+        llm, model = self._llm_for(state, self.responder_llms[tier] if self.responder_llms else self.llm, self.responder_tiers[tier].model)
+        tokens, output = None, ""
+        start = time.time()
         try:
-            score = self.helpfulness_checker.evaluate(
-                state["query"], 
-                state["response"]
-            )
-            state["helpfulness_score"] = score
+            result = llm.invoke(messages)
+            output = str(result.content)
+            if state.get("usage") is not None:
+                tokens = state["usage"].record_llm("reviser", model, messages, result)
+            revision = parse_revision(output)
+        except Exception as e:
+            log_error(state, "reviser", "Revision error", e)
+            revision = None
+        call = {
+            "model": model,
+            "latency": time.time() - start,
+            "tokens": tokens if tokens is not None else estimate_tokens(REVISION_SYSTEM_MESSAGE, messages[1].content, output),
+            "prompt_chars": len(REVISION_SYSTEM_MESSAGE) + len(messages[1].content),
+            "response_chars": len(output),
+            "revision": True
+        }
+        
+        response, patches = apply_revision(state["response"], revision) if revision is not None else (state["response"], [])
+        if patches:
+            update = {"response": response, "revisions": patches, "critique": None}
+        else:
+            # Unreadable output, or edits that match nothing in the answer
+            update = self._generate_response(state)
+        update["tier_usage"] = [call] + update.get("tier_usage", [])
+        return update
+    
+    def _build_context(self, state: AgentState, follow_ups: List[str]) -> str:
+        """Search results, sub-questions and follow-ups for the responder's prompt"""
+        context = ""
+        search_results = state.get("search_results", [])
+        if search_results:
+            context = "\n\nRelevant information:\n"
+            for i, result in enumerate(search_results[:CONTEXT_RESULTS], 1):
+                context += f"{i}. {result.title or 'N/A'}: {result.context}\n"
+        
+        # Decomposed queries list their parts so the answer covers each one
+        if state.get("sub_queries"):
+            context += "\nAddress each part of the question:\n" + "".join(f"- {sub_query['query']}\n" for sub_query in state["sub_queries"])
+        
+        if follow_ups:
+            context += "\nThe user added while you were working:\n" + "".join(f"- {follow_up}\n" for follow_up in follow_ups)
+        return context
+    
+    def _check_helpfulness(self, state: AgentState) -> Dict[str, Any]:
+        """Check if the response is helpful, with a critique of its weak parts when it is not"""
+        if state.get("escalate_to") is not None:
+            # A node must write at least one key; the pending escalation is left as it is
+            return {"escalate_to": state["escalate_to"]}
+        
+        if state.get("control") is not None and state["control"].skip_helpfulness:
+            # The client accepted the answer as it is
+            self._announce_answer(state)
+            return {"helpfulness_score": None}
+        
+        if state.get("budget_mode") is not None:
+            # Past the tenant's soft budget: no check, so no escalation or regeneration either
+            self._announce_answer(state)
+            return {"helpfulness_score": None}
+        
+        tier = state.get("model_tier", 0)
+        can_escalate = tier < len(self.responder_tiers) - 1
+        if self._escalates_unconfident(state):
+            # Cheap signal: skip the helpfulness call and go to the stronger model
+            return {"escalate_to": tier + 1, "escalations": ["low_confidence"]}
+        
+        self._announce_answer(state)
+        try:
+            usage = state.get("usage")
+            on_usage = partial(usage.record_llm, "helpfulness_checker") if usage is not None else None
+            if self.config.revision_mode == "targeted":
+                critique = self.helpfulness_checker.critique(state["query"], state["response"], on_usage=on_usage)
+            else:
+                critique = Critique(score=self.helpfulness_checker.evaluate(state["query"], state["response"], on_usage=on_usage))
         except Exception as e:
-            print(f"Helpfulness check error: {e}")
-            state["helpfulness_score"] = 0.5  # Default neutral score
+            log_error(state, "helpfulness_checker", "Helpfulness check error", e)
+            critique = Critique()  # Default neutral score
+        
+        score = critique.score
+        update = {"helpfulness_score": score}
+        if can_escalate and score < self.config.cascade_escalate_below:
+            update["escalate_to"] = tier + 1
+            update["escalations"] = ["low_helpfulness"]
+        elif score < self.config.revise_below and state.get("iteration_count", 0) < self.config.max_revisions:
+            # Consumed by the reviser, or by the responder for a full rewrite
+            update["critique"] = critique.to_dict()
+            update["iteration_count"] = state.get("iteration_count", 0) + 1
         
-        return state
+        return update
+    
+    def _escalates_unconfident(self, state: AgentState) -> bool:
+        """Whether the answer sounds unsure and a stronger model is left to take over, so it is not shown"""
+        return state.get("model_tier", 0) < len(self.responder_tiers) - 1 and looks_unconfident(state["response"])
+    
+    def _announce_answer(self, state: AgentState):
+        """Hand the answer being checked to the caller, which may show it before any revision arrives"""
+        if state.get("on_answer") is not None:
+            state["on_answer"](state["response"])
     
     def _should_regenerate(self, state: AgentState) -> str:
-        """Decide whether to regenerate response based on helpfulness"""
-        helpfulness_score = state.get("helpfulness_score", 0.5)
-        iteration_count = state.get("iteration_count", 0)
+        """Decide whether to regenerate or revise the response based on helpfulness"""
+        if state.get("escalate_to") is not None:
+            return "regenerate"
         
-        # Regenerate if score is low and we haven't tried too many times
-        if helpfulness_score is not None and helpfulness_score < 0.3 and iteration_count < 2:
-            state["iteration_count"] = iteration_count + 1
+        # Follow-ups that arrived after the responder started get their own pass, up to MAX_REVISIONS;
+        # past that the run finishes and any left are reported as follow_ups_unanswered
+        if (state.get("control") is not None and state["control"].has_follow_ups()
+                and state.get("follow_up_passes", 0) < self.config.max_revisions):
             return "regenerate"
         
+        # A low score left a critique, within the revision limit
+        if state.get("critique") is not None:
+            return "revise" if self.config.revision_mode == "targeted" else "regenerate"
+        
         return "finish"
     
-    def process_query(self, query: str, session_id: Optional[str] = None) -> Dict[str, Any]:
-        """Process a user query and return response with metadata"""
+    def _record_result_utility(self, state: AgentState):
+        """Feed back, per tool, which of the results the responder saw were cited in the answer"""
+        plan = state.get("fetch_plan")
+        if not plan:
+            return
+        
+        response = state.get("response", "")
+        response_lower = response.lower()
+        # Only results in the responder's context say anything about utility; late results
+        # were merged after it ran and the rest were cut by CONTEXT_RESULTS
+        search_results = state.get("search_results", [])
+        seen_count = min(CONTEXT_RESULTS, len(search_results) - state.get("late_results", 0))
+        outcomes = {tool: {"ranks": [], "cited_ranks": []} for tool in state.get("tools_used", [])}
+        ranks: Dict[str, int] = {}
+        for position, result in enumerate(search_results, 1):
+            ranks[result.tool] = ranks.get(result.tool, 0) + 1
+            outcome = outcomes.get(result.tool)
+            if outcome is None or position > seen_count:
+                continue
+            outcome["ranks"].append(ranks[result.tool])
+            url, title = result.url, result.title
+            # The context numbers results, so "[2]" refers to the second one
+            if ((url and url in response) or (len(title) > 12 and title.lower() in response_lower)
+                    or f"[{position}]" in response):
+                outcome["cited_ranks"].append(ranks[result.tool])
+        
+        any_cited = any(outcome["cited_ranks"] for outcome in outcomes.values())
+        for tool, outcome in outcomes.items():
+            if not outcome["ranks"]:
+                # None of this tool's results reached the responder, so nothing was learned about them
+                continue
+            # Cited results say exactly how deep we needed to go; otherwise assume
+            # every result that made it into the context was needed
+            self.result_policy.record(
+                plan["query_class"],
+                tool,
+                plan[tool],
+                seen=len(outcome["ranks"]),
+                used_ranks=outcome["cited_ranks"] or outcome["ranks"],
+                cited=len(outcome["cited_ranks"]) if any_cited else None,
+                latency=state.get("tool_latencies", {}).get(tool, 0.0)
+            )
+    
+    def _record_trace(self, record: Dict[str, Any], model: Optional[str]):
+        """Hand a finished trace to the flight recorder and, when enabled, the query log"""
+        get_flight_recorder(self.config).record(record)
+        query_log = get_query_log(self.config)
+        if query_log is not None:
+            query_log.log(record_from_trace(record, model))
+    
+    def _charge(self, usage: UsageMeter, tenant: str, session_id: str) -> Dict[str, Any]:
+        """Add a finished request's usage to its tenant and session; returns the request's summary"""
+        summary = usage.summary()
+        get_usage_ledger(self.config).record(summary, tenant, session_id)
+        return summary
+    
+    def precompute(self, query: str) -> Dict[str, Any]:
+        """Run the full graph for a hot query on behalf of the background precomputer"""
+        return self.process_query(query, session_id="precompute", use_precomputed=False, tenant=PRECOMPUTE_TENANT)
+    
+    def process_query(self, query: str, session_id: Optional[str] = None, force_full_depth: bool = False,
+                      on_draft: Optional[Callable[[Dict[str, Any]], None]] = None,
+                      use_precomputed: bool = True, control: Optional[RunControl] = None,
+                      tenant: Optional[str] = None,
+                      on_answer: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+        """
+        Process a user query and return response with metadata
+        
+        on_draft, if given, is called from the tool caller with the draft
+        answer as soon as web search returns, and on_answer with each answer
+        as its helpfulness check starts (with progressive generation, before
+        late tool results are awaited); the result's revisions are the
+        patches later made to it: targeted revisions and any late sources
+        section. control lets the caller cancel
+        the run, skip the helpfulness check or add follow-ups while it runs.
+        Token and search usage is charged to tenant (by default the
+        anonymous tenant), whose budget may degrade the run. With hot query
+        precomputation enabled, a fresh precomputed answer is returned
+        without running the graph.
+        """
         start_time = time.time()
         
         if not session_id:
             session_id = str(uuid.uuid4())
         
+        if self.config.hot_query_precompute and use_precomputed and not force_full_depth:
+            hot_queries = get_hot_queries(self.config)
+            hot_queries.observe(query)
+            precomputed = hot_queries.lookup(query)
+            if precomputed is not None:
+                if control is not None:
+                    control.close()
+                return precomputed_result(*precomputed, session_id=session_id, start_time=start_time)
+        trace = RequestTrace(str(uuid.uuid4()), session_id, query)
+        tenant = tenant or tenant_id()
+        usage = UsageMeter(self.token_prices)
+        # Answers shared with every tenant are never degraded by a spending budget
+        budget_mode = None if tenant == PRECOMPUTE_TENANT else get_usage_ledger(self.config).budget_mode(tenant)
+        
+        # Speculation needs the fetch plan before the analyzer runs; otherwise the tool caller plans
+        plan, prefetch = None, None
+        if self.config.speculative_tools:
+            plan = self.result_policy.plan(query, force_full_depth=force_full_depth)
+            prefetch = self._start_prefetch(query, plan, usage)
+        
         # Initial state
         initial_state: AgentState = {
             "messages": [],
@@ -291,60 +1008,207 @@ Multiple sources can be selected if the query would benefit from different types
             "response": "",
             "tools_used": [],
             "search_results": [],
-            "youtube_videos": [],
             "helpfulness_score": None,
             "session_id": session_id,
             "iteration_count": 0,
             "needs_web_search": False,
             "needs_arxiv_search": False,
             "needs_youtube_search": False,
-            "analysis_reasoning": None
+            "needs_corpus_search": False,
+            "analysis_reasoning": None,
+            "force_full_depth": force_full_depth,
+            "fetch_plan": plan,
+            "tool_latencies": {},
+            "prefetch": prefetch,
+            "model_tier": 0,
+            "escalate_to": None,
+            "escalations": [],
+            "tier_usage": [],
+            "draft": None,
+            "draft_accepted": False,
+            "on_draft": on_draft,
+            "sub_queries": [],
+            "control": control,
+            "follow_ups": [],
+            "follow_up_passes": 0,
+            "pending_tools": None,
+            "early_dispatch": {},
+            "late_results": 0,
+            "usage": usage,
+            "budget_mode": budget_mode,
+            "critique": None,
+            "revisions": [],
+            "on_answer": on_answer,
+            "trace": trace
         }
         
         try:
             # Execute the graph
-            final_state = self.graph.invoke(initial_state)
+            try:
+                final_state = self.graph.invoke(initial_state)
+            finally:
+                # Direct responses never reach the tool caller; discard any speculative work
+                if prefetch is not None:
+                    prefetch.close()
+                unanswered = control.close() if control is not None else []
+            
+            # An accepted draft ends the run before late tool results are merged
+            if final_state.get("pending_tools") is not None:
+                final_state["pending_tools"].close()
+            # Tools the analyzer dispatched early are discarded if the run never reached the tool caller
+            if final_state.get("prefetch") is not None:
+                final_state["prefetch"].close()
             
             processing_time = time.time() - start_time
+            self._record_result_utility(final_state)
+            get_cascade_metrics().record(self.responder_tiers, final_state.get("tier_usage", []), final_state.get("escalations", []))
+            model = None if final_state.get("draft_accepted") else self.responder_tiers[final_state.get("model_tier", 0)].model
+            if model is not None and budget_mode == "fallback_model":
+                model = self.config.budget_fallback_model
+            usage_summary = self._charge(usage, tenant, session_id)
+            self._record_trace(trace.finish(trace_details(final_state)), model)
             
-            # Format sources for frontend
-            sources = []
             search_results = final_state.get("search_results", [])
-            for result in search_results:
-                source = {
-                    "title": result.get("title", "Unknown Title"),
-                    "url": result.get("url", ""),
-                    "snippet": result.get("content", result.get("snippet", "No preview available"))[:200] + "...",
-                    "type": "arxiv" if "arxiv.org" in result.get("url", "") else "web",
-                    "published_date": result.get("published_date", result.get("date")),
-                    "score": result.get("score", 0.5)
-                }
-                sources.append(source)
             
             metadata = {
                 "tools_used": final_state.get("tools_used", []),
                 "processing_time": processing_time,
                 "helpfulness_score": final_state.get("helpfulness_score"),
                 "search_results_count": len(search_results),
+                "tool_latencies": final_state.get("tool_latencies", {}),
+                "model": model,
+                "escalations": final_state.get("escalations", []),
+                "draft": (final_state.get("draft") or {}).get("kind"),
+                "draft_accepted": final_state.get("draft_accepted", False),
+                "sub_queries": [sub_query["query"] for sub_query in final_state.get("sub_queries", [])],
+                "follow_ups": final_state.get("follow_ups", []),
+                "late_results": final_state.get("late_results", 0),
+                "early_dispatch": final_state.get("early_dispatch", {}),
+                "usage": usage_summary,
+                "budget_mode": budget_mode,
+                "revisions": len(final_state.get("revisions", [])),
                 "session_id": session_id,
-                "sources": sources[:10]  # Limit to top 10 sources
+                "trace_id": trace.trace_id,
+                "sources": [result.source() for result in search_results[:10]]  # Limit to top 10 sources
             }
+            if unanswered:
+                metadata["follow_ups_unanswered"] = unanswered
             
             return {
                 "response": final_state.get("response", "No response generated"),
                 "metadata": metadata,
                 "tools_used": final_state.get("tools_used", []),
-                "youtube_videos": len(final_state.get("youtube_videos", [])),
-                "search_results": len(final_state.get("search_results", [])),
-                "analysis_reasoning": final_state.get("analysis_reasoning", "")
+                "youtube_videos": sum(1 for result in search_results if result.tool == "youtube_search"),
+                "search_results": len(search_results),
+                "analysis_reasoning": final_state.get("analysis_reasoning", ""),
+                "revisions": final_state.get("revisions", [])
             }
             
+        except RunCancelled:
+            # Not a failure: kept out of the failed-trace ring but still logged
+            usage_summary = self._charge(usage, tenant, session_id)
+            self._record_trace(trace.finish(dict(trace_details(initial_state), cancelled=True)), None)
+            return {
+                "response": "",
+                "metadata": {
+                    "cancelled": True,
+                    "usage": usage_summary,
+                    "processing_time": time.time() - start_time,
+                    "session_id": session_id,
+                    "trace_id": trace.trace_id
+                }
+            }
         except Exception as e:
+            trace.error("process_query", e)
+            usage_summary = self._charge(usage, tenant, session_id)
+            self._record_trace(trace.finish(trace_details(initial_state), failed=True), None)
             return {
                 "response": f"I encountered an error while processing your request: {str(e)}",
                 "metadata": {
                     "error": str(e),
+                    "usage": usage_summary,
                     "processing_time": time.time() - start_time,
-                    "session_id": session_id
+                    "session_id": session_id,
+                    "trace_id": trace.trace_id
                 }
-            }
\ No newline at end of file
+            }
+
+
+def precomputed_result(age: float, result: Dict[str, Any], session_id: str, start_time: float) -> Dict[str, Any]:
+    """A shared precomputed result, re-labelled for the request serving it"""
+    metadata = dict(
+        result["metadata"],
+        session_id=session_id,
+        processing_time=time.time() - start_time,
+        precomputed=True,
+        precomputed_age=round(age, 1),
+        usage=None,
+        trace_id=None
+    )
+    return dict(result, metadata=metadata)
+
+
+def arrival_results(arrival: Arrival) -> List[Dict[str, Any]]:
+    """Raw result dicts of a successful tool arrival"""
+    return arrival.value["results"] if arrival.tool == "web_search" else arrival.value
+
+
+def heuristic_tool_selection(query: str, corpus: bool = False) -> Dict[str, bool]:
+    """Cheap keyword routing, used as the analyzer fallback and to predict tools for prefetch"""
+    query_lower = query.lower()
+    return {
+        "needs_web_search": len(query.split()) > 2,
+        "needs_arxiv_search": any(word in query_lower for word in ["research", "study", "paper", "academic"]),
+        "needs_youtube_search": any(word in query_lower for word in ["how to", "tutorial", "learn", "guide"]),
+        "needs_corpus_search": corpus and any(word in query_lower for word in ["internal", "our ", "policy", "policies", "runbook", "handbook"])
+    }
+
+
+def traced(name: str, node: Callable[[AgentState], Dict[str, Any]]) -> Callable[[AgentState], Dict[str, Any]]:
+    """Wrap a graph node so each run is recorded as a span on the request trace and stops once cancelled"""
+    def run(state: AgentState) -> Dict[str, Any]:
+        if state.get("control") is not None:
+            state["control"].check()
+        trace = state.get("trace")
+        with trace.span(name) if trace is not None else nullcontext():
+            return node(state)
+    return run
+
+
+def log_error(state: AgentState, where: str, message: str, error: Exception):
+    """Print a handled error and keep it on the request trace"""
+    print(f"{message}: {error}")
+    if state.get("trace") is not None:
+        state["trace"].error(where, error)
+
+
+def trace_details(state: AgentState) -> Dict[str, Any]:
+    """Routing decision, tool timings and response sizes for the flight recorder"""
+    tier_usage = state.get("tier_usage", [])
+    return {
+        "routing": {
+            "needs_web_search": state.get("needs_web_search", False),
+            "needs_arxiv_search": state.get("needs_arxiv_search", False),
+            "needs_youtube_search": state.get("needs_youtube_search", False),
+            "needs_corpus_search": state.get("needs_corpus_search", False),
+            "reasoning": state.get("analysis_reasoning"),
+            "sub_queries": [sub_query["query"] for sub_query in state.get("sub_queries", [])],
+            "draft_accepted": state.get("draft_accepted", False)
+        },
+        "tools_used": state.get("tools_used", []),
+        "tool_latencies_ms": {tool: round(latency * 1000, 2) for tool, latency in state.get("tool_latencies", {}).items()},
+        "search_results": len(state.get("search_results", [])),
+        "late_results": state.get("late_results", 0),
+        "early_dispatch": state.get("early_dispatch", {}),
+        "usage": state["usage"].summary() if state.get("usage") is not None else None,
+        "budget_mode": state.get("budget_mode"),
+        "responder_calls": [
+            {key: call[key] for key in ("model", "latency", "prompt_chars", "response_chars", "revision") if key in call}
+            for call in tier_usage
+        ],
+        "regenerations": max(0, len(tier_usage) - 1),
+        "revisions": len(state.get("revisions", [])),
+        "escalations": state.get("escalations", []),
+        "helpfulness_score": state.get("helpfulness_score"),
+        "response_chars": len(state.get("response") or "")
+    }
\ No newline at end of file
@@ -0,0 +1,408 @@
+"""
+Local ArXiv Metadata Index
+BM25 search over an on-disk, memory-mapped index built from arXiv metadata dumps
+"""
+
+import argparse
+import json
+import math
+import mmap
+import os
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from email.utils import parsedate_to_datetime
+from typing import List, Dict, Any, Iterable, Optional, Set, Tuple
+
+import numpy as np
+
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has in is it its of on or that the this to we with".split()
+)
+SEGMENT_PREFIX = "seg-"
+BUILD_HINT = "build it with: python src/tools/arxiv_index.py --index-dir {} ingest <arxiv-metadata.json>"
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokenizer shared by ingest and search"""
+    return [t for t in TOKEN_PATTERN.findall(text.lower()) if len(t) > 1 and t not in STOPWORDS]
+
+
+class _Vocabulary:
+    """
+    Sorted term table searched in place
+    
+    terms.bin holds the UTF-8 terms back to back, term_offsets.npy where
+    each starts and term_postings.npy each term's [postings offset,
+    document frequency]. All three are memory-mapped, so a lookup is a
+    binary search that touches a few pages instead of loading every term.
+    """
+    
+    def __init__(self, path: str):
+        self.term_offsets = np.load(os.path.join(path, "term_offsets.npy"), mmap_mode="r")
+        self.entries = np.load(os.path.join(path, "term_postings.npy"), mmap_mode="r")
+        self._terms_file = open(os.path.join(path, "terms.bin"), "rb")
+        self._terms = mmap.mmap(self._terms_file.fileno(), 0, access=mmap.ACCESS_READ) if len(self.entries) else None
+    
+    def _term(self, i: int) -> bytes:
+        return self._terms[int(self.term_offsets[i]):int(self.term_offsets[i + 1])]
+    
+    def get(self, term: str) -> Optional[Tuple[int, int]]:
+        key = term.encode("utf-8")
+        lo, hi = 0, len(self.entries)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._term(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(self.entries) and self._term(lo) == key:
+            return int(self.entries[lo, 0]), int(self.entries[lo, 1])
+        return None
+    
+    def close(self):
+        if self._terms is not None:
+            self._terms.close()
+        self._terms_file.close()
+
+
+class _Segment:
+    """One immutable, memory-mapped index segment"""
+    
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        self.num_docs = meta["num_docs"]
+        self.total_length = meta["total_length"]
+        
+        self.postings_docs = np.load(os.path.join(path, "postings_docs.npy"), mmap_mode="r")
+        self.postings_tf = np.load(os.path.join(path, "postings_tf.npy"), mmap_mode="r")
+        self.doc_lengths = np.load(os.path.join(path, "doc_lengths.npy"), mmap_mode="r")
+        self.doc_offsets = np.load(os.path.join(path, "doc_offsets.npy"), mmap_mode="r")
+        
+        self._docs_file = open(os.path.join(path, "docs.jsonl"), "rb")
+        self._docs = mmap.mmap(self._docs_file.fileno(), 0, access=mmap.ACCESS_READ) if self.num_docs else None
+        self._vocab = None
+    
+    @property
+    def vocab(self):
+        """
+        Term -> (postings offset, document frequency), opened on first search
+        
+        Segments written before the memory-mapped term table have only
+        vocab.json, which is read into memory whole.
+        """
+        if self._vocab is None:
+            if os.path.exists(os.path.join(self.path, "terms.bin")):
+                self._vocab = _Vocabulary(self.path)
+            else:
+                with open(os.path.join(self.path, "vocab.json"), encoding="utf-8") as f:
+                    self._vocab = json.load(f)
+        return self._vocab
+    
+    def postings(self, term: str):
+        """Return (doc ids, term frequencies) views for a term"""
+        entry = self.vocab.get(term)
+        if entry is None:
+            return None
+        start, df = entry
+        return self.postings_docs[start:start + df], self.postings_tf[start:start + df]
+    
+    def document(self, doc_id: int) -> Dict[str, Any]:
+        """Read one stored document record"""
+        start, end = int(self.doc_offsets[doc_id]), int(self.doc_offsets[doc_id + 1])
+        return json.loads(self._docs[start:end])
+    
+    def ids(self) -> Set[str]:
+        """Set of arXiv ids stored in this segment"""
+        with open(os.path.join(self.path, "ids.txt"), encoding="utf-8") as f:
+            return {line.strip() for line in f if line.strip()}
+    
+    def close(self):
+        if self._docs is not None:
+            self._docs.close()
+        self._docs_file.close()
+        if isinstance(self._vocab, _Vocabulary):
+            self._vocab.close()
+
+
+class ArxivLocalIndex:
+    """
+    BM25 index over arXiv metadata stored as memory-mapped segments
+    
+    Opening an index that does not exist raises FileNotFoundError unless
+    create is set (as ingest does), so a wrong ARXIV_INDEX_DIR is not
+    served as an empty index. At most every check_interval seconds a search
+    looks for segments published since, e.g. by the ingest command, and
+    opens them.
+    """
+    
+    def __init__(self, index_dir: str, k1: float = 1.2, b: float = 0.75,
+                 create: bool = False, check_interval: float = 1.0):
+        self.index_dir = index_dir
+        self.k1 = k1
+        self.b = b
+        self.check_interval = check_interval
+        if create:
+            os.makedirs(index_dir, exist_ok=True)
+        elif not os.path.isdir(index_dir):
+            raise FileNotFoundError(f"arXiv index {index_dir} does not exist; {BUILD_HINT.format(index_dir)}")
+        self.segments: List[_Segment] = []
+        self._lock = threading.Lock()
+        self.reload()
+        if not create and not self.segments:
+            raise FileNotFoundError(f"arXiv index {index_dir} has no segments; {BUILD_HINT.format(index_dir)}")
+    
+    def reload(self):
+        """Open every segment currently on disk"""
+        for segment in self.segments:
+            segment.close()
+        self.segments = [_Segment(os.path.join(self.index_dir, n)) for n in self._segment_names()]
+        self._checked_at = time.monotonic()
+    
+    def refresh(self):
+        """
+        Open segments published since the last check
+        
+        Segments are immutable and ingest only adds them, so the open ones
+        stay in use; a search already running keeps the list it started with.
+        """
+        if time.monotonic() - self._checked_at < self.check_interval:
+            return
+        with self._lock:
+            if time.monotonic() - self._checked_at < self.check_interval:
+                return
+            self._checked_at = time.monotonic()
+            opened = {os.path.basename(s.path) for s in self.segments}
+            added = [n for n in self._segment_names() if n not in opened]
+            if added:
+                self.segments = self.segments + [_Segment(os.path.join(self.index_dir, n)) for n in added]
+    
+    @property
+    def num_docs(self) -> int:
+        return sum(s.num_docs for s in self.segments)
+    
+    def search(self, query: str, max_results: int = 5) -> List[Dict[str, Any]]:
+        """Search the local index, returning ArxivSearchTool.search-shaped results"""
+        self.refresh()
+        segments = self.segments
+        terms = list(dict.fromkeys(tokenize(query)))
+        total_docs = sum(s.num_docs for s in segments)
+        if not terms or not total_docs:
+            return []
+        
+        avg_length = sum(s.total_length for s in segments) / total_docs
+        per_segment = [{t: seg.postings(t) for t in terms} for seg in segments]
+        
+        idf = {}
+        for term in terms:
+            df = sum(len(p[term][0]) for p in per_segment if p[term] is not None)
+            idf[term] = math.log(1 + (total_docs - df + 0.5) / (df + 0.5))
+        
+        candidates = []
+        for seg_index, (segment, postings) in enumerate(zip(segments, per_segment)):
+            doc_parts, score_parts = [], []
+            for term, entry in postings.items():
+                if entry is None:
+                    continue
+                docs, tf = entry
+                tf = tf.astype(np.float32)
+                norm = self.k1 * (1 - self.b + self.b * segment.doc_lengths[docs] / avg_length)
+                doc_parts.append(docs)
+                score_parts.append(idf[term] * tf * (self.k1 + 1) / (tf + norm))
+            if not doc_parts:
+                continue
+            
+            unique_docs, inverse = np.unique(np.concatenate(doc_parts), return_inverse=True)
+            scores = np.bincount(inverse, weights=np.concatenate(score_parts))
+            top = np.argpartition(-scores, min(max_results, len(scores)) - 1)[:max_results]
+            candidates.extend((float(scores[i]), seg_index, int(unique_docs[i])) for i in top)
+        
+        candidates.sort(key=lambda c: c[0], reverse=True)
+        return [
+            self._format(segments[seg_index].document(doc_id))
+            for _, seg_index, doc_id in candidates[:max_results]
+        ]
+    
+    def ingest(self, dump_path: str, segment_size: int = 200_000) -> int:
+        """
+        Incrementally ingest an arXiv metadata dump (JSON lines)
+        
+        Papers whose id is already indexed are skipped, so re-running with a
+        newer dump only adds new papers. Returns the number of papers added.
+        """
+        seen = set()
+        for segment in self.segments:
+            seen |= segment.ids()
+        
+        added = 0
+        batch = []
+        for record in _read_dump(dump_path):
+            paper_id = record.get("id")
+            if not paper_id or paper_id in seen:
+                continue
+            seen.add(paper_id)
+            batch.append(record)
+            if len(batch) >= segment_size:
+                added += self._write_segment(batch)
+                batch = []
+        if batch:
+            added += self._write_segment(batch)
+        
+        self.reload()
+        return added
+    
+    def close(self):
+        for segment in self.segments:
+            segment.close()
+        self.segments = []
+    
+    def _segment_names(self) -> List[str]:
+        """Names of published segment directories, oldest first"""
+        return sorted(
+            n for n in os.listdir(self.index_dir)
+            if n.startswith(SEGMENT_PREFIX) and not n.endswith(".tmp")
+        )
+    
+    def _write_segment(self, records: List[Dict[str, Any]]) -> int:
+        """Build one segment from a batch of dump records"""
+        number = len(self._segment_names()) + 1
+        final_path = os.path.join(self.index_dir, f"{SEGMENT_PREFIX}{number:05d}")
+        tmp_path = final_path + ".tmp"
+        os.makedirs(tmp_path, exist_ok=True)
+        
+        inverted = defaultdict(list)
+        doc_lengths = np.zeros(len(records), dtype=np.int32)
+        doc_offsets = np.zeros(len(records) + 1, dtype=np.int64)
+        
+        with open(os.path.join(tmp_path, "docs.jsonl"), "wb") as docs_file, \
+                open(os.path.join(tmp_path, "ids.txt"), "w", encoding="utf-8") as ids_file:
+            for doc_id, record in enumerate(records):
+                doc = _normalize_record(record)
+                tokens = tokenize(f"{doc['title']} {doc['title']} {doc['summary']}")
+                doc_lengths[doc_id] = len(tokens)
+                for term, tf in Counter(tokens).items():
+                    inverted[term].append((doc_id, min(tf, 65535)))
+                
+                line = json.dumps(doc, ensure_ascii=False).encode("utf-8") + b"\n"
+                docs_file.write(line)
+                doc_offsets[doc_id + 1] = doc_offsets[doc_id] + len(line)
+                ids_file.write(doc["id"] + "\n")
+        
+        total_postings = sum(len(p) for p in inverted.values())
+        postings_docs = np.empty(total_postings, dtype=np.int32)
+        postings_tf = np.empty(total_postings, dtype=np.uint16)
+        # Sorted str order is UTF-8 byte order, which _Vocabulary's binary search relies on
+        terms = sorted(inverted)
+        term_offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        term_postings = np.zeros((len(terms), 2), dtype=np.int64)
+        offset = 0
+        with open(os.path.join(tmp_path, "terms.bin"), "wb") as terms_file:
+            for t, term in enumerate(terms):
+                encoded = term.encode("utf-8")
+                terms_file.write(encoded)
+                term_offsets[t + 1] = term_offsets[t] + len(encoded)
+                entries = inverted[term]
+                term_postings[t] = (offset, len(entries))
+                for i, (doc_id, tf) in enumerate(entries, offset):
+                    postings_docs[i] = doc_id
+                    postings_tf[i] = tf
+                offset += len(entries)
+        
+        np.save(os.path.join(tmp_path, "postings_docs.npy"), postings_docs)
+        np.save(os.path.join(tmp_path, "postings_tf.npy"), postings_tf)
+        np.save(os.path.join(tmp_path, "doc_lengths.npy"), doc_lengths)
+        np.save(os.path.join(tmp_path, "doc_offsets.npy"), doc_offsets)
+        np.save(os.path.join(tmp_path, "term_offsets.npy"), term_offsets)
+        np.save(os.path.join(tmp_path, "term_postings.npy"), term_postings)
+        with open(os.path.join(tmp_path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"num_docs": len(records), "total_length": int(doc_lengths.sum())}, f)
+        
+        # Publish atomically so concurrent readers never see a half-written segment
+        os.rename(tmp_path, final_path)
+        return len(records)
+    
+    def _format(self, doc: Dict[str, Any]) -> Dict[str, Any]:
+        """Shape a stored document like ArxivSearchTool.search results"""
+        summary = doc["summary"]
+        return {
+            "title": doc["title"],
+            "authors": doc["authors"],
+            "summary": summary,
+            "url": f"http://arxiv.org/abs/{doc['id']}",
+            "published": doc["published"],
+            "content": f"{doc['title']}\n\nAuthors: {', '.join(doc['authors'])}\n\nSummary: {summary[:500]}...",
+            "snippet": summary[:300] + "..." if len(summary) > 300 else summary,
+            "source": "arxiv"
+        }
+
+
+def _read_dump(dump_path: str) -> Iterable[Dict[str, Any]]:
+    """Yield records from an arXiv metadata dump in JSON lines format"""
+    with open(dump_path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError as e:
+                    print(f"Skipping malformed dump line: {e}")
+
+
+def _normalize_record(record: Dict[str, Any]) -> Dict[str, Any]:
+    """Reduce a dump record to the fields the search results need"""
+    if record.get("authors_parsed"):
+        authors = [" ".join(p for p in reversed(parts[:2]) if p).strip() for parts in record["authors_parsed"]]
+    else:
+        authors = [a.strip() for a in re.split(r",| and ", record.get("authors", "")) if a.strip()]
+    
+    published = record.get("update_date", "")
+    versions = record.get("versions") or []
+    if versions and versions[0].get("created"):
+        try:
+            published = parsedate_to_datetime(versions[0]["created"]).strftime("%Y-%m-%d")
+        except (TypeError, ValueError):
+            pass
+    
+    return {
+        "id": record["id"],
+        "title": " ".join(record.get("title", "").split()),
+        "authors": authors,
+        "summary": " ".join(record.get("abstract", "").split()),
+        "published": published
+    }
+
+
+def main():
+    """Command line entry point for ingesting dumps and querying the index"""
+    parser = argparse.ArgumentParser(description="Local arXiv metadata index")
+    parser.add_argument("--index-dir", default=os.getenv("ARXIV_INDEX_DIR", "arxiv_index"))
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    
+    ingest_parser = subparsers.add_parser("ingest", help="Add papers from a metadata dump")
+    ingest_parser.add_argument("dump", help="Path to arxiv-metadata JSON lines file")
+    ingest_parser.add_argument("--segment-size", type=int, default=200_000)
+    
+    search_parser = subparsers.add_parser("search", help="Query the index")
+    search_parser.add_argument("query")
+    search_parser.add_argument("--max-results", type=int, default=5)
+    
+    args = parser.parse_args()
+    index = ArxivLocalIndex(args.index_dir, create=args.command == "ingest")
+    
+    if args.command == "ingest":
+        added = index.ingest(args.dump, segment_size=args.segment_size)
+        print(f"Added {added} papers ({index.num_docs} total, {len(index.segments)} segments)")
+    else:
+        for rank, result in enumerate(index.search(args.query, max_results=args.max_results), 1):
+            print(f"{rank:>3}  {result['published']}  {result['title']}  {result['url']}")
+    
+    index.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -3,20 +3,73 @@ ArXiv Search Tool Integration
 Provides academic paper search capabilities using ArXiv API
 """
 
+import re
+import threading
+import time
+
 import arxiv
-from typing import List, Dict, Any
+import feedparser
+import requests
+from typing import List, Dict, Any, Optional
 from langchain.tools import Tool
 
 
+ARXIV_API_URL = "https://export.arxiv.org/api/query"
+
+# arXiv's API terms allow one request every three seconds; arxiv.Client enforces the same delay and retries
+ARXIV_DELAY_SECONDS = 3.0
+ARXIV_RETRIES = 3
+
+
+class RateLimiter:
+    """Spaces calls at least delay_seconds apart across every thread of the process"""
+    
+    def __init__(self, delay_seconds: float):
+        self.delay_seconds = delay_seconds
+        self._last = None
+        self._lock = threading.Lock()
+    
+    def wait(self):
+        with self._lock:
+            if self._last is not None:
+                remaining = self._last + self.delay_seconds - time.monotonic()
+                if remaining > 0:
+                    time.sleep(remaining)
+            self._last = time.monotonic()
+
+
+# One limiter per process, shared by every ArxivSearchTool that uses a pooled session
+_arxiv_rate_limiter = RateLimiter(ARXIV_DELAY_SECONDS)
+
+
 class ArxivSearchTool:
     """ArXiv search tool for academic papers"""
     
-    def __init__(self):
-        self.client = arxiv.Client()
+    def __init__(self, index_dir: Optional[str] = None, session: Optional[requests.Session] = None):
+        # Optional shared requests.Session; arxiv.Client always opens its own, so it is only built without one
+        self.session = session
+        self.client = arxiv.Client() if session is None else None
+        self.rate_limiter = _arxiv_rate_limiter
+        
+        # Optional local metadata index replaces the live API when configured
+        self.local_index = None
+        if index_dir:
+            from tools.arxiv_index import ArxivLocalIndex
+            self.local_index = ArxivLocalIndex(index_dir)
     
     def search(self, query: str, max_results: int = 5) -> List[Dict[str, Any]]:
         """Search ArXiv for academic papers"""
+        if self.local_index is not None:
+            try:
+                return self.local_index.search(query, max_results=max_results)
+            except Exception as e:
+                print(f"Local ArXiv index error: {e}")
+                return []
+        
         try:
+            if self.session is not None:
+                return self._pooled_search(query, max_results)
+            
             search = arxiv.Search(
                 query=query,
                 max_results=max_results,
@@ -25,16 +78,13 @@ class ArxivSearchTool:
             
             results = []
             for paper in self.client.results(search):
-                results.append({
-                    "title": paper.title,
-                    "authors": [author.name for author in paper.authors],
-                    "summary": paper.summary,
-                    "url": paper.entry_id,
-                    "published": paper.published.strftime("%Y-%m-%d"),
-                    "content": f"{paper.title}\n\nAuthors: {', '.join([author.name for author in paper.authors])}\n\nSummary: {paper.summary[:500]}...",
-                    "snippet": paper.summary[:300] + "..." if len(paper.summary) > 300 else paper.summary,
-                    "source": "arxiv"
-                })
+                results.append(_paper_result(
+                    paper.title,
+                    [author.name for author in paper.authors],
+                    paper.summary,
+                    paper.entry_id,
+                    paper.published.strftime("%Y-%m-%d")
+                ))
             
             return results
             
@@ -42,10 +92,60 @@ class ArxivSearchTool:
             print(f"ArXiv search error: {e}")
             return []
     
+    def _pooled_search(self, query: str, max_results: int) -> List[Dict[str, Any]]:
+        """
+        Query the arXiv Atom API over the shared session and parse the feed directly
+        
+        Like arxiv.Client, requests from the whole process are spaced
+        ARXIV_DELAY_SECONDS apart, and failed requests are retried up to
+        ARXIV_RETRIES times.
+        """
+        params = {
+            "search_query": query,
+            "start": 0,
+            "max_results": max_results,
+            "sortBy": "relevance",
+            "sortOrder": "descending"
+        }
+        for attempt in range(ARXIV_RETRIES + 1):
+            self.rate_limiter.wait()
+            try:
+                response = self.session.get(ARXIV_API_URL, params=params, headers={"user-agent": "arxiv.py"}, timeout=30)
+                response.raise_for_status()
+                break
+            except requests.RequestException:
+                if attempt == ARXIV_RETRIES:
+                    raise
+        
+        results = []
+        for entry in feedparser.parse(response.text).entries[:max_results]:
+            published = entry.get("published_parsed")
+            results.append(_paper_result(
+                re.sub(r"\s+", " ", entry.get("title", "")),
+                [author.get("name", "") for author in entry.get("authors", [])],
+                entry.get("summary", ""),
+                entry.get("id", ""),
+                time.strftime("%Y-%m-%d", published) if published else ""
+            ))
+        return results
+    
     def get_tool(self) -> Tool:
         """Get LangChain tool interface"""
         return Tool(
             name="arxiv_search",
             description="Search ArXiv for academic papers and research. Use this for scientific research, academic studies, and scholarly articles.",
             func=lambda query: self.search(query)
-        )
\ No newline at end of file
+        )
+
+
+def _paper_result(title: str, authors: List[str], summary: str, url: str, published: str) -> Dict[str, Any]:
+    return {
+        "title": title,
+        "authors": authors,
+        "summary": summary,
+        "url": url,
+        "published": published,
+        "content": f"{title}\n\nAuthors: {', '.join(authors)}\n\nSummary: {summary[:500]}...",
+        "snippet": summary[:300] + "..." if len(summary) > 300 else summary,
+        "source": "arxiv"
+    }
\ No newline at end of file
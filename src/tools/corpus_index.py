@@ -0,0 +1,467 @@
+"""
+Private Corpus Vector Index
+Hashed embeddings of local document chunks in a memory-mapped matrix, searched by brute force or an IVF coarse index
+"""
+
+import argparse
+import json
+import math
+import mmap
+import os
+import re
+import shutil
+import time
+import zlib
+from collections import Counter
+from datetime import datetime
+from typing import List, Dict, Any, Iterable, Optional, Tuple
+
+import numpy as np
+
+try:
+    from .arxiv_index import tokenize
+except ImportError:
+    # Run as a script: python src/tools/corpus_index.py
+    from arxiv_index import tokenize
+
+
+TEXT_EXTENSIONS = {".txt", ".text", ".md", ".markdown", ".rst", ".html", ".htm"}
+BUILD_PREFIX = "build-"
+CURRENT_FILE = "CURRENT"
+RETIRED_FILE = "RETIRED"
+
+# A superseded build is deleted this long after CURRENT moved off it, once every reader has reopened
+RETIRED_GRACE_SECONDS = 300
+
+DEFAULT_DIM = 1024
+DEFAULT_CHUNK_CHARS = 1200
+
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLE = 100_000
+
+# Rows scored per matrix product; the float copy of an int8 block (16 MiB) stays cache-friendly
+SCAN_BLOCK_ROWS = 4096
+
+# Suffixes stripped so inflections share a feature ("approves", "approval" -> "approv")
+SUFFIXES = ("ies", "ing", "ed", "es", "al", "s", "e")
+
+TAG_PATTERN = re.compile(r"<[^>]+>")
+HEADING_PATTERN = re.compile(r"^\s*#+\s+(.+)$", re.MULTILINE)
+
+
+def stem(token: str) -> str:
+    """Strip one common English suffix, keeping at least four characters"""
+    for suffix in SUFFIXES:
+        if token.endswith(suffix) and len(token) - len(suffix) >= 4:
+            return token[:-len(suffix)]
+    return token
+
+
+def hashed_features(text: str) -> Counter:
+    """Stemmed unigram and bigram counts, the features both chunks and queries are embedded from"""
+    tokens = [stem(token) for token in tokenize(text)]
+    return Counter(tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])])
+
+
+def hash_features(features: Counter, dim: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Bucket indices and signed weights of a feature-hashing embedding
+    
+    Each feature lands in bucket crc32 % dim with a sign taken from the
+    hash's top bit, weighted by sublinear term frequency. No model or
+    network access is needed.
+    """
+    digests = np.fromiter((zlib.crc32(f.encode("utf-8")) for f in features), dtype=np.uint32, count=len(features))
+    weights = 1.0 + np.log(np.fromiter(features.values(), dtype=np.float64, count=len(features)))
+    return (digests % dim).astype(np.int64), np.where(digests & 0x80000000, weights, -weights)
+
+
+def embed_hashed(buckets: np.ndarray, weights: np.ndarray, dim: int, idf: Optional[np.ndarray] = None) -> np.ndarray:
+    """Dense L2-normalized vector from hashed buckets, scaled by the bucket IDF when one is given"""
+    vector = np.bincount(buckets, weights=weights, minlength=dim).astype(np.float32)
+    if idf is not None:
+        vector *= idf
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+def embed_features(features: Counter, dim: int, idf: Optional[np.ndarray] = None) -> np.ndarray:
+    """Signed feature-hashing embedding, L2-normalized"""
+    return embed_hashed(*hash_features(features, dim), dim, idf)
+
+
+def chunk_text(text: str, chunk_chars: int = DEFAULT_CHUNK_CHARS) -> List[str]:
+    """Pack paragraphs into chunks of about chunk_chars, splitting longer paragraphs on word boundaries"""
+    chunks, current = [], ""
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = " ".join(paragraph.split())
+        if not paragraph:
+            continue
+        pieces = [paragraph]
+        if len(paragraph) > chunk_chars:
+            pieces, piece = [], ""
+            for word in paragraph.split(" "):
+                if piece and len(piece) + len(word) + 1 > chunk_chars:
+                    pieces.append(piece)
+                    piece = ""
+                piece = f"{piece} {word}" if piece else word
+            pieces.append(piece)
+        for piece in pieces:
+            if current and len(current) + len(piece) + 2 > chunk_chars:
+                chunks.append(current)
+                current = ""
+            current = f"{current}\n\n{piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def read_documents(paths: Iterable[str]) -> Iterable[Tuple[str, str, str, str]]:
+    """
+    Yield (path, title, modified date, text) for every text file under the given files and directories
+    
+    Paths are relative to the directory given (a file's is its name), so
+    results never expose where the documents live on the server.
+    """
+    for root in paths:
+        files = [root] if os.path.isfile(root) else sorted(
+            os.path.join(directory, name)
+            for directory, _, names in os.walk(root)
+            for name in names
+        )
+        for path in files:
+            extension = os.path.splitext(path)[1].lower()
+            if extension not in TEXT_EXTENSIONS:
+                continue
+            try:
+                with open(path, encoding="utf-8", errors="replace") as f:
+                    text = f.read()
+            except OSError as e:
+                print(f"Skipping unreadable file {path}: {e}")
+                continue
+            if extension in (".html", ".htm"):
+                text = TAG_PATTERN.sub(" ", text)
+            heading = HEADING_PATTERN.search(text) if extension in (".md", ".markdown") else None
+            title = heading.group(1).strip() if heading else os.path.splitext(os.path.basename(path))[0]
+            modified = datetime.fromtimestamp(os.path.getmtime(path)).strftime("%Y-%m-%d")
+            relative = os.path.basename(path) if path == root else os.path.relpath(path, root)
+            yield relative.replace(os.sep, "/"), title, modified, text
+
+
+class CorpusIndex:
+    """
+    Vector index over chunks of local documents
+    
+    Each build is an immutable directory of .npy files opened with
+    mmap_mode="r", so searching touches only the pages it reads and
+    several worker processes share one copy through the page cache.
+    Vectors are float32 or, with quantize, int8 with one scale per row.
+    With an IVF coarse index the rows are stored grouped by list, so a
+    probe scans a few contiguous slices instead of the whole matrix.
+    """
+    
+    def __init__(self, index_dir: str, nprobe: int = 8):
+        self.index_dir = index_dir
+        self.nprobe = nprobe
+        self.build_path: Optional[str] = None
+        self._docs_file = None
+        self._docs = None
+        self.reload()
+    
+    def reload(self):
+        """Open the current build, if any"""
+        self.close()
+        name = self._current_build()
+        if name is None:
+            self.meta = {"num_chunks": 0, "dim": DEFAULT_DIM, "quantized": False, "nlist": 0}
+            return
+        path = os.path.join(self.index_dir, name)
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.build_path = path
+        self.vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        self.scales = np.load(os.path.join(path, "scales.npy"), mmap_mode="r") if self.meta["quantized"] else None
+        self.idf = np.load(os.path.join(path, "idf.npy"))
+        self.centroids = np.load(os.path.join(path, "centroids.npy")) if self.meta["nlist"] else None
+        self.list_offsets = np.load(os.path.join(path, "list_offsets.npy")) if self.meta["nlist"] else None
+        self.chunk_offsets = np.load(os.path.join(path, "chunk_offsets.npy"), mmap_mode="r")
+        self._docs_file = open(os.path.join(path, "chunks.jsonl"), "rb")
+        self._docs = mmap.mmap(self._docs_file.fileno(), 0, access=mmap.ACCESS_READ) if self.meta["num_chunks"] else None
+    
+    @property
+    def num_chunks(self) -> int:
+        return self.meta["num_chunks"]
+    
+    def is_stale(self) -> bool:
+        """Whether CURRENT now points at a different build than the one open"""
+        return self._current_build() != (os.path.basename(self.build_path) if self.build_path else None)
+    
+    def embed(self, text: str) -> np.ndarray:
+        """Query embedding in this index's space"""
+        return embed_features(hashed_features(text), self.meta["dim"], self.idf if self.build_path else None)
+    
+    def search(self, query: str, max_results: int = 5, nprobe: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Top chunks by cosine similarity, shaped like the other search tools' results"""
+        if not self.num_chunks:
+            return []
+        vector = self.embed(query)
+        if not vector.any():
+            return []
+        
+        if self.centroids is not None:
+            probes = min(nprobe or self.nprobe, len(self.centroids))
+            lists = np.argpartition(-(self.centroids @ vector), probes - 1)[:probes]
+            ranges = [(int(self.list_offsets[i]), int(self.list_offsets[i + 1])) for i in lists]
+        else:
+            ranges = [(0, self.num_chunks)]
+        
+        ids, scores = self._top_k(vector, ranges, max_results)
+        return [self._format(self.chunk(int(row)), float(score)) for row, score in zip(ids, scores) if score > 0]
+    
+    def chunk(self, row: int) -> Dict[str, Any]:
+        """Read one stored chunk record"""
+        start, end = int(self.chunk_offsets[row]), int(self.chunk_offsets[row + 1])
+        return json.loads(self._docs[start:end])
+    
+    def build(self, paths: List[str], dim: int = DEFAULT_DIM, chunk_chars: int = DEFAULT_CHUNK_CHARS,
+              quantize: bool = False, nlist: Optional[int] = 0, seed: int = 0) -> int:
+        """
+        Chunk, embed and index every text file under paths as a new build
+        
+        The build replaces the current one atomically once complete, so
+        readers keep searching the previous build meanwhile; the previous
+        build is retired and deleted by a later build once its grace period
+        is over. nlist=0 keeps exact brute-force search; an IVF coarse index
+        is approximate and is only built on request, with nlist lists or,
+        for None, about sqrt(chunks). Returns the chunk count.
+        """
+        records, features = [], []
+        for path, title, modified, text in read_documents(paths):
+            for number, chunk in enumerate(chunk_text(text, chunk_chars)):
+                records.append({"path": path, "title": title, "modified": modified, "chunk": number, "text": chunk})
+                features.append(hash_features(hashed_features(f"{title}\n{chunk}"), dim))
+        if not records:
+            print("No text files found; the current build is unchanged")
+            return 0
+        
+        os.makedirs(self.index_dir, exist_ok=True)
+        final_name = self._next_build_name()
+        tmp_path = os.path.join(self.index_dir, final_name + ".tmp")
+        os.makedirs(tmp_path, exist_ok=True)
+        
+        # Bucket document frequencies give the IDF applied to chunks and queries alike
+        df = np.zeros(dim, dtype=np.float64)
+        for buckets, _ in features:
+            df[np.unique(buckets)] += 1
+        idf = (np.log((1 + len(records)) / (1 + df)) + 1).astype(np.float32)
+        
+        raw_path = os.path.join(tmp_path, "raw.npy")
+        raw = np.lib.format.open_memmap(raw_path, mode="w+", dtype=np.float32, shape=(len(records), dim))
+        for row, (buckets, weights) in enumerate(features):
+            raw[row] = embed_hashed(buckets, weights, dim, idf)
+        features = None
+        
+        if nlist is None:
+            nlist = int(math.sqrt(len(records)))
+        nlist = min(nlist, len(records))
+        if nlist:
+            centroids = train_centroids(raw, nlist, seed)
+            assignments = np.concatenate([
+                np.argmax(raw[start:start + SCAN_BLOCK_ROWS] @ centroids.T, axis=1)
+                for start in range(0, len(records), SCAN_BLOCK_ROWS)
+            ])
+            order = np.argsort(assignments, kind="stable")
+            list_offsets = np.concatenate([[0], np.cumsum(np.bincount(assignments, minlength=nlist))]).astype(np.int64)
+            np.save(os.path.join(tmp_path, "centroids.npy"), centroids)
+            np.save(os.path.join(tmp_path, "list_offsets.npy"), list_offsets)
+        else:
+            order = np.arange(len(records))
+        
+        vectors = np.lib.format.open_memmap(
+            os.path.join(tmp_path, "vectors.npy"), mode="w+",
+            dtype=np.int8 if quantize else np.float32, shape=(len(records), dim)
+        )
+        scales = np.zeros(len(records), dtype=np.float32)
+        for start in range(0, len(records), SCAN_BLOCK_ROWS):
+            block = raw[order[start:start + SCAN_BLOCK_ROWS]]
+            if quantize:
+                block_scales = np.maximum(np.abs(block).max(axis=1), 1e-12) / 127.0
+                vectors[start:start + len(block)] = np.round(block / block_scales[:, None]).astype(np.int8)
+                scales[start:start + len(block)] = block_scales
+            else:
+                vectors[start:start + len(block)] = block
+        vectors.flush()
+        del vectors, raw
+        os.remove(raw_path)
+        if quantize:
+            np.save(os.path.join(tmp_path, "scales.npy"), scales)
+        np.save(os.path.join(tmp_path, "idf.npy"), idf)
+        
+        chunk_offsets = np.zeros(len(records) + 1, dtype=np.int64)
+        with open(os.path.join(tmp_path, "chunks.jsonl"), "wb") as chunks_file:
+            for row, index in enumerate(order):
+                line = json.dumps(records[index], ensure_ascii=False).encode("utf-8") + b"\n"
+                chunks_file.write(line)
+                chunk_offsets[row + 1] = chunk_offsets[row] + len(line)
+        np.save(os.path.join(tmp_path, "chunk_offsets.npy"), chunk_offsets)
+        with open(os.path.join(tmp_path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({
+                "num_chunks": len(records),
+                "num_documents": len({record["path"] for record in records}),
+                "dim": dim,
+                "quantized": quantize,
+                "nlist": nlist,
+                "chunk_chars": chunk_chars
+            }, f)
+        
+        # Publish the build, then point CURRENT at it so readers switch in one rename
+        final_path = os.path.join(self.index_dir, final_name)
+        os.rename(tmp_path, final_path)
+        previous = self._current_build()
+        current_tmp = os.path.join(self.index_dir, CURRENT_FILE + ".tmp")
+        with open(current_tmp, "w", encoding="utf-8") as f:
+            f.write(final_name)
+        os.replace(current_tmp, os.path.join(self.index_dir, CURRENT_FILE))
+        
+        self.reload()
+        if previous is not None:
+            with open(os.path.join(self.index_dir, previous, RETIRED_FILE), "w", encoding="utf-8") as f:
+                f.write(str(time.time()))
+        self.remove_retired()
+        return len(records)
+    
+    def remove_retired(self, grace_seconds: float = RETIRED_GRACE_SECONDS) -> List[str]:
+        """Delete builds retired more than grace_seconds ago; returns their names"""
+        current = self._current_build()
+        removed = []
+        for name in sorted(os.listdir(self.index_dir)):
+            retired_path = os.path.join(self.index_dir, name, RETIRED_FILE)
+            if name == current or not name.startswith(BUILD_PREFIX) or not os.path.exists(retired_path):
+                continue
+            with open(retired_path, encoding="utf-8") as f:
+                retired_at = float(f.read().strip() or 0)
+            if time.time() - retired_at >= grace_seconds:
+                shutil.rmtree(os.path.join(self.index_dir, name), ignore_errors=True)
+                removed.append(name)
+        return removed
+    
+    def close(self):
+        if self._docs is not None:
+            self._docs.close()
+        if self._docs_file is not None:
+            self._docs_file.close()
+        self._docs = self._docs_file = None
+        self.build_path = None
+        self.vectors = self.scales = self.idf = self.centroids = self.list_offsets = self.chunk_offsets = None
+    
+    def _top_k(self, vector: np.ndarray, ranges: List[Tuple[int, int]], k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Best k rows over the given row ranges, scanned in blocks"""
+        best_ids, best_scores = [], []
+        for start, stop in ranges:
+            for block_start in range(start, stop, SCAN_BLOCK_ROWS):
+                block_stop = min(stop, block_start + SCAN_BLOCK_ROWS)
+                if self.scales is not None:
+                    scores = (self.vectors[block_start:block_stop].astype(np.float32) @ vector) * self.scales[block_start:block_stop]
+                else:
+                    scores = self.vectors[block_start:block_stop] @ vector
+                if len(scores) > k:
+                    top = np.argpartition(-scores, k - 1)[:k]
+                else:
+                    top = np.arange(len(scores))
+                best_ids.append(top + block_start)
+                best_scores.append(scores[top])
+        if not best_ids:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        ids, scores = np.concatenate(best_ids), np.concatenate(best_scores)
+        order = np.argsort(-scores, kind="stable")[:k]
+        return ids[order], scores[order]
+    
+    def _current_build(self) -> Optional[str]:
+        try:
+            with open(os.path.join(self.index_dir, CURRENT_FILE), encoding="utf-8") as f:
+                name = f.read().strip()
+        except FileNotFoundError:
+            return None
+        return name if os.path.isdir(os.path.join(self.index_dir, name)) else None
+    
+    def _next_build_name(self) -> str:
+        numbers = [
+            int(name[len(BUILD_PREFIX):].split(".")[0]) for name in os.listdir(self.index_dir)
+            if name.startswith(BUILD_PREFIX) and name[len(BUILD_PREFIX):].split(".")[0].isdigit()
+        ]
+        return f"{BUILD_PREFIX}{max(numbers, default=0) + 1:05d}"
+    
+    def _format(self, record: Dict[str, Any], score: float) -> Dict[str, Any]:
+        """Shape a stored chunk like the web search results"""
+        text = record["text"]
+        # Builds made before paths were stored relative hold absolute ones
+        path = os.path.basename(record["path"]) if os.path.isabs(record["path"]) else record["path"]
+        return {
+            "title": record["title"],
+            "url": f"corpus:{path}#chunk-{record['chunk']}",
+            "path": path,
+            "content": text,
+            "snippet": text[:300] + "..." if len(text) > 300 else text,
+            "published_date": record["modified"],
+            "source": "corpus",
+            "score": score
+        }
+
+
+def train_centroids(vectors: np.ndarray, nlist: int, seed: int = 0) -> np.ndarray:
+    """Spherical k-means on a sample of the rows; returns unit-length centroids"""
+    rng = np.random.default_rng(seed)
+    sample_rows = np.sort(rng.choice(len(vectors), size=min(len(vectors), max(nlist, KMEANS_SAMPLE)), replace=False))
+    sample = np.asarray(vectors[sample_rows])
+    centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+    for _ in range(KMEANS_ITERATIONS):
+        assignments = np.argmax(sample @ centroids.T, axis=1)
+        # Sum each list's rows as contiguous runs of the sorted sample
+        order = np.argsort(assignments, kind="stable")
+        lists, starts = np.unique(assignments[order], return_index=True)
+        sums = np.zeros_like(centroids)
+        sums[lists] = np.add.reduceat(sample[order], starts, axis=0)
+        counts = np.bincount(assignments, minlength=nlist)
+        # Empty lists restart from a random row
+        empty = counts == 0
+        sums[empty] = sample[rng.choice(len(sample), size=int(empty.sum()))]
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        centroids = sums / np.maximum(norms, 1e-12)
+    return centroids.astype(np.float32)
+
+
+def main():
+    """Command line entry point for building and querying the corpus index"""
+    parser = argparse.ArgumentParser(description="Local private-corpus vector index")
+    parser.add_argument("--index-dir", default=os.getenv("CORPUS_INDEX_DIR", "corpus_index"))
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    
+    ingest_parser = subparsers.add_parser("ingest", help="Index every text file under the given paths as a new build")
+    ingest_parser.add_argument("paths", nargs="+", help="Files or directories (.txt, .md, .rst, .html)")
+    ingest_parser.add_argument("--dim", type=int, default=DEFAULT_DIM)
+    ingest_parser.add_argument("--chunk-chars", type=int, default=DEFAULT_CHUNK_CHARS)
+    ingest_parser.add_argument("--quantize", action="store_true", help="Store int8 vectors with per-row scales")
+    ingest_parser.add_argument("--nlist", type=int, default=0, help="IVF lists for an approximate coarse index; 0 (default) keeps exact search")
+    ingest_parser.add_argument("--ivf", action="store_true", help="Build an IVF coarse index of about sqrt(chunks) lists")
+    
+    search_parser = subparsers.add_parser("search", help="Query the index")
+    search_parser.add_argument("query")
+    search_parser.add_argument("--max-results", type=int, default=5)
+    search_parser.add_argument("--nprobe", type=int, default=None)
+    
+    args = parser.parse_args()
+    index = CorpusIndex(args.index_dir)
+    
+    if args.command == "ingest":
+        nlist = None if args.ivf and not args.nlist else args.nlist
+        added = index.build(args.paths, dim=args.dim, chunk_chars=args.chunk_chars, quantize=args.quantize, nlist=nlist)
+        print(f"Indexed {added} chunks from {index.meta.get('num_documents', 0)} documents (ivf lists: {index.meta['nlist']})")
+    else:
+        for result in index.search(args.query, max_results=args.max_results, nprobe=args.nprobe):
+            print(f"{result['score']:.3f}  {result['title']}  {result['url']}")
+    
+    index.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+Private Corpus Search Tool
+Searches local internal documents through the memory-mapped corpus vector index
+"""
+
+import threading
+import time
+from typing import List, Dict, Any
+from langchain.tools import Tool
+
+from tools.corpus_index import CorpusIndex
+
+
+class CorpusSearchTool:
+    """
+    Search tool for the local private-document corpus
+    
+    At most every check_interval seconds a search checks whether an ingest
+    has published a new build and, if so, opens it; searches already
+    running finish on the build they started with.
+    """
+    
+    def __init__(self, index_dir: str, nprobe: int = 8, check_interval: float = 1.0):
+        self.index_dir = index_dir
+        self.nprobe = nprobe
+        self.check_interval = check_interval
+        self.index = CorpusIndex(index_dir, nprobe=nprobe)
+        self._checked_at = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def current_index(self) -> CorpusIndex:
+        """The index on the current build, reopened when CURRENT has moved"""
+        if time.monotonic() - self._checked_at >= self.check_interval:
+            with self._lock:
+                if time.monotonic() - self._checked_at >= self.check_interval:
+                    self._checked_at = time.monotonic()
+                    if self.index.is_stale():
+                        # The old index is closed once the searches holding it drop their reference
+                        self.index = CorpusIndex(self.index_dir, nprobe=self.nprobe)
+        return self.index
+    
+    def search(self, query: str, max_results: int = 5) -> List[Dict[str, Any]]:
+        """Search the local corpus; no network access"""
+        try:
+            return self.current_index().search(query, max_results=max_results)
+        except Exception as e:
+            print(f"Corpus search error: {e}")
+            return []
+    
+    def get_tool(self) -> Tool:
+        """Get LangChain tool interface"""
+        return Tool(
+            name="corpus_search",
+            description="Search internal documents such as policies, design docs and runbooks. Use this for questions about our own organization, systems and processes.",
+            func=lambda query: self.search(query)
+        )
@@ -3,36 +3,185 @@ Helpfulness Checker Tool
 Evaluates response quality and helpfulness
 """
 
-from typing import Optional
+import json
+import re
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Sequence
+import numpy as np
 from langchain_openai import ChatOpenAI
 from langchain_core.messages import HumanMessage, SystemMessage
 
 
+DEFAULT_SCORE = 0.5
+# Called after each LLM call with (model, messages, result), for token accounting
+UsageCallback = Callable[[str, List, Any], None]
+
+# Fallback for output that is not a JSON array; skips integers used as labels, such as "[1]", "1)" or "1:"
+SCORE_PATTERN = re.compile(r"(?<![\d.\[#])(?:0(?:\.\d+)?|1(?:\.0+)?|\.\d+)(?![\d.\]):])")
+JSON_ARRAY_PATTERN = re.compile(r"\[[^\[\]]*\]")
+JSON_OBJECT_PATTERN = re.compile(r"\{.*\}", re.DOTALL)
+
+# Weak parts and missing points kept from one critique
+MAX_CRITIQUE_ITEMS = 5
+
+
+@dataclass
+class Critique:
+    """
+    Helpfulness score with the parts of the response that pulled it down
+    
+    weak_parts quote passages of the response with what is wrong with
+    each; missing lists what the response should have covered. Both are
+    empty when the evaluator found nothing specific, or its output could
+    only be read as a bare score.
+    """
+    score: float = DEFAULT_SCORE
+    weak_parts: List[Dict[str, str]] = field(default_factory=list)
+    missing: List[str] = field(default_factory=list)
+    
+    @property
+    def specific(self) -> bool:
+        """Whether the critique names anything a targeted revision could fix"""
+        return bool(self.weak_parts or self.missing)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {"score": self.score, "weak_parts": self.weak_parts, "missing": self.missing}
+
+
 class HelpfulnessChecker:
     """Tool to evaluate response helpfulness"""
     
-    def __init__(self, api_key: Optional[str] = None):
+    def __init__(self, api_key: Optional[str] = None, http_client=None, http_async_client=None):
         import os
         openai_key = api_key or os.getenv("OPENAI_API_KEY")
         self.llm = ChatOpenAI(
             model="gpt-3.5-turbo",
             temperature=0,
-            api_key=openai_key
+            api_key=openai_key,
+            http_client=http_client,
+            http_async_client=http_async_client
         )
     
-    def evaluate(self, query: str, response: str) -> float:
+    def evaluate(self, query: str, response: str, on_usage: Optional[UsageCallback] = None) -> float:
         """
         Evaluate helpfulness of a response on a scale of 0-1
         
         Args:
             query: Original user query
             response: Generated response
+            on_usage: Optional callback given the model, prompt and result of the LLM call
             
         Returns:
             float: Helpfulness score between 0 and 1
         """
         try:
-            evaluation_prompt = f"""
+            messages = self._build_messages(query, response)
+            
+            result = self.llm.invoke(messages)
+            if on_usage is not None:
+                on_usage(self.llm.model_name, messages, result)
+            
+            # Extract numeric score from response
+            try:
+                content = str(result.content) if hasattr(result.content, '__str__') else str(result.content)
+                score = float(content.strip())
+                return max(0.0, min(1.0, score))  # Ensure score is between 0 and 1
+            except ValueError:
+                return 0.5  # Default neutral score if parsing fails
+                
+        except Exception as e:
+            print(f"Helpfulness evaluation error: {e}")
+            return 0.5  # Default neutral score on error
+    
+    def critique(self, query: str, response: str, on_usage: Optional[UsageCallback] = None) -> Critique:
+        """
+        Score a response and name its weak parts, in one LLM call
+        
+        Args:
+            query: Original user query
+            response: Generated response
+            on_usage: Optional callback given the model, prompt and result of the LLM call
+        
+        Returns:
+            Critique: Score between 0 and 1 with the weak passages and missing points
+        """
+        try:
+            messages = self._build_critique_messages(query, response)
+            
+            result = self.llm.invoke(messages)
+            if on_usage is not None:
+                on_usage(self.llm.model_name, messages, result)
+            return parse_critique(str(result.content))
+        
+        except Exception as e:
+            print(f"Helpfulness critique error: {e}")
+            return Critique()
+    
+    def evaluate_many(
+        self,
+        queries: Sequence[str],
+        responses: Sequence[str],
+        pack_size: int = 1,
+        max_concurrency: int = 8,
+        on_usage: Optional[UsageCallback] = None
+    ) -> np.ndarray:
+        """
+        Evaluate many query/response pairs with bounded concurrency
+        
+        Args:
+            queries: Original user queries
+            responses: Generated responses, aligned with queries
+            pack_size: Number of pairs scored by a single prompt
+            max_concurrency: Maximum number of LLM requests in flight
+            on_usage: Optional callback given the model, prompt and result of each LLM call
+        
+        Returns:
+            np.ndarray: Helpfulness scores between 0 and 1, one per pair
+        """
+        packs = self._build_packs(queries, responses, pack_size)
+        if not packs:
+            return np.empty(0, dtype=np.float64)
+        
+        try:
+            results = self.llm.batch(
+                [self._build_pack_messages(pack) for pack in packs],
+                config={"max_concurrency": max_concurrency},
+                return_exceptions=True
+            )
+        except Exception as e:
+            print(f"Helpfulness batch evaluation error: {e}")
+            return np.full(len(queries), DEFAULT_SCORE, dtype=np.float64)
+        
+        return self._collect_scores(packs, results, on_usage)
+    
+    async def aevaluate_many(
+        self,
+        queries: Sequence[str],
+        responses: Sequence[str],
+        pack_size: int = 1,
+        max_concurrency: int = 8,
+        on_usage: Optional[UsageCallback] = None
+    ) -> np.ndarray:
+        """Async variant of evaluate_many"""
+        packs = self._build_packs(queries, responses, pack_size)
+        if not packs:
+            return np.empty(0, dtype=np.float64)
+        
+        try:
+            results = await self.llm.abatch(
+                [self._build_pack_messages(pack) for pack in packs],
+                config={"max_concurrency": max_concurrency},
+                return_exceptions=True
+            )
+        except Exception as e:
+            print(f"Helpfulness batch evaluation error: {e}")
+            return np.full(len(queries), DEFAULT_SCORE, dtype=np.float64)
+        
+        return self._collect_scores(packs, results, on_usage)
+    
+    def _build_messages(self, query: str, response: str) -> List:
+        """Build the single-pair evaluation prompt"""
+        evaluation_prompt = f"""
             Evaluate the helpfulness of this AI response on a scale of 0.0 to 1.0:
             
             User Query: {query}
@@ -48,26 +197,140 @@ class HelpfulnessChecker:
             
             Respond with only a decimal number between 0.0 and 1.0, where:
             - 0.0-0.3: Poor/Unhelpful
-            - 0.4-0.6: Adequate/Somewhat helpful  
+            - 0.4-0.6: Adequate/Somewhat helpful
             - 0.7-0.9: Good/Helpful
             - 0.9-1.0: Excellent/Very helpful
             """
+        
+        return [
+            SystemMessage(content="You are an objective evaluator of AI response quality."),
+            HumanMessage(content=evaluation_prompt)
+        ]
+    
+    def _build_critique_messages(self, query: str, response: str) -> List:
+        """Build the evaluation prompt that also asks for the weak parts"""
+        critique_prompt = f"""
+            Evaluate the helpfulness of this AI response on a scale of 0.0 to 1.0:
             
-            messages = [
-                SystemMessage(content="You are an objective evaluator of AI response quality."),
-                HumanMessage(content=evaluation_prompt)
-            ]
+            User Query: {query}
             
-            result = self.llm.invoke(messages)
+            AI Response: {response}
             
-            # Extract numeric score from response
-            try:
-                content = str(result.content) if hasattr(result.content, '__str__') else str(result.content)
-                score = float(content.strip())
-                return max(0.0, min(1.0, score))  # Ensure score is between 0 and 1
-            except ValueError:
-                return 0.5  # Default neutral score if parsing fails
-                
-        except Exception as e:
-            print(f"Helpfulness evaluation error: {e}")
-            return 0.5  # Default neutral score on error
\ No newline at end of file
+            Consider relevance, accuracy, completeness, clarity and usefulness.
+            
+            Respond with only a JSON object:
+            {{"score": 0.0-1.0,
+              "weak_parts": [{{"quote": "a passage copied exactly from the response", "problem": "what is wrong with it"}}],
+              "missing": ["something the response should have covered"]}}
+            List at most {MAX_CRITIQUE_ITEMS} weak parts and {MAX_CRITIQUE_ITEMS} missing points, the most important first.
+            Leave both lists empty when the response is good.
+            """
+        
+        return [
+            SystemMessage(content="You are an objective evaluator of AI response quality."),
+            HumanMessage(content=critique_prompt)
+        ]
+    
+    def _build_packs(self, queries: Sequence[str], responses: Sequence[str], pack_size: int) -> List[List[tuple]]:
+        """Split aligned pairs into packs of at most pack_size"""
+        if len(queries) != len(responses):
+            raise ValueError("queries and responses must have the same length")
+        
+        pairs = list(zip(queries, responses))
+        size = max(1, pack_size)
+        return [pairs[i:i + size] for i in range(0, len(pairs), size)]
+    
+    def _build_pack_messages(self, pack: List[tuple]) -> List:
+        """Build one prompt scoring every pair in the pack"""
+        if len(pack) == 1:
+            return self._build_messages(*pack[0])
+        
+        items = ""
+        for i, (query, response) in enumerate(pack, 1):
+            items += f"\n[{i}]\nUser Query: {query}\nAI Response: {response}\n"
+        
+        evaluation_prompt = f"""
+            Evaluate the helpfulness of each of the following {len(pack)} AI responses on a scale of 0.0 to 1.0,
+            using relevance, accuracy, completeness, clarity and usefulness as criteria.
+            {items}
+            Respond with only a JSON array of {len(pack)} decimal numbers, in the same order, for example [0.8, 0.4].
+            """
+        
+        return [
+            SystemMessage(content="You are an objective evaluator of AI response quality."),
+            HumanMessage(content=evaluation_prompt)
+        ]
+    
+    def _collect_scores(self, packs: List[List[tuple]], results: List, on_usage: Optional[UsageCallback] = None) -> np.ndarray:
+        """Flatten per-pack LLM results into one score array"""
+        scores = []
+        for pack, result in zip(packs, results):
+            if isinstance(result, Exception):
+                print(f"Helpfulness evaluation error: {result}")
+                scores.extend([DEFAULT_SCORE] * len(pack))
+            else:
+                if on_usage is not None:
+                    on_usage(self.llm.model_name, self._build_pack_messages(pack), result)
+                scores.extend(parse_scores(str(result.content), len(pack)))
+        
+        return np.asarray(scores, dtype=np.float64)
+
+
+def parse_scores(content: str, expected: int) -> List[float]:
+    """
+    Extract up to `expected` scores in [0, 1] from free-form LLM output
+    
+    The first JSON array of numbers is used when there is one; a lone
+    integer in brackets is a label the model echoed, not an array. Missing
+    scores are padded with the neutral default so the output always has
+    exactly `expected` entries.
+    """
+    scores = next((array for array in map(_number_array, JSON_ARRAY_PATTERN.findall(content)) if array), None)
+    if scores is None:
+        scores = [float(match) for match in SCORE_PATTERN.findall(content)]
+    scores = [max(0.0, min(1.0, score)) for score in scores[:expected]]
+    scores.extend([DEFAULT_SCORE] * (expected - len(scores)))
+    return scores
+
+
+def _number_array(text: str) -> Optional[List[float]]:
+    """Numbers of a JSON array, or None for anything else, including labels like [1]"""
+    try:
+        values = json.loads(text)
+    except ValueError:
+        return None
+    if not values or not all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in values):
+        return None
+    if len(values) == 1 and isinstance(values[0], int):
+        return None
+    return [float(value) for value in values]
+
+
+def parse_critique(content: str) -> Critique:
+    """
+    Read a critique from LLM output
+    
+    Output that is not the requested JSON object still yields its score,
+    as a critique with nothing specific to revise.
+    """
+    match = JSON_OBJECT_PATTERN.search(content)
+    try:
+        data = json.loads(match.group(0)) if match else None
+    except ValueError:
+        data = None
+    if not isinstance(data, dict):
+        return Critique(score=parse_scores(content, 1)[0])
+    
+    try:
+        score = max(0.0, min(1.0, float(data.get("score", DEFAULT_SCORE))))
+    except (TypeError, ValueError):
+        score = DEFAULT_SCORE
+    weak_parts = data.get("weak_parts")
+    weak_parts = [
+        {"quote": str(part["quote"]), "problem": str(part.get("problem", ""))}
+        for part in weak_parts
+        if isinstance(part, dict) and part.get("quote")
+    ] if isinstance(weak_parts, list) else []
+    missing = data.get("missing")
+    missing = [str(point) for point in missing if point] if isinstance(missing, list) else []
+    return Critique(score=score, weak_parts=weak_parts[:MAX_CRITIQUE_ITEMS], missing=missing[:MAX_CRITIQUE_ITEMS])
@@ -5,26 +5,65 @@ Provides web search capabilities using Tavily API
 
 import os
 from typing import List, Dict, Any, Optional
+import requests
 from tavily import TavilyClient
 from langchain.tools import Tool
 
 
+TAVILY_SEARCH_URL = "https://api.tavily.com/search"
+
+
+class TavilyHTTPClient:
+    """
+    Calls Tavily's public REST search endpoint through a shared keep-alive session
+    
+    Takes the keyword arguments TavilySearchTool passes to TavilyClient.search,
+    so it depends only on the documented HTTP API, not on tavily-python's
+    internals, which change between releases.
+    """
+    
+    def __init__(self, api_key: str, session: requests.Session, timeout: float = 100):
+        self.api_key = api_key
+        self.session = session
+        self.timeout = timeout
+    
+    def search(self, query: str, search_depth: str = "basic", max_results: int = 5,
+               include_images: bool = False, include_answer: bool = False) -> Dict[str, Any]:
+        response = self.session.post(TAVILY_SEARCH_URL, json={
+            "api_key": self.api_key,
+            "query": query,
+            "search_depth": search_depth,
+            "max_results": max_results,
+            "include_images": include_images,
+            "include_answer": include_answer
+        }, headers={"Authorization": f"Bearer {self.api_key}"}, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+
 class TavilySearchTool:
     """Tavily search tool for web search capabilities"""
     
-    def __init__(self, api_key: Optional[str] = None):
+    def __init__(self, api_key: Optional[str] = None, session: Optional[requests.Session] = None):
         self.api_key = api_key or os.getenv("TAVILY_API_KEY")
         if not self.api_key:
             raise ValueError("TAVILY_API_KEY not provided and not found in environment variables")
         
-        self.client = TavilyClient(api_key=self.api_key)
+        if session is not None:
+            self.client = TavilyHTTPClient(api_key=self.api_key, session=session)
+        else:
+            self.client = TavilyClient(api_key=self.api_key)
     
-    def search(self, query: str, max_results: int = 5) -> List[Dict[str, Any]]:
+    def search(self, query: str, max_results: int = 5, search_depth: str = "advanced") -> List[Dict[str, Any]]:
         """Perform web search using Tavily"""
+        return self.search_with_answer(query, max_results=max_results, search_depth=search_depth)["results"]
+    
+    def search_with_answer(self, query: str, max_results: int = 5, search_depth: str = "advanced") -> Dict[str, Any]:
+        """Perform web search and also return Tavily's synthesized answer (None if unavailable)"""
         try:
             response = self.client.search(
                 query=query,
-                search_depth="advanced",
+                search_depth=search_depth,
                 max_results=max_results,
                 include_images=False,
                 include_answer=True
@@ -40,11 +79,11 @@ class TavilySearchTool:
                     "source": "web"
                 })
             
-            return results
+            return {"results": results, "answer": response.get("answer")}
             
         except Exception as e:
             print(f"Tavily search error: {e}")
-            return []
+            return {"results": [], "answer": None}
     
     def get_tool(self) -> Tool:
         """Get LangChain tool interface"""
@@ -3,15 +3,21 @@ YouTube Search Tool Integration
 Provides video search capabilities for educational content
 """
 
+import json
 import os
+import time
+import urllib.parse
 from typing import List, Dict, Any, Optional
 from langchain.tools import Tool
 
 
+INITIAL_DATA_MARKER = "ytInitialData"
+
+
 class YouTubeSearchTool:
     """YouTube search tool for educational video content"""
     
-    def __init__(self):
+    def __init__(self, session=None):
         """Initialize YouTube search tool"""
         # Note: Using youtube_search package which doesn't require API key
         try:
@@ -23,6 +29,9 @@ class YouTubeSearchTool:
                 "Install with: pip install youtube-search"
             )
     
+        # Optional shared requests.Session; youtube_search itself opens a new connection per call
+        self.session = session
+    
     def search(self, query: str, max_results: int = 3) -> List[Dict[str, Any]]:
         """Search YouTube for educational videos"""
         try:
@@ -30,7 +39,10 @@ class YouTubeSearchTool:
             enhanced_query = f"{query} tutorial explanation"
             
             # Search YouTube
-            results = self.youtube_search(enhanced_query, max_results=max_results).to_dict()
+            if self.session is not None:
+                results = self._pooled_search(enhanced_query, max_results)
+            else:
+                results = self.youtube_search(enhanced_query, max_results=max_results).to_dict()
             
             videos = []
             for video in results:
@@ -39,18 +51,18 @@ class YouTubeSearchTool:
                 description = long_desc[:200] + "..." if len(long_desc) > 200 else long_desc
                 
                 # Handle thumbnail safely
-                thumbnails = video.get("thumbnails", [])
+                thumbnails = video.get("thumbnails") or []
                 thumbnail_url = thumbnails[0] if thumbnails else ""
                 
                 video_data = {
-                    "title": video.get("title", "Unknown Title"),
-                    "url": f"https://www.youtube.com{video.get('url_suffix', '')}",
+                    "title": video.get("title") or "Unknown Title",
+                    "url": f"https://www.youtube.com{video.get('url_suffix') or ''}",
                     "description": description,
-                    "duration": video.get("duration", "Unknown"),
-                    "channel": video.get("channel", "Unknown Channel"),
-                    "published_date": video.get("publish_time", "Unknown"),
+                    "duration": video.get("duration") or "Unknown",
+                    "channel": video.get("channel") or "Unknown Channel",
+                    "published_date": video.get("publish_time") or "Unknown",
                     "thumbnail": thumbnail_url,
-                    "views": video.get("views", "Unknown"),
+                    "views": video.get("views") or "Unknown",
                     "type": "youtube",
                     "score": 0.8  # High score for educational content
                 }
@@ -62,6 +74,18 @@ class YouTubeSearchTool:
             print(f"YouTube search error: {e}")
             return []
     
+    def _pooled_search(self, query: str, max_results: int, attempts: int = 3, backoff: float = 0.5) -> List[Dict[str, Any]]:
+        """Fetch the results page over the shared session and parse it with parse_results_page"""
+        url = f"https://youtube.com/results?search_query={urllib.parse.quote_plus(query)}"
+        for attempt in range(attempts):
+            html = self.session.get(url, timeout=10).text
+            if INITIAL_DATA_MARKER in html:
+                return parse_results_page(html)[:max_results]
+            # YouTube sometimes serves a page without the initial data; retry after a short pause
+            if attempt < attempts - 1:
+                time.sleep(backoff * 2 ** attempt)
+        return []
+    
     def get_tool(self) -> Tool:
         """Get the LangChain tool for YouTube search"""
         return Tool(
@@ -93,4 +117,54 @@ class YouTubeSearchTool:
             return result
             
         except Exception as e:
-            return f"Error searching YouTube: {str(e)}"
\ No newline at end of file
+            return f"Error searching YouTube: {str(e)}"
+
+
+def _first_text(node: Any) -> Optional[str]:
+    """Text of the first run of a YouTube text object ({"runs": [{"text": ...}]} or {"simpleText": ...})"""
+    if not isinstance(node, dict):
+        return None
+    runs = node.get("runs")
+    if isinstance(runs, list) and runs and isinstance(runs[0], dict):
+        return runs[0].get("text")
+    return node.get("simpleText")
+
+
+def parse_results_page(html: str) -> List[Dict[str, Any]]:
+    """
+    Videos from a YouTube results page, in the shape youtube_search's to_dict() returns
+    
+    Reads the ytInitialData JSON embedded in the page. Items that are not
+    videos (shelves, ads, channels) are skipped, and missing fields come
+    back as None, so layout changes degrade results rather than raise.
+    """
+    start = html.find(INITIAL_DATA_MARKER)
+    if start < 0:
+        return []
+    start = html.find("{", start)
+    try:
+        data, _ = json.JSONDecoder().raw_decode(html, start)
+    except ValueError:
+        return []
+    
+    sections = (data.get("contents", {}).get("twoColumnSearchResultsRenderer", {})
+                .get("primaryContents", {}).get("sectionListRenderer", {}).get("contents", []))
+    videos = []
+    for section in sections:
+        for item in section.get("itemSectionRenderer", {}).get("contents", []):
+            video = item.get("videoRenderer")
+            if not isinstance(video, dict):
+                continue
+            videos.append({
+                "id": video.get("videoId"),
+                "thumbnails": [thumb.get("url") for thumb in video.get("thumbnail", {}).get("thumbnails", [])],
+                "title": _first_text(video.get("title")),
+                "long_desc": _first_text(video.get("descriptionSnippet")),
+                "channel": _first_text(video.get("longBylineText")),
+                "duration": _first_text(video.get("lengthText")),
+                "views": _first_text(video.get("viewCountText")),
+                "publish_time": _first_text(video.get("publishedTimeText")),
+                "url_suffix": video.get("navigationEndpoint", {}).get("commandMetadata", {})
+                .get("webCommandMetadata", {}).get("url")
+            })
+    return videos
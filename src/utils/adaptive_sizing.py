@@ -0,0 +1,188 @@
+"""
+Adaptive Result Sizing
+Tunes per-tool fetch sizes and search depth per query class from observed result utility
+"""
+
+import threading
+from typing import Dict, Any, List, Optional
+
+
+# Keyword heuristics mirror the analyzer's fallback routing
+QUERY_CLASS_KEYWORDS = {
+    "howto": ["how to", "tutorial", "learn", "guide", "step by step"],
+    "academic": ["research", "study", "paper", "academic", "arxiv", "theory"],
+    "news": ["latest", "news", "today", "current", "price", "weather", "recent"]
+}
+
+DEFAULT_FETCH_SIZES = {
+    "corpus_search": 5,
+    "web_search": 5,
+    "arxiv_search": 5,
+    "youtube_search": 3
+}
+
+
+def classify_query(query: str) -> str:
+    """Assign a query to a coarse class used to key the sizing statistics"""
+    query_lower = query.lower()
+    for query_class, keywords in QUERY_CLASS_KEYWORDS.items():
+        if any(keyword in query_lower for keyword in keywords):
+            return query_class
+    return "general"
+
+
+class _ToolStats:
+    """Exponentially weighted utility statistics for one (query class, tool) pair"""
+    
+    def __init__(self, default_size: int):
+        self.observations = 0
+        self.cited_observations = 0
+        self.needed = float(default_size)
+        self.cited_rate = 1.0
+        self.full_latency: Optional[float] = None
+    
+    def update(self, alpha: float, needed: int, cited_rate: Optional[float]):
+        self.observations += 1
+        self.needed = (1 - alpha) * self.needed + alpha * needed
+        # Answers without any citation say nothing about how useful the results were
+        if cited_rate is not None:
+            self.cited_observations += 1
+            self.cited_rate = (1 - alpha) * self.cited_rate + alpha * cited_rate
+
+
+class AdaptiveResultPolicy:
+    """Chooses max_results and search depth per tool from which results were actually used"""
+    
+    def __init__(
+        self,
+        enabled: bool = True,
+        min_results: int = 2,
+        headroom: int = 1,
+        warmup_observations: int = 20,
+        basic_depth_cited_rate: float = 0.3,
+        alpha: float = 0.1,
+        explore_every: int = 20
+    ):
+        self.enabled = enabled
+        self.min_results = min_results
+        self.headroom = headroom
+        self.warmup_observations = warmup_observations
+        self.basic_depth_cited_rate = basic_depth_cited_rate
+        self.alpha = alpha
+        # Every Nth plan per class runs at full depth to keep baselines fresh
+        self.explore_every = explore_every
+        
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, _ToolStats]] = {}
+        self._plans: Dict[str, int] = {}
+        self._calls = {"adapted": 0, "full": 0}
+        self._results_saved = 0
+        self._latency_saved = 0.0
+    
+    def plan(self, query: str, force_full_depth: bool = False) -> Dict[str, Any]:
+        """
+        Fetch plan for a query
+        
+        Returns the query class plus, per tool, the max_results to request
+        (and search_depth for web search). Forced or cold plans use the
+        defaults.
+        """
+        query_class = classify_query(query)
+        plan = {"query_class": query_class, "adapted": False}
+        for tool, default_size in DEFAULT_FETCH_SIZES.items():
+            plan[tool] = {"max_results": default_size}
+        plan["web_search"]["search_depth"] = "advanced"
+        
+        if not self.enabled or force_full_depth:
+            return plan
+        
+        with self._lock:
+            self._plans[query_class] = self._plans.get(query_class, 0) + 1
+            if self.explore_every and self._plans[query_class] % self.explore_every == 0:
+                return plan
+            
+            for tool, default_size in DEFAULT_FETCH_SIZES.items():
+                stats = self._stats.get(query_class, {}).get(tool)
+                if stats is None or stats.observations < self.warmup_observations:
+                    continue
+                size = int(stats.needed + 0.5) + self.headroom
+                plan[tool]["max_results"] = max(self.min_results, min(default_size, size))
+                if (tool == "web_search" and stats.cited_observations >= self.warmup_observations
+                        and stats.cited_rate < self.basic_depth_cited_rate):
+                    plan["web_search"]["search_depth"] = "basic"
+        
+        plan["adapted"] = any(
+            plan[tool]["max_results"] < size for tool, size in DEFAULT_FETCH_SIZES.items()
+        ) or plan["web_search"]["search_depth"] != "advanced"
+        return plan
+    
+    def record(self, query_class: str, tool: str, plan_entry: Dict[str, Any], seen: int,
+               used_ranks: List[int], cited: Optional[int], latency: float):
+        """
+        Record the outcome of one tool call
+        
+        Args:
+            query_class: Class returned by plan()
+            tool: Tool name
+            plan_entry: The per-tool plan the call used
+            seen: Number of this tool's results that reached the responder's context
+            used_ranks: 1-based ranks (within this tool) of seen results that were cited, or all seen ones
+            cited: Number of this tool's seen results referenced in the answer, or None when
+                the answer cites nothing at all
+            latency: Seconds the tool call took
+        """
+        default_size = DEFAULT_FETCH_SIZES[tool]
+        is_full = plan_entry.get("max_results") == default_size and plan_entry.get("search_depth", "advanced") == "advanced"
+        
+        with self._lock:
+            stats = self._stats.setdefault(query_class, {}).setdefault(tool, _ToolStats(default_size))
+            stats.update(self.alpha, max(used_ranks, default=0), cited / seen if cited is not None and seen else None)
+            
+            if is_full:
+                self._calls["full"] += 1
+                if stats.full_latency is None:
+                    stats.full_latency = latency
+                else:
+                    stats.full_latency = (1 - self.alpha) * stats.full_latency + self.alpha * latency
+            else:
+                self._calls["adapted"] += 1
+                self._results_saved += default_size - plan_entry.get("max_results", default_size)
+                if stats.full_latency is not None:
+                    self._latency_saved += max(0.0, stats.full_latency - latency)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Current per-class sizing and estimated savings"""
+        with self._lock:
+            per_class = {
+                query_class: {
+                    tool: {
+                        "observations": s.observations,
+                        "cited_observations": s.cited_observations,
+                        "needed": round(s.needed, 2),
+                        "cited_rate": round(s.cited_rate, 3),
+                        "full_latency": round(s.full_latency, 3) if s.full_latency is not None else None
+                    }
+                    for tool, s in tools.items()
+                }
+                for query_class, tools in self._stats.items()
+            }
+            return {
+                "enabled": self.enabled,
+                "calls": dict(self._calls),
+                "results_saved": self._results_saved,
+                "latency_saved_seconds": round(self._latency_saved, 3),
+                "classes": per_class
+            }
+
+
+_policy: Optional[AdaptiveResultPolicy] = None
+_policy_lock = threading.Lock()
+
+
+def get_result_policy(config=None) -> AdaptiveResultPolicy:
+    """Return the process-wide policy so every agent instance learns from all traffic"""
+    global _policy
+    with _policy_lock:
+        if _policy is None:
+            _policy = AdaptiveResultPolicy(enabled=config.adaptive_result_sizing if config is not None else True)
+        return _policy
@@ -0,0 +1,82 @@
+"""
+Session Affinity
+Consistent-hash ring and routing-key extraction for pinning sessions to workers and nodes
+"""
+
+import bisect
+import hashlib
+import json
+import re
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs
+
+
+# Stream ids carry their session's affinity token before this separator so resumes route like the session
+STREAM_TOKEN_SEPARATOR = "~"
+
+_HISTORY_PATH = re.compile(r"^/chat/([^/]+)/history/?$")
+_SESSION_PATH = re.compile(r"^/chat/([^/]+)/?$")
+_STREAM_PATH = re.compile(r"^/chat/stream/([^/]+)/?$")
+_SOCKET_PATH = re.compile(r"^/chat/ws/?$")
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def affinity_token(session_id: str) -> str:
+    """Short, non-reversible routing token for a session id"""
+    return hashlib.blake2b(session_id.encode("utf-8"), digest_size=6).hexdigest()
+
+
+class HashRing:
+    """
+    Consistent-hash ring with virtual nodes
+    
+    Each node is placed at `replicas` points on the ring and a key belongs
+    to the first point at or after its hash, so adding or removing a node
+    only moves about 1/N of the keys.
+    """
+    
+    def __init__(self, nodes: List[str], replicas: int = 100):
+        if not nodes:
+            raise ValueError("HashRing needs at least one node")
+        self.nodes = list(nodes)
+        points = sorted((_hash(f"{node}#{i}"), node) for node in self.nodes for i in range(replicas))
+        self._hashes = [point for point, _ in points]
+        self._owners = [node for _, node in points]
+    
+    def node_for(self, key: str) -> str:
+        index = bisect.bisect(self._hashes, _hash(key)) % len(self._hashes)
+        return self._owners[index]
+
+
+def routing_key(method: str, path: str, headers: Dict[str, str], body: bytes = b"", query: str = "") -> Optional[str]:
+    """
+    Affinity token for a request, or None when it is not tied to a session
+    
+    Looks at an X-Session-Id header, session-scoped paths, stream ids, the
+    session_id query parameter of a WebSocket connection and the
+    session_id field of a JSON body, in that order. headers must use
+    lower-case names.
+    """
+    session_id = headers.get("x-session-id")
+    if not session_id and method == "GET" and _SOCKET_PATH.match(path):
+        # One connection may carry several sessions; clients name the one it should stay close to
+        session_id = (parse_qs(query).get("session_id") or [None])[0]
+    if not session_id:
+        stream = _STREAM_PATH.match(path)
+        if method == "GET" and stream:
+            stream_id = stream.group(1)
+            return stream_id.split(STREAM_TOKEN_SEPARATOR, 1)[0] if STREAM_TOKEN_SEPARATOR in stream_id else None
+        match = _HISTORY_PATH.match(path) if method == "GET" else _SESSION_PATH.match(path) if method == "DELETE" else None
+        if match:
+            session_id = match.group(1)
+    if not session_id and method == "POST" and body and "json" in headers.get("content-type", ""):
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            payload = None
+        if isinstance(payload, dict) and isinstance(payload.get("session_id"), str):
+            session_id = payload["session_id"]
+    return affinity_token(session_id) if session_id else None
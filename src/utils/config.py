@@ -30,6 +30,95 @@ class AppConfig:
     langchain_tracing: bool = False
     langchain_project: str = "langgraph-agent-app"
     
+    # Tool Settings
+    arxiv_backend: str = "api"
+    arxiv_index_dir: Optional[str] = None
+    corpus_index_dir: Optional[str] = None
+    corpus_nprobe: int = 8
+    corpus_description: str = "internal documents such as policies, design docs and runbooks"
+    adaptive_result_sizing: bool = True
+    speculative_tools: bool = False
+    early_tool_dispatch: bool = True
+    early_dispatch_workers: int = 32
+    subquery_decomposition: bool = False
+    max_subqueries: int = 3
+    max_upstream_calls: int = 6
+    subquery_concurrency: int = 4
+    progressive_generation: bool = False
+    progressive_min_results: int = 3
+    progressive_grace_seconds: float = 1.5
+    progressive_late_results: str = "section"
+    progressive_late_timeout: float = 10.0
+    
+    # Responder Cascade Settings
+    responder_cascade: str = ""
+    cascade_escalate_below: float = 0.5
+    
+    # Answer Revision Settings
+    revision_mode: str = "targeted"
+    revise_below: float = 0.3
+    max_revisions: int = 2
+    
+    # Usage Accounting Settings
+    token_prices: str = ""
+    tenant_budget_usd: float = 0.0
+    tenant_budgets: str = ""
+    budget_window_seconds: float = 3600.0
+    budget_degrade_at: float = 0.8
+    budget_fallback_model: str = "gpt-4o-mini"
+    
+    # Streaming Settings
+    stream_protocol: str = "v2"
+    progressive_answers: bool = True
+    draft_skip_llm: str = "never"
+    stream_checkpoint_every: int = 32
+    stream_replay_ttl: float = 300.0
+    ws_max_streams: int = 8
+    ws_stream_window: int = 64
+    ws_heartbeat_interval: float = 20.0
+    ws_heartbeat_timeout: float = 60.0
+    
+    # Scheduler Settings
+    scheduler_max_concurrency: int = 8
+    scheduler_tenant_concurrency: int = 2
+    scheduler_address_concurrency: int = 0
+    scheduler_max_queue: int = 32
+    scheduler_tenant_weights: str = ""
+    
+    # Flight Recorder Settings
+    flight_recorder_size: int = 50
+    flight_recorder_dump_dir: Optional[str] = None
+    flight_recorder_dump_seconds: float = 10.0
+    debug_token: Optional[str] = None
+    profile_sample_rate: float = 0.0
+    query_log_dir: Optional[str] = None
+    query_log_segment_records: int = 1_000_000
+    
+    # Hot Query Precompute Settings
+    hot_query_precompute: bool = False
+    hot_query_top_k: int = 50
+    hot_query_min_hits: float = 5.0
+    hot_query_ttl: float = 900.0
+    hot_query_refresh_after: float = 600.0
+    hot_query_refresh_budget: int = 120
+    hot_query_interval: float = 30.0
+    hot_query_idle_below: int = 2
+    
+    # Deployment Settings
+    workers: int = 1
+    worker_id: Optional[str] = None
+    shared_state_path: Optional[str] = None
+    metrics_publish_interval: float = 5.0
+    affinity_nodes: str = ""
+    affinity_self: Optional[str] = None
+    affinity_secret: Optional[str] = None
+    
+    # HTTP Connection Pool Settings
+    http_pool_max_connections: int = 100
+    http_pool_max_keepalive: int = 20
+    http_keepalive_expiry: float = 30.0
+    http2: bool = True
+    
     def __post_init__(self):
         """Load configuration from environment variables"""
         self.openai_api_key = os.getenv("OPENAI_API_KEY")
@@ -46,6 +135,85 @@ class AppConfig:
         self.langchain_tracing = os.getenv("LANGCHAIN_TRACING_V2", "false").lower() == "true"
         self.langchain_project = os.getenv("LANGCHAIN_PROJECT", self.langchain_project)
         
+        self.arxiv_backend = os.getenv("ARXIV_BACKEND", self.arxiv_backend).lower()
+        self.arxiv_index_dir = os.getenv("ARXIV_INDEX_DIR", self.arxiv_index_dir)
+        self.corpus_index_dir = os.getenv("CORPUS_INDEX_DIR", self.corpus_index_dir)
+        self.corpus_nprobe = int(os.getenv("CORPUS_NPROBE", self.corpus_nprobe))
+        self.corpus_description = os.getenv("CORPUS_DESCRIPTION", self.corpus_description)
+        self.adaptive_result_sizing = os.getenv("ADAPTIVE_RESULT_SIZING", "true").lower() == "true"
+        self.speculative_tools = os.getenv("SPECULATIVE_TOOLS", "false").lower() == "true"
+        self.early_tool_dispatch = os.getenv("EARLY_TOOL_DISPATCH", "true").lower() == "true"
+        self.early_dispatch_workers = int(os.getenv("EARLY_DISPATCH_WORKERS", self.early_dispatch_workers))
+        self.subquery_decomposition = os.getenv("SUBQUERY_DECOMPOSITION", "false").lower() == "true"
+        self.max_subqueries = int(os.getenv("MAX_SUBQUERIES", self.max_subqueries))
+        self.max_upstream_calls = int(os.getenv("MAX_UPSTREAM_CALLS", self.max_upstream_calls))
+        self.subquery_concurrency = int(os.getenv("SUBQUERY_CONCURRENCY", self.subquery_concurrency))
+        self.progressive_generation = os.getenv("PROGRESSIVE_GENERATION", "false").lower() == "true"
+        self.progressive_min_results = int(os.getenv("PROGRESSIVE_MIN_RESULTS", self.progressive_min_results))
+        self.progressive_grace_seconds = float(os.getenv("PROGRESSIVE_GRACE_SECONDS", self.progressive_grace_seconds))
+        self.progressive_late_results = os.getenv("PROGRESSIVE_LATE_RESULTS", self.progressive_late_results).lower()
+        self.progressive_late_timeout = float(os.getenv("PROGRESSIVE_LATE_TIMEOUT", self.progressive_late_timeout))
+        
+        self.responder_cascade = os.getenv("RESPONDER_CASCADE", self.responder_cascade)
+        self.cascade_escalate_below = float(os.getenv("CASCADE_ESCALATE_BELOW", self.cascade_escalate_below))
+        
+        self.revision_mode = os.getenv("REVISION_MODE", self.revision_mode).lower()
+        self.revise_below = float(os.getenv("REVISE_BELOW", self.revise_below))
+        self.max_revisions = int(os.getenv("MAX_REVISIONS", self.max_revisions))
+        
+        self.token_prices = os.getenv("TOKEN_PRICES", self.token_prices)
+        self.tenant_budget_usd = float(os.getenv("TENANT_BUDGET_USD", self.tenant_budget_usd))
+        self.tenant_budgets = os.getenv("TENANT_BUDGETS", self.tenant_budgets)
+        self.budget_window_seconds = float(os.getenv("BUDGET_WINDOW_SECONDS", self.budget_window_seconds))
+        self.budget_degrade_at = float(os.getenv("BUDGET_DEGRADE_AT", self.budget_degrade_at))
+        self.budget_fallback_model = os.getenv("BUDGET_FALLBACK_MODEL", self.budget_fallback_model)
+        
+        self.stream_protocol = os.getenv("STREAM_PROTOCOL", self.stream_protocol).lower()
+        self.progressive_answers = os.getenv("PROGRESSIVE_ANSWERS", "true").lower() == "true"
+        self.draft_skip_llm = os.getenv("DRAFT_SKIP_LLM", self.draft_skip_llm).lower()
+        self.stream_checkpoint_every = int(os.getenv("STREAM_CHECKPOINT_EVERY", self.stream_checkpoint_every))
+        self.stream_replay_ttl = float(os.getenv("STREAM_REPLAY_TTL", self.stream_replay_ttl))
+        self.ws_max_streams = int(os.getenv("WS_MAX_STREAMS", self.ws_max_streams))
+        self.ws_stream_window = int(os.getenv("WS_STREAM_WINDOW", self.ws_stream_window))
+        self.ws_heartbeat_interval = float(os.getenv("WS_HEARTBEAT_INTERVAL", self.ws_heartbeat_interval))
+        self.ws_heartbeat_timeout = float(os.getenv("WS_HEARTBEAT_TIMEOUT", self.ws_heartbeat_timeout))
+        
+        self.scheduler_max_concurrency = int(os.getenv("SCHEDULER_MAX_CONCURRENCY", self.scheduler_max_concurrency))
+        self.scheduler_tenant_concurrency = int(os.getenv("SCHEDULER_TENANT_CONCURRENCY", self.scheduler_tenant_concurrency))
+        self.scheduler_address_concurrency = int(os.getenv("SCHEDULER_ADDRESS_CONCURRENCY", self.scheduler_address_concurrency))
+        self.scheduler_max_queue = int(os.getenv("SCHEDULER_MAX_QUEUE", self.scheduler_max_queue))
+        self.scheduler_tenant_weights = os.getenv("SCHEDULER_TENANT_WEIGHTS", self.scheduler_tenant_weights)
+        
+        self.flight_recorder_size = int(os.getenv("FLIGHT_RECORDER_SIZE", self.flight_recorder_size))
+        self.flight_recorder_dump_dir = os.getenv("FLIGHT_RECORDER_DUMP_DIR", self.flight_recorder_dump_dir)
+        self.flight_recorder_dump_seconds = float(os.getenv("FLIGHT_RECORDER_DUMP_SECONDS", self.flight_recorder_dump_seconds))
+        self.debug_token = os.getenv("DEBUG_TOKEN", self.debug_token)
+        self.profile_sample_rate = float(os.getenv("PROFILE_SAMPLE_RATE", self.profile_sample_rate))
+        self.query_log_dir = os.getenv("QUERY_LOG_DIR", self.query_log_dir)
+        self.query_log_segment_records = int(os.getenv("QUERY_LOG_SEGMENT_RECORDS", self.query_log_segment_records))
+        
+        self.hot_query_precompute = os.getenv("HOT_QUERY_PRECOMPUTE", "false").lower() == "true"
+        self.hot_query_top_k = int(os.getenv("HOT_QUERY_TOP_K", self.hot_query_top_k))
+        self.hot_query_min_hits = float(os.getenv("HOT_QUERY_MIN_HITS", self.hot_query_min_hits))
+        self.hot_query_ttl = float(os.getenv("HOT_QUERY_TTL", self.hot_query_ttl))
+        self.hot_query_refresh_after = float(os.getenv("HOT_QUERY_REFRESH_AFTER", self.hot_query_refresh_after))
+        self.hot_query_refresh_budget = int(os.getenv("HOT_QUERY_REFRESH_BUDGET", self.hot_query_refresh_budget))
+        self.hot_query_interval = float(os.getenv("HOT_QUERY_INTERVAL", self.hot_query_interval))
+        self.hot_query_idle_below = int(os.getenv("HOT_QUERY_IDLE_BELOW", self.hot_query_idle_below))
+        
+        self.workers = int(os.getenv("WEB_CONCURRENCY", self.workers))
+        self.worker_id = os.getenv("WORKER_ID", self.worker_id)
+        self.shared_state_path = os.getenv("SHARED_STATE_PATH", self.shared_state_path)
+        self.metrics_publish_interval = float(os.getenv("METRICS_PUBLISH_INTERVAL", self.metrics_publish_interval))
+        self.affinity_nodes = os.getenv("AFFINITY_NODES", self.affinity_nodes)
+        self.affinity_self = os.getenv("AFFINITY_SELF", self.affinity_self)
+        self.affinity_secret = os.getenv("AFFINITY_SECRET", self.affinity_secret)
+        
+        self.http_pool_max_connections = int(os.getenv("HTTP_POOL_MAX_CONNECTIONS", self.http_pool_max_connections))
+        self.http_pool_max_keepalive = int(os.getenv("HTTP_POOL_MAX_KEEPALIVE", self.http_pool_max_keepalive))
+        self.http_keepalive_expiry = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", self.http_keepalive_expiry))
+        self.http2 = os.getenv("HTTP2_ENABLED", "true").lower() == "true"
+        
         # Set environment variables for LangChain
         if self.openai_api_key:
             os.environ["OPENAI_API_KEY"] = self.openai_api_key
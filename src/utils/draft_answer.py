@@ -0,0 +1,64 @@
+"""
+Draft Answers
+Builds an instant draft from the web search answer and decides when it can stand in for the LLM response
+"""
+
+from typing import Dict, Any, List, Optional
+
+
+DRAFT_SKIP_MODES = ("never", "factual", "always")
+
+# Queries asking for explanation or comparison always go to the LLM under the "factual" mode
+EXPLANATORY_WORDS = ["how", "why", "explain", "compare", "difference", "versus", "vs", "pros", "cons", "should"]
+
+
+def build_draft(answer: Optional[str], results: List[Dict[str, Any]], max_sources: int = 3) -> Optional[Dict[str, Any]]:
+    """
+    Draft from Tavily's synthesized answer, falling back to the top result snippet
+    
+    Returns None when there is nothing to show.
+    """
+    sources = [
+        {"title": result.get("title", ""), "url": result.get("url", "")}
+        for result in results[:max_sources]
+    ]
+    if answer and answer.strip():
+        return {"text": answer.strip(), "kind": "answer", "sources": sources}
+    if results and results[0].get("content"):
+        return {"text": results[0]["content"].strip(), "kind": "snippet", "sources": sources[:1]}
+    return None
+
+
+class DraftPolicy:
+    """Decides whether a draft is good enough to skip response generation"""
+    
+    def __init__(self, mode: str = "never", max_query_words: int = 12, min_answer_chars: int = 40):
+        if mode not in DRAFT_SKIP_MODES:
+            raise ValueError(f"Unknown draft skip mode '{mode}', expected one of {DRAFT_SKIP_MODES}")
+        self.mode = mode
+        self.max_query_words = max_query_words
+        self.min_answer_chars = min_answer_chars
+    
+    def accept(self, query: str, draft: Optional[Dict[str, Any]], other_tools: bool = False) -> bool:
+        """
+        Whether the draft can be the final answer
+        
+        Args:
+            query: The user query
+            draft: Draft from build_draft
+            other_tools: Whether the analyzer also asked for arXiv or YouTube results,
+                which a web-only draft cannot cover
+        """
+        if self.mode == "never" or draft is None or draft["kind"] != "answer":
+            return False
+        if len(draft["text"]) < self.min_answer_chars:
+            return False
+        if self.mode == "always":
+            return True
+        
+        words = query.lower().replace("?", " ").split()
+        return (
+            not other_tools
+            and len(words) <= self.max_query_words
+            and not any(word in EXPLANATORY_WORDS for word in words)
+        )
@@ -0,0 +1,168 @@
+"""
+Slow-Request Flight Recorder
+Bounded in-process store of full traces for the slowest and failed requests, with optional disk dumps
+"""
+
+import heapq
+import itertools
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+
+
+MAX_QUERY_CHARS = 500
+MAX_ERROR_CHARS = 1000
+
+
+class RequestTrace:
+    """Per-node spans and errors collected while one request runs"""
+    
+    def __init__(self, trace_id: str, session_id: str, query: str):
+        self.trace_id = trace_id
+        self.session_id = session_id
+        self.query = query[:MAX_QUERY_CHARS]
+        self.started_at = time.time()
+        self._origin = time.perf_counter()
+        self.spans: List[Dict[str, Any]] = []
+        self.errors: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+    
+    @contextmanager
+    def span(self, name: str):
+        """Time one graph node or sub-step"""
+        start = time.perf_counter()
+        error = None
+        try:
+            yield
+        except Exception as e:
+            error = str(e)[:MAX_ERROR_CHARS]
+            raise
+        finally:
+            end = time.perf_counter()
+            with self._lock:
+                self.spans.append({
+                    "name": name,
+                    "start_ms": round((start - self._origin) * 1000, 2),
+                    "duration_ms": round((end - start) * 1000, 2),
+                    "error": error
+                })
+    
+    def error(self, where: str, error: Exception):
+        """Record an error that was handled without failing the request"""
+        with self._lock:
+            self.errors.append({
+                "where": where,
+                "at_ms": round((time.perf_counter() - self._origin) * 1000, 2),
+                "error": str(error)[:MAX_ERROR_CHARS]
+            })
+    
+    def finish(self, details: Dict[str, Any], failed: bool = False) -> Dict[str, Any]:
+        """Freeze the trace into a JSON-serializable record"""
+        with self._lock:
+            return {
+                "trace_id": self.trace_id,
+                "session_id": self.session_id,
+                "query": self.query,
+                "started_at": datetime.fromtimestamp(self.started_at).isoformat(),
+                "duration_ms": round((time.perf_counter() - self._origin) * 1000, 2),
+                "failed": failed or bool(self.errors),
+                "spans": list(self.spans),
+                "errors": list(self.errors),
+                **details
+            }
+
+
+class FlightRecorder:
+    """
+    Keeps the N slowest and the N most recent failed request traces
+    
+    Memory is bounded by both capacities; queries and error messages are
+    truncated. Traces slower than dump_seconds, and failed ones, are also
+    appended to a daily JSONL file when dump_dir is set.
+    """
+    
+    def __init__(self, capacity: int = 50, dump_dir: Optional[str] = None, dump_seconds: float = 10.0):
+        self.capacity = capacity
+        self.dump_dir = dump_dir
+        self.dump_seconds = dump_seconds
+        self._lock = threading.Lock()
+        self._slowest: List[Any] = []
+        self._failed: deque = deque(maxlen=capacity)
+        self._counter = itertools.count()
+        self._recorded = 0
+    
+    def record(self, trace: Dict[str, Any]):
+        with self._lock:
+            self._recorded += 1
+            entry = (trace["duration_ms"], next(self._counter), trace)
+            if len(self._slowest) < self.capacity:
+                heapq.heappush(self._slowest, entry)
+            elif entry[0] > self._slowest[0][0]:
+                heapq.heapreplace(self._slowest, entry)
+            if trace["failed"]:
+                self._failed.append(trace)
+        
+        if self.dump_dir and (trace["failed"] or trace["duration_ms"] >= self.dump_seconds * 1000):
+            self._dump(trace)
+    
+    def slowest(self, limit: int = 20) -> List[Dict[str, Any]]:
+        with self._lock:
+            entries = heapq.nlargest(limit, self._slowest)
+        return [trace for _, _, trace in entries]
+    
+    def failed(self, limit: int = 20) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self._failed)[-limit:][::-1]
+    
+    def get(self, trace_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            for _, _, trace in self._slowest:
+                if trace["trace_id"] == trace_id:
+                    return trace
+            for trace in self._failed:
+                if trace["trace_id"] == trace_id:
+                    return trace
+        return None
+    
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "recorded": self._recorded,
+                "kept_slowest": len(self._slowest),
+                "kept_failed": len(self._failed),
+                "slowest_threshold_ms": self._slowest[0][0] if len(self._slowest) >= self.capacity else None
+            }
+    
+    def _dump(self, trace: Dict[str, Any]):
+        try:
+            os.makedirs(self.dump_dir, exist_ok=True)
+            path = os.path.join(self.dump_dir, f"flight-{datetime.now():%Y%m%d}.jsonl")
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(trace, default=str) + "\n")
+        except OSError as e:
+            print(f"Flight recorder dump error: {e}")
+
+
+_recorder: Optional[FlightRecorder] = None
+_recorder_lock = threading.Lock()
+
+
+def get_flight_recorder(config=None) -> FlightRecorder:
+    """Return the process-wide flight recorder"""
+    global _recorder
+    with _recorder_lock:
+        if _recorder is None:
+            if config is not None:
+                _recorder = FlightRecorder(
+                    capacity=config.flight_recorder_size,
+                    dump_dir=config.flight_recorder_dump_dir,
+                    dump_seconds=config.flight_recorder_dump_seconds
+                )
+            else:
+                _recorder = FlightRecorder()
+        return _recorder
@@ -0,0 +1,346 @@
+"""
+Hot Query Precomputation
+Space-Saving heavy-hitter tracking of recent queries and a background worker that keeps their answers precomputed
+"""
+
+import os
+import re
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Any, List, Optional, Tuple
+
+from .shared_state import get_shared_state
+
+
+# Shared-state keys: each worker's published sketch, the refresh budget and the refresher election
+SKETCH_PREFIX = "hot-sketch:"
+BUDGET_KEY = "hot-refreshes"
+REFRESHER_LEASE = "hot-query-refresher"
+
+# Usage tenant of background recomputations; limited by the refresh budget, not a spending budget
+PRECOMPUTE_TENANT = "precompute"
+
+
+def normalize_query(query: str) -> str:
+    """Key under which equivalent phrasings of a query share counts and answers"""
+    return re.sub(r"\s+", " ", query.strip().lower()).rstrip("?!. ")
+
+
+class SpaceSaving:
+    """
+    Space-Saving heavy-hitter sketch with exponential decay
+    
+    Tracks at most `capacity` keys. An untracked key replaces the smallest
+    counter and inherits its count as overestimation error, so any key with
+    true frequency above total/capacity is guaranteed to be tracked. Counts
+    halve every decay_seconds so the hot set follows recent traffic.
+    """
+    
+    def __init__(self, capacity: int = 256, decay_seconds: float = 600.0):
+        self.capacity = capacity
+        self.decay_seconds = decay_seconds
+        self._counts: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+        self._last_decay = time.monotonic()
+    
+    def observe(self, key: str, weight: float = 1.0):
+        with self._lock:
+            self._maybe_decay()
+            entry = self._counts.get(key)
+            if entry is not None:
+                entry[0] += weight
+            elif len(self._counts) < self.capacity:
+                self._counts[key] = [weight, 0.0]
+            else:
+                victim = min(self._counts, key=lambda name: self._counts[name][0])
+                floor = self._counts.pop(victim)[0]
+                self._counts[key] = [floor + weight, floor]
+    
+    def top(self, k: int) -> List[Tuple[str, float, float]]:
+        """The k heaviest keys as (key, count, error), heaviest first"""
+        with self._lock:
+            self._maybe_decay()
+            entries = sorted(self._counts.items(), key=lambda item: -item[1][0])[:k]
+        return [(key, count, error) for key, (count, error) in entries]
+    
+    def _maybe_decay(self):
+        now = time.monotonic()
+        while now - self._last_decay >= self.decay_seconds:
+            self._last_decay += self.decay_seconds
+            for key in list(self._counts):
+                entry = self._counts[key]
+                entry[0] /= 2
+                entry[1] /= 2
+                if entry[0] < 0.5:
+                    del self._counts[key]
+
+
+class HotQueryPrecomputer:
+    """
+    Serves hot queries from precomputed results and keeps those results fresh
+    
+    Every served or computed query is observed in the sketch. A background
+    thread periodically takes the queries seen at least min_hits times
+    (after decay) and, while the service is idle, recomputes any whose
+    answer is missing or older than refresh_after seconds. Recomputations
+    are capped at refresh_budget per hour, which bounds the extra upstream
+    traffic. Answers older than ttl are never served. With a SharedState,
+    answers are also written to its cache so every worker can serve them;
+    each worker publishes its sketch there, and the one worker holding the
+    refresher lease recomputes from the merged counts against a budget
+    kept in the same store.
+    """
+    
+    def __init__(
+        self,
+        top_k: int = 50,
+        min_hits: float = 5,
+        ttl: float = 900.0,
+        refresh_after: float = 600.0,
+        refresh_budget: int = 120,
+        interval: float = 30.0,
+        sketch: Optional[SpaceSaving] = None,
+        shared=None,
+        worker_id: str = "0"
+    ):
+        self.top_k = top_k
+        self.min_hits = min_hits
+        self.ttl = ttl
+        self.refresh_after = refresh_after
+        self.refresh_budget = refresh_budget
+        self.interval = interval
+        self.sketch = sketch or SpaceSaving(capacity=max(256, top_k * 4))
+        self.shared = shared
+        self.worker_id = worker_id
+        self.is_refresher = shared is None
+        
+        self._answers: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+        self._refreshes: deque = deque()
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.hits = 0
+        self.misses = 0
+        self.refreshed = 0
+        self.refresh_failures = 0
+        self.skipped_busy = 0
+        self.skipped_budget = 0
+    
+    def observe(self, query: str):
+        self.sketch.observe(normalize_query(query))
+    
+    def lookup(self, query: str) -> Optional[Tuple[float, Dict[str, Any]]]:
+        """(age in seconds, result) for a fresh precomputed answer, or None"""
+        key = normalize_query(query)
+        with self._lock:
+            entry = self._answers.get(key)
+        if self.shared is not None and (entry is None or time.time() - entry[0] >= self.ttl):
+            entry = self._shared_answer(key) or entry
+        with self._lock:
+            if entry is not None and time.time() - entry[0] < self.ttl:
+                self.hits += 1
+                return time.time() - entry[0], entry[1]
+            self.misses += 1
+            return None
+    
+    def start(self, compute: Callable[[str], Dict[str, Any]], is_idle: Optional[Callable[[], bool]] = None):
+        """Run refresh cycles in a daemon thread; compute(query) must bypass lookup()"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(
+            target=self._run, args=(compute, is_idle or (lambda: True)), name="hot-query-precompute", daemon=True
+        )
+        self._thread.start()
+    
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5.0)
+            self._thread = None
+    
+    def cycle(self, compute: Callable[[str], Dict[str, Any]], is_idle: Callable[[], bool] = lambda: True) -> int:
+        """
+        One background cycle; returns how many answers were recomputed
+        
+        With a SharedState this worker first publishes its sketch, and only
+        refreshes if it holds the refresher lease; the other workers serve
+        the answers it writes to the shared cache.
+        """
+        if self.shared is not None:
+            try:
+                self.shared.cache_set(SKETCH_PREFIX + self.worker_id, self.sketch.top(self.top_k), 3 * self.interval)
+                self.is_refresher = self.shared.try_lease(REFRESHER_LEASE, self.worker_id, 3 * self.interval)
+            except Exception as e:
+                print(f"Hot query shared state error: {e}")
+                return 0
+            if not self.is_refresher:
+                return 0
+        return self.refresh_once(compute, is_idle)
+    
+    def refresh_once(self, compute: Callable[[str], Dict[str, Any]], is_idle: Callable[[], bool] = lambda: True) -> int:
+        """One refresh cycle; returns how many answers were recomputed"""
+        hot = [(key, count) for key, count, _ in self._hot_counts() if count >= self.min_hits]
+        now = time.time()
+        with self._lock:
+            hot_keys = {key for key, _ in hot}
+            for key in [key for key, (computed_at, _) in self._answers.items()
+                        if key not in hot_keys and now - computed_at >= self.ttl]:
+                del self._answers[key]
+            stale = [key for key, _ in hot
+                     if key not in self._answers or now - self._answers[key][0] >= self.refresh_after]
+        
+        refreshed = 0
+        for key in stale:
+            if self._stop_event.is_set():
+                break
+            if not is_idle():
+                self.skipped_busy += 1
+                break
+            if not self._take_budget():
+                self.skipped_budget += 1
+                break
+            try:
+                result = compute(key)
+            except Exception as e:
+                self.refresh_failures += 1
+                print(f"Hot query precompute error: {e}")
+                continue
+            if result.get("metadata", {}).get("error"):
+                self.refresh_failures += 1
+                continue
+            computed_at = time.time()
+            with self._lock:
+                self._answers[key] = (computed_at, result)
+            if self.shared is not None:
+                try:
+                    self.shared.cache_set(f"hot:{key}", {"computed_at": computed_at, "result": result}, self.ttl)
+                except Exception as e:
+                    print(f"Hot query shared cache error: {e}")
+            refreshed += 1
+        self.refreshed += refreshed
+        return refreshed
+    
+    def stats(self, include_queries: bool = True) -> Dict[str, Any]:
+        """Refresh counters and the hot list; without include_queries the list omits the query text"""
+        hot = [(key, count, error) for key, count, error in self._hot_counts() if count >= self.min_hits]
+        refreshes = self._shared_refreshes() if self.shared is not None else None
+        with self._lock:
+            now = time.time()
+            answers = {key: round(now - computed_at, 1) for key, (computed_at, _) in self._answers.items()}
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "refreshed": self.refreshed,
+                "refresh_failures": self.refresh_failures,
+                "skipped_busy": self.skipped_busy,
+                "skipped_budget": self.skipped_budget,
+                "refresher": self.is_refresher,
+                "refreshes_last_hour": len(refreshes if refreshes is not None else self._refreshes),
+                "refresh_budget_per_hour": self.refresh_budget,
+                "hot_queries": [
+                    dict(
+                        {"query": key} if include_queries else {},
+                        count=round(count, 1), error=round(error, 1), answer_age_s=answers.get(key)
+                    )
+                    for key, count, error in hot
+                ]
+            }
+    
+    def _shared_answer(self, key: str) -> Optional[Tuple[float, Dict[str, Any]]]:
+        """An answer another worker precomputed, kept locally once seen"""
+        try:
+            cached = self.shared.cache_get(f"hot:{key}")
+        except Exception as e:
+            print(f"Hot query shared cache error: {e}")
+            return None
+        if cached is None:
+            return None
+        entry = (cached["computed_at"], cached["result"])
+        with self._lock:
+            self._answers[key] = entry
+        return entry
+    
+    def _hot_counts(self) -> List[Tuple[str, float, float]]:
+        """(key, count, error) of the hottest queries, summed over every worker's published sketch when shared"""
+        local = self.sketch.top(self.top_k)
+        if self.shared is None:
+            return local
+        try:
+            sketches = self.shared.cache_prefix(SKETCH_PREFIX)
+        except Exception as e:
+            print(f"Hot query shared cache error: {e}")
+            return local
+        # This worker's own counts are fresher than the copy it last published
+        sketches[SKETCH_PREFIX + self.worker_id] = local
+        merged: Dict[str, List[float]] = {}
+        for entries in sketches.values():
+            for key, count, error in entries:
+                total = merged.setdefault(key, [0.0, 0.0])
+                total[0] += count
+                total[1] += error
+        return sorted(((key, count, error) for key, (count, error) in merged.items()), key=lambda item: -item[1])[:self.top_k]
+    
+    def _shared_refreshes(self) -> List[float]:
+        try:
+            cached = self.shared.cache_get(BUDGET_KEY) or []
+        except Exception as e:
+            print(f"Hot query shared cache error: {e}")
+            return []
+        return [at for at in cached if time.time() - at < 3600]
+    
+    def _take_budget(self) -> bool:
+        if self.shared is not None:
+            # The budget survives a change of refresher because it lives in the shared store
+            refreshes = self._shared_refreshes()
+            if len(refreshes) >= self.refresh_budget:
+                return False
+            try:
+                self.shared.cache_set(BUDGET_KEY, refreshes + [time.time()], 3600)
+            except Exception as e:
+                print(f"Hot query shared cache error: {e}")
+                return False
+            return True
+        
+        now = time.monotonic()
+        while self._refreshes and now - self._refreshes[0] >= 3600:
+            self._refreshes.popleft()
+        if len(self._refreshes) >= self.refresh_budget:
+            return False
+        self._refreshes.append(now)
+        return True
+    
+    def _run(self, compute, is_idle):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.cycle(compute, is_idle)
+            except Exception as e:
+                print(f"Hot query refresh cycle error: {e}")
+
+
+_precomputer: Optional[HotQueryPrecomputer] = None
+_precomputer_lock = threading.Lock()
+
+
+def get_hot_queries(config=None) -> HotQueryPrecomputer:
+    """Return the process-wide hot query precomputer"""
+    global _precomputer
+    shared = get_shared_state(config) if config is not None else None
+    with _precomputer_lock:
+        if _precomputer is None:
+            if config is not None:
+                _precomputer = HotQueryPrecomputer(
+                    top_k=config.hot_query_top_k,
+                    min_hits=config.hot_query_min_hits,
+                    ttl=config.hot_query_ttl,
+                    refresh_after=config.hot_query_refresh_after,
+                    refresh_budget=config.hot_query_refresh_budget,
+                    interval=config.hot_query_interval,
+                    shared=shared,
+                    worker_id=config.worker_id or str(os.getpid())
+                )
+            else:
+                _precomputer = HotQueryPrecomputer()
+        return _precomputer
@@ -0,0 +1,169 @@
+"""
+Shared HTTP Connection Pools
+One process-wide set of keep-alive connection pools for every LLM and search client
+"""
+
+import importlib.util
+import threading
+from typing import Dict, Any, Optional
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class ConnectionPoolManager:
+    """Owns the pooled httpx and requests clients shared across the process"""
+    
+    def __init__(
+        self,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 30.0,
+        http2: bool = True,
+        timeout: float = 60.0
+    ):
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+        # HTTP/2 needs the optional h2 package; fall back to HTTP/1.1 keep-alive without it
+        self.http2 = http2 and importlib.util.find_spec("h2") is not None
+        self.timeout = timeout
+        
+        self._lock = threading.Lock()
+        self._httpx_client: Optional[httpx.Client] = None
+        self._httpx_async_client: Optional[httpx.AsyncClient] = None
+        self._requests_session: Optional[requests.Session] = None
+        self._counters = {"httpx_requests": 0, "httpx_connections_opened": 0}
+    
+    @property
+    def limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry
+        )
+    
+    @property
+    def httpx_client(self) -> httpx.Client:
+        """Pooled sync client for OpenAI-compatible SDKs"""
+        with self._lock:
+            if self._httpx_client is None:
+                self._httpx_client = httpx.Client(
+                    http2=self.http2,
+                    limits=self.limits,
+                    timeout=self.timeout,
+                    event_hooks={"request": [self._on_request]}
+                )
+            return self._httpx_client
+    
+    @property
+    def httpx_async_client(self) -> httpx.AsyncClient:
+        """Pooled async client for OpenAI-compatible SDKs"""
+        with self._lock:
+            if self._httpx_async_client is None:
+                self._httpx_async_client = httpx.AsyncClient(
+                    http2=self.http2,
+                    limits=self.limits,
+                    timeout=self.timeout,
+                    event_hooks={"request": [self._on_async_request]}
+                )
+            return self._httpx_async_client
+    
+    @property
+    def requests_session(self) -> requests.Session:
+        """Pooled session for requests-based clients (Tavily, arXiv, YouTube)"""
+        with self._lock:
+            if self._requests_session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=self.max_keepalive_connections,
+                    pool_maxsize=self.max_connections
+                )
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                self._requests_session = session
+            return self._requests_session
+    
+    def stats(self) -> Dict[str, Any]:
+        """Connection reuse metrics for every pool created so far"""
+        with self._lock:
+            httpx_requests = self._counters["httpx_requests"]
+            httpx_opened = self._counters["httpx_connections_opened"]
+            session = self._requests_session
+        
+        requests_total, requests_opened = 0, 0
+        if session is not None:
+            for adapter in set(session.adapters.values()):
+                pools = adapter.poolmanager.pools
+                for key in list(pools.keys()):
+                    pool = pools.get(key)
+                    if pool is not None:
+                        requests_total += pool.num_requests
+                        requests_opened += pool.num_connections
+        
+        return {
+            "http2": self.http2,
+            "max_connections": self.max_connections,
+            "max_keepalive_connections": self.max_keepalive_connections,
+            "httpx": _reuse_stats(httpx_requests, httpx_opened),
+            "requests": _reuse_stats(requests_total, requests_opened)
+        }
+    
+    def close(self):
+        """Close every pooled client (sync side only; the async client closes with its loop)"""
+        with self._lock:
+            if self._httpx_client is not None:
+                self._httpx_client.close()
+            if self._requests_session is not None:
+                self._requests_session.close()
+            self._httpx_client = None
+            self._requests_session = None
+    
+    def _count(self, event_name: str):
+        with self._lock:
+            if event_name == "request":
+                self._counters["httpx_requests"] += 1
+            elif event_name == "connection.connect_tcp.complete":
+                self._counters["httpx_connections_opened"] += 1
+    
+    def _on_request(self, request: httpx.Request):
+        self._count("request")
+        request.extensions["trace"] = lambda event_name, info: self._count(event_name)
+    
+    async def _on_async_request(self, request: httpx.Request):
+        self._count("request")
+        
+        async def trace(event_name, info):
+            self._count(event_name)
+        
+        request.extensions["trace"] = trace
+
+
+def _reuse_stats(total: int, opened: int) -> Dict[str, Any]:
+    return {
+        "requests": total,
+        "connections_opened": opened,
+        "reuse_ratio": round(1 - opened / total, 4) if total else None
+    }
+
+
+_pool_manager: Optional[ConnectionPoolManager] = None
+_pool_manager_lock = threading.Lock()
+
+
+def get_pool_manager(config=None) -> ConnectionPoolManager:
+    """Return the process-wide pool manager, creating it from config on first use"""
+    global _pool_manager
+    with _pool_manager_lock:
+        if _pool_manager is None:
+            if config is not None:
+                _pool_manager = ConnectionPoolManager(
+                    max_connections=config.http_pool_max_connections,
+                    max_keepalive_connections=config.http_pool_max_keepalive,
+                    keepalive_expiry=config.http_keepalive_expiry,
+                    http2=config.http2
+                )
+            else:
+                _pool_manager = ConnectionPoolManager()
+        return _pool_manager
@@ -0,0 +1,164 @@
+"""
+Incremental JSON Parsing
+Decodes the top-level members of a streamed JSON object as soon as each value is complete
+"""
+
+import json
+from typing import Any, Dict, List, Tuple
+
+
+# Text allowed before the opening brace, such as a ```json fence
+MAX_PREAMBLE_CHARS = 200
+
+_WHITESPACE = " \t\r\n"
+_SCALAR_START = "-0123456789tfn"
+
+
+class JSONStreamError(ValueError):
+    """Malformed streamed JSON, raised at the first offending character"""
+    
+    def __init__(self, message: str, position: int):
+        super().__init__(f"{message} at character {position}")
+        self.position = position
+
+
+class IncrementalJSONParser:
+    """
+    Incremental parser for one streamed JSON object
+    
+    feed() takes text as it arrives and returns the top-level members
+    whose values completed within it, so callers can act on early keys
+    while later ones (long strings, nested lists) are still being
+    generated. Nested values are buffered and decoded whole. Text before
+    the opening brace is skipped and text after the closing brace is
+    ignored.
+    """
+    
+    def __init__(self, max_preamble: int = MAX_PREAMBLE_CHARS):
+        self.max_preamble = max_preamble
+        self.members: Dict[str, Any] = {}
+        self.done = False
+        self._state = "preamble"
+        self._buffer: List[str] = []
+        self._key = None
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._position = 0
+    
+    @property
+    def position(self) -> int:
+        """Characters consumed so far"""
+        return self._position
+    
+    def feed(self, text: str) -> List[Tuple[str, Any]]:
+        """Consume more text; returns the (key, value) members completed by it"""
+        completed = []
+        for char in text:
+            if self.done:
+                break
+            self._step(char, completed)
+            self._position += 1
+        return completed
+    
+    def result(self) -> Dict[str, Any]:
+        """The whole object; raises JSONStreamError if it never closed"""
+        if not self.done:
+            raise JSONStreamError("Incomplete JSON object", self._position)
+        return self.members
+    
+    def _fail(self, message: str):
+        raise JSONStreamError(message, self._position)
+    
+    def _step(self, char: str, completed: List[Tuple[str, Any]]):
+        state = self._state
+        if state == "preamble":
+            if char == "{":
+                self._state = "first_key"
+            elif self._position >= self.max_preamble:
+                self._fail("No JSON object found")
+        elif state in ("first_key", "key_start"):
+            if char in _WHITESPACE:
+                return
+            if char == '"':
+                self._buffer = [char]
+                self._state = "key"
+            elif char == "}" and state == "first_key":
+                self.done = True
+            else:
+                self._fail(f"Expected a key, got {char!r}")
+        elif state == "key":
+            self._buffer.append(char)
+            if self._escape:
+                self._escape = False
+            elif char == "\\":
+                self._escape = True
+            elif char == '"':
+                self._key = json.loads("".join(self._buffer))
+                self._state = "colon"
+        elif state == "colon":
+            if char == ":":
+                self._state = "value_start"
+            elif char not in _WHITESPACE:
+                self._fail(f"Expected ':', got {char!r}")
+        elif state == "value_start":
+            if char in _WHITESPACE:
+                return
+            self._buffer = [char]
+            if char in "{[":
+                self._depth = 1
+                self._state = "compound"
+            elif char == '"':
+                self._state = "string"
+            elif char in _SCALAR_START:
+                self._state = "scalar"
+            else:
+                self._fail(f"Unexpected {char!r} at the start of a value")
+        elif state == "string":
+            self._buffer.append(char)
+            if self._escape:
+                self._escape = False
+            elif char == "\\":
+                self._escape = True
+            elif char == '"':
+                self._complete(completed)
+        elif state == "compound":
+            self._buffer.append(char)
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._complete(completed)
+        elif state == "scalar":
+            if char in _WHITESPACE or char in ",}":
+                self._complete(completed)
+                self._step(char, completed)
+            else:
+                self._buffer.append(char)
+        elif state == "after_value":
+            if char == ",":
+                self._state = "key_start"
+            elif char == "}":
+                self.done = True
+            elif char not in _WHITESPACE:
+                self._fail(f"Expected ',' or '}}', got {char!r}")
+    
+    def _complete(self, completed: List[Tuple[str, Any]]):
+        try:
+            value = json.loads("".join(self._buffer))
+        except ValueError:
+            self._fail(f"Invalid value for {self._key!r}")
+        self.members[self._key] = value
+        completed.append((self._key, value))
+        self._buffer = []
+        self._state = "after_value"
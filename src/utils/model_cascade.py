@@ -0,0 +1,157 @@
+"""
+Responder Model Cascade
+Tier definitions, a cheap confidence signal and escalation metrics for cheap-first response generation
+"""
+
+import threading
+from dataclasses import dataclass
+from typing import Dict, Any, List, Optional
+
+
+# Blended USD per 1K tokens, used only to estimate savings; override per tier in RESPONDER_CASCADE
+DEFAULT_COST_PER_1K = {
+    "gpt-4o-mini": 0.0004,
+    "gpt-4o": 0.006,
+    "gpt-o3": 0.02
+}
+
+DEFAULT_TIER_TIMEOUT = 60.0
+
+# Phrases that signal the model itself is unsure, checked before paying for a helpfulness call
+HEDGE_PHRASES = [
+    "i'm not sure",
+    "i am not sure",
+    "i don't know",
+    "i do not know",
+    "i cannot answer",
+    "i can't answer",
+    "i don't have enough information",
+    "i apologize, but"
+]
+
+
+@dataclass
+class ModelTier:
+    """One responder model in the cascade"""
+    model: str
+    timeout: float = DEFAULT_TIER_TIMEOUT
+    cost_per_1k_tokens: float = 0.0
+
+
+def parse_cascade(spec: str, default_model: str) -> List[ModelTier]:
+    """
+    Parse a cascade spec such as "gpt-4o-mini:15,gpt-o3:60"
+    
+    Each comma-separated entry is model[:timeout_seconds[:usd_per_1k_tokens]],
+    cheapest first. An empty spec is a single tier running default_model.
+    """
+    tiers = []
+    for entry in (spec or "").split(","):
+        parts = [part.strip() for part in entry.split(":")]
+        if not parts[0]:
+            continue
+        model = parts[0]
+        timeout = float(parts[1]) if len(parts) > 1 and parts[1] else DEFAULT_TIER_TIMEOUT
+        cost = float(parts[2]) if len(parts) > 2 and parts[2] else DEFAULT_COST_PER_1K.get(model, 0.0)
+        tiers.append(ModelTier(model, timeout, cost))
+    
+    if not tiers:
+        tiers.append(ModelTier(default_model, DEFAULT_TIER_TIMEOUT, DEFAULT_COST_PER_1K.get(default_model, 0.0)))
+    return tiers
+
+
+def looks_unconfident(response: str, min_length: int = 40) -> bool:
+    """Cheap confidence signal: empty, very short or hedging answers escalate without a helpfulness call"""
+    text = (response or "").strip().lower()
+    if len(text) < min_length:
+        return True
+    return any(phrase in text for phrase in HEDGE_PHRASES)
+
+
+def estimate_tokens(*texts: str) -> int:
+    """Rough token count (about 4 characters per token)"""
+    return sum(len(text or "") for text in texts) // 4 + 1
+
+
+class CascadeMetrics:
+    """Escalation rate plus latency and cost saved relative to always using the top tier"""
+    
+    def __init__(self, alpha: float = 0.1):
+        self.alpha = alpha
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._escalations = 0
+        self._finished_at: Dict[str, int] = {}
+        self._reasons: Dict[str, int] = {}
+        self._tier_latency: Dict[str, float] = {}
+        self._latency_saved = 0.0
+        self._cost_saved = 0.0
+        self._cost_spent = 0.0
+    
+    def record(self, tiers: List[ModelTier], usage: List[Dict[str, Any]], escalations: List[str]):
+        """
+        Record one request
+        
+        Args:
+            tiers: The cascade the request ran against
+            usage: One entry per responder call with model, latency and tokens
+            escalations: Reason for each escalation, in order
+        """
+        if not usage:
+            return
+        top = tiers[-1]
+        spent_latency = sum(call["latency"] for call in usage)
+        tokens = max(call["tokens"] for call in usage)
+        spent_cost = sum(
+            call["tokens"] / 1000 * next((t.cost_per_1k_tokens for t in tiers if t.model == call["model"]), 0.0)
+            for call in usage
+        )
+        
+        with self._lock:
+            self._requests += 1
+            self._escalations += 1 if escalations else 0
+            final_model = usage[-1]["model"]
+            self._finished_at[final_model] = self._finished_at.get(final_model, 0) + 1
+            for reason in escalations:
+                self._reasons[reason] = self._reasons.get(reason, 0) + 1
+            
+            for call in usage:
+                previous = self._tier_latency.get(call["model"])
+                self._tier_latency[call["model"]] = call["latency"] if previous is None else (
+                    (1 - self.alpha) * previous + self.alpha * call["latency"]
+                )
+            
+            self._cost_spent += spent_cost
+            if final_model != top.model:
+                # Compare against what the top tier typically costs for a response of this size
+                self._cost_saved += tokens / 1000 * top.cost_per_1k_tokens - spent_cost
+                top_latency = self._tier_latency.get(top.model)
+                if top_latency is not None:
+                    self._latency_saved += top_latency - spent_latency
+    
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "requests": self._requests,
+                "escalations": self._escalations,
+                "escalation_rate": round(self._escalations / self._requests, 4) if self._requests else None,
+                "escalation_reasons": dict(self._reasons),
+                "finished_at": dict(self._finished_at),
+                "tier_latency_seconds": {model: round(latency, 3) for model, latency in self._tier_latency.items()},
+                "latency_saved_seconds": round(self._latency_saved, 3),
+                "cost_spent_usd": round(self._cost_spent, 6),
+                "cost_saved_usd": round(self._cost_saved, 6)
+            }
+
+
+_metrics: Optional[CascadeMetrics] = None
+_metrics_lock = threading.Lock()
+
+
+def get_cascade_metrics() -> CascadeMetrics:
+    """Return the process-wide cascade metrics"""
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = CascadeMetrics()
+        return _metrics
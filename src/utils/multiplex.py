@@ -0,0 +1,234 @@
+"""
+Multiplexed Chat Streams
+Several concurrent v2 conversations over one WebSocket, with per-stream flow control, run controls and heartbeats
+"""
+
+import asyncio
+import json
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from .run_control import RunControl
+from .streaming import DeltaStreamEncoder
+
+
+MAX_STREAM_ID_CHARS = 64
+
+# Close code used when the client stops answering heartbeats
+HEARTBEAT_CLOSE_CODE = 1001
+
+
+def _dumps(payload: Dict[str, Any]) -> str:
+    return json.dumps(payload, separators=(",", ":"))
+
+
+class MuxFrameEncoder(DeltaStreamEncoder):
+    """v2 frames as WebSocket text messages tagged with their stream id"""
+    
+    def frame(self, payload: Dict[str, Any]) -> str:
+        self.seq += 1
+        payload["seq"] = self.seq
+        payload["stream"] = self.stream_id
+        return _dumps(payload)
+
+
+class MuxStream:
+    """
+    One conversation on a multiplexed connection
+    
+    Content frames (start, draft, delta, patch, checkpoint, done, error) each
+    spend one credit and wait once the window is used up, so a client that
+    stops reading one stream only holds back that stream's producer.
+    Control replies (acks, cancelled, errors about the stream) are not
+    sequenced and skip the window.
+    """
+    
+    def __init__(self, stream_id: str, window: int, outbox: asyncio.Queue, control: RunControl, checkpoint_every: int = 32):
+        self.stream_id = stream_id
+        self.encoder = MuxFrameEncoder(stream_id, checkpoint_every=checkpoint_every)
+        self.control = control
+        self.credit = window
+        self.closed = False
+        self.task: Optional[asyncio.Task] = None
+        self._outbox = outbox
+        self._credit_changed = asyncio.Condition()
+    
+    async def emit(self, frames: List[str]):
+        """Queue content frames in order, waiting for credit; frames after close are dropped"""
+        for frame in frames:
+            async with self._credit_changed:
+                while self.credit <= 0 and not self.closed:
+                    await self._credit_changed.wait()
+                if self.closed:
+                    return
+                self.credit -= 1
+            await self._outbox.put(frame)
+    
+    async def grant(self, frames: int):
+        async with self._credit_changed:
+            self.credit += frames
+            self._credit_changed.notify_all()
+    
+    async def close(self):
+        async with self._credit_changed:
+            self.closed = True
+            self._credit_changed.notify_all()
+
+
+class MultiplexedConnection:
+    """
+    Protocol driver for one WebSocket carrying several conversations
+    
+    Client messages are JSON objects with a type and, apart from ping and
+    pong, the client-chosen id of the stream they belong to:
+    start (with the /chat/stream request fields), cancel, skip_helpfulness,
+    follow_up (with a message) and credit (with a number of frames). The
+    server pings every heartbeat_interval seconds and closes the connection
+    after heartbeat_timeout seconds without any client message. Closing
+    the connection cancels every stream still running on it.
+    
+    run_stream(stream, message) produces one conversation by passing its
+    frames to stream.emit and checking stream.control.
+    """
+    
+    def __init__(
+        self,
+        receive: Callable[[], Awaitable[Optional[str]]],
+        send: Callable[[str], Awaitable[None]],
+        close: Callable[[int], Awaitable[None]],
+        run_stream: Callable[[MuxStream, Dict[str, Any]], Awaitable[None]],
+        max_streams: int = 8,
+        window: int = 64,
+        checkpoint_every: int = 32,
+        heartbeat_interval: float = 20.0,
+        heartbeat_timeout: float = 60.0
+    ):
+        self._receive = receive
+        self._send = send
+        self._close = close
+        self.run_stream = run_stream
+        self.max_streams = max_streams
+        self.window = window
+        self.checkpoint_every = checkpoint_every
+        self.heartbeat_interval = heartbeat_interval
+        self.heartbeat_timeout = heartbeat_timeout
+        self.streams: Dict[str, MuxStream] = {}
+        self._outbox: asyncio.Queue = asyncio.Queue()
+        self._last_seen = time.monotonic()
+        self._stopped = asyncio.Event()
+    
+    async def serve(self):
+        """Handle client messages until the connection closes"""
+        writer = asyncio.create_task(self._write())
+        heartbeat = asyncio.create_task(self._heartbeat())
+        try:
+            while True:
+                text = await self._receive()
+                if text is None:
+                    break
+                self._last_seen = time.monotonic()
+                await self._dispatch(text)
+        finally:
+            self._stopped.set()
+            heartbeat.cancel()
+            writer.cancel()
+            for stream in list(self.streams.values()):
+                # Nobody is left to read the answers; stop the graphs instead
+                stream.control.cancel()
+                await stream.close()
+    
+    async def _dispatch(self, text: str):
+        try:
+            message = json.loads(text)
+        except ValueError:
+            message = None
+        if not isinstance(message, dict) or not isinstance(message.get("type"), str):
+            return await self._reply({"type": "error", "error": "Messages must be JSON objects with a type"})
+        
+        kind = message["type"]
+        if kind == "ping":
+            return await self._reply({"type": "pong"})
+        if kind == "pong":
+            return
+        
+        stream_id = message.get("stream")
+        if not isinstance(stream_id, str) or not 0 < len(stream_id) <= MAX_STREAM_ID_CHARS:
+            return await self._reply({"type": "error", "error": "Missing or invalid stream id"})
+        if kind == "start":
+            return await self._start(stream_id, message)
+        
+        stream = self.streams.get(stream_id)
+        if stream is None:
+            return await self._reply({"type": "error", "stream": stream_id, "error": "Unknown or finished stream"})
+        
+        if kind == "cancel":
+            stream.control.cancel()
+            await stream.close()
+            del self.streams[stream_id]
+            await self._reply({"type": "cancelled", "stream": stream_id})
+        elif kind == "skip_helpfulness":
+            stream.control.skip_helpfulness = True
+            await self._reply({"type": "ack", "stream": stream_id, "control": kind, "applied": True})
+        elif kind == "follow_up":
+            follow_up = message.get("message")
+            if not isinstance(follow_up, str) or not follow_up.strip():
+                return await self._reply({"type": "error", "stream": stream_id, "error": "follow_up needs a message"})
+            applied = stream.control.add_follow_up(follow_up.strip())
+            await self._reply({"type": "ack", "stream": stream_id, "control": kind, "applied": applied})
+        elif kind == "credit":
+            frames = message.get("frames")
+            if not isinstance(frames, int) or isinstance(frames, bool) or frames <= 0:
+                return await self._reply({"type": "error", "stream": stream_id, "error": "credit needs a positive frame count"})
+            await stream.grant(frames)
+        else:
+            await self._reply({"type": "error", "stream": stream_id, "error": f"Unknown message type: {kind}"})
+    
+    async def _start(self, stream_id: str, message: Dict[str, Any]):
+        if stream_id in self.streams:
+            return await self._reply({"type": "error", "stream": stream_id, "error": "Stream id already in use"})
+        if len(self.streams) >= self.max_streams:
+            return await self._reply({"type": "error", "stream": stream_id, "error": "Too many concurrent streams on this connection"})
+        stream = MuxStream(
+            stream_id,
+            self.window,
+            self._outbox,
+            RunControl(skip_helpfulness=bool(message.get("skip_helpfulness"))),
+            checkpoint_every=self.checkpoint_every
+        )
+        self.streams[stream_id] = stream
+        stream.task = asyncio.create_task(self._run(stream, message))
+    
+    async def _run(self, stream: MuxStream, message: Dict[str, Any]):
+        try:
+            await self.run_stream(stream, message)
+        except Exception as e:
+            print(f"WebSocket stream error: {e}")
+            await stream.emit([stream.encoder.error(str(e))])
+        finally:
+            if self.streams.get(stream.stream_id) is stream:
+                del self.streams[stream.stream_id]
+    
+    async def _reply(self, payload: Dict[str, Any]):
+        await self._outbox.put(_dumps(payload))
+    
+    async def _write(self):
+        """Single writer, so frames from concurrent streams never interleave mid-message"""
+        while True:
+            text = await self._outbox.get()
+            try:
+                await self._send(text)
+            except Exception:
+                # The socket is gone; the receive loop sees the disconnect and cleans up
+                return
+    
+    async def _heartbeat(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._stopped.wait(), self.heartbeat_interval)
+                return
+            except asyncio.TimeoutError:
+                pass
+            if time.monotonic() - self._last_seen > self.heartbeat_timeout:
+                await self._close(HEARTBEAT_CLOSE_CODE)
+                return
+            await self._reply({"type": "ping", "t": round(time.time(), 3)})
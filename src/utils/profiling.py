@@ -0,0 +1,210 @@
+"""
+Per-Request Profiling
+Opt-in tracemalloc allocation diffs and a sampling CPU profiler for individual requests
+"""
+
+import random
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter, OrderedDict
+from datetime import datetime
+from typing import Callable, Dict, Any, List, Optional
+
+
+TRACEMALLOC_FRAMES = 10
+
+# Allocations made by the profiler itself are not interesting
+_SNAPSHOT_FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>")
+]
+
+
+class _StackSampler(threading.Thread):
+    """Samples the stacks of the attached threads at a fixed interval"""
+    
+    def __init__(self, interval: float):
+        super().__init__(name="request-profiler", daemon=True)
+        self.interval = interval
+        self.thread_ids: List[int] = []
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop_event = threading.Event()
+    
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frames = sys._current_frames()
+            for ident in list(self.thread_ids):
+                frame = frames.get(ident)
+                if frame is not None:
+                    self.stacks[_fold(frame)] += 1
+                    self.samples += 1
+    
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+def _fold(frame) -> str:
+    """Collapse a stack into flamegraph "root;...;leaf" form"""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_filename.rsplit('/', 1)[-1]}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class ProfileSession:
+    """Profiling state for one request"""
+    
+    def __init__(self, label: str, interval: float):
+        self.profile_id = str(uuid.uuid4())
+        self.label = label
+        self.started_at = datetime.now().isoformat()
+        self._start = time.perf_counter()
+        self._sampler = _StackSampler(interval)
+        self._snapshot = tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+        self._sampler.start()
+    
+    def run(self, func: Callable, *args, **kwargs):
+        """Call func with the current thread's stacks sampled (use inside the worker thread)"""
+        ident = threading.get_ident()
+        self._sampler.thread_ids.append(ident)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self._sampler.thread_ids.remove(ident)
+    
+    def finish(self, top: int) -> Dict[str, Any]:
+        self._sampler.stop()
+        end = tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+        diffs = [diff for diff in end.compare_to(self._snapshot, "lineno") if diff.size_diff > 0]
+        return {
+            "profile_id": self.profile_id,
+            "label": self.label,
+            "started_at": self.started_at,
+            "duration_ms": round((time.perf_counter() - self._start) * 1000, 2),
+            "cpu_samples": self._sampler.samples,
+            "sample_interval_ms": self._sampler.interval * 1000,
+            "folded_stacks": dict(self._sampler.stacks.most_common()),
+            "allocations": [
+                {
+                    "site": _site(diff.traceback),
+                    "size_diff_kb": round(diff.size_diff / 1024, 2),
+                    "count_diff": diff.count_diff
+                }
+                for diff in diffs[:top]
+            ]
+        }
+
+
+def _site(traceback) -> str:
+    frame = traceback[0]
+    return f"{frame.filename}:{frame.lineno}"
+
+
+class RequestProfiler:
+    """
+    Decides which requests to profile and keeps their results
+    
+    When neither the header nor sampling selects a request, start() is a
+    flag check (and one random() call if sampling is configured), so the
+    off path costs well under a microsecond. tracemalloc runs only while
+    at least one profiled request is in flight; concurrent requests share
+    it, so their allocation diffs can include each other's allocations.
+    """
+    
+    def __init__(self, sample_rate: float = 0.0, max_profiles: int = 20, interval: float = 0.005, top: int = 30):
+        self.sample_rate = sample_rate
+        self.max_profiles = max_profiles
+        self.interval = interval
+        self.top = top
+        self._lock = threading.Lock()
+        self._active = 0
+        self._started_tracing = False
+        self._profiles: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._growth: Dict[str, List[float]] = {}
+    
+    def wants(self, requested: bool = False) -> bool:
+        """Whether to profile a request: it asked for it or sampling picked it"""
+        return requested or bool(self.sample_rate and random.random() < self.sample_rate)
+    
+    def start(self, label: str, requested: bool = False) -> Optional[ProfileSession]:
+        """Begin profiling if the request asked for it or was sampled; None otherwise"""
+        if not self.wants(requested):
+            return None
+        return self.begin(label)
+    
+    def begin(self, label: str) -> ProfileSession:
+        """Start a profile unconditionally; the heap snapshot makes this slow, so call it off the event loop"""
+        with self._lock:
+            if self._active == 0 and not tracemalloc.is_tracing():
+                tracemalloc.start(TRACEMALLOC_FRAMES)
+                self._started_tracing = True
+            self._active += 1
+        return ProfileSession(label, self.interval)
+    
+    def finish(self, session: Optional[ProfileSession]) -> Optional[Dict[str, Any]]:
+        """Stop a session, store its profile and fold its allocations into the growth report"""
+        if session is None:
+            return None
+        profile = session.finish(self.top)
+        with self._lock:
+            self._active -= 1
+            if self._active == 0 and self._started_tracing:
+                tracemalloc.stop()
+                self._started_tracing = False
+            self._profiles[profile["profile_id"]] = profile
+            while len(self._profiles) > self.max_profiles:
+                self._profiles.popitem(last=False)
+            for allocation in profile["allocations"]:
+                growth = self._growth.setdefault(allocation["site"], [0.0, 0])
+                growth[0] += allocation["size_diff_kb"]
+                growth[1] += 1
+        return profile
+    
+    def get(self, profile_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._profiles.get(profile_id)
+    
+    def summary(self) -> Dict[str, Any]:
+        """Stored profiles plus allocation growth by call site across all profiled requests"""
+        with self._lock:
+            profiles = [
+                {key: profile[key] for key in ("profile_id", "label", "started_at", "duration_ms", "cpu_samples")}
+                for profile in reversed(self._profiles.values())
+            ]
+            growth = sorted(self._growth.items(), key=lambda item: -item[1][0])[:self.top]
+            return {
+                "sample_rate": self.sample_rate,
+                "active": self._active,
+                "profiles": profiles,
+                "growth_by_site": [
+                    {"site": site, "retained_kb": round(size, 2), "requests": requests}
+                    for site, (size, requests) in growth
+                ]
+            }
+
+
+def folded_text(profile: Dict[str, Any]) -> str:
+    """Folded stacks in the text format flamegraph tools read"""
+    return "".join(f"{stack} {count}\n" for stack, count in profile["folded_stacks"].items())
+
+
+_profiler: Optional[RequestProfiler] = None
+_profiler_lock = threading.Lock()
+
+
+def get_request_profiler(config=None) -> RequestProfiler:
+    """Return the process-wide request profiler"""
+    global _profiler
+    with _profiler_lock:
+        if _profiler is None:
+            _profiler = RequestProfiler(sample_rate=config.profile_sample_rate if config is not None else 0.0)
+        return _profiler
@@ -0,0 +1,106 @@
+"""
+Progressive Tool Results
+Runs the selected search tools concurrently and releases the responder as soon as enough evidence has arrived
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from .search_results import SearchResult
+
+
+class Arrival(NamedTuple):
+    """One tool's outcome: its raw return value and latency, or the error it raised"""
+    tool: str
+    value: Any
+    latency: float
+    error: Optional[Exception]
+
+
+class ToolResultStream:
+    """
+    Outcomes of concurrently running tools, in the order they finish
+    
+    The responder waits on wait_for_evidence() instead of every tool: it is
+    released once the arrived evidence reaches min_evidence, once grace
+    seconds have passed since the first tool finished, or once every tool
+    has finished, whichever comes first. Tools still running are collected
+    later with wait_for_rest(), or abandoned with close().
+    """
+    
+    def __init__(self, calls: Dict[str, Callable[[], Tuple[Any, float]]]):
+        self._arrivals: List[Arrival] = []
+        self._taken = 0
+        self._pending = set(calls)
+        self._first_at: Optional[float] = None
+        self._closed = False
+        self._changed = threading.Condition()
+        executor = ThreadPoolExecutor(max_workers=max(1, len(calls)), thread_name_prefix="progressive-tool")
+        for tool, call in calls.items():
+            executor.submit(self._run, tool, call)
+        executor.shutdown(wait=False)
+    
+    @property
+    def pending(self) -> List[str]:
+        with self._changed:
+            return sorted(self._pending)
+    
+    def wait_for_evidence(self, min_evidence: int, grace: float,
+                          evidence: Callable[[Arrival], int] = lambda arrival: 1) -> List[Arrival]:
+        """Block until enough evidence, the grace window or the last tool; returns arrivals not yet taken"""
+        with self._changed:
+            while self._pending:
+                if sum(evidence(arrival) for arrival in self._arrivals if arrival.error is None) >= min_evidence:
+                    break
+                if self._first_at is None:
+                    self._changed.wait()
+                    continue
+                remaining = grace - (time.monotonic() - self._first_at)
+                if remaining <= 0:
+                    break
+                self._changed.wait(remaining)
+            return self._take()
+    
+    def wait_for_rest(self, timeout: float) -> List[Arrival]:
+        """Block until every tool has finished or timeout passes; returns arrivals not yet taken"""
+        deadline = time.monotonic() + timeout
+        with self._changed:
+            while self._pending and time.monotonic() < deadline:
+                self._changed.wait(deadline - time.monotonic())
+            return self._take()
+    
+    def close(self):
+        """Stop collecting; tools still running finish in the background and are discarded"""
+        with self._changed:
+            self._closed = True
+    
+    def _take(self) -> List[Arrival]:
+        arrivals = self._arrivals[self._taken:]
+        self._taken = len(self._arrivals)
+        return arrivals
+    
+    def _run(self, tool: str, call: Callable[[], Tuple[Any, float]]):
+        start = time.time()
+        try:
+            value, latency = call()
+            arrival = Arrival(tool, value, latency, None)
+        except Exception as e:
+            arrival = Arrival(tool, None, time.time() - start, e)
+        with self._changed:
+            self._pending.discard(tool)
+            if self._closed:
+                return
+            self._arrivals.append(arrival)
+            if self._first_at is None:
+                self._first_at = time.monotonic()
+            self._changed.notify_all()
+
+
+def additional_sources_section(results: List[SearchResult], limit: int = 5) -> str:
+    """Markdown section listing results that arrived after the answer was written"""
+    lines = [f"- [{result.title or result.url}]({result.url}): {result.snippet}" for result in results[:limit] if result.url]
+    if not lines:
+        return ""
+    return "\n\n**Additional sources**\n" + "\n".join(lines)
@@ -0,0 +1,319 @@
+"""
+Query Log
+Append-only, segment-rotated binary log of per-request records with a memory-mapped NumPy reader
+"""
+
+import argparse
+import json
+import os
+import queue
+import threading
+import time
+import zlib
+from typing import Dict, Any, Iterable, List, Optional
+
+import numpy as np
+
+
+FORMAT_VERSION = 1
+
+NODES = ("analyzer", "tool_caller", "responder", "helpfulness_checker")
+TOOLS = ("web_search", "arxiv_search", "youtube_search")
+ROUTING_FLAGS = ("needs_web_search", "needs_arxiv_search", "needs_youtube_search")
+
+# Fixed-width little-endian record; query text lives in the segment's .txt blob
+RECORD_DTYPE = np.dtype([
+    ("ts", "<f8"),
+    ("query_offset", "<u8"),
+    ("query_len", "<u4"),
+    ("query_hash", "<u4"),
+    ("routing", "u1"),
+    ("tools_used", "u1"),
+    ("draft_accepted", "u1"),
+    ("failed", "u1"),
+    ("regenerations", "u1"),
+    ("sub_queries", "u1"),
+    ("result_count", "<u2"),
+    ("helpfulness", "<f4"),
+    ("total_ms", "<f4"),
+    *[(f"{node}_ms", "<f4") for node in NODES],
+    *[(f"{tool}_ms", "<f4") for tool in TOOLS],
+    ("model", "S24")
+])
+
+
+def _bits(values: Iterable[bool]) -> int:
+    return sum(1 << i for i, value in enumerate(values) if value)
+
+
+def record_from_trace(trace: Dict[str, Any], model: Optional[str]) -> Dict[str, Any]:
+    """Flatten a flight-recorder trace into the fields the log stores"""
+    node_ms = {node: 0.0 for node in NODES}
+    for span in trace.get("spans", []):
+        if span["name"] in node_ms:
+            node_ms[span["name"]] += span["duration_ms"]
+    routing = trace.get("routing", {})
+    tools_used = trace.get("tools_used", [])
+    tool_ms = trace.get("tool_latencies_ms", {})
+    return {
+        "ts": time.time(),
+        "query": trace.get("query", ""),
+        "routing": _bits(routing.get(flag, False) for flag in ROUTING_FLAGS),
+        "tools_used": _bits(tool in tools_used for tool in TOOLS),
+        "draft_accepted": bool(routing.get("draft_accepted")),
+        "failed": bool(trace.get("failed")),
+        "regenerations": trace.get("regenerations", 0),
+        "sub_queries": len(routing.get("sub_queries", [])),
+        "result_count": trace.get("search_results", 0),
+        "helpfulness": trace.get("helpfulness_score"),
+        "total_ms": trace.get("duration_ms", 0.0),
+        **{f"{node}_ms": ms for node, ms in node_ms.items()},
+        **{f"{tool}_ms": tool_ms.get(tool, np.nan) for tool in TOOLS},
+        "model": model or ""
+    }
+
+
+class QueryLogWriter:
+    """
+    Buffers records on a queue and appends them from a background thread
+    
+    log() never blocks the request: when the queue is full the record is
+    dropped and counted. A segment holds at most segment_records records;
+    each segment is a .rec file of RECORD_DTYPE rows plus a .txt blob of
+    query text. The query text is written before its row, so a crash can
+    only leave an unreferenced tail in the blob or a partial row, which
+    readers ignore and the next writer truncates.
+    """
+    
+    def __init__(self, log_dir: str, segment_records: int = 1_000_000, flush_interval: float = 1.0,
+                 batch_size: int = 1024, max_queue: int = 100_000):
+        self.log_dir = log_dir
+        self.segment_records = segment_records
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.dropped = 0
+        self.written = 0
+        self._queue: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue(maxsize=max_queue)
+        
+        os.makedirs(log_dir, exist_ok=True)
+        format_path = os.path.join(log_dir, "format.json")
+        if not os.path.exists(format_path):
+            with open(format_path, "w") as f:
+                json.dump({"version": FORMAT_VERSION, "dtype": RECORD_DTYPE.descr}, f)
+        
+        self._segment_index, self._segment_count = self._open_last_segment()
+        self._thread = threading.Thread(target=self._run, name="query-log-writer", daemon=True)
+        self._thread.start()
+    
+    def log(self, record: Dict[str, Any]):
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+    
+    def close(self, timeout: float = 5.0):
+        """Flush everything queued so far and stop the writer thread"""
+        self._queue.put(None)
+        self._thread.join(timeout)
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "log_dir": self.log_dir,
+            "written": self.written,
+            "dropped": self.dropped,
+            "queued": self._queue.qsize(),
+            "segment": self._segment_index
+        }
+    
+    def _open_last_segment(self):
+        segments = list_segments(self.log_dir)
+        if not segments:
+            return 0, 0
+        last = segments[-1]
+        path = _segment_path(self.log_dir, last, ".rec")
+        count = os.path.getsize(path) // RECORD_DTYPE.itemsize
+        if os.path.getsize(path) != count * RECORD_DTYPE.itemsize:
+            # Drop a row torn by a crash so new rows start on a record boundary
+            os.truncate(path, count * RECORD_DTYPE.itemsize)
+        return last, count
+    
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            if batch:
+                try:
+                    self._write(batch)
+                except Exception as e:
+                    # A bad record or a full disk costs this batch, never the writer thread
+                    self.dropped += len(batch)
+                    print(f"Query log write error: {e}")
+    
+    def _write(self, batch: List[Dict[str, Any]]):
+        while batch:
+            if self._segment_count >= self.segment_records:
+                self._segment_index += 1
+                self._segment_count = 0
+            room = self.segment_records - self._segment_count
+            chunk, batch = batch[:room], batch[room:]
+            self._append(chunk)
+            self._segment_count += len(chunk)
+            self.written += len(chunk)
+    
+    def _append(self, records: List[Dict[str, Any]]):
+        rec_path = _segment_path(self.log_dir, self._segment_index, ".rec")
+        txt_path = _segment_path(self.log_dir, self._segment_index, ".txt")
+        rows = np.zeros(len(records), dtype=RECORD_DTYPE)
+        texts = [record.get("query", "").encode("utf-8") for record in records]
+        
+        with open(txt_path, "ab") as blob:
+            offset = blob.tell()
+            blob.write(b"".join(texts))
+        
+        for i, (record, text) in enumerate(zip(records, texts)):
+            row = rows[i]
+            row["query_offset"] = offset
+            row["query_len"] = len(text)
+            row["query_hash"] = zlib.crc32(text.strip().lower())
+            offset += len(text)
+            for name in RECORD_DTYPE.names:
+                if name in record and name not in ("query_offset", "query_len", "query_hash"):
+                    value = record[name]
+                    if name == "model":
+                        value = str(value).encode("utf-8")[:24]
+                    elif value is None:
+                        value = np.nan
+                    row[name] = value
+        
+        with open(rec_path, "ab") as f:
+            f.write(rows.tobytes())
+
+
+def _segment_path(log_dir: str, index: int, suffix: str) -> str:
+    return os.path.join(log_dir, f"segment-{index:06d}{suffix}")
+
+
+def list_segments(log_dir: str) -> List[int]:
+    if not os.path.isdir(log_dir):
+        return []
+    return sorted(
+        int(name[len("segment-"):-len(".rec")])
+        for name in os.listdir(log_dir)
+        if name.startswith("segment-") and name.endswith(".rec")
+    )
+
+
+class QueryLogReader:
+    """Memory-maps every segment and exposes columns as NumPy arrays"""
+    
+    def __init__(self, log_dir: str):
+        self.log_dir = log_dir
+        self._segments = []
+        for index in list_segments(log_dir):
+            path = _segment_path(log_dir, index, ".rec")
+            # A partially written last row is ignored
+            count = os.path.getsize(path) // RECORD_DTYPE.itemsize
+            if count:
+                self._segments.append((index, np.memmap(path, dtype=RECORD_DTYPE, mode="r", shape=(count,))))
+    
+    def __len__(self) -> int:
+        return sum(len(rows) for _, rows in self._segments)
+    
+    def column(self, name: str) -> np.ndarray:
+        """One field across all segments"""
+        if not self._segments:
+            return np.empty(0, dtype=RECORD_DTYPE[name])
+        return np.concatenate([rows[name] for _, rows in self._segments])
+    
+    def columns(self, names: Optional[Iterable[str]] = None) -> Dict[str, np.ndarray]:
+        return {name: self.column(name) for name in (names or RECORD_DTYPE.names)}
+    
+    def queries(self, positions: Iterable[int]) -> List[str]:
+        """Query text for global record positions"""
+        starts = np.cumsum([0] + [len(rows) for _, rows in self._segments])
+        texts = []
+        for position in positions:
+            segment = int(np.searchsorted(starts, position, side="right")) - 1
+            index, rows = self._segments[segment]
+            row = rows[position - starts[segment]]
+            with open(_segment_path(self.log_dir, index, ".txt"), "rb") as blob:
+                blob.seek(int(row["query_offset"]))
+                texts.append(blob.read(int(row["query_len"])).decode("utf-8", errors="replace"))
+        return texts
+    
+    def latency_percentiles(self, percentiles=(50, 90, 99)) -> Dict[str, Dict[str, float]]:
+        """Percentiles of the total and per-node/per-tool latency columns, ignoring missing values"""
+        report = {}
+        for name in ["total_ms"] + [f"{node}_ms" for node in NODES] + [f"{tool}_ms" for tool in TOOLS]:
+            values = self.column(name)
+            values = values[~np.isnan(values)]
+            if len(values):
+                report[name] = {f"p{p}": round(float(v), 2) for p, v in zip(percentiles, np.percentile(values, percentiles))}
+        return report
+    
+    def routing_stats(self) -> Dict[str, Any]:
+        """How often each tool was routed to and used, and helpfulness by model"""
+        total = len(self)
+        if not total:
+            return {"requests": 0}
+        routing, tools_used = self.column("routing"), self.column("tools_used")
+        helpfulness, models = self.column("helpfulness"), self.column("model")
+        by_model = {}
+        for model in np.unique(models):
+            scores = helpfulness[(models == model) & ~np.isnan(helpfulness)]
+            by_model[model.decode("utf-8") or "none"] = {
+                "requests": int((models == model).sum()),
+                "mean_helpfulness": round(float(scores.mean()), 3) if len(scores) else None
+            }
+        return {
+            "requests": total,
+            "routed": {flag: round(float(((routing >> i) & 1).mean()), 4) for i, flag in enumerate(ROUTING_FLAGS)},
+            "used": {tool: round(float(((tools_used >> i) & 1).mean()), 4) for i, tool in enumerate(TOOLS)},
+            "failed_rate": round(float(self.column("failed").mean()), 4),
+            "draft_accepted_rate": round(float(self.column("draft_accepted").mean()), 4),
+            "models": by_model
+        }
+
+
+_writer: Optional[QueryLogWriter] = None
+_writer_lock = threading.Lock()
+
+
+def get_query_log(config=None) -> Optional[QueryLogWriter]:
+    """Return the process-wide writer, or None when QUERY_LOG_DIR is not configured"""
+    global _writer
+    with _writer_lock:
+        if _writer is None and config is not None and config.query_log_dir:
+            _writer = QueryLogWriter(config.query_log_dir, segment_records=config.query_log_segment_records)
+        return _writer
+
+
+def main():
+    """Summarize a query log directory"""
+    parser = argparse.ArgumentParser(description="Query log statistics")
+    parser.add_argument("log_dir", help="Directory containing segment-*.rec files")
+    args = parser.parse_args()
+    
+    start = time.time()
+    reader = QueryLogReader(args.log_dir)
+    report = {
+        "records": len(reader),
+        "latency_ms": reader.latency_percentiles(),
+        "routing": reader.routing_stats()
+    }
+    report["seconds"] = round(time.time() - start, 3)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Targeted Answer Revision
+Turns a helpfulness critique into a revision prompt and merges the edits it returns into the existing answer as patches
+"""
+
+import json
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+
+REVISION_MODES = ("targeted", "full")
+
+JSON_OBJECT_PATTERN = re.compile(r"\{.*\}", re.DOTALL)
+
+REVISION_SYSTEM_MESSAGE = """You improve an existing answer without rewriting it.
+Change only the passages the reviewer criticised and add only what is missing; keep everything else as it is.
+Respond with only a JSON object:
+{"edits": [{"find": "a passage copied exactly from the current answer", "replace": "its improved version"}],
+ "addendum": "new paragraphs to append at the end, or an empty string"}"""
+
+
+def build_revision_prompt(query: str, context: str, answer: str, critique: Dict[str, Any]) -> str:
+    """User prompt for a targeted revision: the original inputs, the current answer and what the reviewer found"""
+    notes = "".join(f'- "{part["quote"]}": {part["problem"]}\n' for part in critique.get("weak_parts", []))
+    notes += "".join(f"- Missing: {point}\n" for point in critique.get("missing", []))
+    return (
+        f"Query: {query}{context}\n\n"
+        f"Current answer:\n{answer}\n\n"
+        f"Reviewer's helpfulness score: {critique.get('score')}\n"
+        f"Reviewer's notes:\n{notes}"
+    )
+
+
+def parse_revision(content: str) -> Optional[Dict[str, Any]]:
+    """Edits and addendum from the responder's output, or None when it is not the requested JSON"""
+    match = JSON_OBJECT_PATTERN.search(content)
+    try:
+        data = json.loads(match.group(0)) if match else None
+    except ValueError:
+        return None
+    if not isinstance(data, dict):
+        return None
+    
+    edits = data.get("edits")
+    edits = [
+        {"find": str(edit["find"]), "replace": str(edit.get("replace", ""))}
+        for edit in edits
+        if isinstance(edit, dict) and edit.get("find")
+    ] if isinstance(edits, list) else []
+    addendum = data.get("addendum")
+    return {"edits": edits, "addendum": addendum.strip() if isinstance(addendum, str) else ""}
+
+
+def apply_revision(answer: str, revision: Dict[str, Any]) -> Tuple[str, List[Dict[str, Any]]]:
+    """
+    Merge a parsed revision into the answer
+    
+    Each edit replaces the first passage matching its find text, exactly
+    or up to whitespace; edits matching nothing are dropped. The addendum
+    is appended as new paragraphs. Returns the revised answer and the
+    patches that turn the old answer into it, each relative to the text
+    left by the ones before.
+    """
+    text, patches = answer, []
+    for edit in revision["edits"]:
+        span = find_passage(text, edit["find"])
+        if span is None:
+            continue
+        start, end = span
+        patches.append({"start": start, "end": end, "text": edit["replace"]})
+        text = text[:start] + edit["replace"] + text[end:]
+    
+    if revision["addendum"]:
+        addition = f"\n\n{revision['addendum']}" if text else revision["addendum"]
+        patches.append({"start": len(text), "end": len(text), "text": addition})
+        text += addition
+    return text, patches
+
+
+def apply_patches(text: str, patches: List[Dict[str, Any]]) -> str:
+    """Replay patches from apply_revision on the text they were made against"""
+    for patch in patches:
+        text = text[:patch["start"]] + patch["text"] + text[patch["end"]:]
+    return text
+
+
+def find_passage(text: str, passage: str) -> Optional[Tuple[int, int]]:
+    """Span of the first occurrence of passage in text, tolerating differences in whitespace"""
+    start = text.find(passage)
+    if start >= 0:
+        return start, start + len(passage)
+    
+    words = passage.split()
+    if not words:
+        return None
+    match = re.search(r"\s+".join(re.escape(word) for word in words), text)
+    return match.span() if match else None
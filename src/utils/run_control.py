@@ -0,0 +1,66 @@
+"""
+Run Control
+Thread-safe signals for steering a running agent graph: cancel, skip the helpfulness check, add follow-up messages
+"""
+
+import threading
+from typing import List
+
+
+class RunCancelled(Exception):
+    """Raised at the next node boundary once a run has been cancelled"""
+
+
+class RunControl:
+    """
+    Client signals for one process_query call
+    
+    Set from the event loop and read by the worker thread running the
+    graph between nodes: a node already in progress (an LLM or search
+    call) completes, but nothing after it runs. Follow-ups are picked up
+    by the next responder pass; once the run closes the control, new
+    follow-ups are refused.
+    """
+    
+    def __init__(self, skip_helpfulness: bool = False):
+        self.skip_helpfulness = skip_helpfulness
+        self._cancelled = threading.Event()
+        self._follow_ups: List[str] = []
+        self._closed = False
+        self._lock = threading.Lock()
+    
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+    
+    def cancel(self):
+        self._cancelled.set()
+    
+    def check(self):
+        """Raise RunCancelled if the run has been cancelled"""
+        if self._cancelled.is_set():
+            raise RunCancelled()
+    
+    def add_follow_up(self, message: str) -> bool:
+        """Queue a follow-up for the running graph; False once the run has finished"""
+        with self._lock:
+            if self._closed:
+                return False
+            self._follow_ups.append(message)
+            return True
+    
+    def has_follow_ups(self) -> bool:
+        with self._lock:
+            return bool(self._follow_ups)
+    
+    def take_follow_ups(self) -> List[str]:
+        with self._lock:
+            follow_ups, self._follow_ups = self._follow_ups, []
+            return follow_ups
+    
+    def close(self) -> List[str]:
+        """Refuse further follow-ups and return any the graph never picked up"""
+        with self._lock:
+            self._closed = True
+            follow_ups, self._follow_ups = self._follow_ups, []
+            return follow_ups
@@ -0,0 +1,280 @@
+"""
+Weighted Fair Request Scheduler
+Per-tenant queues with weighted fair queuing, interactive/batch lanes and per-tenant concurrency caps
+"""
+
+import asyncio
+import hashlib
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Dict, Any, List, Optional
+
+
+LANES = ("interactive", "batch")
+
+
+class QueueFullError(Exception):
+    """Raised when a tenant already has too many requests waiting"""
+    
+    def __init__(self, message: str, retry_after: int = 1):
+        super().__init__(message)
+        # Whole seconds a client should wait before trying again
+        self.retry_after = retry_after
+
+
+def tenant_id(api_key: Optional[str] = None, client_address: Optional[str] = None) -> str:
+    """
+    Tenant for fairness accounting
+    
+    Requests that bring their own API key are grouped by a hash of the key;
+    default-key traffic is grouped by client address, which, unlike a
+    session id, a client cannot choose per request.
+    """
+    if api_key:
+        return "key:" + hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:12]
+    if client_address:
+        return "ip:" + client_address
+    return "anonymous"
+
+
+def is_address_tenant(tenant: str) -> bool:
+    """
+    True for tenants grouped by client address rather than an API key
+    
+    Behind a NAT or a proxy that does not set X-Forwarded-For, one such
+    tenant can stand for many users.
+    """
+    return tenant.startswith("ip:") or tenant == "anonymous"
+
+
+def parse_weights(spec: str) -> Dict[str, float]:
+    """Parse "tenant=weight,..." into a weight map; malformed entries are ignored"""
+    weights = {}
+    for entry in (spec or "").split(","):
+        name, _, value = entry.partition("=")
+        try:
+            weights[name.strip()] = float(value)
+        except ValueError:
+            continue
+    return weights
+
+
+class _Waiter:
+    __slots__ = ("tenant", "lane", "tag", "future", "enqueued_at")
+    
+    def __init__(self, tenant: str, lane: str, tag: float, future: asyncio.Future):
+        self.tenant = tenant
+        self.lane = lane
+        self.tag = tag
+        self.future = future
+        self.enqueued_at = time.monotonic()
+
+
+class _TenantState:
+    def __init__(self, weight: float, history: int):
+        self.weight = weight
+        self.queues: Dict[str, deque] = {lane: deque() for lane in LANES}
+        self.finish_tag = {lane: 0.0 for lane in LANES}
+        self.running = 0
+        self.completed = 0
+        self.waits: deque = deque(maxlen=history)
+
+
+class FairScheduler:
+    """
+    Weighted fair queuing over tenants, with lanes for interactive and batch traffic
+    
+    Each lane runs start-time fair queuing: a request's tag is the later of
+    the lane's virtual clock and its tenant's previous tag, plus 1/weight,
+    and the smallest eligible tag runs next. Lanes share the slots by lane
+    weight the same way, so batch traffic is slowed but never starved.
+    Tenants at their concurrency cap are skipped until one of their
+    requests finishes.
+    """
+    
+    def __init__(
+        self,
+        max_concurrency: int = 8,
+        tenant_concurrency: int = 2,
+        max_queue_per_tenant: int = 32,
+        tenant_weights: Optional[Dict[str, float]] = None,
+        lane_weights: Optional[Dict[str, float]] = None,
+        history: int = 512,
+        max_tenants: int = 1024,
+        address_concurrency: int = 0
+    ):
+        self.max_concurrency = max_concurrency
+        self.tenant_concurrency = tenant_concurrency
+        # Cap for address-grouped tenants; 0 leaves them bounded by max_concurrency only
+        self.address_concurrency = address_concurrency
+        self.max_queue_per_tenant = max_queue_per_tenant
+        self.tenant_weights = tenant_weights or {}
+        self.lane_weights = lane_weights or {"interactive": 4.0, "batch": 1.0}
+        self.history = history
+        self.max_tenants = max_tenants
+        
+        self._tenants: Dict[str, _TenantState] = {}
+        self._virtual_time = {lane: 0.0 for lane in LANES}
+        self._lane_tag = {lane: 0.0 for lane in LANES}
+        self._running = 0
+    
+    @property
+    def running(self) -> int:
+        """Requests currently holding a slot"""
+        return self._running
+    
+    @asynccontextmanager
+    async def slot(self, tenant: str, lane: str = "interactive"):
+        """Wait for a fair turn, hold a concurrency slot for the body, then release it"""
+        await self.acquire(tenant, lane)
+        try:
+            yield
+        finally:
+            self.release(tenant)
+    
+    def admit(self, tenant: str):
+        """
+        Raise QueueFullError if the tenant's queue is full
+        
+        acquire() checks the same limit; streaming endpoints call this first
+        so they can refuse with a status code before the response starts.
+        """
+        state = self._tenant(tenant)
+        if sum(len(queue) for queue in state.queues.values()) >= self.max_queue_per_tenant:
+            waits = sorted(state.waits)
+            retry_after = max(1, math.ceil(waits[len(waits) // 2])) if waits else 1
+            raise QueueFullError(f"Too many queued requests for tenant {tenant}", retry_after=retry_after)
+    
+    async def acquire(self, tenant: str, lane: str = "interactive"):
+        if lane not in LANES:
+            raise ValueError(f"Unknown lane '{lane}', expected one of {LANES}")
+        self.admit(tenant)
+        state = self._tenant(tenant)
+        
+        tag = max(self._virtual_time[lane], state.finish_tag[lane]) + 1.0 / state.weight
+        state.finish_tag[lane] = tag
+        waiter = _Waiter(tenant, lane, tag, asyncio.get_running_loop().create_future())
+        state.queues[lane].append(waiter)
+        self._dispatch()
+        
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter in state.queues[lane]:
+                state.queues[lane].remove(waiter)
+            elif waiter.future.done() and not waiter.future.cancelled():
+                # Granted just as the caller went away; hand the slot on
+                self.release(tenant)
+            raise
+    
+    def release(self, tenant: str):
+        state = self._tenants[tenant]
+        state.running -= 1
+        state.completed += 1
+        self._running -= 1
+        self._dispatch()
+    
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth, concurrency and queue-wait percentiles per tenant"""
+        tenants = {}
+        for name, state in self._tenants.items():
+            waits = sorted(state.waits)
+            tenants[name] = {
+                "weight": state.weight,
+                "queued": {lane: len(queue) for lane, queue in state.queues.items()},
+                "running": state.running,
+                "completed": state.completed,
+                "wait_p50_ms": _percentile_ms(waits, 0.50),
+                "wait_p99_ms": _percentile_ms(waits, 0.99)
+            }
+        return {
+            "max_concurrency": self.max_concurrency,
+            "tenant_concurrency": self.tenant_concurrency,
+            "address_concurrency": self.address_concurrency or self.max_concurrency,
+            "running": self._running,
+            "lane_weights": dict(self.lane_weights),
+            "tenants": tenants
+        }
+    
+    def _concurrency_limit(self, tenant: str) -> int:
+        if is_address_tenant(tenant):
+            return self.address_concurrency or self.max_concurrency
+        return self.tenant_concurrency
+    
+    def _tenant(self, tenant: str) -> _TenantState:
+        if tenant not in self._tenants:
+            if len(self._tenants) >= self.max_tenants:
+                self._prune_idle()
+            self._tenants[tenant] = _TenantState(self.tenant_weights.get(tenant, 1.0), self.history)
+        return self._tenants[tenant]
+    
+    def _prune_idle(self):
+        """Forget tenants with nothing queued or running (per-session tenants come and go)"""
+        for name in [name for name, state in self._tenants.items()
+                     if state.running == 0 and not any(state.queues.values())]:
+            del self._tenants[name]
+    
+    def _dispatch(self):
+        while self._running < self.max_concurrency:
+            waiter = self._next_waiter()
+            if waiter is None:
+                return
+            state = self._tenants[waiter.tenant]
+            state.queues[waiter.lane].popleft()
+            if waiter.future.done():
+                continue
+            state.running += 1
+            self._running += 1
+            state.waits.append(time.monotonic() - waiter.enqueued_at)
+            self._virtual_time[waiter.lane] = waiter.tag
+            self._lane_tag[waiter.lane] += 1.0 / self.lane_weights.get(waiter.lane, 1.0)
+            waiter.future.set_result(None)
+    
+    def _next_waiter(self) -> Optional[_Waiter]:
+        """Eligible head-of-queue request with the smallest tag, from the lane that is furthest behind"""
+        candidates: Dict[str, List[_Waiter]] = {lane: [] for lane in LANES}
+        for name, state in self._tenants.items():
+            if state.running >= self._concurrency_limit(name):
+                continue
+            for lane, queue in state.queues.items():
+                if queue:
+                    candidates[lane].append(queue[0])
+        
+        lanes = [lane for lane in LANES if candidates[lane]]
+        if not lanes:
+            return None
+        # An idle lane must not bank credit while it has no traffic
+        if len(lanes) == 1:
+            for other in LANES:
+                self._lane_tag[other] = max(self._lane_tag[other], self._lane_tag[lanes[0]])
+        lane = min(lanes, key=lambda name: (self._lane_tag[name] + 1.0 / self.lane_weights.get(name, 1.0), LANES.index(name)))
+        return min(candidates[lane], key=lambda waiter: waiter.tag)
+
+
+def _percentile_ms(sorted_values: List[float], fraction: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return round(sorted_values[index] * 1000, 2)
+
+
+_scheduler: Optional[FairScheduler] = None
+
+
+def get_scheduler(config=None) -> FairScheduler:
+    """Return the process-wide scheduler (used from the event loop thread only)"""
+    global _scheduler
+    if _scheduler is None:
+        if config is not None:
+            _scheduler = FairScheduler(
+                max_concurrency=config.scheduler_max_concurrency,
+                tenant_concurrency=config.scheduler_tenant_concurrency,
+                max_queue_per_tenant=config.scheduler_max_queue,
+                tenant_weights=parse_weights(config.scheduler_tenant_weights),
+                address_concurrency=config.scheduler_address_concurrency
+            )
+        else:
+            _scheduler = FairScheduler()
+    return _scheduler
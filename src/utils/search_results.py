@@ -0,0 +1,109 @@
+"""
+Search Result Records
+Compact slotted record for search results held in agent state, with lazily built snippet and context text
+"""
+
+from typing import Dict, Any, Optional
+
+
+SNIPPET_CHARS = 200
+ARXIV_CONTEXT_CHARS = 500
+
+# Tool-specific fields kept from the raw result; everything else is dropped
+EXTRA_FIELDS = {
+    "web_search": (),
+    "arxiv_search": ("authors",),
+    "youtube_search": ("channel", "duration", "thumbnail", "views"),
+    "corpus_search": ("path",)
+}
+
+
+def result_tool(result: Dict[str, Any]) -> str:
+    """Name of the tool that produced a raw search result"""
+    if result.get("type") == "youtube":
+        return "youtube_search"
+    if result.get("source") == "arxiv":
+        return "arxiv_search"
+    if result.get("source") == "corpus":
+        return "corpus_search"
+    return "web_search"
+
+
+class SearchResult:
+    """
+    One search result as the agent keeps it
+    
+    Tools return dicts that repeat keys and carry prebuilt content and
+    snippet strings; a record keeps the body text once and derives the
+    snippet and responder context on first use.
+    """
+    
+    __slots__ = ("tool", "title", "url", "text", "score", "published", "extra", "_snippet", "_context")
+    
+    def __init__(self, tool: str, title: str, url: str, text: str, score: float = 0.5,
+                 published: Optional[str] = None, extra: Optional[Dict[str, Any]] = None):
+        self.tool = tool
+        self.title = title
+        self.url = url
+        self.text = text
+        self.score = score
+        self.published = published
+        self.extra = extra
+        self._snippet = None
+        self._context = None
+    
+    @classmethod
+    def from_tool_result(cls, result: Dict[str, Any]) -> "SearchResult":
+        """Record from a dict returned by one of the search tools"""
+        tool = result_tool(result)
+        if tool == "arxiv_search":
+            text = result.get("summary") or result.get("content", "")
+            published = result.get("published")
+        elif tool == "youtube_search":
+            text = result.get("description", "")
+            published = result.get("published_date")
+        else:
+            text = result.get("content", "")
+            published = result.get("published_date", result.get("date"))
+        extra = {key: result[key] for key in EXTRA_FIELDS[tool] if key in result}
+        return cls(
+            tool,
+            result.get("title", ""),
+            result.get("url", ""),
+            text,
+            score=result.get("score", 0.5),
+            published=published,
+            extra=extra or None
+        )
+    
+    @property
+    def snippet(self) -> str:
+        """Short preview shown with the sources"""
+        if self._snippet is None:
+            self._snippet = (self.text or "No preview available")[:SNIPPET_CHARS] + "..."
+        return self._snippet
+    
+    @property
+    def context(self) -> str:
+        """Text packed into the responder prompt"""
+        if self._context is None:
+            if self.tool == "arxiv_search":
+                authors = ", ".join((self.extra or {}).get("authors", []))
+                self._context = f"{self.title}\n\nAuthors: {authors}\n\nSummary: {self.text[:ARXIV_CONTEXT_CHARS]}..."
+            else:
+                self._context = self.text or "No content"
+        return self._context
+    
+    def source(self) -> Dict[str, Any]:
+        """Source entry for the response metadata"""
+        return {
+            "title": self.title or "Unknown Title",
+            "url": self.url,
+            "snippet": self.snippet,
+            "type": "corpus" if self.tool == "corpus_search" else "arxiv" if "arxiv.org" in self.url else "web",
+            "published_date": self.published,
+            "score": self.score
+        }
+    
+    def __repr__(self) -> str:
+        return f"SearchResult({self.tool!r}, {self.title!r}, {self.url!r})"
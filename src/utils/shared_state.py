@@ -0,0 +1,236 @@
+"""
+Shared Worker State
+Session history, cache entries and per-worker metrics shared across worker processes through SQLite
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Any, List, Optional
+
+
+class MemorySessionStore:
+    """Session history private to this process (single-worker mode)"""
+    
+    def __init__(self):
+        self._sessions: Dict[str, List[Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+    
+    def append(self, session_id: str, message: Dict[str, Any]):
+        with self._lock:
+            self._sessions.setdefault(session_id, []).append(message)
+    
+    def history(self, session_id: str) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self._sessions.get(session_id, []))
+    
+    def delete(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+    
+    def session_ids(self) -> List[str]:
+        with self._lock:
+            return list(self._sessions)
+
+
+class SharedState:
+    """
+    SQLite database shared by the workers on one host
+    
+    Holds session history (so any worker can serve any session), a TTL
+    key-value cache, the latest metrics snapshot of each worker, leases
+    that elect one worker for a background job and each tenant's recent
+    spending. The database runs in WAL
+    mode so readers never block the writer; each thread gets its own
+    connection. Every call blocks on disk, so async code runs them in a
+    worker thread.
+    """
+    
+    def __init__(self, path: str, busy_timeout: float = 5.0):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connection() as db:
+            db.executescript("""
+                CREATE TABLE IF NOT EXISTS messages (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    session_id TEXT NOT NULL,
+                    message TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS messages_by_session ON messages (session_id, seq);
+                CREATE TABLE IF NOT EXISTS cache (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS worker_metrics (
+                    worker_id TEXT PRIMARY KEY,
+                    pid INTEGER NOT NULL,
+                    updated_at REAL NOT NULL,
+                    metrics TEXT NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS leases (
+                    name TEXT PRIMARY KEY,
+                    holder TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS spend (
+                    tenant TEXT NOT NULL,
+                    at REAL NOT NULL,
+                    cost REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS spend_by_tenant ON spend (tenant, at);
+            """)
+    
+    def _connection(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+    
+    # Sessions
+    
+    def append(self, session_id: str, message: Dict[str, Any]):
+        self._connection().execute(
+            "INSERT INTO messages (session_id, message) VALUES (?, ?)",
+            (session_id, json.dumps(message, default=str))
+        )
+    
+    def history(self, session_id: str) -> List[Dict[str, Any]]:
+        rows = self._connection().execute(
+            "SELECT message FROM messages WHERE session_id = ? ORDER BY seq", (session_id,)
+        ).fetchall()
+        return [json.loads(message) for message, in rows]
+    
+    def delete(self, session_id: str):
+        self._connection().execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+    
+    def session_ids(self) -> List[str]:
+        rows = self._connection().execute("SELECT DISTINCT session_id FROM messages").fetchall()
+        return [session_id for session_id, in rows]
+    
+    # Cache
+    
+    def cache_get(self, key: str) -> Optional[Any]:
+        row = self._connection().execute(
+            "SELECT value FROM cache WHERE key = ? AND expires_at > ?", (key, time.time())
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+    
+    def cache_set(self, key: str, value: Any, ttl: float):
+        db = self._connection()
+        db.execute(
+            "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, json.dumps(value, default=str), time.time() + ttl)
+        )
+        db.execute("DELETE FROM cache WHERE expires_at <= ?", (time.time(),))
+    
+    def cache_prefix(self, prefix: str) -> Dict[str, Any]:
+        """Every live cache entry whose key starts with prefix"""
+        rows = self._connection().execute(
+            "SELECT key, value FROM cache WHERE substr(key, 1, ?) = ? AND expires_at > ?",
+            (len(prefix), prefix, time.time())
+        ).fetchall()
+        return {key: json.loads(value) for key, value in rows}
+    
+    # Leases
+    
+    def try_lease(self, name: str, holder: str, ttl: float) -> bool:
+        """Take or renew a named lease; True while holder has it, False while another live holder does"""
+        now = time.time()
+        db = self._connection()
+        db.execute(
+            "INSERT INTO leases (name, holder, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET holder = excluded.holder, expires_at = excluded.expires_at "
+            "WHERE leases.holder = excluded.holder OR leases.expires_at <= ?",
+            (name, holder, now + ttl, now)
+        )
+        row = db.execute("SELECT holder FROM leases WHERE name = ?", (name,)).fetchone()
+        return row is not None and row[0] == holder
+    
+    # Spending
+    
+    def add_spend(self, tenant: str, cost: float, keep_seconds: float):
+        """Record a tenant's spend, dropping entries older than keep_seconds"""
+        now = time.time()
+        db = self._connection()
+        db.execute("INSERT INTO spend (tenant, at, cost) VALUES (?, ?, ?)", (tenant, now, cost))
+        db.execute("DELETE FROM spend WHERE at <= ?", (now - keep_seconds,))
+    
+    def window_spend(self, tenant: str, window_seconds: float) -> float:
+        row = self._connection().execute(
+            "SELECT SUM(cost) FROM spend WHERE tenant = ? AND at > ?", (tenant, time.time() - window_seconds)
+        ).fetchone()
+        return row[0] or 0.0
+    
+    # Metrics
+    
+    def publish_metrics(self, worker_id: str, metrics: Dict[str, Any]):
+        self._connection().execute(
+            "INSERT OR REPLACE INTO worker_metrics (worker_id, pid, updated_at, metrics) VALUES (?, ?, ?, ?)",
+            (worker_id, os.getpid(), time.time(), json.dumps(metrics, default=str))
+        )
+    
+    def worker_metrics(self, max_age: float = 60.0) -> Dict[str, Dict[str, Any]]:
+        """Latest snapshot of every worker that published within max_age seconds"""
+        rows = self._connection().execute(
+            "SELECT worker_id, pid, updated_at, metrics FROM worker_metrics WHERE updated_at > ?",
+            (time.time() - max_age,)
+        ).fetchall()
+        return {
+            worker_id: {"pid": pid, "age_s": round(time.time() - updated_at, 1), "metrics": json.loads(metrics)}
+            for worker_id, pid, updated_at, metrics in rows
+        }
+
+
+def sum_counters(snapshots: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Add up integer counters across worker snapshots with the same layout
+    
+    Only ints are summed; floats are rates, latencies or percentiles that
+    do not add, and are left out of the total.
+    """
+    total: Dict[str, Any] = {}
+    for snapshot in snapshots:
+        for key, value in snapshot.items():
+            if isinstance(value, bool):
+                continue
+            if isinstance(value, int):
+                total[key] = total.get(key, 0) + value
+            elif isinstance(value, dict):
+                nested = sum_counters([value])
+                if nested:
+                    total[key] = sum_counters([total.get(key, {}), nested])
+    return total
+
+
+_shared: Optional[SharedState] = None
+_sessions: Optional[Any] = None
+_shared_lock = threading.Lock()
+
+
+def get_shared_state(config=None) -> Optional[SharedState]:
+    """Return the process-wide shared state, or None when SHARED_STATE_PATH is not configured"""
+    global _shared
+    with _shared_lock:
+        if _shared is None and config is not None and config.shared_state_path:
+            _shared = SharedState(config.shared_state_path)
+        return _shared
+
+
+def get_session_store(config=None):
+    """Shared session history when configured, otherwise an in-process store"""
+    global _sessions
+    shared = get_shared_state(config)
+    with _shared_lock:
+        if _sessions is None:
+            _sessions = shared if shared is not None else MemorySessionStore()
+        return _sessions
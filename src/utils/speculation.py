@@ -0,0 +1,161 @@
+"""
+Speculative Tool Prefetch
+Starts likely tool calls while the analyzer LLM is still deciding, and tracks hit rate and waste
+"""
+
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Any, Iterable, List, Optional, Tuple
+
+
+class PrefetchHandle:
+    """
+    Speculative tool calls started for one request
+    
+    Calls added from another prefetcher (early dispatch) run on that one's
+    pool and count in its statistics, not in this handle's.
+    """
+    
+    def __init__(self, prefetcher: "SpeculativePrefetcher", futures: Dict[str, Future]):
+        self._prefetcher = prefetcher
+        self._futures = futures
+        self._owners: Dict[str, "SpeculativePrefetcher"] = {tool: prefetcher for tool in futures}
+        self._claimed: List[str] = []
+        self._closed = False
+    
+    @property
+    def predicted(self) -> List[str]:
+        return list(self._futures)
+    
+    def claim(self, tool: str) -> Optional[Tuple[List[Dict[str, Any]], float]]:
+        """
+        Take the speculative result for a tool the analyzer actually selected
+        
+        Returns (results, tool latency) or None if the tool was not
+        predicted. Exceptions raised by the speculative call propagate.
+        """
+        future = self._futures.get(tool)
+        if future is None:
+            return None
+        self._claimed.append(tool)
+        wait_start = time.time()
+        try:
+            results, latency = future.result()
+        finally:
+            self._owners[tool]._record_hit(tool, waited=time.time() - wait_start, future=future)
+        return results, latency
+    
+    def add(self, tool: str, call: Callable[[], List[Dict[str, Any]]],
+            prefetcher: Optional["SpeculativePrefetcher"] = None) -> bool:
+        """
+        Start one more call on this handle, on prefetcher's pool if given
+        
+        False if the tool is already running or the handle is closed.
+        """
+        if self._closed or tool in self._futures:
+            return False
+        owner = prefetcher or self._prefetcher
+        self._futures[tool] = owner._submit(call)
+        self._owners[tool] = owner
+        return True
+    
+    def close(self, needed: Iterable[str] = ()):
+        """Discard unclaimed speculative work and record mispredictions"""
+        if self._closed:
+            return
+        self._closed = True
+        wasted = [tool for tool in self._futures if tool not in self._claimed]
+        for tool in wasted:
+            # Calls that have not started are cancelled; running ones finish and are ignored
+            self._futures[tool].cancel()
+        # A tool another prefetcher started was still not predicted by this one
+        missed = [tool for tool in needed if self._owners.get(tool) is not self._prefetcher]
+        for owner in set(self._owners.values()) | {self._prefetcher}:
+            owner._record_close(
+                [tool for tool in wasted if self._owners[tool] is owner],
+                missed if owner is self._prefetcher else []
+            )
+
+
+class SpeculativePrefetcher:
+    """Runs speculative tool calls on a bounded pool and keeps hit/waste statistics"""
+    
+    def __init__(self, max_workers: int = 8, name: str = "prefetch"):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self._stats = {
+            "requests": 0,
+            "predicted": 0,
+            "hits": 0,
+            "wasted": 0,
+            "missed": 0,
+            "hidden_seconds": 0.0
+        }
+    
+    def start(self, calls: Dict[str, Callable[[], List[Dict[str, Any]]]]) -> PrefetchHandle:
+        """Submit one speculative call per predicted tool"""
+        with self._lock:
+            self._stats["requests"] += 1
+        return PrefetchHandle(self, {tool: self._submit(call) for tool, call in calls.items()})
+    
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["hit_rate"] = round(stats["hits"] / stats["predicted"], 4) if stats["predicted"] else None
+        stats["hidden_seconds"] = round(stats["hidden_seconds"], 3)
+        return stats
+    
+    def _submit(self, call: Callable[[], List[Dict[str, Any]]]) -> Future:
+        with self._lock:
+            self._stats["predicted"] += 1
+        return self._executor.submit(_timed, call)
+    
+    def _record_hit(self, tool: str, waited: float, future: Future):
+        latency = 0.0
+        if future.done() and not future.cancelled() and future.exception() is None:
+            latency = future.result()[1]
+        with self._lock:
+            self._stats["hits"] += 1
+            # Tool time that overlapped with the analyzer instead of adding to the request
+            self._stats["hidden_seconds"] += max(0.0, latency - waited)
+    
+    def _record_close(self, wasted: List[str], missed: List[str]):
+        with self._lock:
+            self._stats["wasted"] += len(wasted)
+            self._stats["missed"] += len(missed)
+
+
+def _timed(call: Callable[[], List[Dict[str, Any]]]) -> Tuple[List[Dict[str, Any]], float]:
+    start = time.time()
+    results = call()
+    return results, time.time() - start
+
+
+_prefetcher: Optional[SpeculativePrefetcher] = None
+_early_dispatcher: Optional[SpeculativePrefetcher] = None
+_prefetcher_lock = threading.Lock()
+
+
+def get_prefetcher() -> SpeculativePrefetcher:
+    """Return the process-wide prefetcher"""
+    global _prefetcher
+    with _prefetcher_lock:
+        if _prefetcher is None:
+            _prefetcher = SpeculativePrefetcher()
+        return _prefetcher
+
+
+def get_early_dispatcher(config=None) -> SpeculativePrefetcher:
+    """
+    Return the process-wide pool for tools the analyzer has already selected
+    
+    Kept apart from the speculative prefetcher so real tool calls never
+    queue behind speculative ones and its statistics stay separate.
+    """
+    global _early_dispatcher
+    with _prefetcher_lock:
+        if _early_dispatcher is None:
+            workers = config.early_dispatch_workers if config is not None else 32
+            _early_dispatcher = SpeculativePrefetcher(max_workers=workers, name="early-dispatch")
+        return _early_dispatcher
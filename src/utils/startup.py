@@ -0,0 +1,62 @@
+"""
+Startup Timing
+Records how long each startup stage takes for the startup-time breakdown report
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional
+
+
+class StartupTimer:
+    """Collects named startup stages relative to a common origin"""
+    
+    def __init__(self, origin: Optional[float] = None):
+        self.origin = origin or time.time()
+        self.stages: List[Dict[str, Any]] = []
+        self.ready_at: Optional[float] = None
+        self._lock = threading.Lock()
+    
+    @contextmanager
+    def stage(self, name: str):
+        """Time a block of startup work; safe to use from several threads"""
+        start = time.time()
+        error = None
+        try:
+            yield
+        except Exception as e:
+            error = str(e)
+            raise
+        finally:
+            self.record(name, start, time.time(), error)
+    
+    def record(self, name: str, start: float, end: float, error: Optional[str] = None):
+        """Record a stage whose start and end times were measured elsewhere"""
+        entry = {
+            "stage": name,
+            "start": round(start - self.origin, 4),
+            "duration": round(end - start, 4)
+        }
+        if error:
+            entry["error"] = error
+        with self._lock:
+            self.stages.append(entry)
+    
+    def mark_ready(self):
+        """Record the moment the service became ready to serve"""
+        self.ready_at = time.time()
+    
+    @property
+    def is_ready(self) -> bool:
+        return self.ready_at is not None
+    
+    def report(self) -> Dict[str, Any]:
+        """Startup-time breakdown, stages ordered by start time"""
+        with self._lock:
+            stages = sorted(self.stages, key=lambda s: s["start"])
+        return {
+            "ready": self.is_ready,
+            "time_to_ready": round(self.ready_at - self.origin, 4) if self.ready_at else None,
+            "stages": stages
+        }
@@ -0,0 +1,214 @@
+"""
+Delta Streaming Protocol
+Versioned SSE framing that sends only deltas, with checkpoints, replay and optional compression
+"""
+
+import asyncio
+import json
+import time
+import zlib
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, AsyncIterator
+
+
+STREAM_PROTOCOL_VERSION = 2
+
+
+def _dumps(payload: Dict[str, Any]) -> str:
+    return json.dumps(payload, separators=(",", ":"))
+
+
+def utf16_length(text: str) -> int:
+    """Length of text in UTF-16 code units, as a JavaScript string's .length counts it"""
+    return len(text.encode("utf-16-le")) // 2
+
+
+class DeltaStreamEncoder:
+    """
+    Builds v2 SSE frames for one stream
+    
+    Every frame carries a monotonically increasing sequence number as its
+    SSE id. Chunks only carry the new text; periodic checkpoints carry the
+    total length (in UTF-16 code units, so browsers can compare it with
+    .length) and CRC32 of the text so far so clients can verify their
+    reassembled answer and resume from the last good sequence number.
+    Patches replace a span of the text already sent, as a revision does.
+    """
+    
+    def __init__(self, stream_id: str, checkpoint_every: int = 32):
+        self.stream_id = stream_id
+        self.checkpoint_every = checkpoint_every
+        self.seq = 0
+        self.text = ""
+        self.length = 0
+        self.crc = 0
+        self._deltas_since_checkpoint = 0
+    
+    def frame(self, payload: Dict[str, Any]) -> str:
+        """Assign the next sequence number and render an SSE frame"""
+        self.seq += 1
+        payload["seq"] = self.seq
+        return f"id: {self.seq}\ndata: {_dumps(payload)}\n\n"
+    
+    def start(self, session_id: str) -> str:
+        return self.frame({
+            "type": "start",
+            "v": STREAM_PROTOCOL_VERSION,
+            "session_id": session_id,
+            "stream_id": self.stream_id
+        })
+    
+    def delta(self, text: str) -> List[str]:
+        """Frame a piece of new text, followed by a checkpoint when one is due"""
+        encoded = text.encode("utf-8")
+        self.text += text
+        self.length += utf16_length(text)
+        self.crc = zlib.crc32(encoded, self.crc)
+        frames = [self.frame({"type": "delta", "delta": text})]
+        
+        self._deltas_since_checkpoint += 1
+        if self.checkpoint_every and self._deltas_since_checkpoint >= self.checkpoint_every:
+            frames.append(self.checkpoint())
+        return frames
+    
+    def patch(self, start: int, end: int, text: str) -> List[str]:
+        """
+        Replace text[start:end] of the answer sent so far, followed by a checkpoint
+        
+        start and end index the answer as it stood before this patch in
+        characters (code points); the frame carries them in UTF-16 code
+        units, as JavaScript strings are indexed. start == end inserts.
+        """
+        frame_start, frame_end = utf16_length(self.text[:start]), utf16_length(self.text[:end])
+        self.text = self.text[:start] + text + self.text[end:]
+        self.length = utf16_length(self.text)
+        self.crc = zlib.crc32(self.text.encode("utf-8"))
+        return [
+            self.frame({"type": "patch", "start": frame_start, "end": frame_end, "text": text}),
+            self.checkpoint()
+        ]
+    
+    def draft(self, draft: Dict[str, Any]) -> str:
+        """
+        Provisional answer shown until the real one streams in
+        
+        Draft text is not part of the checkpointed answer; clients replace
+        it with the reassembled deltas once the first delta arrives.
+        """
+        return self.frame({
+            "type": "draft",
+            "label": "Draft",
+            "kind": draft["kind"],
+            "text": draft["text"],
+            "sources": draft.get("sources", [])
+        })
+    
+    def checkpoint(self) -> str:
+        self._deltas_since_checkpoint = 0
+        return self.frame({"type": "checkpoint", "length": self.length, "crc32": self.crc})
+    
+    def done(self, metadata: Dict[str, Any], timestamp: str) -> List[str]:
+        """Final checkpoint and completion frame"""
+        return [
+            self.checkpoint(),
+            self.frame({"type": "done", "metadata": metadata, "timestamp": timestamp})
+        ]
+    
+    def error(self, message: str) -> str:
+        return self.frame({"type": "error", "error": message})
+
+
+class ReplayStream:
+    """Frames of one stream, readable from any sequence number while it is produced"""
+    
+    def __init__(self, stream_id: str):
+        self.stream_id = stream_id
+        self.frames: List[str] = []
+        self.finished = False
+        self.updated_at = time.time()
+        self._changed = asyncio.Condition()
+    
+    async def append(self, frames: List[str]):
+        async with self._changed:
+            self.frames.extend(frames)
+            self.updated_at = time.time()
+            self._changed.notify_all()
+    
+    async def finish(self):
+        async with self._changed:
+            self.finished = True
+            self.updated_at = time.time()
+            self._changed.notify_all()
+    
+    async def read(self, after_seq: int = 0) -> AsyncIterator[str]:
+        """
+        Yield frames with sequence numbers greater than after_seq
+        
+        Sequence numbers start at 1 and match list positions, so resuming
+        is a slice rather than a search.
+        """
+        cursor = max(0, after_seq)
+        while True:
+            async with self._changed:
+                while cursor >= len(self.frames) and not self.finished:
+                    await self._changed.wait()
+                pending = self.frames[cursor:]
+                finished = self.finished
+            for frame in pending:
+                yield frame
+            cursor += len(pending)
+            if finished and cursor >= len(self.frames):
+                return
+
+
+class StreamReplayBuffer:
+    """Bounded, TTL-expiring store of recent streams for Last-Event-ID resume; only finished streams are evicted"""
+    
+    def __init__(self, max_streams: int = 256, ttl_seconds: float = 300.0):
+        self.max_streams = max_streams
+        self.ttl_seconds = ttl_seconds
+        self._streams: "OrderedDict[str, ReplayStream]" = OrderedDict()
+    
+    def create(self, stream_id: str) -> ReplayStream:
+        self._evict()
+        stream = ReplayStream(stream_id)
+        self._streams[stream_id] = stream
+        return stream
+    
+    def get(self, stream_id: str) -> Optional[ReplayStream]:
+        self._evict()
+        return self._streams.get(stream_id)
+    
+    def __len__(self) -> int:
+        return len(self._streams)
+    
+    def _evict(self):
+        now = time.time()
+        expired = [
+            sid for sid, stream in self._streams.items()
+            if stream.finished and now - stream.updated_at > self.ttl_seconds
+        ]
+        for sid in expired:
+            del self._streams[sid]
+        # Over capacity, the oldest finished streams go first; one still producing is never cut off
+        while len(self._streams) >= self.max_streams:
+            oldest = next((sid for sid, stream in self._streams.items() if stream.finished), None)
+            if oldest is None:
+                return
+            del self._streams[oldest]
+
+
+def parse_last_event_id(value: Optional[str]) -> int:
+    """Parse a Last-Event-ID header, treating anything invalid as 'from the start'"""
+    try:
+        return max(0, int(value)) if value else 0
+    except ValueError:
+        return 0
+
+
+async def gzip_stream(frames: AsyncIterator[str]) -> AsyncIterator[bytes]:
+    """Gzip-compress an SSE stream, flushing after every frame so delivery stays incremental"""
+    compressor = zlib.compressobj(wbits=31)
+    async for frame in frames:
+        yield compressor.compress(frame.encode("utf-8")) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
@@ -0,0 +1,80 @@
+"""
+Sub-query Decomposition
+Normalizes analyzer sub-queries, budgets their tool calls and fuses their results into one ranking
+"""
+
+from typing import Dict, Any, List, Tuple
+
+
+TOOL_KEYS = ("needs_corpus_search", "needs_web_search", "needs_arxiv_search", "needs_youtube_search")
+
+# Reciprocal rank fusion constant; larger values flatten the rank bonus
+RRF_K = 60
+
+
+def normalize_sub_queries(raw: Any, max_subqueries: int) -> List[Dict[str, Any]]:
+    """
+    Validate the analyzer's sub_queries list
+    
+    Entries without text or without any tool are dropped, duplicates are
+    removed and the list is cut to max_subqueries. Fewer than two usable
+    sub-queries means the query is not worth decomposing, so [] is returned.
+    """
+    if not isinstance(raw, list):
+        return []
+    
+    sub_queries, seen = [], set()
+    for entry in raw:
+        if not isinstance(entry, dict):
+            continue
+        text = str(entry.get("query", "")).strip()
+        if not text or text.lower() in seen:
+            continue
+        routing = {key: bool(entry.get(key, False)) for key in TOOL_KEYS}
+        if not any(routing.values()):
+            continue
+        seen.add(text.lower())
+        sub_queries.append({"query": text, **routing})
+        if len(sub_queries) >= max_subqueries:
+            break
+    
+    return sub_queries if len(sub_queries) > 1 else []
+
+
+def plan_calls(sub_queries: List[Dict[str, Any]], tool_flags: Dict[str, str], max_calls: int) -> List[Tuple[int, str]]:
+    """
+    (sub-query index, tool) pairs to run, within the upstream call budget
+    
+    Calls are taken round-robin across sub-queries so every part gets its
+    first tool before any part gets a second one.
+    """
+    per_query = [
+        [tool for tool, flag in tool_flags.items() if sub_query.get(flag)]
+        for sub_query in sub_queries
+    ]
+    calls = []
+    for depth in range(len(tool_flags)):
+        for index, tools in enumerate(per_query):
+            if depth < len(tools) and len(calls) < max_calls:
+                calls.append((index, tools[depth]))
+    return calls
+
+
+def fuse_results(ranked_lists: List[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """
+    Merge per-call result lists with reciprocal rank fusion
+    
+    Results seen in several lists (same URL) are kept once and rank higher.
+    Ties keep call order, so earlier sub-queries win.
+    """
+    scores: Dict[str, float] = {}
+    first_seen: Dict[str, Tuple[int, Dict[str, Any]]] = {}
+    for list_index, results in enumerate(ranked_lists):
+        for rank, result in enumerate(results, 1):
+            key = result.get("url") or f"{list_index}:{rank}:{result.get('title', '')}"
+            scores[key] = scores.get(key, 0.0) + 1.0 / (RRF_K + rank)
+            if key not in first_seen:
+                first_seen[key] = (len(first_seen), result)
+    
+    order = sorted(scores, key=lambda key: (-scores[key], first_seen[key][0]))
+    return [first_seen[key][1] for key in order]
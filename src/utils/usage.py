@@ -0,0 +1,323 @@
+"""
+Token and Cost Accounting
+Counts LLM tokens and search calls per request and rolls them up per session and tenant against optional budgets
+"""
+
+import threading
+import time
+from collections import OrderedDict, deque
+from functools import lru_cache
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+from .scheduler import parse_weights
+from .shared_state import SharedState, get_shared_state
+
+
+# USD per 1K (input, output) tokens; TOKEN_PRICES overrides or extends these
+DEFAULT_TOKEN_PRICES = {
+    "gpt-o3": (0.002, 0.008),
+    "gpt-4o": (0.0025, 0.01),
+    "gpt-4o-mini": (0.00015, 0.0006),
+    "gpt-3.5-turbo": (0.0005, 0.0015)
+}
+
+# USD per search call by tool and depth; Tavily bills an advanced search as two credits
+SEARCH_PRICES = {
+    "web_search:advanced": 0.016,
+    "web_search:basic": 0.008
+}
+
+# Chat framing tokens: each message is wrapped in role markers and the reply is primed
+MESSAGE_OVERHEAD_TOKENS = 3
+REPLY_OVERHEAD_TOKENS = 3
+
+# Encoding for models tiktoken does not know by name
+FALLBACK_ENCODING = "o200k_base"
+
+BUDGET_MODES = ("skip_checks", "fallback_model")
+
+
+def parse_prices(spec: str) -> Dict[str, Tuple[float, float]]:
+    """Parse "model=input:output,..." (USD per 1K tokens) over the defaults; malformed entries are ignored"""
+    prices = dict(DEFAULT_TOKEN_PRICES)
+    for entry in (spec or "").split(","):
+        model, _, value = entry.partition("=")
+        input_price, _, output_price = value.partition(":")
+        try:
+            prices[model.strip()] = (float(input_price), float(output_price or input_price))
+        except ValueError:
+            continue
+    return prices
+
+
+@lru_cache(maxsize=16)
+def _encoding(model: str):
+    """tiktoken encoding for a model, or None when tiktoken or its BPE file is unavailable"""
+    try:
+        import tiktoken
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding(FALLBACK_ENCODING)
+    except Exception as e:
+        print(f"Tokenizer unavailable for {model}, estimating tokens from length: {e}")
+        return None
+
+
+def count_tokens(text: str, model: str) -> int:
+    """Tokens in text for a model, or about 4 characters per token without a tokenizer"""
+    text = text or ""
+    encoding = _encoding(model)
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def count_message_tokens(messages: Sequence[Any], model: str) -> int:
+    """Prompt tokens of a chat request, including per-message framing"""
+    return sum(
+        count_tokens(str(getattr(message, "content", message)), model) + MESSAGE_OVERHEAD_TOKENS
+        for message in messages
+    ) + REPLY_OVERHEAD_TOKENS
+
+
+def provider_usage(message: Any) -> Optional[Tuple[int, int]]:
+    """(input, output) tokens the provider reported on a chat result or stream chunk, if any"""
+    usage = getattr(message, "usage_metadata", None)
+    if isinstance(usage, dict) and "input_tokens" in usage:
+        return int(usage["input_tokens"]), int(usage.get("output_tokens", 0))
+    metadata = getattr(message, "response_metadata", None)
+    token_usage = metadata.get("token_usage") if isinstance(metadata, dict) else None
+    if isinstance(token_usage, dict) and "prompt_tokens" in token_usage:
+        return int(token_usage["prompt_tokens"]), int(token_usage.get("completion_tokens", 0))
+    return None
+
+
+def _empty_rollup() -> Dict[str, Any]:
+    return {"requests": 0, "llm_calls": 0, "input_tokens": 0, "output_tokens": 0, "total_tokens": 0, "searches": {}, "cost_usd": 0.0}
+
+
+def _add_summary(rollup: Dict[str, Any], summary: Dict[str, Any]):
+    rollup["requests"] += 1
+    for key in ("llm_calls", "input_tokens", "output_tokens", "total_tokens"):
+        rollup[key] += summary[key]
+    for search, calls in summary["searches"].items():
+        rollup["searches"][search] = rollup["searches"].get(search, 0) + calls
+    rollup["cost_usd"] += summary["cost_usd"]
+
+
+def _rounded(rollup: Dict[str, Any]) -> Dict[str, Any]:
+    return dict(rollup, searches=dict(rollup["searches"]), cost_usd=round(rollup["cost_usd"], 6))
+
+
+class UsageMeter:
+    """
+    Token and search usage of one request
+    
+    Calls are recorded from whichever thread made them (tool threads,
+    speculative prefetch), so every method takes the lock. Provider token
+    counts are used when the response carries them; otherwise prompt and
+    output are counted with the model's tokenizer and the summary is
+    marked estimated.
+    """
+    
+    def __init__(self, prices: Optional[Dict[str, Tuple[float, float]]] = None):
+        self.prices = prices if prices is not None else DEFAULT_TOKEN_PRICES
+        self._lock = threading.Lock()
+        self._nodes: Dict[str, Dict[str, Any]] = {}
+        self._searches: Dict[str, int] = {}
+        self._search_cost = 0.0
+        self._estimated = False
+    
+    def record_llm(self, node: str, model: str, messages: Sequence[Any], result: Any = None,
+                   output_text: Optional[str] = None) -> int:
+        """
+        Record one LLM call made by a graph node; returns its total tokens
+        
+        result is the chat result (or the stream chunk carrying usage);
+        output_text is the generated text when result has none, as for a
+        stream that was stopped early.
+        """
+        counted = provider_usage(result) if result is not None else None
+        estimated = counted is None
+        if estimated:
+            text = output_text if output_text is not None else str(getattr(result, "content", "") or "")
+            counted = (count_message_tokens(messages, model), count_tokens(text, model))
+        input_tokens, output_tokens = counted
+        input_price, output_price = self.prices.get(model, (0.0, 0.0))
+        cost = input_tokens / 1000 * input_price + output_tokens / 1000 * output_price
+        
+        with self._lock:
+            self._estimated = self._estimated or estimated
+            entry = self._nodes.setdefault(node, {"models": [], "calls": 0, "input_tokens": 0, "output_tokens": 0, "cost_usd": 0.0})
+            if model not in entry["models"]:
+                entry["models"].append(model)
+            entry["calls"] += 1
+            entry["input_tokens"] += input_tokens
+            entry["output_tokens"] += output_tokens
+            entry["cost_usd"] += cost
+        return input_tokens + output_tokens
+    
+    def record_search(self, tool: str, search_depth: Optional[str] = None):
+        """Record one upstream search call"""
+        key = f"{tool}:{search_depth}" if search_depth else tool
+        with self._lock:
+            self._searches[key] = self._searches.get(key, 0) + 1
+            self._search_cost += SEARCH_PRICES.get(key, 0.0)
+    
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            by_node = {node: dict(entry, models=list(entry["models"]), cost_usd=round(entry["cost_usd"], 6)) for node, entry in self._nodes.items()}
+            input_tokens = sum(entry["input_tokens"] for entry in self._nodes.values())
+            output_tokens = sum(entry["output_tokens"] for entry in self._nodes.values())
+            return {
+                "llm_calls": sum(entry["calls"] for entry in self._nodes.values()),
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens,
+                "searches": dict(self._searches),
+                "cost_usd": round(sum(entry["cost_usd"] for entry in self._nodes.values()) + self._search_cost, 6),
+                "by_node": by_node,
+                "estimated": self._estimated
+            }
+
+
+class UsageLedger:
+    """
+    Usage rolled up per tenant and session, with per-tenant spending budgets
+    
+    Budgets are in USD over a sliding window. A tenant past degrade_at of
+    its budget loses the helpfulness check and regenerations; past the
+    whole budget its analyzer and responder also switch to the fallback
+    model. Requests are never refused. With a SharedState, window spending
+    is kept there so every worker enforces the same budget; otherwise it is
+    tracked per process. Rollups stay per process, and the least recently
+    active tenants and sessions are dropped past max_entries.
+    """
+    
+    def __init__(self, default_budget: float = 0.0, budgets: Optional[Dict[str, float]] = None,
+                 window_seconds: float = 3600.0, degrade_at: float = 0.8, max_entries: int = 1000,
+                 shared: Optional[SharedState] = None):
+        self.default_budget = default_budget
+        self.budgets = budgets or {}
+        self.window_seconds = window_seconds
+        self.degrade_at = degrade_at
+        self.max_entries = max_entries
+        self.shared = shared
+        self._lock = threading.Lock()
+        self._totals = _empty_rollup()
+        self._by_node: Dict[str, Dict[str, Any]] = {}
+        self._tenants: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._sessions: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._spend: Dict[str, deque] = {}
+        self._degraded: Dict[str, int] = {mode: 0 for mode in BUDGET_MODES}
+    
+    def limit(self, tenant: str) -> float:
+        return self.budgets.get(tenant, self.default_budget)
+    
+    def budget_mode(self, tenant: str) -> Optional[str]:
+        """None within budget, else the degradation the tenant's next request runs with"""
+        limit = self.limit(tenant)
+        if limit <= 0:
+            return None
+        with self._lock:
+            spent = self._window_spend(tenant)
+            if spent >= limit:
+                mode = "fallback_model"
+            elif spent >= self.degrade_at * limit:
+                mode = "skip_checks"
+            else:
+                return None
+            self._degraded[mode] += 1
+            return mode
+    
+    def record(self, summary: Dict[str, Any], tenant: str, session_id: str):
+        """Add one request's usage summary to its tenant and session"""
+        with self._lock:
+            _add_summary(self._totals, summary)
+            for node, entry in summary["by_node"].items():
+                rollup = self._by_node.setdefault(node, {"calls": 0, "input_tokens": 0, "output_tokens": 0, "cost_usd": 0.0})
+                for key in rollup:
+                    rollup[key] += entry[key]
+            for key, entries in ((tenant, self._tenants), (session_id, self._sessions)):
+                rollup = entries.pop(key, None) or _empty_rollup()
+                _add_summary(rollup, summary)
+                entries[key] = rollup
+                while len(entries) > self.max_entries:
+                    dropped, _ = entries.popitem(last=False)
+                    if entries is self._tenants:
+                        self._spend.pop(dropped, None)
+            if summary["cost_usd"] and self.shared is None:
+                self._spend.setdefault(tenant, deque()).append((time.monotonic(), summary["cost_usd"]))
+        if summary["cost_usd"] and self.shared is not None:
+            try:
+                self.shared.add_spend(tenant, summary["cost_usd"], self.window_seconds)
+            except Exception as e:
+                print(f"Usage ledger shared state error: {e}")
+    
+    def session(self, session_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            rollup = self._sessions.get(session_id)
+            return _rounded(rollup) if rollup is not None else None
+    
+    def tenant(self, tenant: str) -> Dict[str, Any]:
+        """A tenant's usage with its budget and current window spend"""
+        with self._lock:
+            rollup = self._tenants.get(tenant)
+            return self._tenant_stats(tenant, rollup or _empty_rollup())
+    
+    def stats(self, include_tenants: bool = True) -> Dict[str, Any]:
+        """Totals per node and overall; the per-tenant breakdown only with include_tenants"""
+        with self._lock:
+            stats = {
+                "totals": _rounded(self._totals),
+                "by_node": {node: dict(entry, cost_usd=round(entry["cost_usd"], 6)) for node, entry in self._by_node.items()},
+                "tenant_count": len(self._tenants),
+                "sessions": len(self._sessions),
+                "degraded_requests": dict(self._degraded),
+                "budget_window_seconds": self.window_seconds
+            }
+            if include_tenants:
+                stats["tenants"] = {tenant: self._tenant_stats(tenant, rollup) for tenant, rollup in self._tenants.items()}
+            return stats
+    
+    def _tenant_stats(self, tenant: str, rollup: Dict[str, Any]) -> Dict[str, Any]:
+        limit = self.limit(tenant)
+        return dict(_rounded(rollup), budget_usd=limit or None, window_spend_usd=round(self._window_spend(tenant), 6))
+    
+    def _window_spend(self, tenant: str) -> float:
+        if self.shared is not None:
+            try:
+                return self.shared.window_spend(tenant, self.window_seconds)
+            except Exception as e:
+                print(f"Usage ledger shared state error: {e}")
+                return 0.0
+        spend = self._spend.get(tenant)
+        if not spend:
+            return 0.0
+        cutoff = time.monotonic() - self.window_seconds
+        while spend and spend[0][0] < cutoff:
+            spend.popleft()
+        return sum(cost for _, cost in spend)
+
+
+_ledger: Optional[UsageLedger] = None
+_ledger_lock = threading.Lock()
+
+
+def get_usage_ledger(config=None) -> UsageLedger:
+    """Return the process-wide usage ledger, configured from AppConfig on first use"""
+    global _ledger
+    with _ledger_lock:
+        if _ledger is None:
+            if config is not None:
+                _ledger = UsageLedger(
+                    default_budget=config.tenant_budget_usd,
+                    budgets=parse_weights(config.tenant_budgets),
+                    window_seconds=config.budget_window_seconds,
+                    degrade_at=config.budget_degrade_at,
+                    shared=get_shared_state(config)
+                )
+            else:
+                _ledger = UsageLedger()
+        return _ledger
@@ -0,0 +1,10 @@
+"""
+Shared test setup
+"""
+
+import os
+import sys
+
+# Agent and tool modules import each other as top-level packages (tools.*, utils.*),
+# the same way backend/main.py arranges the path
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(__file__)), 'src'))
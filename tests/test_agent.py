@@ -0,0 +1,527 @@
+"""
+Test agent workflow
+"""
+
+import json
+import threading
+import pytest
+from unittest.mock import Mock
+from src.agents.langgraph_agent import LangGraphAgent
+from src.utils.config import AppConfig
+from src.utils.model_cascade import parse_cascade
+from src.utils.draft_answer import DraftPolicy
+from tools.helpfulness_checker import Critique
+from utils.flight_recorder import get_flight_recorder
+import utils.hot_queries as hot_queries_module
+from utils.hot_queries import PRECOMPUTE_TENANT, HotQueryPrecomputer
+from utils.revision import apply_patches
+from utils.run_control import RunControl
+from utils.search_results import SearchResult
+from utils.usage import get_usage_ledger
+
+
+def make_agent():
+    """Agent with mocked LLM and search tools"""
+    agent = LangGraphAgent(AppConfig(), openai_api_key="test-key", tavily_api_key="test-key")
+    agent.llm = Mock()
+    # The analyzer streams; by default its output arrives as one chunk from the mocked invoke
+    agent.llm.stream.side_effect = lambda messages: iter([agent.llm.invoke(messages)])
+    agent.helpfulness_checker = Mock()
+    agent.helpfulness_checker.evaluate.return_value = 0.9
+    # The agent asks for critiques; by default they carry the evaluate mock's score and nothing specific
+    agent.helpfulness_checker.critique.side_effect = lambda query, response, on_usage=None: Critique(
+        score=agent.helpfulness_checker.evaluate(query, response, on_usage=on_usage)
+    )
+    agent._tavily_tool = Mock()
+    agent._arxiv_tool = Mock()
+    agent._youtube_tool = Mock()
+    agent._tavily_tool.search_with_answer.return_value = {
+        "results": [
+            {"title": "Paris - Wikipedia", "url": "https://en.wikipedia.org/wiki/Paris", "content": "Paris is the capital of France.", "source": "web"}
+        ],
+        "answer": None
+    }
+    agent._arxiv_tool.search.return_value = []
+    agent._youtube_tool.search.return_value = []
+    return agent
+
+
+class TestLangGraphAgent:
+    """Test end-to-end query processing with mocked dependencies"""
+    
+    def test_process_query_with_web_search(self):
+        """Test analyzer routing, tool calls and response metadata"""
+        agent = make_agent()
+        agent.llm.invoke.side_effect = [
+            Mock(content='{"needs_web_search": true, "needs_arxiv_search": false, "needs_youtube_search": false, "reasoning": "factual"}'),
+            Mock(content="The capital of France is Paris.")
+        ]
+        
+        result = agent.process_query("what is the capital of France")
+        
+        assert result["response"] == "The capital of France is Paris."
+        assert result["tools_used"] == ["web_search"]
+        assert result["metadata"]["helpfulness_score"] == 0.9
+        assert "web_search" in result["metadata"]["tool_latencies"]
+        search_kwargs = agent._tavily_tool.search_with_answer.call_args.kwargs
+        assert search_kwargs["search_depth"] in ("advanced", "basic")
+    
+    def test_speculative_prefetch_is_reused(self):
+        """Test a predicted tool is fetched once and its result claimed by the tool caller"""
+        agent = make_agent()
+        agent.config.speculative_tools = True
+        agent.llm.invoke.side_effect = [
+            Mock(content='{"needs_web_search": true, "needs_arxiv_search": false, "needs_youtube_search": false, "reasoning": "factual"}'),
+            Mock(content="The capital of France is Paris.")
+        ]
+        
+        result = agent.process_query("what is the capital of France")
+        
+        assert result["tools_used"] == ["web_search"]
+        assert agent._tavily_tool.search_with_answer.call_count == 1
+        assert agent._arxiv_tool.search.call_count == 0
+    
+    def test_cascade_escalates_on_low_helpfulness(self):
+        """Test the cheap tier answers first and the strong tier takes over on a low score"""
+        agent = make_agent()
+        agent.responder_tiers = parse_cascade("cheap:5,strong:30", default_model="strong")
+        cheap, strong = Mock(), Mock()
+        agent.responder_llms = [cheap, strong]
+        agent.llm.invoke.return_value = Mock(content='{"needs_web_search": false, "needs_arxiv_search": false, "needs_youtube_search": false, "reasoning": "chat"}')
+        cheap.invoke.return_value = Mock(content="Paris is the capital city of France, on the Seine.")
+        strong.invoke.return_value = Mock(content="Paris is the capital of France and its largest city.")
+        agent.helpfulness_checker.evaluate.side_effect = [0.2, 0.9]
+        
+        result = agent.process_query("capital of France?")
+        
+        assert result["response"] == "Paris is the capital of France and its largest city."
+        assert result["metadata"]["model"] == "strong"
+        assert result["metadata"]["escalations"] == ["low_helpfulness"]
+        assert cheap.invoke.call_count == 1
+    
+    def test_cascade_skips_check_for_unconfident_answer(self):
+        """Test a hedging cheap answer escalates without a helpfulness call"""
+        agent = make_agent()
+        agent.responder_tiers = parse_cascade("cheap,strong", default_model="strong")
+        cheap, strong = Mock(), Mock()
+        agent.responder_llms = [cheap, strong]
+        agent.llm.invoke.return_value = Mock(content='{"needs_web_search": false, "needs_arxiv_search": false, "needs_youtube_search": false, "reasoning": "chat"}')
+        cheap.invoke.return_value = Mock(content="I'm not sure.")
+        strong.invoke.return_value = Mock(content="Paris is the capital of France and its largest city.")
+        
+        result = agent.process_query("capital of France?")
+        
+        assert result["metadata"]["escalations"] == ["low_confidence"]
+        assert agent.helpfulness_checker.evaluate.call_count == 1
+    
+    def test_cascade_escalates_on_responder_error(self):
+        """Test a failing cheap tier hands over to the next tier and usage accumulates across passes"""
+        agent = make_agent()
+        agent.responder_tiers = parse_cascade("cheap,strong", default_model="strong")
+        cheap, strong = Mock(), Mock()
+        agent.responder_llms = [cheap, strong]
+        agent.llm.invoke.return_value = Mock(content='{"needs_web_search": false, "needs_arxiv_search": false, "needs_youtube_search": false, "reasoning": "chat"}')
+        cheap.invoke.side_effect = TimeoutError("tier timed out")
+        strong.invoke.return_value = Mock(content="Paris is the capital of France and its largest city.")
+        
+        result = agent.process_query("capital of France?")
+        trace = get_flight_recorder().get(result["metadata"]["trace_id"])
+        
+        assert result["response"] == "Paris is the capital of France and its largest city."
+        assert result["metadata"]["escalations"] == ["error"]
+        assert [call["model"] for call in trace["responder_calls"]] == ["cheap", "strong"]
+    
+    def test_draft_answer_is_emitted_and_can_skip_responder(self):
+        """Test the web search answer is streamed as a draft and accepted for short factual queries"""
+        agent = make_agent()
+        agent.draft_policy = DraftPolicy(mode="factual")
+        agent._tavily_tool.search_with_answer.return_value["answer"] = "Paris is the capital and most populous city of France."
+        agent.llm.invoke.return_value = Mock(content='{"needs_web_search": true, "needs_arxiv_search": false, "needs_youtube_search": false, "reasoning": "factual"}')
+        drafts = []
+        
+        result = agent.process_query("what is the capital of France", on_draft=drafts.append)
+        
+        assert drafts[0]["kind"] == "answer"
+        assert result["response"] == "Paris is the capital and most populous city of France."
+        assert result["metadata"]["draft_accepted"] is True
+        assert agent.llm.invoke.call_count == 1  # analyzer only
+        agent.helpfulness_checker.evaluate.assert_not_called()
+    
+    def test_compound_query_is_decomposed(self):
+        """Test sub-queries are routed separately and their results merged"""
+        agent = make_agent()
+        agent.config.subquery_decomposition = True
+        agent._youtube_tool.search.return_value = [
+            {"title": "Z tutorial", "url": "https://youtube.com/watch?v=z", "type": "youtube"}
+        ]
+        agent.llm.invoke.side_effect = [
+            Mock(content=json.dumps({
+                "needs_web_search": True, "needs_arxiv_search": False, "needs_youtube_search": False,
+                "reasoning": "compound",
+                "sub_queries": [
+                    {"query": "compare X and Y", "needs_web_search": True},
+                    {"query": "tutorial for Z", "needs_youtube_search": True}
+                ]
+            })),
+            Mock(content="X and Y differ; see the Z tutorial.")
+        ]
+        
+        result = agent.process_query("compare X and Y and show me a tutorial for Z")
+        
+        assert result["metadata"]["sub_queries"] == ["compare X and Y", "tutorial for Z"]
+        assert set(result["tools_used"]) == {"web_search", "youtube_search"}
+        assert agent._tavily_tool.search_with_answer.call_args.args[0] == "compare X and Y"
+        assert agent._youtube_tool.search.call_args.args[0] == "tutorial for Z"
+        assert result["search_results"] == 2
+    
+    def test_request_trace_is_recorded(self):
+        """Test node spans, routing and responder sizes reach the flight recorder"""
+        agent = make_agent()
+        agent.llm.invoke.side_effect = [
+            Mock(content='{"needs_web_search": true, "needs_arxiv_search": false, "needs_youtube_search": false, "reasoning": "factual"}'),
+            Mock(content="The capital of France is Paris.")
+        ]
+        
+        result = agent.process_query("what is the capital of France")
+        trace = get_flight_recorder().get(result["metadata"]["trace_id"])
+        
+        assert [span["name"] for span in trace["spans"]] == ["analyzer", "tool_caller", "responder", "helpfulness_checker"]
+        assert trace["routing"]["needs_web_search"] is True
+        assert trace["responder_calls"][0]["response_chars"] == len("The capital of France is Paris.")
+    
+    def test_hot_query_is_served_from_precomputed_answer(self, monkeypatch):
+        """Test a hot query is precomputed in the background and then answered without the graph"""
+        agent = make_agent()
+        agent.config.hot_query_precompute = True
+        routing = Mock(content='{"needs_web_search": true, "needs_arxiv_search": false, "needs_youtube_search": false, "reasoning": "factual"}')
+        agent.llm.invoke.side_effect = [routing, Mock(content="Paris."), routing, Mock(content="Paris is the capital of France.")]
+        # A private precomputer, so its answers do not leak into other tests through the singleton
+        hot_queries = HotQueryPrecomputer(min_hits=1)
+        monkeypatch.setattr(hot_queries_module, "_precomputer", hot_queries)
+        
+        agent.process_query("What is the capital of France?")
+        assert hot_queries.refresh_once(agent.precompute) == 1
+        calls = agent.llm.invoke.call_count
+        result = agent.process_query("what is the capital of  France", session_id="s1")
+        
+        assert agent.llm.invoke.call_count == calls
+        assert result["response"] == "Paris is the capital of France."
+        assert result["metadata"]["precomputed"] is True
+        assert result["metadata"]["session_id"] == "s1"
+        
+        # Callers paying with their own keys always get a run of their own
+        agent.llm.invoke.side_effect = [routing, Mock(content="Paris, on the Seine.")]
+        result = agent.process_query("what is the capital of France", use_precomputed=False)
+        assert result["response"] == "Paris, on the Seine."
+    
+    def test_cancelled_run_stops_at_next_node(self):
+        """Test cancelling during the analyzer skips the searches and the responder"""
+        agent = make_agent()
+        # Otherwise the decoded web flag starts its search before the analyzer returns
+        agent.config.early_tool_dispatch = False
+        control = RunControl()
+        
+        def analyze(messages):
+            control.cancel()
+            return Mock(content='{"needs_web_search": true, "needs_arxiv_search": false, "needs_youtube_search": false, "reasoning": "factual"}')
+        
+        agent.llm.invoke.side_effect = analyze
+        result = agent.process_query("what is the capital of France", control=control)
+        
+        assert result["metadata"]["cancelled"] is True
+        assert agent.llm.invoke.call_count == 1
+        agent._tavily_tool.search_with_answer.assert_not_called()
+    
+    def test_follow_up_reaches_responder_and_check_can_be_skipped(self):
+        """Test a follow-up sent mid-run is answered and the helpfulness check is skipped on request"""
+        agent = make_agent()
+        control = RunControl(skip_helpfulness=True)
+        
+        replies = [
+            Mock(content='{"needs_web_search": true, "needs_arxiv_search": false, "needs_youtube_search": false, "reasoning": "factual"}'),
+            Mock(content="Paris, with about 2.1 million people.")
+        ]
+        
+        def invoke(messages):
+            if len(replies) == 2:
+                # Arrives while the analyzer is running
+                control.add_follow_up("and its population?")
+            return replies.pop(0)
+        
+        agent.llm.invoke.side_effect = invoke
+        result = agent.process_query("what is the capital of France", control=control)
+        
+        assert "and its population?" in agent.llm.invoke.call_args_list[1][0][0][1].content
+        assert result["metadata"]["follow_ups"] == ["and its population?"]
+        assert result["metadata"]["helpfulness_score"] is None
+        agent.helpfulness_checker.evaluate.assert_not_called()
+        assert control.add_follow_up("too late") is False
+    
+    def test_follow_up_passes_stop_at_max_revisions(self):
+        """Test a stream of follow-ups gets at most MAX_REVISIONS extra passes, then the rest are reported unanswered"""
+        agent = make_agent()
+        agent.config.max_revisions = 2
+        control = RunControl(skip_helpfulness=True)
+        sent = []
+        
+        def invoke(messages):
+            if "Analyze this user query" in messages[0].content:
+                return Mock(content='{"needs_web_search": false, "needs_arxiv_search": false, "needs_youtube_search": false, "reasoning": "chat"}')
+            # Every responder pass brings another follow-up
+            sent.append(f"and {len(sent)}?")
+            control.add_follow_up(sent[-1])
+            return Mock(content=f"Answer {len(sent)}")
+        
+        agent.llm.invoke.side_effect = invoke
+        result = agent.process_query("tell me about Paris", control=control)
+        
+        assert result["response"] == "Answer 3"
+        assert result["metadata"]["follow_ups"] == sent[:2]
+        assert result["metadata"]["follow_ups_unanswered"] == sent[2:]
+    
+    def test_progressive_responder_starts_before_slow_tool(self):
+        """Test the responder runs on the web results while ArXiv is still searching"""
+        agent = make_agent()
+        agent.config.progressive_generation = True
+        agent.config.progressive_min_results = 1
+        responder_started = threading.Event()
+        
+        def slow_arxiv(query, **kwargs):
+            assert responder_started.wait(5)
+            return [{"title": "Attention Is All You Need", "url": "http://arxiv.org/abs/1706.03762", "summary": "Transformers.", "source": "arxiv"}]
+        
+        def respond(messages):
+            responder_started.set()
+            return Mock(content="Transformers replaced recurrence.")
+        
+        routing = Mock(content='{"needs_web_search": true, "needs_arxiv_search": true, "needs_youtube_search": false, "reasoning": "research"}')
+        agent._arxiv_tool.search.side_effect = slow_arxiv
+        agent.llm.invoke.side_effect = lambda messages: routing if agent.llm.invoke.call_count == 1 else respond(messages)
+        
+        result = agent.process_query("research on transformer attention")
+        
+        assert "Attention Is All You Need" not in agent.llm.invoke.call_args_list[1][0][0][1].content
+        assert result["response"].startswith("Transformers replaced recurrence.\n\n**Additional sources**")
+        assert "http://arxiv.org/abs/1706.03762" in result["response"]
+        assert result["metadata"]["late_results"] == 1
+        assert result["metadata"]["tools_used"] == ["web_search", "arxiv_search"]
+        assert any(source["type"] == "arxiv" for source in result["metadata"]["sources"])
+    
+    def test_progressive_answer_is_announced_before_late_results(self):
+        """Test the answer reaches on_answer while ArXiv is still searching and its section follows as a patch"""
+        agent = make_agent()
+        agent.config.progressive_generation = True
+        agent.config.progressive_min_results = 1
+        answers = []
+        announced = threading.Event()
+        
+        def slow_arxiv(query, **kwargs):
+            assert announced.wait(5)
+            return [{"title": "Attention Is All You Need", "url": "http://arxiv.org/abs/1706.03762", "summary": "Transformers.", "source": "arxiv"}]
+        
+        def on_answer(text):
+            answers.append(text)
+            announced.set()
+        
+        routing = Mock(content='{"needs_web_search": true, "needs_arxiv_search": true, "needs_youtube_search": false, "reasoning": "research"}')
+        agent._arxiv_tool.search.side_effect = slow_arxiv
+        agent.llm.invoke.side_effect = lambda messages: routing if agent.llm.invoke.call_count == 1 else Mock(content="Transformers replaced recurrence.")
+        
+        result = agent.process_query("research on transformer attention", on_answer=on_answer)
+        
+        assert answers[0] == "Transformers replaced recurrence."
+        assert apply_patches(answers[0], result["revisions"]) == result["response"]
+        assert result["revisions"][0]["start"] == len(answers[0])
+        assert "http://arxiv.org/abs/1706.03762" in result["revisions"][0]["text"]
+    
+    def test_analyzer_flags_start_tools_before_reasoning_finishes(self):
+        """Test a decoded needs_web_search flag dispatches the search while the analyzer is still streaming"""
+        agent = make_agent()
+        agent.llm.invoke.return_value = Mock(content="The capital of France is Paris.")
+        searched = threading.Event()
+        agent._tavily_tool.search_with_answer.side_effect = lambda *args, **kwargs: searched.set() or {
+            "results": [{"title": "Paris", "url": "https://example.com/paris", "content": "Paris is the capital."}], "answer": None
+        }
+        
+        def analyzer_stream(messages):
+            yield Mock(content='```json\n{"needs_web_search": true, "needs_arxiv')
+            yield Mock(content='_search": false, "needs_youtube_search": false, ')
+            assert searched.wait(5)
+            yield Mock(content='"reasoning": "factual lookup"}\n```')
+        
+        agent.llm.stream.side_effect = analyzer_stream
+        result = agent.process_query("what is the capital of France")
+        
+        assert agent._tavily_tool.search_with_answer.call_count == 1
+        assert set(result["metadata"]["early_dispatch"]) == {"web_search"}
+        assert result["metadata"]["tools_used"] == ["web_search"]
+    
+    def test_malformed_analyzer_output_fails_fast(self):
+        """Test a malformed flag stops the analyzer stream and falls back to the keyword heuristic"""
+        agent = make_agent()
+        agent.llm.invoke.return_value = Mock(content="An answer.")
+        consumed = []
+        
+        def analyzer_stream(messages):
+            for chunk in ['{"needs_web_search": maybe, ', '"reasoning": "', "never read", '"}']:
+                consumed.append(chunk)
+                yield Mock(content=chunk)
+        
+        agent.llm.stream.side_effect = analyzer_stream
+        result = agent.process_query("research papers on attention")
+        trace = get_flight_recorder().get(result["metadata"]["trace_id"])
+        
+        assert consumed == ['{"needs_web_search": maybe, ']
+        assert trace["routing"]["reasoning"].startswith("Fallback analysis due to error: Unexpected 'm'")
+        assert trace["routing"]["needs_arxiv_search"] is True
+    
+    def test_usage_is_accounted_per_node_and_tenant(self):
+        """Test every LLM call and search is counted, preferring provider usage, and charged to the tenant"""
+        agent = make_agent()
+        answer = Mock(content="Paris is the capital of France.", usage_metadata={"input_tokens": 120, "output_tokens": 8})
+        agent.llm.invoke.side_effect = lambda messages: answer if "Query:" in messages[1 % len(messages)].content else Mock(
+            content='{"needs_web_search": true, "needs_arxiv_search": false, "needs_youtube_search": false, "reasoning": "fact"}'
+        )
+        
+        def evaluate(query, response, on_usage=None):
+            on_usage("gpt-3.5-turbo", [], Mock(usage_metadata={"input_tokens": 200, "output_tokens": 3}))
+            return 0.9
+        
+        agent.helpfulness_checker.evaluate.side_effect = evaluate
+        result = agent.process_query("what is the capital of France", session_id="usage-session", tenant="key:usage-test")
+        usage = result["metadata"]["usage"]
+        
+        assert usage["by_node"]["responder"]["input_tokens"] == 120
+        assert usage["by_node"]["helpfulness_checker"]["models"] == ["gpt-3.5-turbo"]
+        assert usage["by_node"]["analyzer"]["output_tokens"] > 0
+        assert usage["searches"] == {"web_search:advanced": 1}
+        assert usage["llm_calls"] == 3
+        assert get_usage_ledger().stats()["tenants"]["key:usage-test"]["cost_usd"] == usage["cost_usd"]
+        assert get_usage_ledger().session("usage-session")["total_tokens"] == usage["total_tokens"]
+    
+    def test_tenant_over_budget_uses_fallback_model_without_checks(self):
+        """Test a tenant past its budget skips the helpfulness check and answers with the fallback model"""
+        agent = make_agent()
+        routing = Mock(content='{"needs_web_search": false, "needs_arxiv_search": false, "needs_youtube_search": false, "reasoning": "chat"}')
+        agent._fallback_llm = Mock()
+        agent._fallback_llm.stream.side_effect = lambda messages: iter([routing])
+        agent._fallback_llm.invoke.return_value = Mock(content="Hello!")
+        ledger = get_usage_ledger()
+        ledger.budgets["key:over-budget"] = 0.01
+        ledger.record({"llm_calls": 1, "input_tokens": 1, "output_tokens": 1, "total_tokens": 2, "searches": {},
+                       "cost_usd": 0.02, "by_node": {}}, "key:over-budget", "over-budget-session")
+        
+        result = agent.process_query("hi", tenant="key:over-budget")
+        
+        assert result["response"] == "Hello!"
+        assert result["metadata"]["budget_mode"] == "fallback_model"
+        assert result["metadata"]["model"] == agent.config.budget_fallback_model
+        agent.llm.stream.assert_not_called()
+        agent.llm.invoke.assert_not_called()
+        agent.helpfulness_checker.evaluate.assert_not_called()
+    
+    def test_precompute_has_its_own_tenant_and_no_spending_budget(self):
+        """Test background precomputation is charged to its own tenant and never degraded by a budget"""
+        agent = make_agent()
+        agent.llm.invoke.side_effect = lambda messages: Mock(content="Hello!") if "Query:" in messages[1 % len(messages)].content else Mock(
+            content='{"needs_web_search": false, "needs_arxiv_search": false, "needs_youtube_search": false, "reasoning": "chat"}'
+        )
+        ledger = get_usage_ledger()
+        ledger.budgets[PRECOMPUTE_TENANT] = 0.01
+        ledger.record({"llm_calls": 1, "input_tokens": 1, "output_tokens": 1, "total_tokens": 2, "searches": {},
+                       "cost_usd": 0.02, "by_node": {}}, PRECOMPUTE_TENANT, "precompute")
+        requests = ledger.tenant(PRECOMPUTE_TENANT)["requests"]
+        
+        result = agent.precompute("hi")
+        
+        assert result["metadata"]["budget_mode"] is None
+        assert ledger.tenant(PRECOMPUTE_TENANT)["requests"] == requests + 1
+        agent.helpfulness_checker.evaluate.assert_called_once()
+    
+    def test_corpus_search_routed_when_index_configured(self, tmp_path):
+        """Test the analyzer can route to the local corpus and its results lead the context"""
+        from tools.corpus_index import CorpusIndex
+        docs = tmp_path / "docs"
+        docs.mkdir()
+        (docs / "oncall.md").write_text("# Oncall Policy\n\nThe primary oncall engineer must acknowledge pages within 5 minutes.\n")
+        CorpusIndex(str(tmp_path / "index")).build([str(docs)])
+        
+        agent = make_agent()
+        agent.config.corpus_index_dir = str(tmp_path / "index")
+        agent.llm.invoke.side_effect = lambda messages: Mock(
+            content='{"needs_corpus_search": true, "needs_web_search": false, "needs_arxiv_search": false, "needs_youtube_search": false, "reasoning": "internal"}'
+        ) if "Analyze this user query" in messages[0].content else Mock(content="Within 5 minutes.")
+        result = agent.process_query("how fast must oncall acknowledge pages")
+        
+        assert "needs_corpus_search" in agent.llm.invoke.call_args_list[0][0][0][0].content
+        assert result["metadata"]["tools_used"] == ["corpus_search"]
+        assert result["metadata"]["sources"][0]["type"] == "corpus"
+        assert "within 5 minutes" in agent.llm.invoke.call_args_list[1][0][0][1].content
+        agent._tavily_tool.search_with_answer.assert_not_called()
+    
+    def test_corpus_flag_ignored_without_index(self):
+        """Test a corpus flag from the analyzer is dropped when no corpus is configured"""
+        agent = make_agent()
+        agent.llm.invoke.side_effect = lambda messages: Mock(
+            content='{"needs_corpus_search": true, "needs_web_search": false, "needs_arxiv_search": false, "needs_youtube_search": false, "reasoning": "chat"}'
+        ) if "Analyze this user query" in messages[0].content else Mock(content="Hello!")
+        result = agent.process_query("hi")
+        
+        assert "needs_corpus_search" not in agent.llm.invoke.call_args_list[0][0][0][0].content
+        assert result["metadata"]["tools_used"] == []
+    
+    def test_low_score_patches_weak_parts(self):
+        """Test a low helpfulness score leads to a targeted revision merged as patches, not a rewrite"""
+        agent = make_agent()
+        agent.helpfulness_checker.critique.side_effect = [
+            Critique(score=0.2, weak_parts=[{"quote": "Paris is big.", "problem": "vague"}]),
+            Critique(score=0.9)
+        ]
+        agent.llm.invoke.side_effect = [
+            Mock(content='{"needs_web_search": false, "needs_arxiv_search": false, "needs_youtube_search": false, "reasoning": "factual"}'),
+            Mock(content="The capital of France is Paris. Paris is big."),
+            Mock(content='{"edits": [{"find": "Paris is big.", "replace": "It has about 2.1 million residents."}], "addendum": ""}')
+        ]
+        answers = []
+        
+        result = agent.process_query("tell me about the capital of France", on_answer=answers.append)
+        
+        assert result["response"] == "The capital of France is Paris. It has about 2.1 million residents."
+        assert result["revisions"] == [{"start": 32, "end": 45, "text": "It has about 2.1 million residents."}]
+        assert result["metadata"]["revisions"] == 1
+        assert result["metadata"]["helpfulness_score"] == 0.9
+        assert answers[0] == "The capital of France is Paris. Paris is big."
+        assert "Current answer:" in agent.llm.invoke.call_args_list[2][0][0][1].content
+    
+    def test_revisions_stop_at_the_limit(self):
+        """Test persistently low scores end after max_revisions, rewriting when nothing specific was named"""
+        agent = make_agent()
+        agent.helpfulness_checker.evaluate.return_value = 0.1
+        agent.llm.invoke.side_effect = [
+            Mock(content='{"needs_web_search": false, "needs_arxiv_search": false, "needs_youtube_search": false, "reasoning": "chat"}')
+        ] + [Mock(content="Hello!")] * 5
+        
+        result = agent.process_query("hi")
+        
+        assert result["response"] == "Hello!"
+        assert agent.helpfulness_checker.critique.call_count == agent.config.max_revisions + 1
+        assert agent.llm.invoke.call_count == agent.config.max_revisions + 2
+        assert result["revisions"] == []
+    
+    def test_result_utility_counts_only_results_the_responder_saw(self):
+        """Test utility is recorded per tool over context results, with no citation signal when nothing is cited"""
+        agent = make_agent()
+        agent.result_policy = Mock()
+        web = [SearchResult("web_search", f"Web result number {i}", f"https://example.com/{i}", "text", score=0.9) for i in range(5)]
+        papers = [SearchResult("arxiv_search", f"Paper number {i}", f"http://arxiv.org/abs/{i}", "text") for i in range(3)]
+        plan = {"query_class": "general", "web_search": {"max_results": 5}, "arxiv_search": {"max_results": 5}}
+        state = {"fetch_plan": plan, "search_results": web + papers, "tools_used": ["web_search", "arxiv_search"], "response": "See [2]."}
+        
+        agent._record_result_utility(state)
+        state["response"] = "An answer with no references."
+        agent._record_result_utility(state)
+        
+        cited, uncited = agent.result_policy.record.call_args_list
+        assert cited.args[1] == "web_search" and cited.kwargs["seen"] == 5
+        assert cited.kwargs["used_ranks"] == [2] and cited.kwargs["cited"] == 1
+        assert uncited.kwargs["used_ranks"] == [1, 2, 3, 4, 5] and uncited.kwargs["cited"] is None
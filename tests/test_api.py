@@ -0,0 +1,267 @@
+"""
+Test backend API endpoints
+"""
+
+import asyncio
+import json
+import time
+import zlib
+import pytest
+from unittest.mock import Mock
+from fastapi.testclient import TestClient
+
+import backend.main as backend
+from utils.affinity import affinity_token, routing_key
+from utils.hot_queries import HotQueryPrecomputer
+from utils.usage import UsageMeter
+
+REAL_SLEEP = asyncio.sleep
+
+
+@pytest.fixture
+def client(monkeypatch):
+    """API client backed by a mocked default agent"""
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    monkeypatch.delenv("TAVILY_API_KEY", raising=False)
+    # Skip streaming delays but still yield, which the WebSocket test transport relies on
+    monkeypatch.setattr(backend.asyncio, "sleep", Mock(side_effect=lambda *_: REAL_SLEEP(0)))
+    agent = Mock()
+    agent.process_query.return_value = {
+        "response": "Paris is the capital of France.",
+        "metadata": {"tools_used": ["web_search"]}
+    }
+    monkeypatch.setattr(backend, "agent", agent)
+    with TestClient(backend.app) as test_client:
+        yield test_client
+
+
+def read_events(text):
+    return [json.loads(line[6:]) for line in text.splitlines() if line.startswith("data: ")]
+
+
+class TestChatStream:
+    """Test the streaming chat protocols"""
+    
+    def test_delta_stream_reassembles_answer(self, client):
+        """Test v2 frames carry deltas, checkpoints and sequence numbers"""
+        response = client.post("/chat/stream", json={"message": "capital of France?", "stream_protocol": "v2"})
+        events = read_events(response.text)
+        
+        deltas = "".join(e["delta"] for e in events if e["type"] == "delta")
+        checkpoint = [e for e in events if e["type"] == "checkpoint"][-1]
+        
+        assert events[0]["type"] == "start" and events[0]["v"] == 2
+        assert deltas == "Paris is the capital of France."
+        assert checkpoint["length"] == len(deltas)
+        assert [e["seq"] for e in events] == list(range(1, len(events) + 1))
+        assert all("full_content" not in e for e in events)
+        assert events[-1]["type"] == "done"
+    
+    def test_resume_after_last_event_id(self, client):
+        """Test a stream can be resumed from the replay buffer"""
+        response = client.post("/chat/stream", json={"message": "capital of France?"})
+        stream_id = response.headers["X-Stream-Id"]
+        
+        resumed = client.get(f"/chat/stream/{stream_id}", headers={"Last-Event-ID": "3"})
+        events = read_events(resumed.text)
+        
+        assert events[0]["seq"] == 4
+        assert events[-1]["type"] == "done"
+        assert client.get("/chat/stream/unknown").status_code == 404
+    
+    def test_legacy_protocol_still_available(self, client):
+        """Test v1 frames keep the full_content field"""
+        response = client.post("/chat/stream", json={"message": "capital of France?", "stream_protocol": "v1"})
+        events = read_events(response.text)
+        
+        assert events[-2]["full_content"] == "Paris is the capital of France."
+    
+    def test_compressed_stream(self, client):
+        """Test gzip compression of the delta stream"""
+        response = client.post("/chat/stream", json={"message": "capital of France?", "compress": True})
+        
+        assert response.headers["Content-Encoding"] == "gzip"
+        assert read_events(response.text)[-1]["type"] == "done"
+    
+    def test_progressive_draft_precedes_deltas(self, client):
+        """Test the draft callback produces a labeled draft frame before the answer deltas"""
+        def process_query(message, session_id, force_full_depth=False, on_draft=None, on_answer=None, tenant=None):
+            on_draft({"text": "Paris.", "kind": "answer", "sources": []})
+            return {"response": "Paris is the capital of France.", "metadata": {}}
+        
+        backend.agent.process_query.side_effect = process_query
+        events = read_events(client.post("/chat/stream", json={"message": "capital of France?"}).text)
+        types = [e["type"] for e in events]
+        
+        assert types.index("draft") < types.index("delta")
+        assert events[types.index("draft")]["label"] == "Draft"
+    
+    def test_revision_streams_as_patch(self, client):
+        """Test the checked answer streams early and its revision arrives as a verified patch"""
+        def process_query(message, session_id, force_full_depth=False, on_draft=None, on_answer=None, tenant=None):
+            on_answer("Paris is a city.")
+            return {
+                "response": "Paris is the capital of France.",
+                "metadata": {"revisions": 1},
+                "revisions": [{"start": 9, "end": 15, "text": "the capital of France"}]
+            }
+        
+        backend.agent.process_query.side_effect = process_query
+        events = read_events(client.post("/chat/stream", json={"message": "capital of France?"}).text)
+        types = [e["type"] for e in events]
+        
+        assert "".join(e["delta"] for e in events if e["type"] == "delta") == "Paris is a city."
+        patch = events[types.index("patch")]
+        assert (patch["start"], patch["end"], patch["text"]) == (9, 15, "the capital of France")
+        final = [e for e in events if e["type"] == "checkpoint"][-1]
+        assert final["length"] == len("Paris is the capital of France.")
+        assert final["crc32"] == zlib.crc32("Paris is the capital of France.".encode("utf-8"))
+    
+    def test_full_queue_is_refused_before_streaming(self, client, monkeypatch):
+        """Test default-key tenants follow the client address and a full queue gets 429 with Retry-After"""
+        client.post("/chat/stream", json={"message": "capital of France?", "session_id": "first"})
+        client.post("/chat/stream", json={"message": "capital of France?", "session_id": "second"})
+        tenants = {call.kwargs["tenant"] for call in backend.agent.process_query.call_args_list}
+        monkeypatch.setattr(backend.get_scheduler(backend.config), "max_queue_per_tenant", 0)
+        
+        response = client.post("/chat/stream", json={"message": "capital of France?"})
+        
+        assert tenants == {"ip:testclient"}
+        assert response.status_code == 429
+        assert int(response.headers["Retry-After"]) >= 1
+    
+    def test_own_keys_skip_precomputed_answers(self, client, monkeypatch):
+        """Test callers with their own API keys never get answers precomputed on the server's keys"""
+        monkeypatch.setattr(backend, "load_agent_class", lambda: lambda *args: backend.agent)
+        client.post("/chat", json={"message": "capital of France?"})
+        client.post("/chat", json={"message": "capital of France?", "openai_api_key": "sk-own", "tavily_api_key": "tvly-own"})
+        
+        default_call, own_call = backend.agent.process_query.call_args_list
+        assert "use_precomputed" not in default_call.kwargs
+        assert own_call.kwargs["use_precomputed"] is False
+        assert own_call.kwargs["tenant"].startswith("key:")
+
+
+class TestChatWebSocket:
+    """Test multiplexed conversations over /chat/ws"""
+    
+    def test_concurrent_streams_reassemble(self, client):
+        """Test two conversations on one connection each get their own sequenced frames"""
+        with client.websocket_connect("/chat/ws") as ws:
+            ws.send_json({"type": "start", "stream": "a", "message": "capital of France?"})
+            ws.send_json({"type": "start", "stream": "b", "message": "capital of France again?"})
+            frames = {"a": [], "b": []}
+            while not all(f and f[-1]["type"] == "done" for f in frames.values()):
+                frame = ws.receive_json()
+                frames[frame["stream"]].append(frame)
+        
+        for stream_frames in frames.values():
+            assert "".join(f["delta"] for f in stream_frames if f["type"] == "delta") == "Paris is the capital of France."
+            assert [f["seq"] for f in stream_frames] == list(range(1, len(stream_frames) + 1))
+    
+    def test_follow_up_and_cancel_reach_running_graph(self, client):
+        """Test controls are delivered to the run's RunControl while it is in progress"""
+        controls = []
+        
+        def process_query(message, session_id, force_full_depth=False, on_draft=None, on_answer=None, control=None, tenant=None):
+            controls.append(control)
+            deadline = time.time() + 5
+            while not control.cancelled and time.time() < deadline:
+                time.sleep(0.01)
+            return {"response": "", "metadata": {"cancelled": True}}
+        
+        backend.agent.process_query.side_effect = process_query
+        with client.websocket_connect("/chat/ws") as ws:
+            ws.send_json({"type": "start", "stream": "a", "message": "capital of France?"})
+            assert ws.receive_json()["type"] == "start"
+            ws.send_json({"type": "follow_up", "stream": "a", "message": "and its population?"})
+            assert ws.receive_json() == {"type": "ack", "stream": "a", "control": "follow_up", "applied": True}
+            ws.send_json({"type": "cancel", "stream": "a"})
+            assert ws.receive_json() == {"type": "cancelled", "stream": "a"}
+            ws.send_json({"type": "skip_helpfulness", "stream": "a"})
+            assert ws.receive_json()["error"] == "Unknown or finished stream"
+        
+        assert controls[0].cancelled
+        assert controls[0].take_follow_ups() == ["and its population?"]
+
+
+class TestHealth:
+    def test_not_ready_until_warm_up_finishes(self, client, monkeypatch):
+        monkeypatch.setattr(backend.startup_timer, "ready_at", None)
+        
+        response = client.get("/health")
+        assert response.status_code == 503
+        assert response.json()["status"] == "starting"
+        assert client.get("/health/live").status_code == 200
+        
+        monkeypatch.setattr(backend.startup_timer, "ready_at", time.time())
+        assert client.get("/health").json()["status"] == "healthy"
+
+
+class TestSessions:
+    """Test session history through the session store"""
+    
+    def test_history_round_trip(self, client):
+        client.post("/chat", json={"message": "capital of France?", "session_id": "history-test"})
+        
+        history = client.get("/chat/history-test/history").json()
+        assert [message["role"] for message in history] == ["user", "assistant"]
+        assert history[1]["content"] == "Paris is the capital of France."
+        assert "history-test" in client.get("/sessions").json()["sessions"]
+        
+        client.delete("/chat/history-test")
+        assert client.get("/chat/history-test/history").json() == []
+    
+    def test_stream_id_carries_session_affinity(self, client):
+        response = client.post("/chat/stream", json={"message": "capital of France?", "session_id": "s1"})
+        token, _, _ = response.headers["X-Stream-Id"].partition("~")
+        assert routing_key("GET", f"/chat/stream/{response.headers['X-Stream-Id']}", {}) == token == affinity_token("s1")
+
+
+class TestProfilingEndpoints:
+    """Test the X-Profile header and profile download"""
+    
+    def test_profiled_request_is_downloadable(self, client, monkeypatch):
+        monkeypatch.setattr(backend.config, "debug_token", "secret")
+        debug = {"X-Debug-Token": "secret"}
+        response = client.post("/chat", json={"message": "capital of France?"}, headers=dict(debug, **{"X-Profile": "1"}))
+        profile_id = response.json()["metadata"]["profile_id"]
+        
+        assert any(p["profile_id"] == profile_id for p in client.get("/debug/profile", headers=debug).json()["profiles"])
+        assert client.get(f"/debug/profile/{profile_id}", headers=debug).json()["label"] == "/chat"
+        assert client.get(f"/debug/profile/{profile_id}?format=folded", headers=debug).status_code == 200
+        assert client.get("/debug/profile").status_code == 403
+        assert "profile_id" not in client.post("/chat", json={"message": "hi"}).json()["metadata"]
+    
+    def test_debug_endpoints_are_off_without_token(self, client, monkeypatch):
+        monkeypatch.setattr(backend.config, "debug_token", None)
+        
+        assert client.get("/debug/slow").status_code == 404
+        assert client.get("/debug/slow/some-trace").status_code == 404
+        assert client.get("/debug/profile").status_code == 404
+        # Without a token, clients cannot switch on tracing either
+        response = client.post("/chat", json={"message": "hi"}, headers={"X-Profile": "1"})
+        assert "profile_id" not in response.json()["metadata"]
+    
+    def test_hot_query_text_needs_debug_token(self, client, monkeypatch):
+        hot_queries = HotQueryPrecomputer(min_hits=1)
+        hot_queries.observe("my private question")
+        monkeypatch.setattr(backend, "get_hot_queries", lambda config: hot_queries)
+        monkeypatch.setattr(backend.config, "debug_token", "secret")
+        
+        public = client.get("/metrics/hot_queries").json()["hot_queries"]
+        assert public[0]["count"] == 1.0 and "query" not in public[0]
+        assert "private" not in client.get("/metrics/workers").text
+        debug = client.get("/metrics/hot_queries", headers={"X-Debug-Token": "secret"}).json()["hot_queries"]
+        assert debug[0]["query"] == "my private question"
+    
+    def test_usage_breakdown_needs_debug_token(self, client, monkeypatch):
+        monkeypatch.setattr(backend.config, "debug_token", "secret")
+        backend.get_usage_ledger(backend.config).record(UsageMeter().summary(), "key:abc", "s-usage")
+        debug = {"X-Debug-Token": "secret"}
+        
+        public = client.get("/metrics/usage").json()
+        assert "totals" in public and "tenants" not in public
+        assert "tenants" in client.get("/metrics/usage", headers=debug).json()
+        assert client.get("/metrics/usage?session_id=s-usage").status_code == 403
+        assert client.get("/metrics/usage?session_id=s-usage", headers=debug).status_code == 200
@@ -3,8 +3,13 @@ Test tools functionality
 """
 
 import pytest
+import numpy as np
 from unittest.mock import Mock, patch
+import json
 from src.tools.arxiv_search import ArxivSearchTool
+from src.tools.arxiv_index import ArxivLocalIndex
+from src.tools.corpus_index import CorpusIndex
+from src.tools.corpus_search import CorpusSearchTool
 from src.tools.helpfulness_checker import HelpfulnessChecker
 
 
@@ -45,6 +50,186 @@ class TestArxivSearch:
         assert "academic papers" in tool.description.lower()
 
 
+class TestArxivLocalIndex:
+    """Test local ArXiv metadata index"""
+    
+    def write_dump(self, path, records):
+        with open(path, "w") as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+    
+    def test_ingest_and_search(self, tmp_path):
+        """Test BM25 search returns ArXiv-shaped results"""
+        dump = tmp_path / "dump.json"
+        self.write_dump(dump, [
+            {"id": "1706.03762", "title": "Attention Is All You Need", "authors": "Ashish Vaswani, Noam Shazeer",
+             "abstract": "We propose the Transformer, based solely on attention mechanisms.",
+             "versions": [{"created": "Mon, 12 Jun 2017 17:57:34 GMT"}]},
+            {"id": "1512.03385", "title": "Deep Residual Learning", "authors": "Kaiming He",
+             "abstract": "Residual networks ease the training of deep networks.", "update_date": "2015-12-10"}
+        ])
+        
+        index = ArxivLocalIndex(str(tmp_path / "index"), create=True)
+        assert index.ingest(str(dump)) == 2
+        results = index.search("transformer attention")
+        
+        assert results[0]["title"] == "Attention Is All You Need"
+        assert results[0]["authors"] == ["Ashish Vaswani", "Noam Shazeer"]
+        assert results[0]["url"] == "http://arxiv.org/abs/1706.03762"
+        assert results[0]["published"] == "2017-06-12"
+        assert results[0]["source"] == "arxiv"
+        assert "score" not in results[0]
+        assert len(results) == 1
+        index.close()
+    
+    def test_incremental_ingest_skips_known_papers(self, tmp_path):
+        """Test re-ingesting adds only new papers as a new segment"""
+        first = tmp_path / "first.json"
+        second = tmp_path / "second.json"
+        self.write_dump(first, [{"id": "1", "title": "Graph networks", "abstract": "Message passing."}])
+        self.write_dump(second, [
+            {"id": "1", "title": "Graph networks", "abstract": "Message passing."},
+            {"id": "2", "title": "Diffusion models", "abstract": "Denoising score matching."}
+        ])
+        
+        index = ArxivLocalIndex(str(tmp_path / "index"), create=True)
+        index.ingest(str(first))
+        assert index.ingest(str(second)) == 1
+        
+        reopened = ArxivLocalIndex(str(tmp_path / "index"))
+        assert reopened.num_docs == 2
+        assert len(reopened.segments) == 2
+        assert reopened.search("diffusion")[0]["url"] == "http://arxiv.org/abs/2"
+        index.close()
+        reopened.close()
+    
+    def test_search_tool_uses_local_index(self, tmp_path):
+        """Test ArxivSearchTool routes to the local backend when configured"""
+        dump = tmp_path / "dump.json"
+        self.write_dump(dump, [{"id": "3", "title": "Sparse autoencoders", "abstract": "Interpretability."}])
+        ArxivLocalIndex(str(tmp_path / "index"), create=True).ingest(str(dump))
+        
+        tool = ArxivSearchTool(index_dir=str(tmp_path / "index"))
+        results = tool.search("sparse autoencoders")
+        
+        assert results[0]["title"] == "Sparse autoencoders"
+    
+    def test_missing_index_fails_loudly(self, tmp_path):
+        """Test a wrong index path raises instead of serving an empty index"""
+        with pytest.raises(FileNotFoundError):
+            ArxivLocalIndex(str(tmp_path / "missing"))
+        (tmp_path / "empty").mkdir()
+        with pytest.raises(FileNotFoundError):
+            ArxivLocalIndex(str(tmp_path / "empty"))
+        assert not (tmp_path / "missing").exists()
+    
+    def test_running_index_picks_up_new_segments(self, tmp_path):
+        """Test a serving index opens segments a separate ingest publishes"""
+        first = tmp_path / "first.json"
+        second = tmp_path / "second.json"
+        self.write_dump(first, [{"id": "1", "title": "Graph networks", "abstract": "Message passing."}])
+        self.write_dump(second, [{"id": "2", "title": "Diffusion models", "abstract": "Denoising score matching."}])
+        ArxivLocalIndex(str(tmp_path / "index"), create=True).ingest(str(first))
+        
+        serving = ArxivLocalIndex(str(tmp_path / "index"), check_interval=0)
+        assert serving.search("diffusion") == []
+        ArxivLocalIndex(str(tmp_path / "index"), create=True).ingest(str(second))
+        
+        assert serving.search("diffusion")[0]["url"] == "http://arxiv.org/abs/2"
+        assert serving.search("graph")[0]["url"] == "http://arxiv.org/abs/1"
+        assert not any((tmp_path / "index").glob("*/vocab.json"))
+        serving.close()
+
+
+class TestCorpusIndex:
+    """Test the local private-corpus vector index"""
+    
+    def write_corpus(self, root):
+        root.mkdir()
+        (root / "expenses.md").write_text("# Expense Policy\n\nTravel up to 500 dollars per trip needs manager approval.\n\nMeals are reimbursed up to 60 dollars a day.\n")
+        (root / "runbook.txt").write_text("Payments oncall runbook\n\nWhen the payments database fails over, page the storage team and freeze deploys.\n")
+        (root / "logo.png").write_bytes(b"\x89PNG")
+        return root
+    
+    def test_ingest_and_search(self, tmp_path):
+        """Test chunks are embedded locally and returned in the standard result shape"""
+        corpus = self.write_corpus(tmp_path / "docs")
+        index = CorpusIndex(str(tmp_path / "index"))
+        assert index.build([str(corpus)]) == 2
+        results = index.search("who approves travel expenses")
+        
+        assert results[0]["title"] == "Expense Policy"
+        assert results[0]["url"] == "corpus:expenses.md#chunk-0"
+        assert results[0]["source"] == "corpus"
+        assert "manager approval" in results[0]["content"]
+        assert index.search("payments database failover")[0]["title"] == "runbook"
+        assert index.search("zzz qqq") == []
+        index.close()
+    
+    def test_quantized_ivf_build_matches_brute_force(self, tmp_path):
+        """Test int8 vectors with an IVF coarse index find the same top chunks as float32 brute force"""
+        corpus = tmp_path / "docs"
+        corpus.mkdir()
+        topics = ["kubernetes cluster upgrade", "quarterly revenue forecast", "vacation leave request",
+                  "laptop security patch", "customer refund escalation", "database backup restore"]
+        for i in range(60):
+            (corpus / f"doc{i}.txt").write_text(f"{topics[i % 6]} procedure number {i} owner team{i % 7}\n")
+        
+        exact = CorpusIndex(str(tmp_path / "exact"))
+        exact.build([str(corpus)], nlist=0)
+        compact = CorpusIndex(str(tmp_path / "compact"), nprobe=4)
+        compact.build([str(corpus)], quantize=True, nlist=6)
+        
+        assert compact.vectors.dtype == np.int8 and compact.meta["nlist"] == 6
+        for topic in topics:
+            expected = {result["url"] for result in exact.search(topic, max_results=3)}
+            found = {result["url"] for result in compact.search(topic, max_results=3)}
+            assert len(expected & found) >= 2
+        exact.close()
+        compact.close()
+    
+    def test_rebuild_replaces_current_build(self, tmp_path):
+        """Test a new build is published atomically and the previous one removed only after its grace period"""
+        corpus = self.write_corpus(tmp_path / "docs")
+        index = CorpusIndex(str(tmp_path / "index"))
+        index.build([str(corpus)])
+        (corpus / "runbook.txt").unlink()
+        index.build([str(corpus)])
+        
+        reopened = CorpusIndex(str(tmp_path / "index"))
+        assert reopened.num_chunks == 1
+        assert sorted(p.name for p in (tmp_path / "index").iterdir()) == ["CURRENT", "build-00001", "build-00002"]
+        assert index.remove_retired(grace_seconds=0) == ["build-00001"]
+        assert sorted(p.name for p in (tmp_path / "index").iterdir()) == ["CURRENT", "build-00002"]
+        index.close()
+        reopened.close()
+    
+    def test_search_tool_reopens_after_ingest(self, tmp_path):
+        """Test a running search tool switches to a build published after it opened the index"""
+        corpus = self.write_corpus(tmp_path / "docs")
+        index = CorpusIndex(str(tmp_path / "index"))
+        index.build([str(corpus)])
+        tool = CorpusSearchTool(str(tmp_path / "index"), check_interval=0)
+        assert tool.search("payments database failover")[0]["title"] == "runbook"
+        
+        (corpus / "runbook.txt").unlink()
+        index.build([str(corpus)])
+        
+        assert all(result["title"] != "runbook" for result in tool.search("payments database failover"))
+        assert not tool.index.is_stale()
+        index.close()
+    
+    def test_opening_a_missing_index_creates_nothing(self, tmp_path):
+        """Test readers never create the index directory and default builds use exact search"""
+        index = CorpusIndex(str(tmp_path / "missing"))
+        
+        assert index.search("anything") == []
+        assert not (tmp_path / "missing").exists()
+        corpus = self.write_corpus(tmp_path / "docs")
+        index.build([str(corpus)])
+        assert index.meta["nlist"] == 0
+
+
 class TestHelpfulnessChecker:
     """Test helpfulness checker functionality"""
     
@@ -76,4 +261,64 @@ class TestHelpfulnessChecker:
         
         score = self.checker.evaluate("test query", "test response")
         
-        assert score == 0.5  # Default score on error
\ No newline at end of file
+        assert score == 0.5  # Default score on error
+
+
+class TestHelpfulnessBatch:
+    """Test batched helpfulness evaluation"""
+    
+    def setup_method(self):
+        """Set up test fixtures"""
+        self.checker = HelpfulnessChecker(api_key="test-key")
+        self.checker.llm = Mock()
+    
+    def test_evaluate_many_packs_and_parses_scores(self):
+        """Test batched evaluation returns one score per pair"""
+        packed = Mock(content="[0.9, 0.2, 0.7]")
+        single = Mock(content="Score: 0.4")
+        self.checker.llm.batch.return_value = [packed, single]
+        
+        scores = self.checker.evaluate_many(["q1", "q2", "q3", "q4"], ["r1", "r2", "r3", "r4"], pack_size=3)
+        
+        assert isinstance(scores, np.ndarray)
+        assert scores.tolist() == [0.9, 0.2, 0.7, 0.4]
+        assert self.checker.llm.batch.call_count == 1
+    
+    def test_evaluate_many_defaults_failed_packs(self):
+        """Test failed or short batch results fall back to the neutral score"""
+        self.checker.llm.batch.return_value = [Exception("API Error"), Mock(content="0.8")]
+        
+        scores = self.checker.evaluate_many(["q1", "q2", "q3"], ["r1", "r2", "r3"], pack_size=2)
+        
+        assert scores.tolist() == [0.5, 0.5, 0.8]
+    
+    def test_echoed_labels_are_not_scores(self):
+        """Test numbering labels the model echoes back are not read as scores of 1.0"""
+        self.checker.llm.batch.return_value = [Mock(content="[1] 0.8\n[2] 0.3\n1) 0.6"), Mock(content="Scores: [0.2, 0.9] for [1] and [2]")]
+        
+        scores = self.checker.evaluate_many(["q1", "q2", "q3", "q4", "q5"], ["r1", "r2", "r3", "r4", "r5"], pack_size=3)
+        
+        assert scores.tolist() == [0.8, 0.3, 0.6, 0.2, 0.9]
+
+
+class TestHelpfulnessCritique:
+    """Test the structured critique behind targeted revisions"""
+    
+    def setup_method(self):
+        """Set up test fixtures"""
+        self.checker = HelpfulnessChecker(api_key="test-key")
+        self.checker.llm = Mock()
+    
+    def test_critique_names_weak_parts(self):
+        """Test the JSON critique is parsed and bare scores still read as scores"""
+        self.checker.llm.invoke.return_value = Mock(content='Here you go: {"score": 0.2, "weak_parts": [{"quote": "Paris is big.", "problem": "vague"}, "stray"], "missing": ["population"]}')
+        
+        critique = self.checker.critique("capital of France?", "Paris is big.")
+        
+        assert critique.score == 0.2
+        assert critique.weak_parts == [{"quote": "Paris is big.", "problem": "vague"}]
+        assert critique.missing == ["population"]
+        
+        self.checker.llm.invoke.return_value = Mock(content="0.7")
+        critique = self.checker.critique("capital of France?", "Paris.")
+        assert (critique.score, critique.specific) == (0.7, False)
@@ -0,0 +1,944 @@
+"""
+Test utility modules
+"""
+
+import asyncio
+import json
+import threading
+import time
+import pytest
+import requests
+from requests.adapters import BaseAdapter
+from src.utils.startup import StartupTimer
+from src.utils.http_pool import ConnectionPoolManager
+from src.utils.adaptive_sizing import AdaptiveResultPolicy
+from src.utils.speculation import SpeculativePrefetcher
+from src.utils.model_cascade import CascadeMetrics, parse_cascade
+from src.utils.draft_answer import DraftPolicy, build_draft
+from src.utils.subqueries import normalize_sub_queries, plan_calls, fuse_results
+from src.utils.scheduler import FairScheduler, QueueFullError, tenant_id
+from src.utils.flight_recorder import FlightRecorder, RequestTrace
+from src.utils.profiling import RequestProfiler, folded_text
+from src.utils.query_log import QueryLogWriter, QueryLogReader, record_from_trace
+from src.utils.hot_queries import SpaceSaving, HotQueryPrecomputer
+from src.utils.search_results import SearchResult
+from src.utils.affinity import HashRing, routing_key, affinity_token
+from backend.prefork import AffinityProxy, Worker, read_chunked
+from src.utils.shared_state import SharedState, sum_counters
+from src.utils.streaming import DeltaStreamEncoder, StreamReplayBuffer
+from src.utils.multiplex import MultiplexedConnection, MuxStream
+from src.utils.run_control import RunControl
+from src.utils.progressive import ToolResultStream
+from src.utils.json_stream import IncrementalJSONParser, JSONStreamError
+from src.utils.usage import UsageMeter, UsageLedger, parse_prices
+from src.utils.revision import parse_revision, apply_revision, apply_patches
+from src.tools.tavily_search import TavilySearchTool
+from src.tools.arxiv_search import ArxivSearchTool, RateLimiter
+from src.tools.youtube_search import YouTubeSearchTool, parse_results_page
+
+
+class TestStartupTimer:
+    """Test startup-time breakdown reporting"""
+    
+    def test_stages_are_reported_in_start_order(self):
+        """Test recorded stages and readiness appear in the report"""
+        timer = StartupTimer(origin=100.0)
+        timer.record("warm_openai", 101.5, 102.0)
+        timer.record("import_agent", 100.2, 101.2)
+        
+        report = timer.report()
+        
+        assert report["ready"] == False
+        assert [s["stage"] for s in report["stages"]] == ["import_agent", "warm_openai"]
+        assert report["stages"][0]["duration"] == 1.0
+    
+    def test_failed_stage_records_error(self):
+        """Test a failing stage is still recorded with its error"""
+        timer = StartupTimer()
+        
+        with pytest.raises(RuntimeError):
+            with timer.stage("warm_arxiv"):
+                raise RuntimeError("offline")
+        timer.mark_ready()
+        
+        report = timer.report()
+        assert report["ready"] == True
+        assert report["stages"][0]["error"] == "offline"
+
+
+ARXIV_FEED = """<?xml version="1.0" encoding="UTF-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom">
+  <entry>
+    <id>http://arxiv.org/abs/1706.03762v7</id>
+    <published>2017-06-12T17:57:34Z</published>
+    <title>Attention Is All
+      You Need</title>
+    <summary>The dominant sequence transduction models are based on recurrent networks.</summary>
+    <author><name>Ashish Vaswani</name></author>
+  </entry>
+</feed>"""
+
+YOUTUBE_PAGE = "var ytInitialData = " + json.dumps({"contents": {"twoColumnSearchResultsRenderer": {"primaryContents": {"sectionListRenderer": {"contents": [
+    {"itemSectionRenderer": {"contents": [{"videoRenderer": {
+        "videoId": "abc",
+        "title": {"runs": [{"text": "Attention explained"}]},
+        "descriptionSnippet": {"runs": [{"text": "Transformers from scratch"}]},
+        "longBylineText": {"runs": [{"text": "A channel"}]},
+        "navigationEndpoint": {"commandMetadata": {"webCommandMetadata": {"url": "/watch?v=abc"}}}
+    }}]}}
+]}}}}}) + ";</script>"
+
+
+class CannedAdapter(BaseAdapter):
+    """Transport adapter answering each host with a fixed body and recording what was requested"""
+    
+    def __init__(self, bodies, failures=0):
+        super().__init__()
+        self.bodies = bodies
+        self.failures = failures
+        self.requests = []
+        self.payloads = []
+    
+    def send(self, request, **kwargs):
+        host = requests.utils.urlparse(request.url).hostname
+        self.requests.append((host, request.method))
+        self.payloads.append(request.body)
+        response = requests.Response()
+        # The first `failures` requests get a 503
+        response.status_code = 503 if len(self.requests) <= self.failures else 200
+        response._content = self.bodies[host].encode("utf-8")
+        response.encoding = "utf-8"
+        response.url = request.url
+        response.request = request
+        return response
+    
+    def close(self):
+        pass
+
+
+class TestConnectionPoolManager:
+    """Test the shared HTTP connection pools"""
+    
+    def test_clients_are_shared(self):
+        """Test repeated access returns the same pooled clients"""
+        pool = ConnectionPoolManager(max_connections=10, max_keepalive_connections=5)
+        
+        assert pool.httpx_client is pool.httpx_client
+        assert pool.requests_session is pool.requests_session
+        assert pool.httpx_client._transport._pool._max_connections == 10
+        pool.close()
+    
+    def test_stats_report_reuse(self):
+        """Test reuse metrics count requests and opened connections"""
+        pool = ConnectionPoolManager()
+        pool._count("request")
+        pool._count("request")
+        pool._count("connection.connect_tcp.complete")
+        
+        stats = pool.stats()
+        
+        assert stats["httpx"]["requests"] == 2
+        assert stats["httpx"]["connections_opened"] == 1
+        assert stats["httpx"]["reuse_ratio"] == 0.5
+        assert stats["requests"]["reuse_ratio"] is None
+    
+    def test_search_tools_send_through_shared_session(self):
+        """Test the real Tavily, arXiv and YouTube tools all request through the pooled session"""
+        pool = ConnectionPoolManager()
+        session = pool.requests_session
+        adapter = CannedAdapter({
+            "api.tavily.com": json.dumps({"results": [{"title": "Web page", "url": "https://example.com", "content": "text"}], "answer": "yes"}),
+            "export.arxiv.org": ARXIV_FEED,
+            "youtube.com": YOUTUBE_PAGE
+        })
+        session.mount("https://", adapter)
+        
+        web = TavilySearchTool(api_key="test-key", session=session).search_with_answer("query")
+        papers = ArxivSearchTool(session=session).search("attention", max_results=1)
+        videos = YouTubeSearchTool(session=session).search("attention", max_results=1)
+        
+        assert web["answer"] == "yes" and web["results"][0]["url"] == "https://example.com"
+        assert papers[0]["title"] == "Attention Is All You Need"
+        assert papers[0]["authors"] == ["Ashish Vaswani"]
+        assert papers[0]["published"] == "2017-06-12"
+        assert videos[0]["url"] == "https://www.youtube.com/watch?v=abc"
+        assert [host for host, _ in adapter.requests] == ["api.tavily.com", "export.arxiv.org", "youtube.com"]
+        # Tavily's documented REST body, whatever tavily-python version is installed
+        assert json.loads(adapter.payloads[0]) == {"api_key": "test-key", "query": "query", "search_depth": "advanced",
+                                                   "max_results": 5, "include_images": False, "include_answer": True}
+        pool.close()
+    
+    def test_pooled_arxiv_search_is_rate_limited_and_retried(self):
+        """Test pooled arXiv requests keep arxiv.Client's spacing and retry a failed request"""
+        session = requests.Session()
+        adapter = CannedAdapter({"export.arxiv.org": ARXIV_FEED}, failures=1)
+        session.mount("https://", adapter)
+        tool = ArxivSearchTool(session=session)
+        tool.rate_limiter = RateLimiter(0.1)
+        
+        start = time.monotonic()
+        papers = tool.search("attention", max_results=1)
+        
+        assert papers[0]["title"] == "Attention Is All You Need"
+        assert len(adapter.requests) == 2
+        assert time.monotonic() - start >= 0.1
+        assert tool.client is None
+    
+    def test_youtube_results_page_parser_skips_other_items(self):
+        """Test the owned results-page parser reads videos and tolerates missing fields and non-video items"""
+        page = "<script>var ytInitialData = " + json.dumps({"contents": {"twoColumnSearchResultsRenderer": {"primaryContents": {"sectionListRenderer": {"contents": [
+            {"continuationItemRenderer": {}},
+            {"itemSectionRenderer": {"contents": [
+                {"shelfRenderer": {"title": {"simpleText": "Related"}}},
+                {"videoRenderer": {"videoId": "xyz", "title": {"runs": [{"text": "Bare video};"}]},
+                                   "lengthText": {"simpleText": "4:20"}}}
+            ]}}
+        ]}}}}}) + ";</script>"
+        
+        videos = parse_results_page(page)
+        
+        assert videos == [{"id": "xyz", "thumbnails": [], "title": "Bare video};", "long_desc": None, "channel": None,
+                           "duration": "4:20", "views": None, "publish_time": None, "url_suffix": None}]
+        assert parse_results_page("<html>no data</html>") == []
+
+
+class TestAdaptiveResultPolicy:
+    """Test adaptive per-tool result sizing"""
+    
+    def test_cold_policy_uses_full_depth(self):
+        """Test defaults are used until enough observations exist"""
+        policy = AdaptiveResultPolicy(warmup_observations=5)
+        
+        plan = policy.plan("what is the capital of France")
+        
+        assert plan["web_search"] == {"max_results": 5, "search_depth": "advanced"}
+        assert plan["arxiv_search"]["max_results"] == 5
+        assert plan["adapted"] == False
+    
+    def test_shrinks_unused_results_and_honours_override(self):
+        """Test sizes shrink to observed need and the override forces defaults"""
+        policy = AdaptiveResultPolicy(warmup_observations=3, alpha=0.5, explore_every=0)
+        full = policy.plan("research on sparse attention")
+        for _ in range(6):
+            policy.record("academic", "arxiv_search", full["arxiv_search"], seen=5, used_ranks=[1], cited=0, latency=2.0)
+            policy.record("academic", "web_search", full["web_search"], seen=5, used_ranks=[1], cited=0, latency=1.0)
+        
+        plan = policy.plan("research on sparse attention")
+        forced = policy.plan("research on sparse attention", force_full_depth=True)
+        
+        assert plan["query_class"] == "academic"
+        assert plan["arxiv_search"]["max_results"] == 2
+        assert plan["web_search"]["search_depth"] == "basic"
+        assert plan["adapted"] == True
+        assert forced["arxiv_search"]["max_results"] == 5
+        
+        policy.record("academic", "arxiv_search", plan["arxiv_search"], seen=2, used_ranks=[1], cited=0, latency=0.5)
+        assert policy.stats()["latency_saved_seconds"] == 1.5
+    
+    def test_missing_citation_signal_keeps_depth(self):
+        """Test answers that cite nothing shrink sizes but never lower search depth"""
+        policy = AdaptiveResultPolicy(warmup_observations=3, alpha=0.5, explore_every=0)
+        full = policy.plan("what is the capital of France")
+        for _ in range(6):
+            policy.record("general", "web_search", full["web_search"], seen=2, used_ranks=[1, 2], cited=None, latency=1.0)
+        
+        plan = policy.plan("what is the capital of France")
+        
+        assert plan["web_search"] == {"max_results": 3, "search_depth": "advanced"}
+        assert policy.stats()["classes"]["general"]["web_search"]["cited_observations"] == 0
+
+
+class TestSpeculativePrefetcher:
+    """Test speculative tool call hits and waste accounting"""
+    
+    def test_claimed_and_wasted_calls(self):
+        prefetcher = SpeculativePrefetcher(max_workers=2)
+        handle = prefetcher.start({
+            "web_search": lambda: [{"title": "a"}],
+            "youtube_search": lambda: []
+        })
+        
+        results, latency = handle.claim("web_search")
+        assert results == [{"title": "a"}]
+        assert latency >= 0
+        assert handle.claim("arxiv_search") is None
+        handle.close(needed=["web_search", "arxiv_search"])
+        
+        stats = prefetcher.stats()
+        assert stats["hits"] == 1
+        assert stats["wasted"] == 1
+        assert stats["missed"] == 1
+        assert stats["hit_rate"] == 0.5
+    
+    def test_calls_added_from_another_pool_count_there(self):
+        speculative = SpeculativePrefetcher(max_workers=1)
+        early = SpeculativePrefetcher(max_workers=1, name="early-dispatch")
+        handle = speculative.start({"youtube_search": lambda: []})
+        
+        assert handle.add("web_search", lambda: [{"title": "a"}], prefetcher=early)
+        assert handle.claim("web_search")[0] == [{"title": "a"}]
+        handle.close(needed=["web_search"])
+        
+        assert early.stats()["predicted"] == 1
+        assert early.stats()["hits"] == 1
+        assert speculative.stats()["predicted"] == 1
+        assert speculative.stats()["hits"] == 0
+        assert speculative.stats()["wasted"] == 1
+        assert speculative.stats()["missed"] == 1
+
+
+class TestModelCascade:
+    """Test cascade parsing and escalation metrics"""
+    
+    def test_parse_cascade(self):
+        tiers = parse_cascade("gpt-4o-mini:15, gpt-o3:60:0.03", default_model="gpt-o3")
+        assert [t.model for t in tiers] == ["gpt-4o-mini", "gpt-o3"]
+        assert tiers[0].timeout == 15.0
+        assert tiers[1].cost_per_1k_tokens == 0.03
+        assert [t.model for t in parse_cascade("", default_model="gpt-o3")] == ["gpt-o3"]
+    
+    def test_metrics_track_escalations_and_savings(self):
+        tiers = parse_cascade("cheap:5:0.001,strong:30:0.01", default_model="strong")
+        metrics = CascadeMetrics()
+        metrics.record(tiers, [
+            {"model": "cheap", "latency": 0.5, "tokens": 1000},
+            {"model": "strong", "latency": 3.0, "tokens": 1000}
+        ], ["low_helpfulness"])
+        metrics.record(tiers, [{"model": "cheap", "latency": 0.5, "tokens": 1000}], [])
+        
+        stats = metrics.stats()
+        assert stats["escalation_rate"] == 0.5
+        assert stats["latency_saved_seconds"] == 2.5
+        assert stats["cost_saved_usd"] == 0.009
+
+
+class TestDraftAnswer:
+    """Test draft construction and the skip-LLM policy"""
+    
+    def test_draft_falls_back_to_top_snippet(self):
+        results = [{"title": "A", "url": "https://a", "content": "Top snippet"}]
+        assert build_draft("Synthesized answer", results)["kind"] == "answer"
+        assert build_draft(None, results) == {"text": "Top snippet", "kind": "snippet", "sources": [{"title": "A", "url": "https://a"}]}
+        assert build_draft(None, []) is None
+    
+    def test_factual_policy(self):
+        policy = DraftPolicy(mode="factual")
+        draft = {"text": "The Eiffel Tower is 330 metres tall including antennas.", "kind": "answer"}
+        assert policy.accept("how tall is the eiffel tower", draft) is False
+        assert policy.accept("eiffel tower height", draft) is True
+        assert policy.accept("eiffel tower height", draft, other_tools=True) is False
+        assert DraftPolicy().accept("eiffel tower height", draft) is False
+
+
+class TestSubQueries:
+    """Test sub-query validation, call budgeting and result fusion"""
+    
+    def test_normalize_drops_invalid_and_caps_count(self):
+        raw = [
+            {"query": "compare X and Y", "needs_web_search": True},
+            {"query": "compare x and y", "needs_web_search": True},
+            {"query": "no tools"},
+            {"query": "tutorial for Z", "needs_youtube_search": True},
+            {"query": "papers on Z", "needs_arxiv_search": True}
+        ]
+        assert [q["query"] for q in normalize_sub_queries(raw, 2)] == ["compare X and Y", "tutorial for Z"]
+        assert normalize_sub_queries(raw[:1], 3) == []
+        assert normalize_sub_queries("not a list", 3) == []
+    
+    def test_plan_calls_round_robin_within_budget(self):
+        flags = {"web_search": "needs_web_search", "arxiv_search": "needs_arxiv_search", "youtube_search": "needs_youtube_search"}
+        sub_queries = [
+            {"query": "a", "needs_web_search": True, "needs_arxiv_search": True, "needs_youtube_search": True},
+            {"query": "b", "needs_youtube_search": True}
+        ]
+        assert plan_calls(sub_queries, flags, 3) == [(0, "web_search"), (1, "youtube_search"), (0, "arxiv_search")]
+    
+    def test_fuse_interleaves_and_dedupes(self):
+        fused = fuse_results([
+            [{"url": "a1"}, {"url": "shared"}],
+            [{"url": "shared"}, {"url": "b2"}]
+        ])
+        assert [r["url"] for r in fused] == ["shared", "a1", "b2"]
+
+
+def run_in_order(scheduler, requests):
+    """Enqueue (tenant, lane) requests while the only slot is busy and return the order they run in"""
+    order = []
+    
+    async def job(tenant, lane):
+        async with scheduler.slot(tenant, lane):
+            order.append(tenant)
+            await asyncio.sleep(0)
+    
+    async def main():
+        await scheduler.acquire("blocker")
+        tasks = [asyncio.ensure_future(job(tenant, lane)) for tenant, lane in requests]
+        await asyncio.sleep(0)
+        scheduler.release("blocker")
+        await asyncio.gather(*tasks)
+    
+    asyncio.run(main())
+    return order
+
+
+class TestFairScheduler:
+    """Test weighted fair queuing across tenants and lanes"""
+    
+    def test_noisy_tenant_does_not_starve_others(self):
+        scheduler = FairScheduler(max_concurrency=1)
+        order = run_in_order(scheduler, [("noisy", "interactive")] * 4 + [("quiet", "interactive")])
+        assert order.index("quiet") == 1
+        assert scheduler.stats()["tenants"]["quiet"]["completed"] == 1
+    
+    def test_weights_and_lanes(self):
+        scheduler = FairScheduler(max_concurrency=1, tenant_weights={"heavy": 2.0})
+        order = run_in_order(scheduler, [("heavy", "interactive")] * 4 + [("light", "interactive")] * 2)
+        assert order[:3].count("heavy") == 2
+        
+        scheduler = FairScheduler(max_concurrency=1)
+        order = run_in_order(scheduler, [("script", "batch")] * 3 + [("user", "interactive")])
+        assert order.index("user") == 0
+    
+    def test_queue_limit_and_tenant_ids(self):
+        scheduler = FairScheduler(max_concurrency=1, max_queue_per_tenant=1)
+        
+        async def main():
+            await scheduler.acquire("a")
+            waiting = asyncio.ensure_future(scheduler.acquire("a"))
+            await asyncio.sleep(0)
+            with pytest.raises(QueueFullError):
+                await scheduler.acquire("a")
+            waiting.cancel()
+        
+        asyncio.run(main())
+        assert tenant_id("sk-1").startswith("key:") and tenant_id("sk-1") != tenant_id("sk-2")
+        assert tenant_id(None, "10.0.0.7") == "ip:10.0.0.7"
+    
+    def test_only_keyed_tenants_are_capped_by_default(self):
+        scheduler = FairScheduler(max_concurrency=4, tenant_concurrency=1)
+        
+        async def main():
+            for _ in range(3):
+                await scheduler.acquire("ip:10.0.0.7")
+            await scheduler.acquire("key:abc")
+            waiting = asyncio.ensure_future(scheduler.acquire("key:abc"))
+            await asyncio.sleep(0)
+            capped = not waiting.done()
+            waiting.cancel()
+            return capped
+        
+        # The address tenant takes three slots; the keyed one is held at one while a slot is free
+        assert asyncio.run(main())
+        assert scheduler.stats()["tenants"]["ip:10.0.0.7"]["running"] == 3
+        assert scheduler.running == 4
+
+
+class TestFlightRecorder:
+    """Test bounded retention of slow and failed traces"""
+    
+    def test_keeps_slowest_and_failed(self, tmp_path):
+        recorder = FlightRecorder(capacity=2, dump_dir=str(tmp_path), dump_seconds=100)
+        for i, duration in enumerate([5, 50, 1, 30]):
+            recorder.record({"trace_id": str(i), "duration_ms": duration, "failed": i == 2})
+        
+        assert [t["trace_id"] for t in recorder.slowest()] == ["1", "3"]
+        assert [t["trace_id"] for t in recorder.failed()] == ["2"]
+        assert recorder.get("2")["failed"] is True
+        assert recorder.get("0") is None
+        dumps = list(tmp_path.iterdir())
+        assert len(dumps) == 1 and len(dumps[0].read_text().splitlines()) == 1
+    
+    def test_trace_spans_and_errors(self):
+        trace = RequestTrace("t", "s", "query")
+        with trace.span("analyzer"):
+            pass
+        trace.error("web_search", RuntimeError("timeout"))
+        record = trace.finish({"routing": {}})
+        
+        assert record["spans"][0]["name"] == "analyzer"
+        assert record["failed"] is True
+        assert record["errors"][0]["where"] == "web_search"
+
+
+class TestRequestProfiler:
+    """Test opt-in per-request profiling"""
+    
+    def test_off_by_default(self):
+        profiler = RequestProfiler()
+        assert profiler.start("/chat") is None
+        assert profiler.finish(None) is None
+    
+    def test_requested_profile_records_allocations_and_samples(self):
+        profiler = RequestProfiler(interval=0.001)
+        session = profiler.start("/chat", requested=True)
+        retained = session.run(lambda: [bytearray(1024) for _ in range(500)] + [sum(i * i for i in range(200000))])
+        profile = profiler.finish(session)
+        
+        assert profile["allocations"] and profile["allocations"][0]["size_diff_kb"] > 0
+        assert profile["cpu_samples"] > 0
+        assert folded_text(profile).strip()
+        assert profiler.get(profile["profile_id"]) is profile
+        assert profiler.summary()["growth_by_site"]
+        assert len(retained) == 501
+
+
+class TestQueryLog:
+    """Test the append-only binary query log"""
+    
+    def trace(self, query, duration_ms, model_score):
+        return {
+            "query": query,
+            "duration_ms": duration_ms,
+            "failed": False,
+            "spans": [{"name": "analyzer", "duration_ms": 5.0}, {"name": "responder", "duration_ms": duration_ms - 5.0}],
+            "routing": {"needs_web_search": True, "needs_arxiv_search": False, "needs_youtube_search": False, "sub_queries": []},
+            "tools_used": ["web_search"],
+            "tool_latencies_ms": {"web_search": 40.0},
+            "search_results": 5,
+            "regenerations": 0,
+            "helpfulness_score": model_score
+        }
+    
+    def test_records_rotate_segments_and_read_back_as_columns(self, tmp_path):
+        writer = QueryLogWriter(str(tmp_path), segment_records=3, flush_interval=0.01)
+        for i in range(7):
+            writer.log(record_from_trace(self.trace(f"query {i}", 100.0 + i, None if i == 0 else 0.8), "gpt-o3"))
+        writer.close()
+        
+        assert len(list(tmp_path.glob("segment-*.rec"))) == 3
+        reader = QueryLogReader(str(tmp_path))
+        assert len(reader) == 7
+        assert list(reader.column("total_ms")) == [100.0 + i for i in range(7)]
+        assert reader.queries([0, 4, 6]) == ["query 0", "query 4", "query 6"]
+        assert reader.latency_percentiles()["analyzer_ms"]["p50"] == 5.0
+        assert "youtube_search_ms" not in reader.latency_percentiles()
+        
+        stats = reader.routing_stats()
+        assert stats["routed"]["needs_web_search"] == 1.0
+        assert stats["used"]["arxiv_search"] == 0.0
+        assert stats["models"]["gpt-o3"] == {"requests": 7, "mean_helpfulness": 0.8}
+    
+    def test_reopening_appends_and_ignores_partial_rows(self, tmp_path):
+        writer = QueryLogWriter(str(tmp_path), flush_interval=0.01)
+        writer.log(record_from_trace(self.trace("first", 50.0, 0.5), None))
+        writer.close()
+        with open(tmp_path / "segment-000000.rec", "ab") as f:
+            f.write(b"partial")
+        
+        assert len(QueryLogReader(str(tmp_path))) == 1
+        
+        writer = QueryLogWriter(str(tmp_path), flush_interval=0.01)
+        writer.log(record_from_trace(self.trace("second", 60.0, 0.7), None))
+        writer.close()
+        reader = QueryLogReader(str(tmp_path))
+        
+        assert len(reader) == 2
+        assert reader.queries([0, 1]) == ["first", "second"]
+        assert list(reader.column("total_ms")) == [50.0, 60.0]
+    
+    def test_bad_record_does_not_stop_the_writer(self, tmp_path):
+        writer = QueryLogWriter(str(tmp_path), flush_interval=0.01, batch_size=1)
+        writer.log(dict(record_from_trace(self.trace("bad", 50.0, 0.5), None), result_count="many"))
+        writer.log(record_from_trace(self.trace("good", 60.0, 0.7), None))
+        writer.close()
+        
+        assert writer.dropped == 1
+        assert QueryLogReader(str(tmp_path)).queries([0]) == ["good"]
+
+
+class TestHotQueries:
+    """Test heavy-hitter tracking and background precomputation"""
+    
+    def test_space_saving_keeps_heavy_hitters(self):
+        sketch = SpaceSaving(capacity=4)
+        for i in range(200):
+            sketch.observe("hot")
+            sketch.observe(f"cold {i}")
+        
+        key, count, error = sketch.top(1)[0]
+        assert key == "hot"
+        assert count - error <= 200 <= count
+    
+    def test_refresh_respects_threshold_budget_and_idleness(self):
+        precomputer = HotQueryPrecomputer(min_hits=3, refresh_budget=1)
+        for _ in range(3):
+            precomputer.observe("What is RAG?")
+            precomputer.observe("what is a transformer")
+        precomputer.observe("rare question")
+        compute = lambda query: {"response": f"answer to {query}", "metadata": {}}
+        
+        assert precomputer.refresh_once(compute, is_idle=lambda: False) == 0
+        assert precomputer.refresh_once(compute) == 1
+        assert precomputer.refresh_once(compute) == 0
+        assert precomputer.stats()["skipped_budget"] == 2
+        
+        hit = precomputer.lookup("what is rag")
+        assert hit is not None and hit[1]["response"] == "answer to what is rag"
+        assert precomputer.lookup("rare question") is None
+
+
+class TestSearchResult:
+    """Test compact search result records"""
+    
+    def test_records_from_each_tool_shape(self):
+        web = SearchResult.from_tool_result({"title": "Paris", "url": "https://example.com", "content": "x" * 300, "snippet": "x" * 300, "source": "web"})
+        paper = SearchResult.from_tool_result({
+            "title": "Attention", "authors": ["A", "B"], "summary": "Transformers.", "url": "http://arxiv.org/abs/1706.03762",
+            "published": "2017-06-12", "content": "prebuilt", "snippet": "prebuilt", "source": "arxiv"
+        })
+        video = SearchResult.from_tool_result({"title": "RAG tutorial", "url": "https://www.youtube.com/watch?v=1", "description": "Intro", "channel": "C", "type": "youtube", "score": 0.8})
+        
+        assert (web.tool, paper.tool, video.tool) == ("web_search", "arxiv_search", "youtube_search")
+        assert web.snippet == "x" * 200 + "..."
+        assert paper.context == "Attention\n\nAuthors: A, B\n\nSummary: Transformers...."
+        assert paper.source()["type"] == "arxiv" and paper.source()["published_date"] == "2017-06-12"
+        assert video.extra == {"channel": "C"} and video.score == 0.8
+        assert not hasattr(web, "__dict__")
+
+
+class TestAffinity:
+    """Test consistent-hash session routing"""
+    
+    def test_ring_spreads_keys_and_moves_few_on_resize(self):
+        keys = [f"session-{i}" for i in range(4000)]
+        before = HashRing(["0", "1", "2", "3"])
+        after = HashRing(["0", "1", "2", "3", "4"])
+        
+        owners = [before.node_for(key) for key in keys]
+        assert min(owners.count(node) for node in before.nodes) > 600
+        moved = sum(before.node_for(key) != after.node_for(key) for key in keys)
+        assert moved < len(keys) * 0.3
+    
+    def test_routing_key_sources(self):
+        token = affinity_token("abc")
+        json_headers = {"content-type": "application/json"}
+        
+        assert routing_key("POST", "/chat", json_headers, b'{"message": "hi", "session_id": "abc"}') == token
+        assert routing_key("GET", "/chat/abc/history", {}) == token
+        assert routing_key("DELETE", "/chat/abc", {}) == token
+        assert routing_key("GET", "/health", {"x-session-id": "abc"}) == token
+        assert routing_key("GET", f"/chat/stream/{token}~1234", {}) == token
+        assert routing_key("GET", "/chat/ws", {}, query="session_id=abc") == token
+        assert routing_key("POST", "/chat/stream", json_headers, b'{"message": "hi"}') is None
+    
+    def test_proxy_ignores_relay_mark_from_plain_clients(self, tmp_path):
+        async def forward(proxy, request):
+            received = asyncio.get_running_loop().create_future()
+            
+            async def worker_side(reader, writer):
+                received.set_result((await reader.readuntil(b"\r\n\r\n")).decode("latin-1"))
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: 0\r\n\r\n")
+                writer.close()
+            
+            worker_server = await asyncio.start_unix_server(worker_side, proxy.workers[0].socket_path)
+            proxy_server = await asyncio.start_server(proxy.handle, "127.0.0.1", 0)
+            reader, writer = await asyncio.open_connection("127.0.0.1", proxy_server.sockets[0].getsockname()[1])
+            writer.write(request)
+            await reader.read()
+            writer.close()
+            worker_server.close()
+            proxy_server.close()
+            return await received
+        
+        request = (b"GET /health HTTP/1.1\r\nHost: x\r\nX-Affinity-Forwarded: 1\r\n"
+                   b"X-Forwarded-For: 203.0.113.9\r\n\r\n")
+        worker = Worker(0, str(tmp_path / "w.sock"), {})
+        
+        untrusted = asyncio.run(forward(AffinityProxy([worker], nodes=["http://10.9.9.9:8000"]), request))
+        assert "X-Forwarded-For: 127.0.0.1" in untrusted and "203.0.113.9" not in untrusted
+        assert "X-Affinity-Forwarded" not in untrusted
+        
+        spoofed = asyncio.run(forward(AffinityProxy([worker], secret="s3cret"), request))
+        assert "203.0.113.9" not in spoofed
+        relayed = asyncio.run(forward(AffinityProxy([worker], secret="s3cret"), request.replace(b": 1\r\n", b": s3cret\r\n")))
+        assert "X-Forwarded-For: 203.0.113.9" in relayed
+        peer = asyncio.run(forward(AffinityProxy([worker], nodes=["http://127.0.0.1:8000", "http://10.9.9.9:8000"]), request))
+        assert "X-Forwarded-For: 203.0.113.9" in peer
+    
+    def test_proxy_decodes_chunked_bodies(self):
+        async def decode(raw, limit=1024):
+            reader = asyncio.StreamReader()
+            reader.feed_data(raw)
+            reader.feed_eof()
+            return await read_chunked(reader, limit)
+        
+        assert asyncio.run(decode(b'7\r\n{"a": 1\r\n1;ext=x\r\n}\r\n0\r\nX-Trailer: y\r\n\r\n')) == b'{"a": 1}'
+        assert asyncio.run(decode(b"8\r\n12345678\r\n0\r\n\r\n", limit=4)) is None
+
+
+class TestDeltaStreaming:
+    """Test v2 frame checkpoints and the replay buffer"""
+    
+    def test_checkpoint_length_counts_utf16_units(self):
+        encoder = DeltaStreamEncoder("s", checkpoint_every=0)
+        encoder.delta("Caf\u00e9 ")
+        encoder.delta("\U0001F600")
+        
+        checkpoint = json.loads(encoder.checkpoint().split("data: ")[1])
+        
+        assert checkpoint["length"] == 7  # The emoji is a surrogate pair in JavaScript
+    
+    def test_patch_offsets_count_utf16_units(self):
+        encoder = DeltaStreamEncoder("s", checkpoint_every=0)
+        encoder.delta("\U0001F600 is a smile")
+        
+        frames = encoder.patch(7, 12, "grin")
+        patch, checkpoint = (json.loads(frame.split("data: ")[1]) for frame in frames)
+        
+        assert encoder.text == "\U0001F600 is a grin"
+        assert (patch["start"], patch["end"]) == (8, 13)
+        # What the browser does with the frame: slice a UTF-16 string
+        units = "\U0001F600 is a smile".encode("utf-16-le")
+        patched = units[:2 * patch["start"]] + patch["text"].encode("utf-16-le") + units[2 * patch["end"]:]
+        assert patched.decode("utf-16-le") == encoder.text
+        assert checkpoint["length"] == len(patched) // 2
+    
+    def test_buffer_never_evicts_producing_streams(self):
+        async def scenario():
+            buffer = StreamReplayBuffer(max_streams=2)
+            producing = buffer.create("producing")
+            finished = buffer.create("finished")
+            await finished.finish()
+            buffer.create("third")
+            buffer.create("fourth")
+            return buffer, producing
+        
+        buffer, producing = asyncio.run(scenario())
+        
+        assert buffer.get("producing") is producing
+        assert buffer.get("finished") is None
+        assert len(buffer) == 3
+
+
+class TestMultiplex:
+    """Test per-stream flow control and heartbeats on multiplexed connections"""
+    
+    def test_stream_waits_for_credit(self):
+        async def main():
+            outbox = asyncio.Queue()
+            stream = MuxStream("a", 2, outbox, RunControl())
+            sending = asyncio.ensure_future(stream.emit([stream.encoder.frame({"type": "delta"}) for _ in range(5)]))
+            await asyncio.sleep(0)
+            assert outbox.qsize() == 2 and not sending.done()
+            
+            await stream.grant(2)
+            await asyncio.sleep(0)
+            assert outbox.qsize() == 4
+            
+            await stream.close()
+            await sending
+            assert outbox.qsize() == 4
+        
+        asyncio.run(main())
+    
+    def test_silent_client_is_disconnected_and_streams_cancelled(self):
+        async def main():
+            closed = asyncio.Event()
+            sent, close_codes = [], []
+            
+            async def receive():
+                await closed.wait()
+                return None
+            
+            async def close(code):
+                close_codes.append(code)
+                closed.set()
+            
+            async def run_stream(stream, message):
+                await asyncio.Event().wait()
+            
+            async def send(text):
+                sent.append(text)
+            
+            connection = MultiplexedConnection(receive, send, close, run_stream, heartbeat_interval=0.01, heartbeat_timeout=0.05)
+            await connection._dispatch('{"type": "start", "stream": "a", "message": "hi"}')
+            stream = connection.streams["a"]
+            await asyncio.wait_for(connection.serve(), 2.0)
+            
+            assert close_codes == [1001]
+            assert stream.control.cancelled and stream.closed
+            assert any('"ping"' in text for text in sent)
+            stream.task.cancel()
+        
+        asyncio.run(main())
+
+
+class TestProgressiveTools:
+    """Test the responder is released before slow tools finish"""
+    
+    def test_evidence_threshold_and_grace_window(self):
+        slow_done = threading.Event()
+        
+        def slow():
+            slow_done.wait(5)
+            return ["late"], 1.0
+        
+        stream = ToolResultStream({"fast": lambda: (["a", "b"], 0.1), "slow": slow})
+        arrivals = stream.wait_for_evidence(2, grace=5.0, evidence=lambda arrival: len(arrival.value))
+        assert [arrival.tool for arrival in arrivals] == ["fast"]
+        assert stream.pending == ["slow"]
+        
+        slow_done.set()
+        assert [arrival.value for arrival in stream.wait_for_rest(2.0)] == [["late"]]
+        
+        slow_done.clear()
+        waiting = ToolResultStream({"fast": lambda: (["a"], 0.1), "slow": slow})
+        started = time.monotonic()
+        assert len(waiting.wait_for_evidence(10, grace=0.05)) == 1
+        assert time.monotonic() - started < 1.0
+        waiting.close()
+        slow_done.set()
+
+
+class TestIncrementalJSON:
+    """Test members are decoded as soon as their values complete"""
+    
+    def test_members_complete_before_the_object(self):
+        parser = IncrementalJSONParser()
+        assert parser.feed('```json\n{"needs_web_search": tr') == []
+        assert parser.feed('ue, "sub": {"a": ["}", 1]}, "reasoning": "long') == [("needs_web_search", True), ("sub", {"a": ["}", 1]})]
+        assert parser.feed(' \\"quoted\\" text"}\n```') == [("reasoning", 'long "quoted" text')]
+        assert parser.done and parser.result()["sub"] == {"a": ["}", 1]}
+    
+    def test_malformed_input_fails_at_first_bad_character(self):
+        with pytest.raises(JSONStreamError) as error:
+            IncrementalJSONParser().feed('{"needs_web_search": yes, "reasoning": "...')
+        assert error.value.position == 21
+        with pytest.raises(JSONStreamError):
+            IncrementalJSONParser().feed("I think you should search the web. " * 10)
+        with pytest.raises(JSONStreamError):
+            parser = IncrementalJSONParser()
+            parser.feed('{"needs_web_search": true')
+            parser.result()
+
+
+class TestUsageAccounting:
+    """Test token accounting and per-tenant budget degradation"""
+    
+    def test_provider_counts_preferred_over_local_estimate(self):
+        meter = UsageMeter(parse_prices("gpt-o3=0.01:0.02"))
+        reported = type("Result", (), {"content": "ok", "usage_metadata": {"input_tokens": 1000, "output_tokens": 500}})()
+        unreported = type("Result", (), {"content": "answer " * 20})()
+        meter.record_llm("responder", "gpt-o3", ["prompt"], reported)
+        meter.record_llm("helpfulness_checker", "gpt-3.5-turbo", ["prompt " * 50], unreported)
+        meter.record_search("web_search", "advanced")
+        meter.record_search("arxiv_search")
+        summary = meter.summary()
+        
+        assert summary["by_node"]["responder"]["input_tokens"] == 1000
+        assert summary["by_node"]["responder"]["cost_usd"] == pytest.approx(0.02)
+        assert 0 < summary["by_node"]["helpfulness_checker"]["input_tokens"] < 1000
+        assert summary["llm_calls"] == 2 and summary["estimated"] is True
+        assert summary["searches"] == {"web_search:advanced": 1, "arxiv_search": 1}
+        assert summary["cost_usd"] == pytest.approx(0.02 + 0.016 + summary["by_node"]["helpfulness_checker"]["cost_usd"], abs=1e-5)
+    
+    def test_budget_degrades_then_recovers_after_window(self):
+        ledger = UsageLedger(budgets={"key:a": 1.0}, window_seconds=0.2, degrade_at=0.8)
+        spend = lambda cost: {"llm_calls": 1, "input_tokens": 10, "output_tokens": 5, "total_tokens": 15,
+                              "searches": {}, "cost_usd": cost, "by_node": {}}
+        
+        ledger.record(spend(0.5), "key:a", "s1")
+        assert ledger.budget_mode("key:a") is None
+        ledger.record(spend(0.4), "key:a", "s1")
+        assert ledger.budget_mode("key:a") == "skip_checks"
+        ledger.record(spend(0.2), "key:a", "s2")
+        assert ledger.budget_mode("key:a") == "fallback_model"
+        assert ledger.budget_mode("key:b") is None
+        assert ledger.session("s1")["requests"] == 2
+        assert ledger.stats()["tenants"]["key:a"]["total_tokens"] == 45
+        
+        time.sleep(0.25)
+        assert ledger.budget_mode("key:a") is None
+    
+    def test_budget_spend_is_shared_across_workers(self, tmp_path):
+        path = str(tmp_path / "shared.db")
+        workers = [UsageLedger(budgets={"ip:10.0.0.1": 1.0}, shared=SharedState(path)) for _ in range(2)]
+        spend = lambda cost: {"llm_calls": 1, "input_tokens": 10, "output_tokens": 5, "total_tokens": 15,
+                              "searches": {}, "cost_usd": cost, "by_node": {}}
+        
+        workers[0].record(spend(0.6), "ip:10.0.0.1", "s1")
+        workers[1].record(spend(0.5), "ip:10.0.0.1", "s2")
+        
+        assert [worker.budget_mode("ip:10.0.0.1") for worker in workers] == ["fallback_model", "fallback_model"]
+        assert workers[0].budget_mode("ip:10.0.0.2") is None
+
+
+class TestRevision:
+    """Test merging targeted revisions into an answer"""
+    
+    def test_edits_and_addendum_become_patches(self):
+        answer = "Paris is the capital.\n\nIt is  big."
+        revision = parse_revision('{"edits": [{"find": "It is big.", "replace": "It has 2.1 million residents."}, {"find": "Lyon", "replace": "x"}], "addendum": " Sources: INSEE. "}')
+        
+        revised, patches = apply_revision(answer, revision)
+        
+        assert revised == "Paris is the capital.\n\nIt has 2.1 million residents.\n\nSources: INSEE."
+        assert len(patches) == 2  # The edit matching nothing is dropped
+        assert apply_patches(answer, patches) == revised
+    
+    def test_unreadable_output_is_not_a_revision(self):
+        assert parse_revision("I rewrote the answer: Paris is the capital.") is None
+        assert apply_revision("Paris.", {"edits": [], "addendum": ""}) == ("Paris.", [])
+
+
+class TestSharedState:
+    """Test the SQLite coordination layer shared by workers"""
+    
+    def test_sessions_cache_and_metrics_are_shared(self, tmp_path):
+        path = str(tmp_path / "shared.db")
+        first, second = SharedState(path), SharedState(path)
+        
+        first.append("s1", {"role": "user", "content": "hi"})
+        second.append("s1", {"role": "assistant", "content": "hello"})
+        assert [message["role"] for message in first.history("s1")] == ["user", "assistant"]
+        assert second.session_ids() == ["s1"]
+        
+        first.cache_set("k", {"v": 1}, ttl=60)
+        first.cache_set("gone", 1, ttl=-1)
+        assert second.cache_get("k") == {"v": 1}
+        assert second.cache_get("gone") is None
+        
+        first.publish_metrics("0", {"hits": 2, "hit_rate": 0.5, "nested": {"requests": 3}})
+        second.publish_metrics("1", {"hits": 3, "hit_rate": 0.25, "nested": {"requests": 4}})
+        workers = first.worker_metrics()
+        assert set(workers) == {"0", "1"}
+        assert sum_counters([worker["metrics"] for worker in workers.values()]) == {"hits": 5, "nested": {"requests": 7}}
+    
+    def test_precomputed_answers_reach_other_workers(self, tmp_path):
+        path = str(tmp_path / "shared.db")
+        producer = HotQueryPrecomputer(min_hits=1, shared=SharedState(path))
+        consumer = HotQueryPrecomputer(min_hits=1, shared=SharedState(path))
+        producer.observe("what is rag")
+        producer.refresh_once(lambda query: {"response": "answer", "metadata": {}})
+        
+        age, result = consumer.lookup("What is RAG?")
+        assert result["response"] == "answer"
+    
+    def test_one_worker_refreshes_from_merged_counts_and_shared_budget(self, tmp_path):
+        path = str(tmp_path / "shared.db")
+        workers = [HotQueryPrecomputer(min_hits=3, refresh_budget=1, shared=SharedState(path), worker_id=str(i)) for i in range(2)]
+        for worker in workers:
+            # Below the threshold on each worker, above it once their counts are merged
+            worker.observe("what is rag")
+            worker.observe("what is rag")
+            worker.observe("what is a transformer")
+            worker.observe("what is a transformer")
+        computed = []
+        compute = lambda query: computed.append(query) or {"response": query, "metadata": {}}
+        
+        refreshed = [worker.cycle(compute) for worker in workers] + [worker.cycle(compute) for worker in workers]
+        
+        # Worker 0 sees the merged counts once worker 1 has published its sketch
+        assert refreshed == [0, 0, 1, 0]
+        assert [worker.is_refresher for worker in workers] == [True, False]
+        assert len(computed) == 1  # The budget is shared, so the refresher's second cycle found it spent
+        assert workers[1].lookup(computed[0])[1]["response"] == computed[0]
+    
+    def test_leases_elect_one_holder_until_expiry(self, tmp_path):
+        path = str(tmp_path / "shared.db")
+        first, second = SharedState(path), SharedState(path)
+        
+        assert first.try_lease("job", "a", ttl=60)
+        assert not second.try_lease("job", "b", ttl=60)
+        assert first.try_lease("job", "a", ttl=-1)
+        assert second.try_lease("job", "b", ttl=60)